@@ -0,0 +1,330 @@
+from __future__ import annotations
+
+import json
+import os
+from collections import Counter
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+from typing import Any, Iterable
+
+from app_models import AdminStats
+from storage_services import (
+    START_CHECKPOINT,
+    _json_lines,
+    _parse_timestamp,
+    _read_handle_from,
+    append_bytes,
+    atomic_write_text,
+    build_llm_usage_stats,
+    file_lock,
+    shared_file_lock,
+)
+
+
+TOP_QUESTIONS_TRACKED = int(os.getenv("ADMIN_TOP_QUESTIONS_TRACKED", "1000"))
+CHAT_DELTAS_COMPACT_BYTES = 1024 * 1024
+USAGE_RETENTION_HOURS = 24 * 7
+USAGE_SAMPLES_MAX = 5000
+USAGE_FIELDS = (
+    "event",
+    "timestamp",
+    "answer_type",
+    "duration_ms",
+    "ttft_ms",
+    "prompt_tokens",
+    "completion_tokens",
+    "cached_tokens",
+)
+
+
+def _empty_chat_state() -> dict:
+    return {
+        "total_chats": 0,
+        "total_messages": 0,
+        "questions": {},
+        "regimes": {},
+        "deltas_identity": None,
+        "deltas_offset": 0,
+    }
+
+
+def _empty_log_state() -> dict:
+    return {
+        "feedback": {"checkpoint": START_CHECKPOINT, "identity": None, "votes": {}},
+        "events": {"checkpoint": START_CHECKPOINT, "identity": None, "counts": {}, "llm_usage": []},
+    }
+
+
+def _bump(counter: dict, key: str | None, delta: int) -> None:
+    if not key:
+        return
+    value = counter.get(key, 0) + delta
+    if value > 0:
+        counter[key] = value
+    else:
+        counter.pop(key, None)
+
+
+def _prune_questions(questions: dict) -> None:
+    # Le domande distinte crescono senza limite: oltre la soglia si tengono solo le piu'
+    # frequenti. La classifica resta esatta per le domande ricorrenti, approssimata in coda.
+    if len(questions) <= TOP_QUESTIONS_TRACKED * 2:
+        return
+    keep = Counter(questions).most_common(TOP_QUESTIONS_TRACKED)
+    questions.clear()
+    questions.update(keep)
+
+
+class _StateFile:
+    # Stato JSON persistito con scrittura atomica, ricaricato solo se un altro worker lo ha cambiato.
+    def __init__(self, path: Path, factory) -> None:
+        self.path = Path(path)
+        self.factory = factory
+        self.lock_path = self.path.with_name(f".{self.path.name}.lock")
+        self._state: dict | None = None
+        self._version: tuple[int, int] | None = None
+
+    def exists(self) -> bool:
+        return self.path.exists()
+
+    def load(self) -> dict:
+        try:
+            stat = self.path.stat()
+        except FileNotFoundError:
+            return self.factory()
+        version = (stat.st_ino, stat.st_mtime_ns)
+        if self._state is None or version != self._version:
+            try:
+                self._state = json.loads(self.path.read_text(encoding="utf-8"))
+            except (json.JSONDecodeError, FileNotFoundError):
+                self._state = self.factory()
+            self._version = version
+        return self._state
+
+    def save(self, state: dict) -> None:
+        atomic_write_text(self.path, json.dumps(state, ensure_ascii=False))
+        stat = self.path.stat()
+        self._state = state
+        self._version = (stat.st_ino, stat.st_mtime_ns)
+
+
+class AdminAggregates:
+    # Contatori di /admin/overview mantenuti in modo incrementale invece di rileggere tutto:
+    # - chat: lo store chiama record_turn/record_delete a ogni save_turn/delete_chat, che
+    #   aggiungono una riga di variazioni a `chat_deltas.jsonl` (un append, niente fsync);
+    #   stats() le somma allo stato e lo salva una volta sola;
+    # - feedback ed eventi: letti solo i record nuovi dopo l'ultimo checkpoint (read_from).
+    # Entrambi sono persistiti in `base_dir` e ricostruibili da zero con rebuild().
+    # Le scritture delle chat avvengono dentro recording(), che esclude rebuild_chats.
+    def __init__(self, base_dir: Path, chat_store: Any, feedback_store: Any, event_store: Any) -> None:
+        self.base_dir = Path(base_dir)
+        self.base_dir.mkdir(parents=True, exist_ok=True)
+        self.chat_store = chat_store
+        self.feedback_store = feedback_store
+        self.event_store = event_store
+        self._chats = _StateFile(self.base_dir / "chat_aggregates.json", _empty_chat_state)
+        self._deltas_path = self.base_dir / "chat_deltas.jsonl"
+        self._rebuild_lock_path = self.base_dir / ".chat_rebuild.lock"
+        self._logs = _StateFile(self.base_dir / "log_aggregates.json", _empty_log_state)
+        chat_store.aggregates = self
+
+    def recording(self):
+        # Gli store scrivono la chat e la sua variazione dentro questo lock condiviso;
+        # rebuild_chats lo prende esclusivo, quindi nessun turno sta a cavallo della rilettura.
+        return shared_file_lock(self._rebuild_lock_path)
+
+    def record_turn(self, previous: dict | None, current: dict, question: str) -> None:
+        regimes: dict = {}
+        if previous is None:
+            _bump(regimes, current.get("regime_id"), 1)
+        elif previous.get("regime_id") != current.get("regime_id"):
+            _bump(regimes, previous.get("regime_id"), -1)
+            _bump(regimes, current.get("regime_id"), 1)
+        question = question.strip()
+        self._append_delta(
+            {
+                "chats": 1 if previous is None else 0,
+                "messages": current["message_count"] - (previous or {}).get("message_count", 0),
+                "regimes": regimes,
+                "questions": {question: 1} if question else {},
+            }
+        )
+
+    def record_delete(self, entry: dict, questions: Iterable[str]) -> None:
+        removed: dict = {}
+        for question in questions:
+            question = question.strip()
+            if question:
+                removed[question] = removed.get(question, 0) - 1
+        regime_id = entry.get("regime_id")
+        self._append_delta(
+            {
+                "chats": -1,
+                "messages": -entry.get("message_count", 0),
+                "regimes": {regime_id: -1} if regime_id else {},
+                "questions": removed,
+            }
+        )
+
+    def _append_delta(self, delta: dict) -> None:
+        with file_lock(self._chats.lock_path):
+            if not self._chats.exists():
+                # Lo stato verra' ricostruito per intero dalle chat: questa variazione e' gia' inclusa.
+                return
+            append_bytes(self._deltas_path, _json_lines([delta]))
+
+    def _fold_deltas(self) -> dict:
+        # Somma allo stato le variazioni registrate dopo l'ultimo checkpoint; oltre
+        # CHAT_DELTAS_COMPACT_BYTES il log viene sostituito da uno vuoto (nuovo inode).
+        with file_lock(self._chats.lock_path):
+            state = self._chats.load()
+            identity = self._deltas_identity()
+            if identity is None:
+                return state
+            if identity != state.get("deltas_identity"):
+                state["deltas_identity"] = identity
+                state["deltas_offset"] = 0
+            with self._deltas_path.open("rb") as handle:
+                deltas, offset = _read_handle_from(handle, state["deltas_offset"], None)
+            if offset == state["deltas_offset"]:
+                return state
+            for delta in deltas:
+                state["total_chats"] = max(0, state["total_chats"] + delta.get("chats", 0))
+                state["total_messages"] = max(0, state["total_messages"] + delta.get("messages", 0))
+                for regime_id, change in delta.get("regimes", {}).items():
+                    _bump(state["regimes"], regime_id, change)
+                for question, change in delta.get("questions", {}).items():
+                    _bump(state["questions"], question, change)
+            _prune_questions(state["questions"])
+            state["deltas_offset"] = offset
+            self._chats.save(state)
+            if offset >= CHAT_DELTAS_COMPACT_BYTES:
+                atomic_write_text(self._deltas_path, "")
+                state["deltas_identity"] = self._deltas_identity()
+                state["deltas_offset"] = 0
+                self._chats.save(state)
+            return state
+
+    def _deltas_identity(self) -> int | None:
+        try:
+            return self._deltas_path.stat().st_ino
+        except FileNotFoundError:
+            return None
+
+    def stats(self, usage_window_hours: int = 24) -> AdminStats:
+        # Oltre la retention dei campioni la finestra non sarebbe coperta: si limita qui.
+        usage_window_hours = min(max(1, usage_window_hours), USAGE_RETENTION_HOURS)
+        if not self._chats.exists():
+            self.rebuild_chats()
+        chats = self._fold_deltas()
+        logs = self.refresh_logs()
+        votes = logs["feedback"]["votes"]
+        counts = logs["events"]["counts"]
+        return AdminStats(
+            total_chats=chats["total_chats"],
+            total_messages=chats["total_messages"],
+            positive_feedback=votes.get("up", 0),
+            negative_feedback=votes.get("down", 0),
+            no_result_events=counts.get("rag_no_results", 0),
+            low_confidence_events=counts.get("rag_low_confidence", 0),
+            top_questions=[item for item, _ in Counter(chats["questions"]).most_common(5)],
+            top_regimes=[item for item, _ in Counter(chats["regimes"]).most_common(5)],
+            llm_usage=build_llm_usage_stats(
+                logs["events"]["llm_usage"],
+                usage_window_hours,
+                available_since=self._usage_available_since(logs["events"]["llm_usage"]),
+            ),
+        )
+
+    @staticmethod
+    def _usage_available_since(samples: list[dict]) -> datetime | None:
+        # Con il tetto USAGE_SAMPLES_MAX raggiunto i campioni piu' vecchi sono stati scartati.
+        if len(samples) < USAGE_SAMPLES_MAX:
+            return None
+        return _parse_timestamp(samples[0].get("timestamp"))
+
+    def refresh_logs(self) -> dict:
+        # Legge solo feedback ed eventi scritti dopo l'ultimo checkpoint.
+        with file_lock(self._logs.lock_path):
+            state = self._logs.load()
+            changed = self._catch_up(state, "feedback", self.feedback_store, self._apply_feedback)
+            changed = self._catch_up(state, "events", self.event_store, self._apply_event) or changed
+            if changed:
+                self._prune_usage(state["events"])
+                self._logs.save(state)
+            return state
+
+    def rebuild(self) -> AdminStats:
+        self.rebuild_chats()
+        with file_lock(self._logs.lock_path):
+            self._logs.save(_empty_log_state())
+        return self.stats()
+
+    def rebuild_chats(self) -> None:
+        # Scansione e posizione nel log delle variazioni sotto lo stesso lock esclusivo: un
+        # turno e' o tutto nella rilettura o tutto nelle variazioni successive, mai in entrambe.
+        with file_lock(self._rebuild_lock_path), file_lock(self._chats.lock_path):
+            state = _empty_chat_state()
+            for chat_id in list(self.chat_store.iter_chat_ids()):
+                try:
+                    transcript = self.chat_store.get_chat(chat_id)
+                except (json.JSONDecodeError, KeyError, TypeError):
+                    continue
+                if transcript is None:
+                    continue
+                state["total_chats"] += 1
+                state["total_messages"] += len(transcript.messages)
+                _bump(state["regimes"], transcript.regime_id, 1)
+                for message in transcript.messages:
+                    if message.role == "user":
+                        _bump(state["questions"], message.text.strip(), 1)
+            _prune_questions(state["questions"])
+            # Le variazioni gia' registrate sono comprese nella rilettura delle chat.
+            state["deltas_identity"] = self._deltas_identity()
+            if state["deltas_identity"] is not None:
+                state["deltas_offset"] = self._deltas_path.stat().st_size
+            self._chats.save(state)
+
+    @staticmethod
+    def _catch_up(state: dict, name: str, store: Any, apply) -> bool:
+        section = state[name]
+        identity = store.log_identity()
+        changed = False
+        if identity != section["identity"]:
+            # Log sostituito (o appena creato): si riparte da capo per questa sezione.
+            section = state[name] = {**_empty_log_state()[name], "identity": identity}
+            changed = True
+        while True:
+            try:
+                records, checkpoint = store.read_from(section["checkpoint"], limit=5000)
+            except ValueError:
+                # Checkpoint di un altro backend o di un formato precedente: si rilegge da capo.
+                section = state[name] = {**_empty_log_state()[name], "identity": identity}
+                changed = True
+                continue
+            if not records and checkpoint == section["checkpoint"]:
+                return changed
+            for record in records:
+                apply(section, record)
+            section["checkpoint"] = checkpoint
+            changed = True
+
+    @staticmethod
+    def _apply_feedback(section: dict, record: dict) -> None:
+        _bump(section["votes"], record.get("vote"), 1)
+
+    @staticmethod
+    def _apply_event(section: dict, record: dict) -> None:
+        _bump(section["counts"], record.get("event"), 1)
+        if record.get("event") == "llm_usage":
+            section["llm_usage"].append({key: record.get(key) for key in USAGE_FIELDS})
+
+    @staticmethod
+    def _prune_usage(section: dict) -> None:
+        since = datetime.now(timezone.utc) - timedelta(hours=USAGE_RETENTION_HOURS)
+        recent = [
+            item
+            for item in section["llm_usage"]
+            if (timestamp := _parse_timestamp(item.get("timestamp"))) is not None and timestamp >= since
+        ]
+        section["llm_usage"] = recent[-USAGE_SAMPLES_MAX:]
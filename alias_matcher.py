@@ -0,0 +1,82 @@
+from functools import lru_cache
+from typing import Callable, Dict, Iterable, List
+
+from keyword_matcher import KeywordAutomaton
+
+
+class _TrieNode:
+    __slots__ = ("children", "regime_ids")
+
+    def __init__(self) -> None:
+        self.children: Dict[str, "_TrieNode"] = {}
+        self.regime_ids: List[str] = []
+
+
+# Matcher compilato sugli alias dei regimi: un automa Aho-Corasick per gli alias presenti
+# come sottostringa e un trie di token con archi "fuzzy" per gli alias scritti con refusi.
+class RegimeAliasMatcher:
+    def __init__(
+        self,
+        aliases: Iterable[tuple[str, str]],
+        tokenize: Callable[[str], List[str]],
+        is_close: Callable[[str, str], bool],
+    ) -> None:
+        self._tokenize = tokenize
+        self._is_close = is_close
+        self._regime_order: Dict[str, int] = {}
+        self._exact = KeywordAutomaton()
+        self._exact_masks: List[tuple[int, str]] = []
+        self._root = _TrieNode()
+        self._tokens_by_edges: Dict[tuple[str, str], List[str]] = {}
+
+        for regime_id, alias in aliases:
+            alias_tokens = alias.split()
+            if not alias_tokens:
+                continue
+            self._regime_order.setdefault(regime_id, len(self._regime_order))
+            self._exact_masks.append((self._exact.register((alias,)), regime_id))
+            node = self._root
+            for token in alias_tokens:
+                node = node.children.setdefault(token, _TrieNode())
+                bucket = self._tokens_by_edges.setdefault((token[0], token[-1]), [])
+                if token not in bucket:
+                    bucket.append(token)
+            if regime_id not in node.regime_ids:
+                node.regime_ids.append(regime_id)
+
+        self._close_tokens = lru_cache(maxsize=4096)(self._compute_close_tokens)
+
+    def match(self, normalized_query: str) -> List[str]:
+        found: set[str] = set()
+        hits = self._exact.scan(normalized_query)
+        for mask, regime_id in self._exact_masks:
+            if hits & mask:
+                found.add(regime_id)
+
+        if len(found) < len(self._regime_order):
+            query_tokens = self._tokenize(normalized_query)
+            for start in range(len(query_tokens)):
+                self._walk(self._root, query_tokens, start, found)
+        return sorted(found, key=self._regime_order.__getitem__)
+
+    def _walk(self, node: _TrieNode, query_tokens: List[str], position: int, found: set[str]) -> None:
+        if position >= len(query_tokens):
+            return
+        close_tokens = self._close_tokens(query_tokens[position])
+        for alias_token in close_tokens:
+            child = node.children.get(alias_token)
+            if child is None:
+                continue
+            found.update(child.regime_ids)
+            if child.children:
+                self._walk(child, query_tokens, position + 1, found)
+
+    def _compute_close_tokens(self, token: str) -> tuple[str, ...]:
+        if not token:
+            return ()
+        candidates = self._tokens_by_edges.get((token[0], token[-1]), ())
+        return tuple(
+            candidate
+            for candidate in candidates
+            if candidate == token or self._is_close(token, candidate)
+        )
@@ -1,16 +1,29 @@
+import asyncio
 import json
 import os
 import re
 import secrets
+import threading
+import time
 import unicodedata
-from dataclasses import dataclass
-from datetime import datetime, timezone
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta, timezone
 from difflib import SequenceMatcher
+from functools import lru_cache, wraps
 from pathlib import Path
-from typing import List
+from typing import Any, Callable, List
 
 import fastapi
-from app_paths import DATA_ROOT, DOCUMENT_ROOTS, FRONTEND_ROOT, LOG_DIR, RAG_INDEX_PATH, UPLOADS_ROOT
+from app_paths import (
+    DATA_ROOT,
+    DOCUMENT_ROOTS,
+    FRONTEND_ROOT,
+    INTENT_EXAMPLES_PATH,
+    LOG_DIR,
+    RAG_INDEX_PATH,
+    STORAGE_SQLITE_PATH,
+    UPLOADS_ROOT,
+)
 from app_models import (
     ChatRequest,
     ChatResponse,
@@ -25,26 +38,58 @@ from app_models import (
     SourceRef,
 )
 from dotenv import load_dotenv
-from fastapi import File, Header, HTTPException, UploadFile
+from fastapi import File, Header, HTTPException, Query, UploadFile
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.responses import FileResponse, StreamingResponse
-from openai import OpenAI
+from openai import AsyncOpenAI
 from openai import APIError, RateLimitError
-from storage_services import ChatHistoryStore, EventStore, FeedbackStore, build_admin_stats
+from storage_services import ChatHistoryStore, EventStore, FeedbackStore, JsonlStore
+from storage_sqlite import SQLiteChatHistoryStore, SQLiteDatabase, SQLiteEventStore, SQLiteFeedbackStore
 from tax_simulator import simulate_forfettario
 
+from admin_aggregates import USAGE_RETENTION_HOURS, AdminAggregates
+from alias_matcher import RegimeAliasMatcher
+from context_packing import pack_context, render_context
+from event_query import EventRollups
+from event_writer import BufferedEventWriter
+from intent_classifier import (
+    OFF_TOPIC_INTENT,
+    RETRIEVAL_INTENT,
+    IntentPrediction,
+    NearestCentroidClassifier,
+    load_intent_examples,
+)
+from keyword_matcher import KeywordAutomaton
 from lexical_fallback import LexicalChunk, LexicalFallbackIndex
+from llm_transport import (
+    LLMBusyError,
+    LLMTransport,
+    LLMTransportConfig,
+    QueuePosition,
+    build_http_client,
+)
+from prompt_builder import build_messages, prompt_cache_usage
 from rag_qdrant import CorpusConfig, QdrantRAG, RetrievedChunk
+from single_flight import SingleFlight
+from typo_index import SymSpellIndex
 
 load_dotenv()  # Carica le variabili dal file .env
 chiave_api = os.getenv("API_KEY_DEEPSEEK", "").strip()
 
+# Con LLM_BASE_URL si puo' puntare a un server compatibile OpenAI (es. stub_llm_server.py).
+LLM_BASE_URL = os.getenv("LLM_BASE_URL", "https://api.deepseek.com").strip()
 llm_model = "deepseek-chat"
-client: OpenAI | None = None
+LLM_BUSY_MESSAGE = (
+    "Il servizio sta gestendo molte richieste in questo momento. "
+    "Riprova tra qualche secondo."
+)
+LLM_TRANSPORT_CONFIG = LLMTransportConfig.from_env()
+client: AsyncOpenAI | None = None
+llm_transport: LLMTransport | None = None
 client_init_error: str | None = None
 
 
-def _get_llm_client() -> OpenAI | None:
+def _get_llm_client() -> AsyncOpenAI | None:
     global client, client_init_error
     if client is not None:
         return client
@@ -54,15 +99,30 @@ def _get_llm_client() -> OpenAI | None:
         client_init_error = "API_KEY_DEEPSEEK non configurata sul server."
         return None
     try:
-        client = OpenAI(
+        # Retry e timeout sono gestiti da LLMTransport, non dal client OpenAI.
+        client = AsyncOpenAI(
             api_key=chiave_api,
-            base_url="https://api.deepseek.com",
+            base_url=LLM_BASE_URL,
+            http_client=build_http_client(LLM_TRANSPORT_CONFIG),
+            timeout=LLM_TRANSPORT_CONFIG.timeout,
+            max_retries=0,
         )
     except Exception as error:  # pragma: no cover
         client_init_error = f"Impossibile inizializzare DeepSeek: {error}"
         return None
     return client
 
+
+def _get_llm_transport() -> LLMTransport | None:
+    global llm_transport
+    if llm_transport is not None:
+        return llm_transport
+    llm_client = _get_llm_client()
+    if llm_client is None:
+        return None
+    llm_transport = LLMTransport(llm_client, LLM_TRANSPORT_CONFIG)
+    return llm_transport
+
 app = fastapi.FastAPI()
 app.add_middleware(
     CORSMiddleware,
@@ -75,6 +135,9 @@ app.add_middleware(
 rag = QdrantRAG.from_env()
 rag_load_error = None
 rag_ready = False
+# Incrementata a ogni reindicizzazione: fa parte della chiave di coalescenza delle richieste.
+corpus_version = 0
+request_flights = SingleFlight()
 
 LEXICAL_FALLBACK_ENABLED = os.getenv("LEXICAL_FALLBACK_ENABLED", "1") != "0"
 SEMANTIC_SEARCH_ENABLED = os.getenv("SEMANTIC_SEARCH_ENABLED", "1") != "0"
@@ -86,9 +149,49 @@ HARD_CODED_CATEGORIES = {
     "critical": {"critical"},
 }
 ALLOWED_HARD_CODED = HARD_CODED_CATEGORIES.get(HARD_CODED_MODE, {"critical", "stable"})
-chat_store = ChatHistoryStore(DATA_ROOT / "chat_history")
-feedback_store = FeedbackStore(DATA_ROOT / "feedback" / "feedback.jsonl")
-event_store = EventStore(DATA_ROOT / "events" / "app_events.jsonl")
+INTENT_CLASSIFIER_ENABLED = os.getenv("INTENT_CLASSIFIER_ENABLED", "0") == "1"
+INTENT_CLASSIFIER_THRESHOLD = float(os.getenv("INTENT_CLASSIFIER_THRESHOLD", "0.8"))
+CONTEXT_TOKEN_BUDGET = int(os.getenv("CONTEXT_TOKEN_BUDGET", "2000"))
+STREAM_COALESCE_S = max(0.0, float(os.getenv("STREAM_COALESCE_MS", "50")) / 1000)
+intent_classifier: NearestCentroidClassifier | None = None
+intent_classifier_error: str | None = None
+intent_classifier_lock = threading.Lock()
+STORAGE_BACKEND = os.getenv("STORAGE_BACKEND", "json").strip().lower()
+if STORAGE_BACKEND == "sqlite":
+    storage_db = SQLiteDatabase(STORAGE_SQLITE_PATH)
+    chat_store = SQLiteChatHistoryStore(storage_db)
+    feedback_store = SQLiteFeedbackStore(storage_db)
+    event_store = SQLiteEventStore(storage_db)
+else:
+    chat_store = ChatHistoryStore(DATA_ROOT / "chat_history")
+    feedback_store = FeedbackStore(
+        DATA_ROOT / "feedback" / "feedback.jsonl",
+        retention_days=int(os.getenv("FEEDBACK_RETENTION_DAYS", "0")),
+    )
+    event_store = EventStore(
+        DATA_ROOT / "events" / "app_events.jsonl",
+        retention_days=int(os.getenv("EVENT_RETENTION_DAYS", "90")),
+    )
+admin_aggregates = AdminAggregates(DATA_ROOT / "admin", chat_store, feedback_store, event_store)
+event_rollups = EventRollups(event_store)
+EVENT_BATCH_SIZE = int(os.getenv("EVENT_BATCH_SIZE", "200"))
+EVENT_FLUSH_INTERVAL_S = float(os.getenv("EVENT_FLUSH_INTERVAL_MS", "500")) / 1000
+EVENT_MAX_PENDING = int(os.getenv("EVENT_MAX_PENDING", "10000"))
+
+
+def _event_writer(sink) -> BufferedEventWriter:
+    return BufferedEventWriter(
+        [sink],
+        max_batch=EVENT_BATCH_SIZE,
+        flush_interval_s=EVENT_FLUSH_INTERVAL_S,
+        max_pending=EVENT_MAX_PENDING,
+    )
+
+
+# Gli eventi non vengono scritti nel percorso della richiesta: si accodano e un thread
+# li scrive a blocchi. Allo shutdown le code vengono svuotate.
+event_bus = _event_writer(event_store)
+rag_log_bus = _event_writer(JsonlStore(LOG_DIR / "rag_events.jsonl")) if LOG_RAG_EVENTS else None
 ADMIN_ACCESS_KEY = os.getenv("ADMIN_ACCESS_KEY", "").strip()
 FRONTEND_PAGES = {"index.html", "chat.html", "dashboard.html", "admin.html", "admin_tools.html"}
 FRONTEND_ASSETS = {"admin.css", "style.css", "style_home.css", "logo.png", "robot.png"}
@@ -113,19 +216,27 @@ def _discover_corpora() -> List[CorpusConfig]:
     return []
 
 
+def _publish_event(payload: dict) -> None:
+    # Il timestamp si fissa qui: la scrittura su disco avviene piu' tardi.
+    event_bus.publish({"timestamp": datetime.now(timezone.utc).isoformat(), **payload})
+
+
 def _log_rag_event(event: str, payload: dict) -> None:
-    event_store.append({"event": event, **payload})
-    if not LOG_RAG_EVENTS:
-        return
-    LOG_DIR.mkdir(parents=True, exist_ok=True)
     record = {
         "event": event,
         "timestamp": datetime.now(timezone.utc).isoformat(),
         **payload,
     }
-    log_path = LOG_DIR / "rag_events.jsonl"
-    with log_path.open("a", encoding="utf-8") as handle:
-        handle.write(json.dumps(record, ensure_ascii=False) + "\n")
+    event_bus.publish(record)
+    if rag_log_bus is not None:
+        rag_log_bus.publish(record)
+
+
+@app.on_event("shutdown")
+def _flush_event_buses() -> None:
+    event_bus.close()
+    if rag_log_bus is not None:
+        rag_log_bus.close()
 
 
 def _require_admin(admin_key: str | None) -> None:
@@ -239,9 +350,17 @@ REGIME_PROFILES: List[RegimeProfile] = []
 DEFAULT_REGIME_ID = FORFETTARIO_REGIME_ID
 
 
+regime_alias_matcher: RegimeAliasMatcher | None = None
+
+
 def _refresh_regime_profiles() -> None:
-    global REGIME_PROFILES, DEFAULT_REGIME_ID
-    REGIME_PROFILES = _build_regime_profiles()
+    global REGIME_PROFILES, DEFAULT_REGIME_ID, regime_alias_matcher
+    profiles = _build_regime_profiles()
+    if profiles == REGIME_PROFILES:
+        return
+    REGIME_PROFILES = profiles
+    # Il matcher degli alias si ricompila al primo uso solo se i profili sono cambiati.
+    regime_alias_matcher = None
     DEFAULT_REGIME_ID = next(
         (profile.regime_id for profile in REGIME_PROFILES if profile.is_default),
         REGIME_PROFILES[0].regime_id,
@@ -276,6 +395,53 @@ def _compact_excerpt(text: str, max_length: int = 220) -> str:
     return normalized[: max_length - 1].rstrip() + "…"
 
 
+def _build_context(items: List[RetrievedChunk]) -> str:
+    # Chunk consecutivi della stessa fonte vengono fusi togliendo l'overlap, poi si
+    # riempie CONTEXT_TOKEN_BUDGET in ordine di score.
+    return render_context(pack_context(items, CONTEXT_TOKEN_BUDGET))
+
+
+def _log_llm_usage(
+    endpoint: str,
+    regime_id: str,
+    *,
+    usage: Any = None,
+    started: float | None = None,
+    first_token_at: float | None = None,
+    retrieval_mode: str | None = None,
+    intent_id: str | None = None,
+) -> None:
+    # Un record compatto per ogni risposta: generata (token, cache, TTFT, durata) o hardcoded.
+    record: dict = {
+        "endpoint": endpoint,
+        "regime": regime_id,
+        "answer_type": "hard_coded" if intent_id else "generated",
+    }
+    if intent_id:
+        record["intent_id"] = intent_id
+    else:
+        cache_usage = prompt_cache_usage(usage) or {}
+        completion_tokens = getattr(usage, "completion_tokens", None)
+        record.update(
+            {
+                "model": llm_model,
+                "retrieval_mode": retrieval_mode,
+                "prompt_tokens": cache_usage.get("prompt_tokens"),
+                "completion_tokens": int(completion_tokens) if completion_tokens is not None else None,
+                "cached_tokens": cache_usage.get("prompt_cache_hit_tokens"),
+                "ttft_ms": (
+                    round((first_token_at - started) * 1000)
+                    if first_token_at is not None and started is not None
+                    else None
+                ),
+                "duration_ms": (
+                    round((time.perf_counter() - started) * 1000) if started is not None else None
+                ),
+            }
+        )
+    _log_rag_event("llm_usage", record)
+
+
 def _build_source_details(items: List[RetrievedChunk]) -> List[SourceRef]:
     details: List[SourceRef] = []
     seen = set()
@@ -363,35 +529,23 @@ def _is_close_alias_token(token: str, alias_token: str) -> bool:
     return SequenceMatcher(None, token, alias_token).ratio() >= 0.82
 
 
-def _query_matches_alias(query: str, alias: str) -> bool:
-    normalized_query = _normalize_match_text(query)
-    normalized_alias = _normalize_match_text(alias)
-    if normalized_alias in normalized_query:
-        return True
-
-    alias_tokens = [token for token in normalized_alias.split() if token]
-    query_tokens = _tokenize_for_matching(normalized_query)
-    if not alias_tokens or not query_tokens:
-        return False
-    if len(alias_tokens) == 1:
-        return any(_is_close_alias_token(token, alias_tokens[0]) for token in query_tokens)
-
-    window_size = len(alias_tokens)
-    for start in range(len(query_tokens) - window_size + 1):
-        window = query_tokens[start : start + window_size]
-        if all(
-            candidate == expected or _is_close_alias_token(candidate, expected)
-            for candidate, expected in zip(window, alias_tokens)
-        ):
-            return True
-    return False
+def _get_regime_alias_matcher() -> RegimeAliasMatcher:
+    global regime_alias_matcher
+    if regime_alias_matcher is None:
+        regime_alias_matcher = RegimeAliasMatcher(
+            (
+                (profile.regime_id, _normalize_match_text(alias))
+                for profile in REGIME_PROFILES
+                for alias in profile.aliases
+            ),
+            tokenize=_tokenize_for_matching,
+            is_close=_is_close_alias_token,
+        )
+    return regime_alias_matcher
 
 
 def _query_mentions_regime_id(query: str, regime_id: str) -> bool:
-    profile = next((item for item in REGIME_PROFILES if item.regime_id == regime_id), None)
-    if profile is None:
-        return False
-    return any(_query_matches_alias(query, alias) for alias in profile.aliases)
+    return regime_id in _get_regime_alias_matcher().match(_normalize_match_text(query))
 
 
 EXACT_QUERY_TOKEN_REPLACEMENTS = {
@@ -464,17 +618,30 @@ CANONICAL_QUERY_TOKENS = (
 )
 
 
-def _canonicalize_tax_token(match: re.Match[str]) -> str:
-    token = match.group(0)
+def _build_token_corrections() -> SymSpellIndex:
+    # Solo i token canonici sono candidati alla correzione (le sostituzioni esatte e gli alias
+    # di regime restano fuori, come nel confronto completo). Con ratio >= 0.84 e parole fino
+    # a 16 caratteri servono al massimo 3 cancellazioni per lato: l'indice restituisce un
+    # superinsieme dei candidati che il confronto su tutta la lista accetterebbe.
+    return SymSpellIndex.from_words(CANONICAL_QUERY_TOKENS, max_distance=3)
+
+
+TOKEN_CORRECTIONS = _build_token_corrections()
+
+
+@lru_cache(maxsize=4096)
+def _correct_tax_token(token: str) -> str:
     exact_replacement = EXACT_QUERY_TOKEN_REPLACEMENTS.get(token)
     if exact_replacement is not None:
         return exact_replacement
     if len(token) < 6 or any(char.isdigit() for char in token):
         return token
+    if token in TOKEN_CORRECTIONS:
+        return token
 
     best_match = token
     best_score = 0.0
-    for candidate in CANONICAL_QUERY_TOKENS:
+    for candidate in TOKEN_CORRECTIONS.candidates(token):
         if token[0] != candidate[0] or token[-1] != candidate[-1]:
             continue
         if abs(len(token) - len(candidate)) > 2:
@@ -486,12 +653,74 @@ def _canonicalize_tax_token(match: re.Match[str]) -> str:
     return best_match
 
 
+def _canonicalize_tax_token(match: re.Match[str]) -> str:
+    return _correct_tax_token(match.group(0))
+
+
+QUERY_TOKEN_RE = re.compile(r"[a-z0-9%]+")
+
+
+@lru_cache(maxsize=2048)
 def _normalize_tax_query(query: str) -> str:
     normalized = _normalize_match_text(query)
-    normalized = re.sub(r"[a-z0-9%]+", _canonicalize_tax_token, normalized)
+    normalized = QUERY_TOKEN_RE.sub(_canonicalize_tax_token, normalized)
     return re.sub(r"\s+", " ", normalized).strip()
 
 
+_MISSING = object()
+
+
+@dataclass(frozen=True)
+class QueryFeatures:
+    raw: str
+    text: str
+    tokens: tuple[str, ...]
+    memo: dict = field(default_factory=dict, compare=False, repr=False)
+
+
+def _query_features(query: "str | QueryFeatures") -> QueryFeatures:
+    if isinstance(query, QueryFeatures):
+        return query
+    text = _normalize_tax_query(query)
+    return QueryFeatures(raw=query, text=text, tokens=tuple(QUERY_TOKEN_RE.findall(text)))
+
+
+INTENT_KEYWORDS = KeywordAutomaton()
+_KEYWORD_HITS = "__keyword_hits__"
+
+
+def _keyword_set(*terms: str) -> tuple[str, ...]:
+    # Gli insiemi di keyword sono costanti di modulo registrate qui, prima di INTENT_KEYWORDS.compile().
+    INTENT_KEYWORDS.register(terms)
+    return terms
+
+
+def _any_term(query: QueryFeatures, terms: tuple[str, ...]) -> bool:
+    # Una sola scansione del testo per query; `terms` deve essere un insieme dichiarato con _keyword_set.
+    hits = query.memo.get(_KEYWORD_HITS)
+    if hits is None:
+        hits = INTENT_KEYWORDS.snapshot().scan(query.text)
+        query.memo[_KEYWORD_HITS] = hits
+    return bool(hits & INTENT_KEYWORDS.mask(terms))
+
+
+def _query_predicate(predicate: Callable[[QueryFeatures], Any]) -> Callable[["str | QueryFeatures"], Any]:
+    # La query viene normalizzata una sola volta: ogni regola riceve le stesse QueryFeatures
+    # e il suo esito resta memorizzato per le regole che la richiamano.
+    key = predicate.__name__
+
+    @wraps(predicate)
+    def evaluate(query: "str | QueryFeatures") -> Any:
+        features = _query_features(query)
+        value = features.memo.get(key, _MISSING)
+        if value is _MISSING:
+            value = predicate(features)
+            features.memo[key] = value
+        return value
+
+    return evaluate
+
+
 def _allow_hardcoded(category: str) -> bool:
     return category in ALLOWED_HARD_CODED
 
@@ -503,8 +732,9 @@ DEFINITION_PATTERNS = (
 )
 
 
-def _extract_definition_term(query: str) -> str | None:
-    q = _normalize_tax_query(query)
+@_query_predicate
+def _extract_definition_term(query: QueryFeatures) -> str | None:
+    q = query.text
     if not any(re.search(pattern, q) for pattern in DEFINITION_PATTERNS):
         return None
 
@@ -548,55 +778,56 @@ def _contains_percent_reference(query: str, value: str) -> bool:
     return re.search(rf"(?<!\d){re.escape(value)}\s*%", query) is not None
 
 
-def _has_inps_35_context(query: str) -> bool:
-    q = _normalize_tax_query(query)
-    return any(
-        term in q
-        for term in (
-            "riduzione contributiva",
-            "riduzione inps",
-            "riduzione del 35",
-            "riduzione 35",
-            "agevolazione",
-            "artigiani",
-            "commercianti",
-            "gestione separata",
-            "cassa professionale",
-            "professionisti con cassa",
-            "inps",
-        )
-    ) or _contains_percent_reference(q, "35")
-
-
-def _has_non_inps_domain_context(query: str) -> bool:
-    q = _normalize_tax_query(query)
-    return any(
-        term in q
-        for term in (
-            "ateco",
-            "vies",
-            "intrastat",
-            "bollo",
-            "extra-ue",
-            "extra ue",
-            "reverse",
-            "td17",
-            "google ads",
-            "facebook ads",
-            "meta ads",
-            "lavoro dipendente",
-            "reddito dipendente",
-            "srl",
-            "societa",
-            "società",
-            "ex datore",
-            "partecipazioni",
-            "residenza estera",
-            "regimi speciali",
-            "acconto",
-            "saldo",
-        )
-    )
+INPS_35_CONTEXT_TERMS = _keyword_set(
+    "riduzione contributiva",
+    "riduzione inps",
+    "riduzione del 35",
+    "riduzione 35",
+    "agevolazione",
+    "artigiani",
+    "commercianti",
+    "gestione separata",
+    "cassa professionale",
+    "professionisti con cassa",
+    "inps",
+)
+
+
+@_query_predicate
+def _has_inps_35_context(query: QueryFeatures) -> bool:
+    q = query.text
+    return _any_term(query, INPS_35_CONTEXT_TERMS) or _contains_percent_reference(q, "35")
+
+
+NON_INPS_DOMAIN_CONTEXT_TERMS = _keyword_set(
+    "ateco",
+    "vies",
+    "intrastat",
+    "bollo",
+    "extra-ue",
+    "extra ue",
+    "reverse",
+    "td17",
+    "google ads",
+    "facebook ads",
+    "meta ads",
+    "lavoro dipendente",
+    "reddito dipendente",
+    "srl",
+    "societa",
+    "società",
+    "ex datore",
+    "partecipazioni",
+    "residenza estera",
+    "regimi speciali",
+    "acconto",
+    "saldo",
+)
+
+
+@_query_predicate
+def _has_non_inps_domain_context(query: QueryFeatures) -> bool:
+    return _any_term(query, NON_INPS_DOMAIN_CONTEXT_TERMS)
 
 
 def _extract_ateco_components(query: str) -> tuple[int, int | None] | None:
@@ -649,8 +880,9 @@ def _lookup_coefficiente_ateco(prefix: int, subcode: int | None = None) -> str |
     return None
 
 
-def _is_ateco_coeff_query(query: str) -> bool:
-    q = _normalize_tax_query(query)
+@_query_predicate
+def _is_ateco_coeff_query(query: QueryFeatures) -> bool:
+    q = query.text
     has_ateco_ref = "ateco" in q or re.search(r"\bcodice\s*[0-9]{2}", q) is not None
     return (
         has_ateco_ref
@@ -661,8 +893,9 @@ def _is_ateco_coeff_query(query: str) -> bool:
     )
 
 
-def _is_ateco_list_query(query: str) -> bool:
-    q = _normalize_tax_query(query)
+@_query_predicate
+def _is_ateco_list_query(query: QueryFeatures) -> bool:
+    q = query.text
     return (
         "ateco" in q
         and (
@@ -679,8 +912,9 @@ def _is_ateco_list_query(query: str) -> bool:
     )
 
 
-def _is_ateco_codes_query(query: str) -> bool:
-    q = _normalize_tax_query(query)
+@_query_predicate
+def _is_ateco_codes_query(query: QueryFeatures) -> bool:
+    q = query.text
     return "ateco" in q and (
         "tutti i codici" in q
         or "elenco codici" in q
@@ -691,153 +925,159 @@ def _is_ateco_codes_query(query: str) -> bool:
     )
 
 
-def _is_random_ateco_query(query: str) -> bool:
-    q = _normalize_tax_query(query)
+RANDOM_ATECO_INTENT_TERMS = _keyword_set(
+    "a caso",
+    "random",
+    "uno a caso",
+    "qualsiasi",
+    "dammi un codice",
+)
+
+
+@_query_predicate
+def _is_random_ateco_query(query: QueryFeatures) -> bool:
+    q = query.text
     has_ateco = "ateco" in q
-    has_random_intent = any(
-        term in q
-        for term in (
-            "a caso",
-            "random",
-            "uno a caso",
-            "qualsiasi",
-            "dammi un codice",
-        )
-    )
+    has_random_intent = _any_term(query, RANDOM_ATECO_INTENT_TERMS)
     return has_ateco and has_random_intent
 
 
-def _is_quadro_lm_query(query: str) -> bool:
-    q = _normalize_tax_query(query)
+@_query_predicate
+def _is_quadro_lm_query(query: QueryFeatures) -> bool:
+    q = query.text
     return "quadro lm" in q or ("lm" in q and "quadro" in q)
 
 
-def _is_off_topic_query(query: str) -> bool:
-    q = _normalize_tax_query(query)
-    return any(
-        term in q
-        for term in (
-            "sanremo",
-            "meteo",
-            "bitcoin",
-            "barzelletta",
-            "api key",
-            ".env",
-            "fuori tema",
-            "chi ha vinto",
-        )
-    )
+OFF_TOPIC_TERMS = _keyword_set(
+    "sanremo",
+    "meteo",
+    "bitcoin",
+    "barzelletta",
+    "api key",
+    ".env",
+    "fuori tema",
+    "chi ha vinto",
+)
 
 
-def _is_limit_query(query: str) -> bool:
-    q = _normalize_tax_query(query)
-    return any(term in q for term in ("quanto posso guadagn", "limite", "soglia", "ricavi", "compensi"))
-
-
-def _is_tax_query(query: str) -> bool:
-    q = _normalize_tax_query(query)
-    return any(term in q for term in ("quanto vengo tass", "tassat", "imposta", "aliquota", "sostitutiva", "tasse"))
-
-
-def _is_forfettario_query(query: str) -> bool:
-    q = _normalize_tax_query(query)
-    return "forfett" in q or _query_mentions_regime_id(query, "forfettario")
-
-
-def _is_tax_regime_query(query: str) -> bool:
-    q = _normalize_tax_query(query)
-    return any(
-        term in q
-        for term in (
-            "regime",
-            "forfett",
-            "fisco",
-            "fiscal",
-            "imposta",
-            "aliquota",
-            "iva",
-            "contribut",
-            "reddito",
-            "imponib",
-            "ricavi",
-            "compensi",
-            "soglia",
-            "fattur",
-            "detra",
-            "dedu",
-            "residenza",
-            "rientr",
-            "uscit",
-            "apertura",
-            "attivita",
-            "partecipaz",
-            "srl",
-            "societ",
-            "scadenz",
-            "acconto",
-            "saldo",
-            "partita iva",
-            "requisit",
-            "accesso",
-            "uscita",
-            "ademp",
-            "dichiar",
-        )
-    )
+@_query_predicate
+def _is_off_topic_query(query: QueryFeatures) -> bool:
+    return _any_term(query, OFF_TOPIC_TERMS)
 
 
-def _is_forfettario_intro_query(query: str) -> bool:
-    q = _normalize_tax_query(query)
-    has_forfettario = _is_forfettario_query(q)
-    has_intro_intent = any(
-        term in q
-        for term in (
-            "cos'e",
-            "cos e",
-            "che cos'e",
-            "che cos e",
-            "spiegami",
-            "spiegare",
-            "in parole semplici",
-            "in pratica",
-            "come funziona",
-            "come funziona in generale",
-            "di cosa si tratta",
-        )
-    )
-    technical_terms = (
-        "ateco",
-        "vies",
-        "intrastat",
-        "td17",
-        "bollo",
-        "inps",
-        "35%",
-        "soglia",
-        "ricavi",
-        "compensi",
-        "srl",
-        "ex datore",
-        "lavoro dipendente",
-        "cassa professionale",
-        "google ads",
-        "uscita",
-        "scadenza",
-        "acconto",
-        "saldo",
-        "causa ostativa",
-        "cause ostative",
-        "regimi speciali",
-    )
-    return has_forfettario and has_intro_intent and not any(term in q for term in technical_terms)
+LIMIT_TERMS = _keyword_set("quanto posso guadagn", "limite", "soglia", "ricavi", "compensi")
+
+
+@_query_predicate
+def _is_limit_query(query: QueryFeatures) -> bool:
+    return _any_term(query, LIMIT_TERMS)
+
+
+TAX_TERMS = _keyword_set("quanto vengo tass", "tassat", "imposta", "aliquota", "sostitutiva", "tasse")
+
+
+@_query_predicate
+def _is_tax_query(query: QueryFeatures) -> bool:
+    return _any_term(query, TAX_TERMS)
+
+
+@_query_predicate
+def _is_forfettario_query(query: QueryFeatures) -> bool:
+    q = query.text
+    return "forfett" in q or _query_mentions_regime_id(q, "forfettario")
+
+
+TAX_REGIME_TERMS = _keyword_set(
+    "regime",
+    "forfett",
+    "fisco",
+    "fiscal",
+    "imposta",
+    "aliquota",
+    "iva",
+    "contribut",
+    "reddito",
+    "imponib",
+    "ricavi",
+    "compensi",
+    "soglia",
+    "fattur",
+    "detra",
+    "dedu",
+    "residenza",
+    "rientr",
+    "uscit",
+    "apertura",
+    "attivita",
+    "partecipaz",
+    "srl",
+    "societ",
+    "scadenz",
+    "acconto",
+    "saldo",
+    "partita iva",
+    "requisit",
+    "accesso",
+    "uscita",
+    "ademp",
+    "dichiar",
+)
+
+
+@_query_predicate
+def _is_tax_regime_query(query: QueryFeatures) -> bool:
+    return _any_term(query, TAX_REGIME_TERMS)
+
+
+FORFETTARIO_INTRO_INTENT_TERMS = _keyword_set(
+    "cos'e",
+    "cos e",
+    "che cos'e",
+    "che cos e",
+    "spiegami",
+    "spiegare",
+    "in parole semplici",
+    "in pratica",
+    "come funziona",
+    "come funziona in generale",
+    "di cosa si tratta",
+)
+FORFETTARIO_INTRO_TECHNICAL_TERMS = _keyword_set(
+    "ateco",
+    "vies",
+    "intrastat",
+    "td17",
+    "bollo",
+    "inps",
+    "35%",
+    "soglia",
+    "ricavi",
+    "compensi",
+    "srl",
+    "ex datore",
+    "lavoro dipendente",
+    "cassa professionale",
+    "google ads",
+    "uscita",
+    "scadenza",
+    "acconto",
+    "saldo",
+    "causa ostativa",
+    "cause ostative",
+    "regimi speciali",
+)
+
+
+@_query_predicate
+def _is_forfettario_intro_query(query: QueryFeatures) -> bool:
+    has_forfettario = _is_forfettario_query(query)
+    has_intro_intent = _any_term(query, FORFETTARIO_INTRO_INTENT_TERMS)
+    return has_forfettario and has_intro_intent and not _any_term(query, FORFETTARIO_INTRO_TECHNICAL_TERMS)
 
 
 def _match_regime_profiles(query: str) -> List[RegimeProfile]:
-    matches: List[RegimeProfile] = []
-    for profile in REGIME_PROFILES:
-        if any(_query_matches_alias(query, alias) for alias in profile.aliases):
-            matches.append(profile)
-    return matches
+    matched_ids = set(_get_regime_alias_matcher().match(_normalize_match_text(query)))
+    return [profile for profile in REGIME_PROFILES if profile.regime_id in matched_ids]
 
 
 def _resolve_regime(query: str) -> tuple[RegimeProfile | None, bool, bool]:
@@ -862,929 +1102,1905 @@ def _regime_scope_message(active_regime: RegimeProfile | None = None) -> str:
     )
 
 
-def _is_vies_query(query: str) -> bool:
-    q = _normalize_tax_query(query)
+VIES_EU_TERMS = _keyword_set("intracomunit", "unione europea", "ue")
+VIES_REGISTRATION_TERMS = _keyword_set("iscrizion", "obbligator", "quando serve", "a cosa serve")
+
+
+@_query_predicate
+def _is_vies_query(query: QueryFeatures) -> bool:
+    q = query.text
     return (
         "vies" in q
         or (
-            any(term in q for term in ("intracomunit", "unione europea", "ue"))
-            and any(term in q for term in ("iscrizion", "obbligator", "quando serve", "a cosa serve"))
+            _any_term(query, VIES_EU_TERMS)
+            and _any_term(query, VIES_REGISTRATION_TERMS)
         )
     )
 
 
-def _is_bollo_query(query: str) -> bool:
-    q = _normalize_tax_query(query)
+BOLLO_ESTERO_TERMS = _keyword_set("estera", "estere", "estero", "extra-ue", "extra ue", "ue")
+BOLLO_THRESHOLD_TERMS = _keyword_set("77,47", "77.47", "2 euro", "2,00")
+
+
+@_query_predicate
+def _is_bollo_query(query: QueryFeatures) -> bool:
+    q = query.text
     has_bollo = "bollo" in q
-    has_estero = any(term in q for term in ("estera", "estere", "estero", "extra-ue", "extra ue", "ue"))
-    has_threshold = any(term in q for term in ("77,47", "77.47", "2 euro", "2,00"))
+    has_estero = _any_term(query, BOLLO_ESTERO_TERMS)
+    has_threshold = _any_term(query, BOLLO_THRESHOLD_TERMS)
     return has_bollo and (has_estero or has_threshold)
 
 
-def _is_eu_b2b_services_query(query: str) -> bool:
-    q = _normalize_tax_query(query)
+EU_B2B_SERVICES_EU_CONTEXT_TERMS = _keyword_set(
+    "b2b",
+    "cliente ue",
+    "unione europea",
+    "intracomunit",
+    "verso ue",
+    "nell'ue",
+    "in ue",
+)
+INVOICE_INTENT_TERMS = _keyword_set("fattur", "dicitura", "iva", "come", "vendita")
+
+
+@_query_predicate
+def _is_eu_b2b_services_query(query: QueryFeatures) -> bool:
+    q = query.text
     if "b2c" in q:
         return False
     has_service = "serviz" in q or "b2b" in q
-    has_eu_context = any(
-        term in q
-        for term in (
-            "b2b",
-            "cliente ue",
-            "unione europea",
-            "intracomunit",
-            "verso ue",
-            "nell'ue",
-            "in ue",
-        )
-    )
-    has_invoice_intent = any(term in q for term in ("fattur", "dicitura", "iva", "come", "vendita"))
+    has_eu_context = _any_term(query, EU_B2B_SERVICES_EU_CONTEXT_TERMS)
+    has_invoice_intent = _any_term(query, INVOICE_INTENT_TERMS)
     return has_service and has_eu_context and has_invoice_intent
 
 
-def _is_extra_ue_services_query(query: str) -> bool:
-    q = _normalize_tax_query(query)
+EXTRA_UE_SERVICES_EXTRA_CONTEXT_TERMS = _keyword_set(
+    "extra-ue",
+    "extra ue",
+    "usa",
+    "fuori ue",
+    "cliente estero",
+    "verso estero",
+)
+
+
+@_query_predicate
+def _is_extra_ue_services_query(query: QueryFeatures) -> bool:
+    q = query.text
     has_service = "serviz" in q
-    has_extra_context = any(
-        term in q
-        for term in (
-            "extra-ue",
-            "extra ue",
-            "usa",
-            "fuori ue",
-            "cliente estero",
-            "verso estero",
-        )
-    )
-    has_invoice_intent = any(term in q for term in ("fattur", "dicitura", "iva", "come", "vendita"))
+    has_extra_context = _any_term(query, EXTRA_UE_SERVICES_EXTRA_CONTEXT_TERMS)
+    has_invoice_intent = _any_term(query, INVOICE_INTENT_TERMS)
     return has_service and has_extra_context and has_invoice_intent
 
 
-def _is_eu_b2c_services_query(query: str) -> bool:
-    q = _normalize_tax_query(query)
+EU_B2C_SERVICES_B2C_CONTEXT_TERMS = _keyword_set("b2c", "cliente privato ue", "privato ue", "consumatore ue")
+
+
+@_query_predicate
+def _is_eu_b2c_services_query(query: QueryFeatures) -> bool:
+    q = query.text
     has_service = "serviz" in q
-    has_b2c_context = any(
-        term in q
-        for term in (
-            "b2c",
-            "cliente privato ue",
-            "privato ue",
-            "consumatore ue",
-        )
-    )
-    has_invoice_intent = any(term in q for term in ("fattur", "dicitura", "iva", "come", "vendita"))
+    has_b2c_context = _any_term(query, EU_B2C_SERVICES_B2C_CONTEXT_TERMS)
+    has_invoice_intent = _any_term(query, INVOICE_INTENT_TERMS)
     return has_service and has_b2c_context and has_invoice_intent
 
 
-def _is_forfettario_exit_100k_query(query: str) -> bool:
-    q = _normalize_tax_query(query)
-    has_threshold = any(term in q for term in ("100.000", "100000", "100k"))
-    has_exit_intent = any(term in q for term in ("esco", "uscita", "subito", "anno dopo", "quando"))
+FORFETTARIO_EXIT_100K_THRESHOLD_TERMS = _keyword_set("100.000", "100000", "100k")
+FORFETTARIO_EXIT_100K_EXIT_INTENT_TERMS = _keyword_set("esco", "uscita", "subito", "anno dopo", "quando")
+
+
+@_query_predicate
+def _is_forfettario_exit_100k_query(query: QueryFeatures) -> bool:
+    has_threshold = _any_term(query, FORFETTARIO_EXIT_100K_THRESHOLD_TERMS)
+    has_exit_intent = _any_term(query, FORFETTARIO_EXIT_100K_EXIT_INTENT_TERMS)
     return has_threshold and has_exit_intent
 
 
-def _is_cash_basis_threshold_query(query: str) -> bool:
-    q = _normalize_tax_query(query)
-    has_cash_terms = any(
-        term in q for term in ("fatturato", "incassato", "incassi", "criterio di cassa")
-    )
-    has_threshold_terms = any(
-        term in q for term in ("soglie", "soglia", "limite", "ricavi", "compensi")
-    )
+CASH_BASIS_THRESHOLD_CASH_TERMS = _keyword_set("fatturato", "incassato", "incassi", "criterio di cassa")
+CASH_BASIS_THRESHOLD_TERMS = _keyword_set("soglie", "soglia", "limite", "ricavi", "compensi")
+
+
+@_query_predicate
+def _is_cash_basis_threshold_query(query: QueryFeatures) -> bool:
+    has_cash_terms = _any_term(query, CASH_BASIS_THRESHOLD_CASH_TERMS)
+    has_threshold_terms = _any_term(query, CASH_BASIS_THRESHOLD_TERMS)
     return has_cash_terms and has_threshold_terms
 
 
-def _is_aliquota_5_query(query: str) -> bool:
-    q = _normalize_tax_query(query)
-    has_aliquota = any(term in q for term in ("aliquota", "imposta sostitutiva")) or _contains_percent_reference(q, "5")
+ALIQUOTA_5_WHEN_TERMS = _keyword_set("quando", "applica", "si applica")
+ALIQUOTA_5_ALIQUOTA_TERMS = _keyword_set("aliquota", "imposta sostitutiva")
+
+
+@_query_predicate
+def _is_aliquota_5_query(query: QueryFeatures) -> bool:
+    q = query.text
+    has_aliquota = _any_term(query, ALIQUOTA_5_ALIQUOTA_TERMS) or _contains_percent_reference(q, "5")
     has_five = _contains_percent_reference(q, "5") or "5 per cento" in q
-    has_when = any(term in q for term in ("quando", "applica", "si applica"))
+    has_when = _any_term(query, ALIQUOTA_5_WHEN_TERMS)
     return has_aliquota and has_five and has_when
 
 
-def _is_ads_reverse_charge_query(query: str) -> bool:
-    q = _normalize_tax_query(query)
-    has_ads = any(term in q for term in ("google ads", "facebook ads", "meta ads"))
-    has_reverse_context = any(term in q for term in ("td17", "reverse", "iva", "autofattura"))
+ADS_REVERSE_CHARGE_ADS_TERMS = _keyword_set("google ads", "facebook ads", "meta ads")
+ADS_REVERSE_CHARGE_REVERSE_CONTEXT_TERMS = _keyword_set("td17", "reverse", "iva", "autofattura")
+
+
+@_query_predicate
+def _is_ads_reverse_charge_query(query: QueryFeatures) -> bool:
+    has_ads = _any_term(query, ADS_REVERSE_CHARGE_ADS_TERMS)
+    has_reverse_context = _any_term(query, ADS_REVERSE_CHARGE_REVERSE_CONTEXT_TERMS)
     return has_ads and has_reverse_context
 
 
-def _is_intrastat_query(query: str) -> bool:
-    q = _normalize_tax_query(query)
+@_query_predicate
+def _is_intrastat_query(query: QueryFeatures) -> bool:
+    q = query.text
     return "intrastat" in q
 
 
-def _is_extra_ue_wording_query(query: str) -> bool:
-    q = _normalize_tax_query(query)
-    has_extra_context = any(term in q for term in ("extra-ue", "extra ue", "fuori ue"))
-    has_wording_intent = any(term in q for term in ("dicitura", "artt. 7", "7-septies", "articoli 7"))
+EXTRA_UE_WORDING_EXTRA_CONTEXT_TERMS = _keyword_set("extra-ue", "extra ue", "fuori ue")
+EXTRA_UE_WORDING_INTENT_TERMS = _keyword_set("dicitura", "artt. 7", "7-septies", "articoli 7")
+
+
+@_query_predicate
+def _is_extra_ue_wording_query(query: QueryFeatures) -> bool:
+    has_extra_context = _any_term(query, EXTRA_UE_WORDING_EXTRA_CONTEXT_TERMS)
+    has_wording_intent = _any_term(query, EXTRA_UE_WORDING_INTENT_TERMS)
     return has_extra_context and has_wording_intent
 
 
-def _is_bollo_exact_threshold_query(query: str) -> bool:
-    q = _normalize_tax_query(query)
+BOLLO_EXACT_THRESHOLD_EXACT_INTENT_TERMS = _keyword_set("esatt", "uguale", "pari a", "preciso")
+
+
+@_query_predicate
+def _is_bollo_exact_threshold_query(query: QueryFeatures) -> bool:
+    q = query.text
     has_threshold = "77,47" in q or "77.47" in q
-    has_exact_intent = any(term in q for term in ("esatt", "uguale", "pari a", "preciso"))
+    has_exact_intent = _any_term(query, BOLLO_EXACT_THRESHOLD_EXACT_INTENT_TERMS)
     has_bollo = "bollo" in q
     return has_bollo and has_threshold and has_exact_intent
 
 
-def _is_employment_income_threshold_query(query: str) -> bool:
-    q = _normalize_tax_query(query)
-    has_employment_context = any(
-        term in q
-        for term in (
-            "lavoro dipendente",
-            "reddito da lavoro dipendente",
-            "redditi da lavoro dipendente",
-            "reddito dipendente",
-            "come dipendente",
-            "sono dipendente",
-            "faccio il dipendente",
-        )
-    )
-    has_threshold_or_access_intent = any(
-        term in q
-        for term in (
-            "30.000",
-            "30000",
-            "trentamila",
-            "posso stare",
-            "posso rimanere",
-            "accesso",
-            "forfettario",
-        )
-    )
+EMPLOYMENT_INCOME_THRESHOLD_EMPLOYMENT_CONTEXT_TERMS = _keyword_set(
+    "lavoro dipendente",
+    "reddito da lavoro dipendente",
+    "redditi da lavoro dipendente",
+    "reddito dipendente",
+    "come dipendente",
+    "sono dipendente",
+    "faccio il dipendente",
+)
+EMPLOYMENT_INCOME_THRESHOLD_OR_ACCESS_INTENT_TERMS = _keyword_set(
+    "30.000",
+    "30000",
+    "trentamila",
+    "posso stare",
+    "posso rimanere",
+    "accesso",
+    "forfettario",
+)
+
+
+@_query_predicate
+def _is_employment_income_threshold_query(query: QueryFeatures) -> bool:
+    has_employment_context = _any_term(query, EMPLOYMENT_INCOME_THRESHOLD_EMPLOYMENT_CONTEXT_TERMS)
+    has_threshold_or_access_intent = _any_term(query, EMPLOYMENT_INCOME_THRESHOLD_OR_ACCESS_INTENT_TERMS)
     return has_employment_context and has_threshold_or_access_intent
 
 
-def _is_employment_income_under_threshold_query(query: str) -> bool:
-    q = _normalize_tax_query(query)
-    has_employment_context = any(
-        term in q
-        for term in (
-            "lavoro dipendente",
-            "reddito da lavoro dipendente",
-            "redditi da lavoro dipendente",
-            "reddito dipendente",
-            "dipendente",
-        )
-    )
-    has_under_threshold = any(
-        term in q
-        for term in (
-            "29.000",
-            "29000",
-            "29mila",
-            "sotto 30.000",
-            "inferiore a 30.000",
-        )
-    )
-    has_access_intent = any(term in q for term in ("posso", "restare", "forfettario"))
+EMPLOYMENT_INCOME_UNDER_THRESHOLD_EMPLOYMENT_CONTEXT_TERMS = _keyword_set(
+    "lavoro dipendente",
+    "reddito da lavoro dipendente",
+    "redditi da lavoro dipendente",
+    "reddito dipendente",
+    "dipendente",
+)
+EMPLOYMENT_INCOME_UNDER_THRESHOLD_TERMS = _keyword_set(
+    "29.000",
+    "29000",
+    "29mila",
+    "sotto 30.000",
+    "inferiore a 30.000",
+)
+EMPLOYMENT_INCOME_UNDER_THRESHOLD_ACCESS_INTENT_TERMS = _keyword_set("posso", "restare", "forfettario")
+
+
+@_query_predicate
+def _is_employment_income_under_threshold_query(query: QueryFeatures) -> bool:
+    has_employment_context = _any_term(query, EMPLOYMENT_INCOME_UNDER_THRESHOLD_EMPLOYMENT_CONTEXT_TERMS)
+    has_under_threshold = _any_term(query, EMPLOYMENT_INCOME_UNDER_THRESHOLD_TERMS)
+    has_access_intent = _any_term(query, EMPLOYMENT_INCOME_UNDER_THRESHOLD_ACCESS_INTENT_TERMS)
     return has_employment_context and has_access_intent and has_under_threshold
 
 
-def _is_employment_cessation_query(query: str) -> bool:
-    q = _normalize_tax_query(query)
+EMPLOYMENT_CESSATION_EMPLOYMENT_CONTEXT_TERMS = _keyword_set(
+    "rapporto di lavoro",
+    "lavoro dipendente",
+    "dipendente",
+)
+EMPLOYMENT_CESSATION_EFFECT_INTENT_TERMS = _keyword_set("cambia", "rileva", "forfettario", "soglia", "conta")
+
+
+@_query_predicate
+def _is_employment_cessation_query(query: QueryFeatures) -> bool:
+    q = query.text
     has_cessation = "cessat" in q
-    has_employment_context = any(
-        term in q for term in ("rapporto di lavoro", "lavoro dipendente", "dipendente")
-    )
-    has_effect_intent = any(term in q for term in ("cambia", "rileva", "forfettario", "soglia", "conta"))
+    has_employment_context = _any_term(query, EMPLOYMENT_CESSATION_EMPLOYMENT_CONTEXT_TERMS)
+    has_effect_intent = _any_term(query, EMPLOYMENT_CESSATION_EFFECT_INTENT_TERMS)
     return has_cessation and has_employment_context and has_effect_intent
 
 
-def _is_inps_35_general_query(query: str) -> bool:
-    q = _normalize_tax_query(query)
-    strong_terms = (
-        "riduzione contributiva",
-        "riduzione inps",
-        "riduzione del 35",
-        "riduzione 35",
-        "sconto del 35",
-        "sconto inps",
-    )
-    follow_up_terms = (
-        "domanda",
-        "presentata",
-        "entro quando",
-        "decorre",
-        "rinnova",
-        "rinnovo",
-        "automatic",
-        "pensione",
-        "rinuncio",
-        "rinuncia",
-        "agevolazione",
-        "si perde",
-        "nuove attività",
-        "richiederla",
-        "di nuovo",
-        "riattiv",
-        "chi può",
-        "vale anche",
-    )
-    context_anchor_terms = (
-        "inps",
-        "riduzione contributiva",
-        "riduzione",
-        "35%",
-        "contribut",
-        "agevolazione",
-        "artigiani",
-        "commercianti",
-        "rinnova",
-        "rinuncio",
-        "richiederla",
-    )
-    if any(term in q for term in strong_terms):
+INPS_35_GENERAL_STRONG_TERMS = _keyword_set(
+    "riduzione contributiva",
+    "riduzione inps",
+    "riduzione del 35",
+    "riduzione 35",
+    "sconto del 35",
+    "sconto inps",
+)
+INPS_35_GENERAL_OTHER_TOPIC_TERMS = _keyword_set(
+    "ateco", "vies", "intrastat", "bollo", "extra-ue", "reverse", "td17"
+)
+INPS_35_GENERAL_FOLLOW_UP_TERMS = _keyword_set(
+    "domanda",
+    "presentata",
+    "entro quando",
+    "decorre",
+    "rinnova",
+    "rinnovo",
+    "automatic",
+    "pensione",
+    "rinuncio",
+    "rinuncia",
+    "agevolazione",
+    "si perde",
+    "nuove attività",
+    "richiederla",
+    "di nuovo",
+    "riattiv",
+    "chi può",
+    "vale anche",
+)
+INPS_35_GENERAL_CONTEXT_ANCHOR_TERMS = _keyword_set(
+    "inps",
+    "riduzione contributiva",
+    "riduzione",
+    "35%",
+    "contribut",
+    "agevolazione",
+    "artigiani",
+    "commercianti",
+    "rinnova",
+    "rinuncio",
+    "richiederla",
+)
+
+
+@_query_predicate
+def _is_inps_35_general_query(query: QueryFeatures) -> bool:
+    q = query.text
+    if _any_term(query, INPS_35_GENERAL_STRONG_TERMS):
         return True
     if _contains_percent_reference(q, "35"):
         return True
-    if any(term in q for term in ("ateco", "vies", "intrastat", "bollo", "extra-ue", "reverse", "td17")):
+    if _any_term(query, INPS_35_GENERAL_OTHER_TOPIC_TERMS):
         return False
-    return any(term in q for term in follow_up_terms) and any(
-        term in q for term in context_anchor_terms
+    return _any_term(query, INPS_35_GENERAL_FOLLOW_UP_TERMS) and _any_term(
+        query, INPS_35_GENERAL_CONTEXT_ANCHOR_TERMS
     )
 
 
-def _is_forfettario_domain_query(query: str) -> bool:
-    q = _normalize_tax_query(query)
-    domain_terms = (
-        "forfett",
-        "regime",
-        "ateco",
-        "iva",
-        "inps",
-        "contribut",
-        "fattur",
-        "bollo",
-        "vies",
-        "reverse charge",
-        "inversione contabile",
-        "intrastat",
-        "b2b",
-        "b2c",
-        "extra-ue",
-        "extra ue",
-        "intracomunit",
-        "cliente ue",
-        "cliente estero",
-        "vendita servizi",
-        "dicitura",
-        "ricavi",
-        "compensi",
-        "imposta",
-        "aliquota",
-        "sostitutiva",
-        "soglia",
-        "limite",
-        "quadro lm",
-        "artigiani",
-        "commercianti",
-        "partita iva",
-        "scadenz",
-        "acconto",
-        "saldo",
-        "cause ostative",
-        "lavoro dipendente",
-        "srl",
-        "societa",
-        "società",
-        "partecipazioni",
-        "controllo",
-        "ex datore",
-        "riduzione",
-        "35%",
-        "domanda",
-        "decorre",
-        "rinnova",
-        "rinuncio",
-        "rinuncia",
-        "richiederla",
-        "riattiv",
-        "pensione",
-        "gestione separata",
-        "cassa professionale",
-        "google ads",
-        "facebook ads",
-        "td17",
-        "100k",
-        "100.000",
-        "100000",
-        "uscita",
-        "esco",
-        "presentata",
-        "detraz",
-        "dedu",
-        "figli a carico",
-        "asilo nido",
-        "bene strumentale",
-        "beni strumentali",
-        "plusvalenza",
-        "rimborso",
-        "730",
-        "modello 730",
-        "naspi",
-        "residenza",
-        "regimi speciali",
-        "agricoltura",
-        "editoria",
-        "cassa professionale",
-        "cassa forense",
-        "inarcassa",
-        "contributo integrativo",
-    )
-    return any(term in q for term in domain_terms)
-
-
-def _is_inps_35_deadline_query(query: str) -> bool:
-    q = _normalize_tax_query(query)
-    has_inps_context = _has_inps_35_context(q)
-    has_deadline_intent = any(
-        term in q
-        for term in (
-            "scadenz",
-            "entro quando",
-            "termine",
-            "quando va presentata",
-            "presentazione",
-        )
-    )
+FORFETTARIO_DOMAIN_TERMS = _keyword_set(
+    "forfett",
+    "regime",
+    "ateco",
+    "iva",
+    "inps",
+    "contribut",
+    "fattur",
+    "bollo",
+    "vies",
+    "reverse charge",
+    "inversione contabile",
+    "intrastat",
+    "b2b",
+    "b2c",
+    "extra-ue",
+    "extra ue",
+    "intracomunit",
+    "cliente ue",
+    "cliente estero",
+    "vendita servizi",
+    "dicitura",
+    "ricavi",
+    "compensi",
+    "imposta",
+    "aliquota",
+    "sostitutiva",
+    "soglia",
+    "limite",
+    "quadro lm",
+    "artigiani",
+    "commercianti",
+    "partita iva",
+    "scadenz",
+    "acconto",
+    "saldo",
+    "cause ostative",
+    "lavoro dipendente",
+    "srl",
+    "societa",
+    "società",
+    "partecipazioni",
+    "controllo",
+    "ex datore",
+    "riduzione",
+    "35%",
+    "domanda",
+    "decorre",
+    "rinnova",
+    "rinuncio",
+    "rinuncia",
+    "richiederla",
+    "riattiv",
+    "pensione",
+    "gestione separata",
+    "cassa professionale",
+    "google ads",
+    "facebook ads",
+    "td17",
+    "100k",
+    "100.000",
+    "100000",
+    "uscita",
+    "esco",
+    "presentata",
+    "detraz",
+    "dedu",
+    "figli a carico",
+    "asilo nido",
+    "bene strumentale",
+    "beni strumentali",
+    "plusvalenza",
+    "rimborso",
+    "730",
+    "modello 730",
+    "naspi",
+    "residenza",
+    "regimi speciali",
+    "agricoltura",
+    "editoria",
+    "cassa professionale",
+    "cassa forense",
+    "inarcassa",
+    "contributo integrativo",
+)
+
+
+@_query_predicate
+def _is_forfettario_domain_query(query: QueryFeatures) -> bool:
+    return _any_term(query, FORFETTARIO_DOMAIN_TERMS)
+
+
+INPS_35_DEADLINE_INTENT_TERMS = _keyword_set(
+    "scadenz",
+    "entro quando",
+    "termine",
+    "quando va presentata",
+    "presentazione",
+)
+
+
+@_query_predicate
+def _is_inps_35_deadline_query(query: QueryFeatures) -> bool:
+    has_inps_context = _has_inps_35_context(query)
+    has_deadline_intent = _any_term(query, INPS_35_DEADLINE_INTENT_TERMS)
     return has_inps_context and has_deadline_intent
 
 
-def _is_inps_35_short_deadline_query(query: str) -> bool:
-    q = _normalize_tax_query(query)
-    has_inps_context = _has_inps_35_context(q)
-    has_deadline_intent = any(
-        term in q
-        for term in (
-            "entro quando",
-            "scadenza",
-            "quando va presentata",
-            "termine",
-        )
-    )
-    generic_follow_up = not _has_non_inps_domain_context(q)
+INPS_35_SHORT_DEADLINE_INTENT_TERMS = _keyword_set(
+    "entro quando",
+    "scadenza",
+    "quando va presentata",
+    "termine",
+)
+
+
+@_query_predicate
+def _is_inps_35_short_deadline_query(query: QueryFeatures) -> bool:
+    q = query.text
+    has_inps_context = _has_inps_35_context(query)
+    has_deadline_intent = _any_term(query, INPS_35_SHORT_DEADLINE_INTENT_TERMS)
+    generic_follow_up = not _has_non_inps_domain_context(query)
     return has_deadline_intent and "domanda" in q and (has_inps_context or generic_follow_up)
 
 
-def _is_inps_35_march_decorrenza_query(query: str) -> bool:
-    q = _normalize_tax_query(query)
-    has_march_example = "10 marzo" in q or ("marzo" in q and any(term in q for term in ("domanda", "invio", "invi")))
-    has_decorrenza_intent = any(
-        term in q
-        for term in (
-            "decorre",
-            "da quando",
-            "quando decorre",
-            "decorrenza",
-        )
+INPS_35_MARCH_DECORRENZA_INTENT_TERMS = _keyword_set("decorre", "da quando", "quando decorre", "decorrenza")
+INPS_35_MARCH_DECORRENZA_EXAMPLE_TERMS = _keyword_set("domanda", "invio", "invi")
+
+
+@_query_predicate
+def _is_inps_35_march_decorrenza_query(query: QueryFeatures) -> bool:
+    q = query.text
+    has_march_example = "10 marzo" in q or (
+        "marzo" in q and _any_term(query, INPS_35_MARCH_DECORRENZA_EXAMPLE_TERMS)
     )
-    generic_follow_up = not _has_non_inps_domain_context(q)
+    has_decorrenza_intent = _any_term(query, INPS_35_MARCH_DECORRENZA_INTENT_TERMS)
+    generic_follow_up = not _has_non_inps_domain_context(query)
     return has_march_example and has_decorrenza_intent and (
-        _has_inps_35_context(q) or generic_follow_up
+        _has_inps_35_context(query) or generic_follow_up
     )
 
 
-def _is_inps_35_reapply_query(query: str) -> bool:
-    q = _normalize_tax_query(query)
-    has_renounce = any(
-        term in q
-        for term in (
-            "rinuncio",
-            "rinuncia",
-            "rinunciare",
-            "rinunci",
-            "revoca",
-        )
-    )
-    has_reapply = any(
-        term in q
-        for term in (
-            "richiederla",
-            "richiedere di nuovo",
-            "nuova domanda",
-            "di nuovo",
-            "riattiv",
-        )
-    )
+INPS_35_REAPPLY_RENOUNCE_TERMS = _keyword_set("rinuncio", "rinuncia", "rinunciare", "rinunci", "revoca")
+INPS_35_REAPPLY_TERMS = _keyword_set(
+    "richiederla",
+    "richiedere di nuovo",
+    "nuova domanda",
+    "di nuovo",
+    "riattiv",
+)
+
+
+@_query_predicate
+def _is_inps_35_reapply_query(query: QueryFeatures) -> bool:
+    has_renounce = _any_term(query, INPS_35_REAPPLY_RENOUNCE_TERMS)
+    has_reapply = _any_term(query, INPS_35_REAPPLY_TERMS)
     return has_renounce and has_reapply
 
 
-def _is_inps_35_renewal_query(query: str) -> bool:
-    q = _normalize_tax_query(query)
-    has_inps_35_context = _has_inps_35_context(q)
+@_query_predicate
+def _is_inps_35_renewal_query(query: QueryFeatures) -> bool:
+    q = query.text
+    has_inps_35_context = _has_inps_35_context(query)
     has_renewal_intent = "rinnova" in q or "rinnovo" in q
     has_auto_intent = "automatic" in q or "ogni anno" in q
     return has_inps_35_context and has_renewal_intent and has_auto_intent
 
 
-def _is_inps_35_cassa_query(query: str) -> bool:
-    q = _normalize_tax_query(query)
-    has_35 = _contains_percent_reference(q, "35") or any(
-        term in q for term in ("riduzione inps", "riduzione contributiva", "sconto inps", "sconto del 35")
-    )
+INPS_35_CASSA_REDUCTION_TERMS = _keyword_set(
+    "riduzione inps",
+    "riduzione contributiva",
+    "sconto inps",
+    "sconto del 35",
+)
+
+
+@_query_predicate
+def _is_inps_35_cassa_query(query: QueryFeatures) -> bool:
+    q = query.text
+    has_35 = _contains_percent_reference(q, "35") or _any_term(query, INPS_35_CASSA_REDUCTION_TERMS)
     has_cassa = "cassa" in q or "professionist" in q
     return has_35 and has_cassa
 
 
-def _is_srl_control_query(query: str) -> bool:
-    q = _normalize_tax_query(query)
+SRL_CONTROL_TERMS = _keyword_set("controllo", "2359", "controllo di fatto")
+SRL_CONTROL_FORFETTARIO_INTENT_TERMS = _keyword_set(
+    "forfett",
+    "posso restare",
+    "posso accedere",
+    "causa ostativa",
+    "restare",
+    "accedere",
+)
+
+
+@_query_predicate
+def _is_srl_control_query(query: QueryFeatures) -> bool:
+    q = query.text
     has_srl = "srl" in q or "societa" in q or "società" in q
-    has_control = any(term in q for term in ("controllo", "2359", "controllo di fatto"))
-    has_forfettario_intent = any(
-        term in q
-        for term in (
-            "forfett",
-            "posso restare",
-            "posso accedere",
-            "causa ostativa",
-            "restare",
-            "accedere",
-        )
-    )
+    has_control = _any_term(query, SRL_CONTROL_TERMS)
+    has_forfettario_intent = _any_term(query, SRL_CONTROL_FORFETTARIO_INTENT_TERMS)
     return has_srl and has_control and has_forfettario_intent
 
 
-def _is_inps_35_new_activity_query(query: str) -> bool:
-    q = _normalize_tax_query(query)
-    has_new_activity = any(
-        term in q
-        for term in (
-            "nuove attivita",
-            "nuove attività",
-            "nuova attivita",
-            "nuova attività",
-            "appena aperto",
-            "inizio attivita",
-            "inizio attività",
-        )
-    )
-    has_request_intent = any(
-        term in q
-        for term in ("domanda", "richiesta", "quando va fatta", "quando chiedo", "quando la chiedo", "quando richiedo")
-    )
-    generic_follow_up = not _has_non_inps_domain_context(q)
-    return has_new_activity and has_request_intent and (
-        _has_inps_35_context(q) or generic_follow_up
-    )
+INPS_35_NEW_ACTIVITY_TERMS = _keyword_set(
+    "nuove attivita",
+    "nuove attività",
+    "nuova attivita",
+    "nuova attività",
+    "appena aperto",
+    "inizio attivita",
+    "inizio attività",
+)
+INPS_35_NEW_ACTIVITY_REQUEST_INTENT_TERMS = _keyword_set(
+    "domanda",
+    "richiesta",
+    "quando va fatta",
+    "quando chiedo",
+    "quando la chiedo",
+    "quando richiedo",
+)
 
 
-def _is_inps_35_apply_query(query: str) -> bool:
-    q = _normalize_tax_query(query)
-    has_apply_intent = any(
-        term in q
-        for term in (
-            "come si presenta",
-            "come present",
-            "come fare domanda",
-            "dove si presenta",
-            "dove fare domanda",
-        )
-    )
-    generic_follow_up = "domanda" in q and not _has_non_inps_domain_context(q)
-    return has_apply_intent and (_has_inps_35_context(q) or generic_follow_up)
-
-
-def _is_inps_35_late_deadline_query(query: str) -> bool:
-    q = _normalize_tax_query(query)
-    has_late_deadline = any(
-        term in q
-        for term in (
-            "dopo il 28 febbraio",
-            "dopo 28 febbraio",
-            "oltre il 28 febbraio",
-            "oltre 28 febbraio",
-        )
+@_query_predicate
+def _is_inps_35_new_activity_query(query: QueryFeatures) -> bool:
+    has_new_activity = _any_term(query, INPS_35_NEW_ACTIVITY_TERMS)
+    has_request_intent = _any_term(query, INPS_35_NEW_ACTIVITY_REQUEST_INTENT_TERMS)
+    generic_follow_up = not _has_non_inps_domain_context(query)
+    return has_new_activity and has_request_intent and (
+        _has_inps_35_context(query) or generic_follow_up
     )
+
+
+INPS_35_APPLY_INTENT_TERMS = _keyword_set(
+    "come si presenta",
+    "come present",
+    "come fare domanda",
+    "dove si presenta",
+    "dove fare domanda",
+)
+
+
+@_query_predicate
+def _is_inps_35_apply_query(query: QueryFeatures) -> bool:
+    q = query.text
+    has_apply_intent = _any_term(query, INPS_35_APPLY_INTENT_TERMS)
+    generic_follow_up = "domanda" in q and not _has_non_inps_domain_context(query)
+    return has_apply_intent and (_has_inps_35_context(query) or generic_follow_up)
+
+
+INPS_35_LATE_DEADLINE_TERMS = _keyword_set(
+    "dopo il 28 febbraio",
+    "dopo 28 febbraio",
+    "oltre il 28 febbraio",
+    "oltre 28 febbraio",
+)
+
+
+@_query_predicate
+def _is_inps_35_late_deadline_query(query: QueryFeatures) -> bool:
+    q = query.text
+    has_late_deadline = _any_term(query, INPS_35_LATE_DEADLINE_TERMS)
     return has_late_deadline and "domanda" in q and (
-        _has_inps_35_context(q) or not _has_non_inps_domain_context(q)
+        _has_inps_35_context(query) or not _has_non_inps_domain_context(query)
     )
 
 
-def _is_inps_35_loss_query(query: str) -> bool:
-    q = _normalize_tax_query(query)
-    has_loss_intent = any(
-        term in q for term in ("si perde", "quando si perde", "perdo", "perdita")
-    )
-    return _has_inps_35_context(q) and has_loss_intent
+INPS_35_LOSS_INTENT_TERMS = _keyword_set("si perde", "quando si perde", "perdo", "perdita")
+
+
+@_query_predicate
+def _is_inps_35_loss_query(query: QueryFeatures) -> bool:
+    has_loss_intent = _any_term(query, INPS_35_LOSS_INTENT_TERMS)
+    return _has_inps_35_context(query) and has_loss_intent
 
 
-def _is_ex_datore_query(query: str) -> bool:
-    q = _normalize_tax_query(query)
+EX_DATORE_OSTATIVA_TERMS = _keyword_set("causa ostativa", "ostativo", "forfettario")
+
+
+@_query_predicate
+def _is_ex_datore_query(query: QueryFeatures) -> bool:
+    q = query.text
     has_ex_datore = "ex datore" in q or "datore di lavoro" in q
-    has_ostativa = any(term in q for term in ("causa ostativa", "ostativo", "forfettario"))
+    has_ostativa = _any_term(query, EX_DATORE_OSTATIVA_TERMS)
     return has_ex_datore and has_ostativa
 
 
-def _is_ex_datore_after_two_years_query(query: str) -> bool:
-    q = _normalize_tax_query(query)
-    has_ex_datore = _is_ex_datore_query(q)
-    has_time_reference = any(
-        term in q
-        for term in (
-            "3 anni",
-            "tre anni",
-            "oltre due anni",
-            "piu di due anni",
-            "più di due anni",
-        )
-    )
+EX_DATORE_AFTER_TWO_YEARS_TIME_REFERENCE_TERMS = _keyword_set(
+    "3 anni",
+    "tre anni",
+    "oltre due anni",
+    "piu di due anni",
+    "più di due anni",
+)
+
+
+@_query_predicate
+def _is_ex_datore_after_two_years_query(query: QueryFeatures) -> bool:
+    has_ex_datore = _is_ex_datore_query(query)
+    has_time_reference = _any_term(query, EX_DATORE_AFTER_TWO_YEARS_TIME_REFERENCE_TERMS)
     return has_ex_datore and has_time_reference
 
 
-def _is_business_meal_cost_query(query: str) -> bool:
-    q = _normalize_tax_query(query)
-    has_meal_context = any(
-        term in q
-        for term in (
-            "cena",
-            "pranzo",
-            "ristorante",
-            "cliente a cena",
-            "portato un cliente",
-        )
-    )
-    has_tax_intent = any(
-        term in q
-        for term in (
-            "scaricare l'iva",
-            "scaricare iva",
-            "scaricare l iva",
-            "dedurre",
-            "deduc",
-            "abbassare le tasse",
-            "15%",
-        )
-    )
+BUSINESS_MEAL_COST_MEAL_CONTEXT_TERMS = _keyword_set(
+    "cena",
+    "pranzo",
+    "ristorante",
+    "cliente a cena",
+    "portato un cliente",
+)
+BUSINESS_MEAL_COST_TAX_INTENT_TERMS = _keyword_set(
+    "scaricare l'iva",
+    "scaricare iva",
+    "scaricare l iva",
+    "dedurre",
+    "deduc",
+    "abbassare le tasse",
+    "15%",
+)
+
+
+@_query_predicate
+def _is_business_meal_cost_query(query: QueryFeatures) -> bool:
+    has_meal_context = _any_term(query, BUSINESS_MEAL_COST_MEAL_CONTEXT_TERMS)
+    has_tax_intent = _any_term(query, BUSINESS_MEAL_COST_TAX_INTENT_TERMS)
     return has_meal_context and has_tax_intent
 
 
-def _is_employee_above_threshold_access_query(query: str) -> bool:
-    q = _normalize_tax_query(query)
-    has_employee_context = any(
-        term in q
-        for term in (
-            "dipendente",
-            "lavoro come dipendente",
-            "lavoro dipendente",
-            "reddito da lavoro dipendente",
-        )
-    )
-    has_threshold = any(term in q for term in ("32.000", "32000", "30.000", "30000"))
-    has_access_intent = any(
-        term in q
-        for term in (
-            "aprire la partita iva",
-            "aprire p.iva",
-            "aprire partita iva",
-            "posso aprire",
-            "arrotondare",
-            "forfettari",
-            "forfettario",
-        )
-    )
+EMPLOYEE_ABOVE_THRESHOLD_ACCESS_EMPLOYEE_CONTEXT_TERMS = _keyword_set(
+    "dipendente",
+    "lavoro come dipendente",
+    "lavoro dipendente",
+    "reddito da lavoro dipendente",
+)
+EMPLOYEE_ABOVE_THRESHOLD_ACCESS_THRESHOLD_TERMS = _keyword_set("32.000", "32000", "30.000", "30000")
+EMPLOYEE_ABOVE_THRESHOLD_ACCESS_INTENT_TERMS = _keyword_set(
+    "aprire la partita iva",
+    "aprire p.iva",
+    "aprire partita iva",
+    "posso aprire",
+    "arrotondare",
+    "forfettari",
+    "forfettario",
+)
+
+
+@_query_predicate
+def _is_employee_above_threshold_access_query(query: QueryFeatures) -> bool:
+    has_employee_context = _any_term(query, EMPLOYEE_ABOVE_THRESHOLD_ACCESS_EMPLOYEE_CONTEXT_TERMS)
+    has_threshold = _any_term(query, EMPLOYEE_ABOVE_THRESHOLD_ACCESS_THRESHOLD_TERMS)
+    has_access_intent = _any_term(query, EMPLOYEE_ABOVE_THRESHOLD_ACCESS_INTENT_TERMS)
     return has_employee_context and has_threshold and has_access_intent
 
 
-def _is_ex_employer_prevalence_query(query: str) -> bool:
-    q = _normalize_tax_query(query)
-    has_previous_employer = any(
-        term in q
-        for term in (
-            "ex datore",
-            "datore di lavoro",
-            "ex azienda",
-            "mia ex azienda",
-            "mi sono licenziato",
-            "licenziato",
-        )
-    )
-    has_invoicing_intent = any(
-        term in q
-        for term in (
-            "fatturare tutto",
-            "fatturare",
-            "prevalent",
-            "tutto il mio lavoro",
-            "risparmio sulle tasse",
-        )
-    )
+EX_EMPLOYER_PREVALENCE_PREVIOUS_EMPLOYER_TERMS = _keyword_set(
+    "ex datore",
+    "datore di lavoro",
+    "ex azienda",
+    "mia ex azienda",
+    "mi sono licenziato",
+    "licenziato",
+)
+EX_EMPLOYER_PREVALENCE_INVOICING_INTENT_TERMS = _keyword_set(
+    "fatturare tutto",
+    "fatturare",
+    "prevalent",
+    "tutto il mio lavoro",
+    "risparmio sulle tasse",
+)
+
+
+@_query_predicate
+def _is_ex_employer_prevalence_query(query: QueryFeatures) -> bool:
+    has_previous_employer = _any_term(query, EX_EMPLOYER_PREVALENCE_PREVIOUS_EMPLOYER_TERMS)
+    has_invoicing_intent = _any_term(query, EX_EMPLOYER_PREVALENCE_INVOICING_INTENT_TERMS)
     return has_previous_employer and has_invoicing_intent
 
 
-def _is_strumental_asset_sale_query(query: str) -> bool:
-    q = _normalize_tax_query(query)
-    has_asset_context = any(
-        term in q
-        for term in (
-            "pc aziendale",
-            "vecchio pc",
-            "computer aziendale",
-            "bene strumentale",
-            "beni strumentali",
-        )
-    ) or ("venduto" in q and "pc" in q)
-    has_threshold_intent = any(
-        term in q
-        for term in (
-            "85.000",
-            "85000",
-            "85mila",
-            "limite annuale",
-            "limite dei ricavi",
-            "sommare",
-            "concorre",
-        )
-    )
+STRUMENTAL_ASSET_SALE_THRESHOLD_INTENT_TERMS = _keyword_set(
+    "85.000",
+    "85000",
+    "85mila",
+    "limite annuale",
+    "limite dei ricavi",
+    "sommare",
+    "concorre",
+)
+STRUMENTAL_ASSET_SALE_ASSET_CONTEXT_TERMS = _keyword_set(
+    "pc aziendale",
+    "vecchio pc",
+    "computer aziendale",
+    "bene strumentale",
+    "beni strumentali",
+)
+
+
+@_query_predicate
+def _is_strumental_asset_sale_query(query: QueryFeatures) -> bool:
+    q = query.text
+    has_asset_context = _any_term(query, STRUMENTAL_ASSET_SALE_ASSET_CONTEXT_TERMS) or ("venduto" in q and "pc" in q)
+    has_threshold_intent = _any_term(query, STRUMENTAL_ASSET_SALE_THRESHOLD_INTENT_TERMS)
     return has_asset_context and has_threshold_intent
 
 
-def _is_family_detraction_query(query: str) -> bool:
-    q = _normalize_tax_query(query)
-    has_family_context = any(
-        term in q
-        for term in (
-            "figli a carico",
-            "carico",
-            "asilo nido",
-            "spese d'istruzione",
-            "spese di istruzione",
-        )
-    )
-    has_detraction_intent = any(
-        term in q
-        for term in (
-            "19%",
-            "19 per cento",
-            "detraz",
-            "recuperare",
-            "tasse della mia partita iva",
-        )
-    )
+FAMILY_DETRACTION_FAMILY_CONTEXT_TERMS = _keyword_set(
+    "figli a carico",
+    "carico",
+    "asilo nido",
+    "spese d'istruzione",
+    "spese di istruzione",
+)
+FAMILY_DETRACTION_INTENT_TERMS = _keyword_set(
+    "19%",
+    "19 per cento",
+    "detraz",
+    "recuperare",
+    "tasse della mia partita iva",
+)
+
+
+@_query_predicate
+def _is_family_detraction_query(query: QueryFeatures) -> bool:
+    has_family_context = _any_term(query, FAMILY_DETRACTION_FAMILY_CONTEXT_TERMS)
+    has_detraction_intent = _any_term(query, FAMILY_DETRACTION_INTENT_TERMS)
     return has_family_context and has_detraction_intent
 
 
-def _is_exit_100k_example_query(query: str) -> bool:
-    q = _normalize_tax_query(query)
-    has_superamento = any(term in q for term in ("105.000", "105000", "oltre 100.000", "oltre 100000"))
-    has_timing_intent = any(
-        term in q
-        for term in (
-            "resto forfettario fino a dicembre",
-            "cambio l'anno prossimo",
-            "anno prossimo",
-            "fino a dicembre",
-        )
-    )
+EXIT_100K_EXAMPLE_SUPERAMENTO_TERMS = _keyword_set("105.000", "105000", "oltre 100.000", "oltre 100000")
+EXIT_100K_EXAMPLE_TIMING_INTENT_TERMS = _keyword_set(
+    "resto forfettario fino a dicembre",
+    "cambio l'anno prossimo",
+    "anno prossimo",
+    "fino a dicembre",
+)
+
+
+@_query_predicate
+def _is_exit_100k_example_query(query: QueryFeatures) -> bool:
+    has_superamento = _any_term(query, EXIT_100K_EXAMPLE_SUPERAMENTO_TERMS)
+    has_timing_intent = _any_term(query, EXIT_100K_EXAMPLE_TIMING_INTENT_TERMS)
     return has_superamento and has_timing_intent
 
 
-def _is_foreign_software_reverse_charge_query(query: str) -> bool:
-    q = _normalize_tax_query(query)
-    has_software_context = any(
-        term in q
-        for term in (
-            "software",
-            "abbonamento software",
-            "sito americano",
-            "sito estero",
-            "americano",
-            "estero",
-        )
-    )
-    has_vat_doubt = any(
-        term in q
-        for term in (
-            "non c'e l'iva",
-            "non c'è l'iva",
-            "senza iva",
-            "sono a posto",
-            "a posto cosi",
-            "a posto così",
-        )
-    )
+FOREIGN_SOFTWARE_REVERSE_CHARGE_SOFTWARE_CONTEXT_TERMS = _keyword_set(
+    "software",
+    "abbonamento software",
+    "sito americano",
+    "sito estero",
+    "americano",
+    "estero",
+)
+FOREIGN_SOFTWARE_REVERSE_CHARGE_VAT_DOUBT_TERMS = _keyword_set(
+    "non c'e l'iva",
+    "non c'è l'iva",
+    "senza iva",
+    "sono a posto",
+    "a posto cosi",
+    "a posto così",
+)
+
+
+@_query_predicate
+def _is_foreign_software_reverse_charge_query(query: QueryFeatures) -> bool:
+    has_software_context = _any_term(query, FOREIGN_SOFTWARE_REVERSE_CHARGE_SOFTWARE_CONTEXT_TERMS)
+    has_vat_doubt = _any_term(query, FOREIGN_SOFTWARE_REVERSE_CHARGE_VAT_DOUBT_TERMS)
     return has_software_context and has_vat_doubt
 
 
-def _is_srl_non_reconducible_query(query: str) -> bool:
-    q = _normalize_tax_query(query)
-    has_srl_context = "srl" in q and any(
-        term in q for term in ("20%", "20 per cento", "20 %", "socio")
-    )
-    has_non_reconducible_example = any(
-        term in q
-        for term in (
-            "pulizie",
-            "marketing",
-            "consulente marketing",
-            "attivita diverse",
-            "attivita non riconducibili",
-        )
-    )
-    has_forfettario_intent = any(
-        term in q
-        for term in (
-            "posso",
-            "aprire",
-            "forfettari",
-            "forfettaria",
-            "forfettario",
-        )
-    )
+SRL_NON_RECONDUCIBLE_EXAMPLE_TERMS = _keyword_set(
+    "pulizie",
+    "marketing",
+    "consulente marketing",
+    "attivita diverse",
+    "attivita non riconducibili",
+)
+SRL_NON_RECONDUCIBLE_FORFETTARIO_INTENT_TERMS = _keyword_set(
+    "posso",
+    "aprire",
+    "forfettari",
+    "forfettaria",
+    "forfettario",
+)
+SRL_NON_RECONDUCIBLE_SRL_CONTEXT_TERMS = _keyword_set("20%", "20 per cento", "20 %", "socio")
+
+
+@_query_predicate
+def _is_srl_non_reconducible_query(query: QueryFeatures) -> bool:
+    q = query.text
+    has_srl_context = "srl" in q and _any_term(query, SRL_NON_RECONDUCIBLE_SRL_CONTEXT_TERMS)
+    has_non_reconducible_example = _any_term(query, SRL_NON_RECONDUCIBLE_EXAMPLE_TERMS)
+    has_forfettario_intent = _any_term(query, SRL_NON_RECONDUCIBLE_FORFETTARIO_INTENT_TERMS)
     return has_srl_context and has_non_reconducible_example and has_forfettario_intent
 
 
-def _is_bollo_reimbursement_tax_query(query: str) -> bool:
-    q = _normalize_tax_query(query)
-    has_bollo_context = "bollo" in q and any(
-        term in q
-        for term in (
-            "rimborsato",
-            "rimborso",
-            "2 euro",
-            "2€",
-            "marca da bollo",
-        )
-    )
-    has_tax_intent = any(
-        term in q
-        for term in (
-            "pagare le tasse",
-            "ci devo pagare le tasse",
-            "tassabile",
-            "tassato",
-            "ricavo",
-            "85.000",
-            "85000",
-        )
-    )
+BOLLO_REIMBURSEMENT_TAX_INTENT_TERMS = _keyword_set(
+    "pagare le tasse",
+    "ci devo pagare le tasse",
+    "tassabile",
+    "tassato",
+    "ricavo",
+    "85.000",
+    "85000",
+)
+BOLLO_REIMBURSEMENT_TAX_BOLLO_CONTEXT_TERMS = _keyword_set(
+    "rimborsato",
+    "rimborso",
+    "2 euro",
+    "2€",
+    "marca da bollo",
+)
+
+
+@_query_predicate
+def _is_bollo_reimbursement_tax_query(query: QueryFeatures) -> bool:
+    q = query.text
+    has_bollo_context = "bollo" in q and _any_term(query, BOLLO_REIMBURSEMENT_TAX_BOLLO_CONTEXT_TERMS)
+    has_tax_intent = _any_term(query, BOLLO_REIMBURSEMENT_TAX_INTENT_TERMS)
     return has_bollo_context and has_tax_intent
 
 
-def _is_residency_query(query: str) -> bool:
-    q = _normalize_tax_query(query)
-    has_residency = any(
-        term in q
-        for term in (
-            "residenza fiscale",
-            "residente all'estero",
-            "residente estero",
-            "vivo all'estero",
-            "vivo all estero",
-            "all estero",
-            "non residente",
-            "residenza",
-        )
-    )
-    has_forfettario_intent = any(
-        term in q
-        for term in ("forfettario", "forfettaria", "forfettari", "posso", "accedere", "applicare")
-    )
+RESIDENCY_TERMS = _keyword_set(
+    "residenza fiscale",
+    "residente all'estero",
+    "residente estero",
+    "vivo all'estero",
+    "vivo all estero",
+    "all estero",
+    "non residente",
+    "residenza",
+)
+RESIDENCY_FORFETTARIO_INTENT_TERMS = _keyword_set(
+    "forfettario",
+    "forfettaria",
+    "forfettari",
+    "posso",
+    "accedere",
+    "applicare",
+)
+
+
+@_query_predicate
+def _is_residency_query(query: QueryFeatures) -> bool:
+    has_residency = _any_term(query, RESIDENCY_TERMS)
+    has_forfettario_intent = _any_term(query, RESIDENCY_FORFETTARIO_INTENT_TERMS)
     return has_residency and has_forfettario_intent
 
 
-def _is_special_vat_regime_query(query: str) -> bool:
-    q = _normalize_tax_query(query)
-    has_special_context = any(
-        term in q
-        for term in (
-            "regimi speciali iva",
-            "regime speciale iva",
-            "agricoltura",
-            "editoria",
-            "agenzia di viaggio",
-            "tabacchi",
-            "sali e tabacchi",
-        )
-    )
-    has_access_intent = any(
-        term in q
-        for term in ("forfettario", "compatibile", "posso", "accedere", "incompatibile")
-    )
+SPECIAL_VAT_REGIME_SPECIAL_CONTEXT_TERMS = _keyword_set(
+    "regimi speciali iva",
+    "regime speciale iva",
+    "agricoltura",
+    "editoria",
+    "agenzia di viaggio",
+    "tabacchi",
+    "sali e tabacchi",
+)
+SPECIAL_VAT_REGIME_ACCESS_INTENT_TERMS = _keyword_set(
+    "forfettario",
+    "compatibile",
+    "posso",
+    "accedere",
+    "incompatibile",
+)
+
+
+@_query_predicate
+def _is_special_vat_regime_query(query: QueryFeatures) -> bool:
+    has_special_context = _any_term(query, SPECIAL_VAT_REGIME_SPECIAL_CONTEXT_TERMS)
+    has_access_intent = _any_term(query, SPECIAL_VAT_REGIME_ACCESS_INTENT_TERMS)
     return has_special_context and has_access_intent
 
 
-def _is_730_query(query: str) -> bool:
-    q = _normalize_tax_query(query)
-    return "730" in query or "modello 730" in q
+@_query_predicate
+def _is_730_query(query: QueryFeatures) -> bool:
+    q = query.text
+    return "730" in query.raw or "modello 730" in q
+
+
+MODELLO_730_DECLARE_INTENT_TERMS = _keyword_set(
+    "posso presentare",
+    "posso fare",
+    "posso usare",
+    "dichiarare",
+    "mettere",
+    "quadro e",
+    "detrazioni",
+    "scaricare",
+)
 
 
-def _is_730_only_forfettario_query(query: str) -> bool:
-    q = _normalize_tax_query(query)
+@_query_predicate
+def _is_730_only_forfettario_query(query: QueryFeatures) -> bool:
+    q = query.text
     has_730 = _is_730_query(query)
-    has_forfettario = _is_forfettario_query(q) or "partita iva" in q
-    has_declare_intent = any(
-        term in q
-        for term in (
-            "posso presentare",
-            "posso fare",
-            "posso usare",
-            "dichiarare",
-            "mettere",
-            "quadro e",
-            "detrazioni",
-            "scaricare",
-        )
-    )
+    has_forfettario = _is_forfettario_query(query) or "partita iva" in q
+    has_declare_intent = _any_term(query, MODELLO_730_DECLARE_INTENT_TERMS)
     return has_730 and has_forfettario and has_declare_intent
 
 
-def _is_cassa_integrativo_threshold_query(query: str) -> bool:
-    q = _normalize_tax_query(query)
-    has_cassa = any(
-        term in q
-        for term in (
-            "cassa forense",
-            "inarcassa",
-            "enpam",
-            "cipag",
-            "cassa professionale",
-            "contributo integrativo",
-        )
-    ) or _contains_percent_reference(q, "4") or _contains_percent_reference(q, "2") or _contains_percent_reference(q, "5")
-    has_threshold_intent = any(
-        term in q
-        for term in (
-            "85.000",
-            "85000",
-            "limite",
-            "conta",
-            "concorre",
-            "in fattura",
-        )
-    )
+CASSA_INTEGRATIVO_THRESHOLD_INTENT_TERMS = _keyword_set(
+    "85.000",
+    "85000",
+    "limite",
+    "conta",
+    "concorre",
+    "in fattura",
+)
+CASSA_INTEGRATIVO_THRESHOLD_CASSA_TERMS = _keyword_set(
+    "cassa forense",
+    "inarcassa",
+    "enpam",
+    "cipag",
+    "cassa professionale",
+    "contributo integrativo",
+)
+
+
+@_query_predicate
+def _is_cassa_integrativo_threshold_query(query: QueryFeatures) -> bool:
+    q = query.text
+    has_cassa = _any_term(query, CASSA_INTEGRATIVO_THRESHOLD_CASSA_TERMS) or _contains_percent_reference(q, "4") or _contains_percent_reference(q, "2") or _contains_percent_reference(q, "5")
+    has_threshold_intent = _any_term(query, CASSA_INTEGRATIVO_THRESHOLD_INTENT_TERMS)
     return has_cassa and has_threshold_intent
 
 
-def _is_cassa_integrativo_deduction_query(query: str) -> bool:
-    q = _normalize_tax_query(query)
+CASSA_INTEGRATIVO_DEDUCTION_INTENT_TERMS = _keyword_set(
+    "deducibile",
+    "dedurre",
+    "rigo lm35",
+    "ci pago le tasse",
+    "tass",
+)
+CASSA_INTEGRATIVO_DEDUCTION_INTEGRATIVO_TERMS = _keyword_set(
+    "cassa",
+    "inarcassa",
+    "forense",
+    "enpam",
+    "cipag",
+    "professionale",
+)
+
+
+@_query_predicate
+def _is_cassa_integrativo_deduction_query(query: QueryFeatures) -> bool:
+    q = query.text
     has_integrativo = (
         "contributo integrativo" in q
         or _contains_percent_reference(q, "4")
         or _contains_percent_reference(q, "2")
         or _contains_percent_reference(q, "5")
-    ) and any(term in q for term in ("cassa", "inarcassa", "forense", "enpam", "cipag", "professionale"))
-    has_deduction_intent = any(
-        term in q
-        for term in (
-            "deducibile",
-            "dedurre",
-            "rigo lm35",
-            "ci pago le tasse",
-            "tass",
-        )
-    )
+    ) and _any_term(query, CASSA_INTEGRATIVO_DEDUCTION_INTEGRATIVO_TERMS)
+    has_deduction_intent = _any_term(query, CASSA_INTEGRATIVO_DEDUCTION_INTENT_TERMS)
     return has_integrativo and has_deduction_intent
 
 
-def _is_naspi_anticipation_query(query: str) -> bool:
-    q = _normalize_tax_query(query)
+NASPI_ANTICIPATION_TERMS = _keyword_set(
+    "anticipo",
+    "anticipata",
+    "unica soluzione",
+    "30 giorni",
+    "apertura della partita iva",
+)
+
+
+@_query_predicate
+def _is_naspi_anticipation_query(query: QueryFeatures) -> bool:
+    q = query.text
     has_naspi = "naspi" in q
-    has_anticipation = any(
-        term in q
-        for term in (
-            "anticipo",
-            "anticipata",
-            "unica soluzione",
-            "30 giorni",
-            "apertura della partita iva",
-        )
-    )
+    has_anticipation = _any_term(query, NASPI_ANTICIPATION_TERMS)
     return has_naspi and has_anticipation
 
 
-def _is_naspi_monthly_compatibility_query(query: str) -> bool:
-    q = _normalize_tax_query(query)
+NASPI_MONTHLY_COMPATIBILITY_MONTHLY_CONTEXT_TERMS = _keyword_set(
+    "mensile",
+    "compatibile",
+    "continuare a ricevere",
+    "ridotta",
+    "naspi-com",
+    "5500",
+    "8500",
+)
+
+
+@_query_predicate
+def _is_naspi_monthly_compatibility_query(query: QueryFeatures) -> bool:
+    q = query.text
     has_naspi = "naspi" in q
-    has_monthly_context = any(
-        term in q
-        for term in (
-            "mensile",
-            "compatibile",
-            "continuare a ricevere",
-            "ridotta",
-            "naspi-com",
-            "5500",
-            "8500",
-        )
-    )
+    has_monthly_context = _any_term(query, NASPI_MONTHLY_COMPATIBILITY_MONTHLY_CONTEXT_TERMS)
     return has_naspi and has_monthly_context
 
 
-def _is_general_forfettario_tax_query(query: str) -> bool:
-    q = _normalize_tax_query(query)
-    has_forfettario = _is_forfettario_query(q)
-    has_tax_intent = any(
-        term in q
-        for term in ("che tasse pago", "quali tasse", "imposta sostitutiva", "aliquota", "quanto pago")
-    )
-    has_limit_terms = any(term in q for term in ("soglia", "limite", "85.000", "100.000", "ricavi", "compensi"))
+GENERAL_FORFETTARIO_TAX_INTENT_TERMS = _keyword_set(
+    "che tasse pago",
+    "quali tasse",
+    "imposta sostitutiva",
+    "aliquota",
+    "quanto pago",
+)
+GENERAL_FORFETTARIO_TAX_LIMIT_TERMS = _keyword_set(
+    "soglia",
+    "limite",
+    "85.000",
+    "100.000",
+    "ricavi",
+    "compensi",
+)
+
+
+@_query_predicate
+def _is_general_forfettario_tax_query(query: QueryFeatures) -> bool:
+    has_forfettario = _is_forfettario_query(query)
+    has_tax_intent = _any_term(query, GENERAL_FORFETTARIO_TAX_INTENT_TERMS)
+    has_limit_terms = _any_term(query, GENERAL_FORFETTARIO_TAX_LIMIT_TERMS)
     return has_forfettario and has_tax_intent and not has_limit_terms
 
 
+@_query_predicate
+def _is_forfettario_limit_tax_query(query: QueryFeatures) -> bool:
+    return _is_forfettario_query(query) and _is_limit_query(query) and _is_tax_query(query)
+
+
+@_query_predicate
+def _is_forfettario_limit_query(query: QueryFeatures) -> bool:
+    return _is_forfettario_query(query) and _is_limit_query(query)
+
+
+@_query_predicate
+def _is_ateco_groups_query(query: QueryFeatures) -> bool:
+    return _is_ateco_coeff_query(query) and _is_ateco_list_query(query)
+
+
+def _ateco_coefficient_message(query: QueryFeatures) -> str | None:
+    ateco_data = _extract_ateco_components(query.text)
+    if ateco_data is None:
+        return None
+    prefix, subcode = ateco_data
+    coeff = _lookup_coefficiente_ateco(prefix, subcode=subcode)
+    if coeff is None:
+        return None
+    if subcode is not None and coeff.endswith("%"):
+        return f"Il coefficiente di redditività per ATECO {prefix}.{subcode} è {coeff}."
+    if prefix == 46 or prefix == 47:
+        return (
+            f"Per il codice ATECO {prefix}, {coeff} "
+            "Controlla sempre il sottocodice completo per il valore esatto."
+        )
+    return f"Il coefficiente di redditività per ATECO {prefix} è {coeff}."
+
+
+@dataclass(frozen=True)
+class HardCodedRule:
+    intent_id: str
+    category: str
+    predicate: Callable[[QueryFeatures], bool]
+    message: "str | Callable[[QueryFeatures], str | None]"
+    sources: tuple[str, ...] = ()
+    regime_id: str = FORFETTARIO_REGIME_ID
+
+
+# Risposte curate servite sia da `/` sia da `/chat-stream`: vince la prima regola che corrisponde.
+HARD_CODED_RULES: tuple[HardCodedRule, ...] = (
+    HardCodedRule(
+        intent_id="forfettario_intro",
+        category="optional",
+        predicate=_is_forfettario_intro_query,
+        message=(
+            "Il regime forfettario è un regime fiscale agevolato per partite IVA individuali. "
+            "In pratica, il reddito imponibile non si calcola sottraendo tutte le spese reali una per una, "
+            "ma applicando ai ricavi un coefficiente di redditività legato all'attività svolta. "
+            "Su quel reddito si paga di norma un'imposta sostitutiva del 15%, che in alcuni casi scende al 5% "
+            "per le nuove attività. Prevede anche semplificazioni IVA e contabili, ma si può usare solo se "
+            "rispetti i requisiti e non hai cause ostative."
+        ),
+        sources=(
+            "01_Legge_190-2014_Base_Normativa_e_Coefficienti.pdf",
+            "04_Elenco_Cause_Ostative_e_Esclusioni_2026.pdf",
+        ),
+    ),
+    HardCodedRule(
+        intent_id="quadro_lm",
+        category="stable",
+        predicate=_is_quadro_lm_query,
+        message=(
+            "Il Quadro LM è la sezione del Modello Redditi Persone Fisiche dedicata ai contribuenti "
+            "che applicano il regime forfettario. Serve a determinare il reddito imponibile e "
+            "l'imposta sostitutiva dovuta."
+        ),
+        sources=(
+            "09_Guida_Tecnica_Quadro_LM_Dichiarazione_Redditi.pdf",
+        ),
+    ),
+    HardCodedRule(
+        intent_id="ateco_coeff",
+        category="critical",
+        predicate=_is_ateco_coeff_query,
+        message=_ateco_coefficient_message,
+        sources=(
+            "03_Tabella_Coefficienti_Redditivita_ATECO.pdf",
+            "01_Legge_190-2014_Base_Normativa_e_Coefficienti.pdf",
+        ),
+    ),
+    HardCodedRule(
+        intent_id="ateco_groups",
+        category="critical",
+        predicate=_is_ateco_groups_query,
+        message=(
+            "Nel regime forfettario i coefficienti di redditività sono associati a gruppi ATECO: "
+            "40% (es. commercio e alloggio/ristorazione), "
+            "54% (commercio ambulante alimenti/bevande), "
+            "62% (intermediari del commercio), "
+            "67% (altre attività economiche), "
+            "78% (attività professionali, sanitarie, istruzione e finanziarie), "
+            "86% (costruzioni e attività immobiliari). "
+            "Se mi indichi un codice ATECO specifico, ti dico il coefficiente esatto."
+        ),
+        sources=(
+            "03_Tabella_Coefficienti_Redditivita_ATECO.pdf",
+            "01_Legge_190-2014_Base_Normativa_e_Coefficienti.pdf",
+        ),
+    ),
+    HardCodedRule(
+        intent_id="random_ateco",
+        category="critical",
+        predicate=_is_random_ateco_query,
+        message=(
+            "Non posso inventare un codice ATECO a caso. Nei documenti disponibili non c'è "
+            "l'elenco completo dei codici ATECO italiani; c'è solo la tabella dei gruppi ATECO "
+            "con i relativi coefficienti. Se mi dai un codice specifico, posso dirti il coefficiente."
+        ),
+        sources=(
+            "03_Tabella_Coefficienti_Redditivita_ATECO.pdf",
+            "01_Legge_190-2014_Base_Normativa_e_Coefficienti.pdf",
+        ),
+    ),
+    HardCodedRule(
+        intent_id="ateco_codes",
+        category="critical",
+        predicate=_is_ateco_codes_query,
+        message=(
+            "Nei documenti disponibili non c'è un elenco completo di tutti i codici ATECO italiani; "
+            "c'è la tabella dei gruppi ATECO rilevanti per il regime forfettario con i relativi coefficienti. "
+            "Se vuoi, posso dirti il coefficiente partendo da un codice ATECO preciso."
+        ),
+        sources=(
+            "03_Tabella_Coefficienti_Redditivita_ATECO.pdf",
+            "01_Legge_190-2014_Base_Normativa_e_Coefficienti.pdf",
+        ),
+    ),
+    HardCodedRule(
+        intent_id="forfettario_limit_tax",
+        category="stable",
+        predicate=_is_forfettario_limit_tax_query,
+        message=(
+            "Per restare nel regime forfettario, nel periodo precedente ricavi o compensi non devono superare 85.000 euro; "
+            "se durante l'anno superi 100.000 euro, l'uscita dal regime è immediata. "
+            "L'imposta sostitutiva è in via ordinaria al 15%, ridotta al 5% per i primi 5 anni se sono rispettati i requisiti di nuova attività."
+        ),
+        sources=(
+            "02_Circolare_32E-2023_Novita_Soglie_e_Uscita_Immediat.pdf",
+            "01_Legge_190-2014_Base_Normativa_e_Coefficienti.pdf",
+        ),
+    ),
+    HardCodedRule(
+        intent_id="forfettario_limit",
+        category="stable",
+        predicate=_is_forfettario_limit_query,
+        message=(
+            "Per il regime forfettario, la soglia ordinaria è 85.000 euro di ricavi o compensi. "
+            "L'uscita immediata scatta se nell'anno superi 100.000 euro."
+        ),
+        sources=(
+            "02_Circolare_32E-2023_Novita_Soglie_e_Uscita_Immediat.pdf",
+            "01_Legge_190-2014_Base_Normativa_e_Coefficienti.pdf",
+        ),
+    ),
+    HardCodedRule(
+        intent_id="general_forfettario_tax",
+        category="stable",
+        predicate=_is_general_forfettario_tax_query,
+        message=(
+            "Nel regime forfettario paghi un'imposta sostitutiva che in via ordinaria e' del 15%. "
+            "Per le nuove attivita', se rispetti i requisiti, l'aliquota scende al 5% per i primi 5 anni."
+        ),
+        sources=(
+            "01_Legge_190-2014_Base_Normativa_e_Coefficienti.pdf",
+            "09_Guida_Tecnica_Quadro_LM_Dichiarazione_Redditi.pdf",
+        ),
+    ),
+    HardCodedRule(
+        intent_id="forfettario_exit_100k",
+        category="stable",
+        predicate=_is_forfettario_exit_100k_query,
+        message=(
+            "Se superi 100.000 euro di ricavi o compensi nell'anno, l'uscita dal forfettario è immediata "
+            "dal momento del superamento."
+        ),
+        sources=(
+            "02_Circolare_32E-2023_Novita_Soglie_e_Uscita_Immediat.pdf",
+        ),
+    ),
+    HardCodedRule(
+        intent_id="cash_basis_threshold",
+        category="stable",
+        predicate=_is_cash_basis_threshold_query,
+        message=(
+            "Per le soglie del regime forfettario conta quanto incassi, non quanto fatturi, perché si applica "
+            "il criterio di cassa. "
+            "Quindi per verificare i limiti di 85.000 e 100.000 euro rilevano i ricavi o compensi percepiti."
+        ),
+        sources=(
+            "02_Circolare_32E-2023_Novita_Soglie_e_Uscita_Immediat.pdf",
+            "01_Legge_190-2014_Base_Normativa_e_Coefficienti.pdf",
+        ),
+    ),
+    HardCodedRule(
+        intent_id="aliquota_5",
+        category="stable",
+        predicate=_is_aliquota_5_query,
+        message=(
+            "L'aliquota del 5% si applica alle nuove attività che rispettano i requisiti previsti "
+            "per il regime forfettario, e vale per i primi 5 anni."
+        ),
+        sources=(
+            "01_Legge_190-2014_Base_Normativa_e_Coefficienti.pdf",
+            "02_Circolare_32E-2023_Novita_Soglie_e_Uscita_Immediat.pdf",
+        ),
+    ),
+    HardCodedRule(
+        intent_id="inps_35_apply",
+        category="stable",
+        predicate=_is_inps_35_apply_query,
+        message=(
+            "La domanda per la riduzione INPS del 35% è esclusivamente telematica. "
+            "Si presenta dal portale INPS, con accesso SPID, CIE o CNS, nel Cassetto Previdenziale per "
+            "Artigiani e Commercianti alla voce Domande telematizzate e Regime agevolato."
+        ),
+        sources=(
+            "11_Guida_Riduzione_Contributiva_35_INPS.pdf",
+            "10_Circolare_INPS_14-2026_Artigiani_e_Commercianti.pdf",
+        ),
+    ),
+    HardCodedRule(
+        intent_id="inps_35_deadline",
+        category="stable",
+        predicate=_is_inps_35_deadline_query,
+        message=(
+            "La domanda per la riduzione contributiva INPS del 35% si presenta solo online nel Cassetto "
+            "Previdenziale Artigiani e Commercianti (accesso con SPID/CIE/CNS). "
+            "Per i contribuenti già attivi va presentata entro il 28 febbraio di ogni anno; "
+            "se inviata dopo, l'agevolazione decorre dal 1° gennaio dell'anno successivo. "
+            "Per le nuove attività, la richiesta va fatta tempestivamente dopo l'iscrizione previdenziale."
+        ),
+        sources=(
+            "11_Guida_Riduzione_Contributiva_35_INPS.pdf",
+            "10_Circolare_INPS_14-2026_Artigiani_e_Commercianti.pdf",
+        ),
+    ),
+    HardCodedRule(
+        intent_id="inps_35_late_deadline",
+        category="stable",
+        predicate=_is_inps_35_late_deadline_query,
+        message=(
+            "Sì, puoi presentarla anche dopo il 28 febbraio, ma per i contribuenti già attivi la riduzione "
+            "non opera nell'anno in corso. "
+            "Se la domanda è tardiva, l'agevolazione decorre dal 1° gennaio dell'anno successivo."
+        ),
+        sources=(
+            "11_Guida_Riduzione_Contributiva_35_INPS.pdf",
+            "10_Circolare_INPS_14-2026_Artigiani_e_Commercianti.pdf",
+        ),
+    ),
+    HardCodedRule(
+        intent_id="inps_35_short_deadline",
+        category="stable",
+        predicate=_is_inps_35_short_deadline_query,
+        message=(
+            "Per i contribuenti già attivi, la domanda per la riduzione INPS del 35% va presentata "
+            "entro il 28 febbraio di ogni anno."
+        ),
+        sources=(
+            "11_Guida_Riduzione_Contributiva_35_INPS.pdf",
+            "10_Circolare_INPS_14-2026_Artigiani_e_Commercianti.pdf",
+        ),
+    ),
+    HardCodedRule(
+        intent_id="inps_35_march_decorrenza",
+        category="stable",
+        predicate=_is_inps_35_march_decorrenza_query,
+        message=(
+            "Se presenti la domanda il 10 marzo, la riduzione non decorre nell'anno in corso ma dal "
+            "1° gennaio dell'anno successivo."
+        ),
+        sources=(
+            "11_Guida_Riduzione_Contributiva_35_INPS.pdf",
+            "10_Circolare_INPS_14-2026_Artigiani_e_Commercianti.pdf",
+        ),
+    ),
+    HardCodedRule(
+        intent_id="inps_35_new_activity",
+        category="stable",
+        predicate=_is_inps_35_new_activity_query,
+        message=(
+            "Per una nuova attività, la richiesta della riduzione INPS del 35% va fatta dopo l'iscrizione "
+            "alla Gestione Artigiani e Commercianti, tramite il Cassetto Previdenziale. "
+            "Va presentata tempestivamente, senza attendere il 28 febbraio dell'anno successivo."
+        ),
+        sources=(
+            "11_Guida_Riduzione_Contributiva_35_INPS.pdf",
+            "10_Circolare_INPS_14-2026_Artigiani_e_Commercianti.pdf",
+        ),
+    ),
+    HardCodedRule(
+        intent_id="inps_35_reapply",
+        category="stable",
+        predicate=_is_inps_35_reapply_query,
+        message=(
+            "Sì, se rinunci puoi presentare una nuova domanda in seguito, purché tu sia ancora nel "
+            "regime forfettario e restino i requisiti per l'agevolazione. "
+            "Per i contribuenti già attivi si applica il termine ordinario del 28 febbraio; se presenti "
+            "la domanda dopo tale data, la riduzione decorre dal 1° gennaio dell'anno successivo."
+        ),
+        sources=(
+            "11_Guida_Riduzione_Contributiva_35_INPS.pdf",
+            "10_Circolare_INPS_14-2026_Artigiani_e_Commercianti.pdf",
+        ),
+    ),
+    HardCodedRule(
+        intent_id="inps_35_renewal",
+        category="stable",
+        predicate=_is_inps_35_renewal_query,
+        message=(
+            "Sì, l'agevolazione si rinnova se continui ad avere i requisiti del regime forfettario e "
+            "dell'iscrizione alla Gestione Artigiani e Commercianti. "
+            "Se i requisiti vengono meno o rinunci, si torna al regime contributivo ordinario."
+        ),
+        sources=(
+            "11_Guida_Riduzione_Contributiva_35_INPS.pdf",
+            "10_Circolare_INPS_14-2026_Artigiani_e_Commercianti.pdf",
+        ),
+    ),
+    HardCodedRule(
+        intent_id="inps_35_loss",
+        category="stable",
+        predicate=_is_inps_35_loss_query,
+        message=(
+            "L'agevolazione del 35% si perde se non restano i requisiti per applicarla o se presenti "
+            "rinuncia. In quel caso si rientra nel regime contributivo ordinario."
+        ),
+        sources=(
+            "11_Guida_Riduzione_Contributiva_35_INPS.pdf",
+            "10_Circolare_INPS_14-2026_Artigiani_e_Commercianti.pdf",
+        ),
+    ),
+    HardCodedRule(
+        intent_id="inps_35_cassa",
+        category="stable",
+        predicate=_is_inps_35_cassa_query,
+        message=(
+            "No, la riduzione INPS del 35% non si applica ai professionisti iscritti a una Cassa "
+            "professionale e non si applica neppure alla Gestione Separata. "
+            "È riservata agli imprenditori individuali forfettari iscritti alla Gestione Artigiani e Commercianti."
+        ),
+        sources=(
+            "11_Guida_Riduzione_Contributiva_35_INPS.pdf",
+            "10_Circolare_INPS_14-2026_Artigiani_e_Commercianti.pdf",
+            "06_Circolare_INPS_8-2026_Aliquote_Gestione_Separata.pdf",
+        ),
+    ),
+    HardCodedRule(
+        intent_id="inps_35_general",
+        category="stable",
+        predicate=_is_inps_35_general_query,
+        message=(
+            "La riduzione INPS del 35% è riservata agli imprenditori individuali forfettari iscritti alla "
+            "Gestione Artigiani e Commercianti; non si applica a Gestione Separata o Casse professionali. "
+            "La domanda è telematica; per gli attivi va presentata entro il 28 febbraio, se tardiva decorre "
+            "dal 1° gennaio dell'anno successivo. "
+            "L'agevolazione si rinnova se restano i requisiti, ma riduce la contribuzione utile ai fini pensionistici."
+        ),
+        sources=(
+            "11_Guida_Riduzione_Contributiva_35_INPS.pdf",
+            "10_Circolare_INPS_14-2026_Artigiani_e_Commercianti.pdf",
+            "06_Circolare_INPS_8-2026_Aliquote_Gestione_Separata.pdf",
+        ),
+    ),
+    HardCodedRule(
+        intent_id="ex_datore_after_two_years",
+        category="stable",
+        predicate=_is_ex_datore_after_two_years_query,
+        message=(
+            "No, non è ostativo se il rapporto con l'ex datore di lavoro è cessato da oltre due periodi "
+            "d'imposta. La causa ostativa riguarda la fatturazione prevalente verso datori di lavoro con "
+            "cui il rapporto è in corso o è cessato nei due precedenti periodi d'imposta."
+        ),
+        sources=(
+            "04_Elenco_Cause_Ostative_e_Esclusioni_2026.pdf",
+            "05_Circolare_9E-2019_Approfondimento_Cause_Ostative.pdf",
+        ),
+    ),
+    HardCodedRule(
+        intent_id="srl_control",
+        category="stable",
+        predicate=_is_srl_control_query,
+        message=(
+            "In presenza di controllo, anche di fatto, una partecipazione in SRL può costituire causa "
+            "ostativa se la società esercita attività economiche direttamente o indirettamente riconducibili "
+            "a quella svolta individualmente. La sola percentuale di partecipazione non basta: conta il controllo "
+            "ai sensi dell'articolo 2359 c.c. e la riconducibilità dell'attività."
+        ),
+        sources=(
+            "04_Elenco_Cause_Ostative_e_Esclusioni_2026.pdf",
+            "05_Circolare_9E-2019_Approfondimento_Cause_Ostative.pdf",
+        ),
+    ),
+    HardCodedRule(
+        intent_id="vies",
+        category="stable",
+        predicate=_is_vies_query,
+        message=(
+            "Sì, per il forfettario l'iscrizione al VIES è necessaria quando effettua operazioni "
+            "intracomunitarie (vendita di servizi o acquisto di beni/servizi nell'UE). "
+            "Serve a operare con partita IVA abilitata nei rapporti UE."
+        ),
+        sources=(
+            "12_Operazioni_Estere_VIES_Reverse_Charge_e_Dogane.pdf",
+        ),
+    ),
+    HardCodedRule(
+        intent_id="ads_reverse_charge",
+        category="stable",
+        predicate=_is_ads_reverse_charge_query,
+        message=(
+            "Per acquisti di servizi esteri come Google Ads o Facebook Ads, in forfettario si applica "
+            "integrazione/autofattura TD17 con IVA al 22% e versamento entro il giorno 16 del mese successivo "
+            "con F24 codice 6099. L'IVA resta un costo non detraibile."
+        ),
+        sources=(
+            "12_Operazioni_Estere_VIES_Reverse_Charge_e_Dogane.pdf",
+            "08a_Guida_Pratica_Fatturazione_Elettronica_Forfettari_2026.pdf",
+        ),
+    ),
+    HardCodedRule(
+        intent_id="bollo_reimbursement_tax",
+        category="stable",
+        predicate=_is_bollo_reimbursement_tax_query,
+        message=(
+            "No. Il rimborso dei 2 euro del bollo da parte del cliente non costituisce un ricavo "
+            "aggiuntivo da tassare separatamente e non si somma al limite degli 85.000 euro. Il bollo "
+            "resta solo un riaddebito dell'imposta assolta in fattura."
+        ),
+        sources=(
+            "08b_Manuale_AdE_Imposta_Bollo_Fatture_Elettroniche.pdf",
+            "08a_Guida_Pratica_Fatturazione_Elettronica_Forfettari_2026.pdf",
+            "13_CASI CRITICI E RISPOSTE AI QUESITI (PRASSI ADE).pdf",
+        ),
+    ),
+    HardCodedRule(
+        intent_id="residency",
+        category="stable",
+        predicate=_is_residency_query,
+        message=(
+            "In via generale il regime forfettario e' riservato ai residenti in Italia. Fanno eccezione "
+            "i residenti in uno Stato UE o SEE con adeguato scambio di informazioni, ma solo se producono "
+            "in Italia almeno il 75% del reddito complessivo."
+        ),
+        sources=(
+            "04_Elenco_Cause_Ostative_e_Esclusioni_2026.pdf",
+            "01_Legge_190-2014_Base_Normativa_e_Coefficienti.pdf",
+        ),
+    ),
+    HardCodedRule(
+        intent_id="special_vat_regime",
+        category="stable",
+        predicate=_is_special_vat_regime_query,
+        message=(
+            "No, i regimi speciali IVA sono incompatibili con il regime forfettario. Se ti avvali di "
+            "regimi speciali come agricoltura, editoria, agenzie di viaggio o sali e tabacchi, non puoi "
+            "accedere o permanere nel forfettario."
+        ),
+        sources=(
+            "04_Elenco_Cause_Ostative_e_Esclusioni_2026.pdf",
+            "01_Legge_190-2014_Base_Normativa_e_Coefficienti.pdf",
+        ),
+    ),
+    HardCodedRule(
+        intent_id="730_only_forfettario",
+        category="stable",
+        predicate=_is_730_only_forfettario_query,
+        message=(
+            "Il reddito della partita IVA forfettaria non si dichiara nel 730 ma nel Modello Redditi PF, "
+            "quadro LM. Il 730 puoi usarlo solo per eventuali altri redditi soggetti a IRPEF, come lavoro "
+            "dipendente, pensione, terreni o fabbricati; se hai solo reddito forfettario, il 730 non basta "
+            "e le detrazioni si usano solo se hai capienza IRPEF su altri redditi."
+        ),
+        sources=(
+            "16_IL MODELLO 730 E IL CONTRIBUENTE FORFETTARIO (2026).pdf",
+            "09_Guida_Tecnica_Quadro_LM_Dichiarazione_Redditi.pdf",
+        ),
+    ),
+    HardCodedRule(
+        intent_id="cassa_integrativo_threshold",
+        category="stable",
+        predicate=_is_cassa_integrativo_threshold_query,
+        message=(
+            "No. Il contributo integrativo addebitato in fattura dagli iscritti a una Cassa professionale "
+            "(per esempio 2%, 4% o 5%) non concorre al reddito forfettario e non conta nel limite degli "
+            "85.000 euro."
+        ),
+        sources=(
+            "15_CASSE PROFESSIONALI AUTONOME E REGIME FORFETTARIO (2026).pdf",
+        ),
+    ),
+    HardCodedRule(
+        intent_id="cassa_integrativo_deduction",
+        category="stable",
+        predicate=_is_cassa_integrativo_deduction_query,
+        message=(
+            "No. Il contributo integrativo non e' deducibile e non va trattato come costo del professionista, "
+            "perche' e' un importo addebitato al cliente e poi riversato alla Cassa. In deduzione, nel rigo "
+            "LM35, rilevano invece i contributi soggettivi e maternita' effettivamente versati."
+        ),
+        sources=(
+            "15_CASSE PROFESSIONALI AUTONOME E REGIME FORFETTARIO (2026).pdf",
+            "09_Guida_Tecnica_Quadro_LM_Dichiarazione_Redditi.pdf",
+        ),
+    ),
+    HardCodedRule(
+        intent_id="naspi_anticipation",
+        category="stable",
+        predicate=_is_naspi_anticipation_query,
+        message=(
+            "Sì, chi apre una partita IVA forfettaria puo' chiedere l'anticipazione della NASPI in un'unica "
+            "soluzione, ma la domanda va inviata all'INPS entro 30 giorni dall'apertura della partita IVA o "
+            "dall'inizio attivita'. L'importo anticipato e' tassato ordinariamente IRPEF, non rientra nel "
+            "forfettario e non concorre al limite degli 85.000 euro."
+        ),
+        sources=(
+            "14_NASPI, DISOCCUPAZIONE E INCENTIVI ALL'AUTOIMPRENDITORIALITÀ (2026).pdf",
+        ),
+    ),
+    HardCodedRule(
+        intent_id="naspi_monthly_compatibility",
+        category="stable",
+        predicate=_is_naspi_monthly_compatibility_query,
+        message=(
+            "La NASPI mensile puo' essere compatibile con la partita IVA forfettaria, ma non resta intera: "
+            "va comunicato il reddito presunto all'INPS con NASPI-COM entro un mese e l'assegno viene ridotto. "
+            "Nei documenti la compatibilita' e' indicata entro 5.500 euro per attivita' d'impresa/commercio e "
+            "8.500 euro per lavoro autonomo o professionale."
+        ),
+        sources=(
+            "14_NASPI, DISOCCUPAZIONE E INCENTIVI ALL'AUTOIMPRENDITORIALITÀ (2026).pdf",
+        ),
+    ),
+    HardCodedRule(
+        intent_id="bollo_exact_threshold",
+        category="stable",
+        predicate=_is_bollo_exact_threshold_query,
+        message=(
+            "No, con importo esattamente pari a 77,47 euro il bollo non si applica. "
+            "L'imposta di bollo da 2,00 euro scatta solo oltre 77,47 euro."
+        ),
+        sources=(
+            "08b_Manuale_AdE_Imposta_Bollo_Fatture_Elettroniche.pdf",
+            "08a_Guida_Pratica_Fatturazione_Elettronica_Forfettari_2026.pdf",
+        ),
+    ),
+    HardCodedRule(
+        intent_id="bollo",
+        category="stable",
+        predicate=_is_bollo_query,
+        message=(
+            "Sì, se la fattura supera 77,47 euro si applica l'imposta di bollo da 2,00 euro, "
+            "anche nelle fatture verso l'estero. "
+            "In fattura va indicata la dicitura di assolvimento del bollo; "
+            "il versamento è gestito con liquidazione periodica tramite i canali dell'Agenzia delle Entrate."
+        ),
+        sources=(
+            "08b_Manuale_AdE_Imposta_Bollo_Fatture_Elettroniche.pdf",
+            "08a_Guida_Pratica_Fatturazione_Elettronica_Forfettari_2026.pdf",
+        ),
+    ),
+    HardCodedRule(
+        intent_id="intrastat",
+        category="stable",
+        predicate=_is_intrastat_query,
+        message=(
+            "Nei documenti, l'Intrastat è richiamato per le operazioni di servizi B2B verso soggetti UE. "
+            "Per i casi specifici (periodicità e obbligo puntuale) è necessaria verifica operativa sul singolo caso."
+        ),
+        sources=(
+            "12_Operazioni_Estere_VIES_Reverse_Charge_e_Dogane.pdf",
+        ),
+    ),
+    HardCodedRule(
+        intent_id="eu_b2c_services",
+        category="stable",
+        predicate=_is_eu_b2c_services_query,
+        message=(
+            "Nei documenti disponibili è trattata in modo esplicito soprattutto la casistica B2B UE "
+            "(reverse charge e Intrastat). "
+            "Per servizi B2C verso cliente UE la disciplina IVA dipende dal tipo di servizio e dal luogo di consumo, "
+            "quindi serve una verifica specifica prima di emettere fattura."
+        ),
+        sources=(
+            "12_Operazioni_Estere_VIES_Reverse_Charge_e_Dogane.pdf",
+            "08a_Guida_Pratica_Fatturazione_Elettronica_Forfettari_2026.pdf",
+        ),
+    ),
+    HardCodedRule(
+        intent_id="eu_b2b_services",
+        category="stable",
+        predicate=_is_eu_b2b_services_query,
+        message=(
+            "Per servizi B2B verso cliente UE, la fattura si emette senza IVA con dicitura "
+            "\"Reverse Charge\" o \"Inversione contabile\" e richiede iscrizione VIES. "
+            "Per queste operazioni è previsto l'adempimento Intrastat. "
+            "Se la fattura supera 77,47 euro, si applica anche il bollo da 2,00 euro."
+        ),
+        sources=(
+            "12_Operazioni_Estere_VIES_Reverse_Charge_e_Dogane.pdf",
+            "08a_Guida_Pratica_Fatturazione_Elettronica_Forfettari_2026.pdf",
+        ),
+    ),
+    HardCodedRule(
+        intent_id="extra_ue_wording",
+        category="stable",
+        predicate=_is_extra_ue_wording_query,
+        message=(
+            "La dicitura da usare per servizi extra-UE è: "
+            "\"Operazione non soggetta ai sensi degli artt. da 7 a 7-septies del DPR 633/72\"."
+        ),
+        sources=(
+            "12_Operazioni_Estere_VIES_Reverse_Charge_e_Dogane.pdf",
+        ),
+    ),
+    HardCodedRule(
+        intent_id="extra_ue_services",
+        category="stable",
+        predicate=_is_extra_ue_services_query,
+        message=(
+            "Per servizi verso cliente extra-UE, la fattura è senza IVA con dicitura: "
+            "\"Operazione non soggetta ai sensi degli artt. da 7 a 7-septies del DPR 633/72\". "
+            "Se l'importo supera 77,47 euro, si applica il bollo da 2,00 euro."
+        ),
+        sources=(
+            "12_Operazioni_Estere_VIES_Reverse_Charge_e_Dogane.pdf",
+            "08b_Manuale_AdE_Imposta_Bollo_Fatture_Elettroniche.pdf",
+        ),
+    ),
+    HardCodedRule(
+        intent_id="employment_income_under_threshold",
+        category="stable",
+        predicate=_is_employment_income_under_threshold_query,
+        message=(
+            "Con reddito da lavoro dipendente pari a 29.000 euro, la sola soglia dei 30.000 euro "
+            "non è causa ostativa. "
+            "Restano comunque da verificare le altre condizioni di accesso e permanenza nel forfettario."
+        ),
+        sources=(
+            "04_Elenco_Cause_Ostative_e_Esclusioni_2026.pdf",
+            "05_Circolare_9E-2019_Approfondimento_Cause_Ostative.pdf",
+        ),
+    ),
+    HardCodedRule(
+        intent_id="employment_income_threshold",
+        category="stable",
+        predicate=_is_employment_income_threshold_query,
+        message=(
+            "In generale, con redditi da lavoro dipendente o assimilati superiori a 30.000 euro "
+            "non puoi applicare il regime forfettario. "
+            "La soglia non rileva se il rapporto di lavoro è cessato. "
+            "Restano comunque da verificare anche le altre cause ostative."
+        ),
+        sources=(
+            "04_Elenco_Cause_Ostative_e_Esclusioni_2026.pdf",
+            "05_Circolare_9E-2019_Approfondimento_Cause_Ostative.pdf",
+            "02_Circolare_32E-2023_Novita_Soglie_e_Uscita_Immediat.pdf",
+        ),
+    ),
+    HardCodedRule(
+        intent_id="employment_cessation",
+        category="stable",
+        predicate=_is_employment_cessation_query,
+        message=(
+            "Sì: se il rapporto di lavoro dipendente è cessato, la soglia dei 30.000 euro non rileva "
+            "come causa ostativa. Restano però da verificare gli altri requisiti del regime forfettario."
+        ),
+        sources=(
+            "04_Elenco_Cause_Ostative_e_Esclusioni_2026.pdf",
+            "05_Circolare_9E-2019_Approfondimento_Cause_Ostative.pdf",
+        ),
+    ),
+    HardCodedRule(
+        intent_id="business_meal_cost",
+        category="stable",
+        predicate=_is_business_meal_cost_query,
+        message=(
+            "No. Nel regime forfettario non detrai l'IVA sugli acquisti e non deduci analiticamente "
+            "spese come una cena con cliente. Il vantaggio fiscale e' gia' forfettizzato tramite il "
+            "coefficiente di redditivita', quindi quella fattura non ti abbassa separatamente l'imposta del 15%."
+        ),
+        sources=(
+            "01_Legge_190-2014_Base_Normativa_e_Coefficienti.pdf",
+            "08a_Guida_Pratica_Fatturazione_Elettronica_Forfettari_2026.pdf",
+            "13_CASI CRITICI E RISPOSTE AI QUESITI (PRASSI ADE).pdf",
+        ),
+    ),
+    HardCodedRule(
+        intent_id="employee_above_threshold_access",
+        category="stable",
+        predicate=_is_employee_above_threshold_access_query,
+        message=(
+            "No, in via generale non puoi applicare il regime forfettario se hai redditi da lavoro "
+            "dipendente o assimilati superiori a 30.000 euro. La soglia diventa irrilevante solo se il "
+            "rapporto di lavoro e' cessato; altrimenti questa e' una causa ostativa."
+        ),
+        sources=(
+            "04_Elenco_Cause_Ostative_e_Esclusioni_2026.pdf",
+            "05_Circolare_9E-2019_Approfondimento_Cause_Ostative.pdf",
+            "16_IL MODELLO 730 E IL CONTRIBUENTE FORFETTARIO (2026).pdf",
+        ),
+    ),
+    HardCodedRule(
+        intent_id="ex_employer_prevalence",
+        category="stable",
+        predicate=_is_ex_employer_prevalence_query,
+        message=(
+            "Puoi aprire la partita IVA, ma c'e' un rischio forte di causa ostativa se fatturi "
+            "prevalentemente all'ex datore di lavoro o alla ex azienda con cui il rapporto e' in corso "
+            "o e' cessato nei due precedenti periodi d'imposta. Se oltre il 50% dei compensi arriva da "
+            "quel soggetto, perdi il forfettario dall'anno successivo."
+        ),
+        sources=(
+            "04_Elenco_Cause_Ostative_e_Esclusioni_2026.pdf",
+            "05_Circolare_9E-2019_Approfondimento_Cause_Ostative.pdf",
+            "13_CASI CRITICI E RISPOSTE AI QUESITI (PRASSI ADE).pdf",
+        ),
+    ),
+    HardCodedRule(
+        intent_id="strumental_asset_sale",
+        category="stable",
+        predicate=_is_strumental_asset_sale_query,
+        message=(
+            "No. La cessione di un bene strumentale usato, come un vecchio PC aziendale, non si somma "
+            "ai ricavi o compensi che contano per la soglia degli 85.000 euro. In questi casi il "
+            "forfettario non tassa la plusvalenza come ricavo ordinario del regime."
+        ),
+        sources=(
+            "13_CASI CRITICI E RISPOSTE AI QUESITI (PRASSI ADE).pdf",
+            "01_Legge_190-2014_Base_Normativa_e_Coefficienti.pdf",
+        ),
+    ),
+    HardCodedRule(
+        intent_id="family_detraction",
+        category="stable",
+        predicate=_is_family_detraction_query,
+        message=(
+            "No. L'imposta sostitutiva del regime forfettario non consente di recuperare dal carico "
+            "fiscale della partita IVA le detrazioni per figli a carico o spese come l'asilo nido. "
+            "Quelle agevolazioni non riducono l'imposta sostitutiva del forfettario; restano solo gli "
+            "eventuali strumenti dedicati, come l'Assegno Unico, se spettanti."
+        ),
+        sources=(
+            "16_IL MODELLO 730 E IL CONTRIBUENTE FORFETTARIO (2026).pdf",
+            "01_Legge_190-2014_Base_Normativa_e_Coefficienti.pdf",
+        ),
+    ),
+    HardCodedRule(
+        intent_id="exit_100k_example",
+        category="stable",
+        predicate=_is_exit_100k_example_query,
+        message=(
+            "No, non resti forfettario fino a dicembre. Se superi 100.000 euro di compensi o ricavi "
+            "percepiti nell'anno, l'uscita dal regime e' immediata dal momento del superamento e "
+            "sull'operazione che fa superare la soglia devi applicare subito il regime IVA ordinario."
+        ),
+        sources=(
+            "02_Circolare_32E-2023_Novita_Soglie_e_Uscita_Immediat.pdf",
+            "13_CASI CRITICI E RISPOSTE AI QUESITI (PRASSI ADE).pdf",
+            "01_Legge_190-2014_Base_Normativa_e_Coefficienti.pdf",
+        ),
+    ),
+    HardCodedRule(
+        intent_id="foreign_software_reverse_charge",
+        category="stable",
+        predicate=_is_foreign_software_reverse_charge_query,
+        message=(
+            "No, non sei a posto cosi'. Se acquisti un software o un servizio digitale da un fornitore "
+            "estero senza IVA, devi emettere autofattura/integrazione TD17 con IVA italiana al 22% e "
+            "versarla con F24 entro il giorno 16 del mese successivo. Nel forfettario quell'IVA resta "
+            "un costo e non e' detraibile."
+        ),
+        sources=(
+            "12_Operazioni_Estere_VIES_Reverse_Charge_e_Dogane.pdf",
+            "08a_Guida_Pratica_Fatturazione_Elettronica_Forfettari_2026.pdf",
+        ),
+    ),
+    HardCodedRule(
+        intent_id="srl_non_reconducible",
+        category="stable",
+        predicate=_is_srl_non_reconducible_query,
+        message=(
+            "Sì, in linea di principio puoi applicare il forfettario se hai solo il 20% della SRL, "
+            "quindi senza controllo, e l'attivita' individuale non e' riconducibile a quella della "
+            "societa'. Nel tuo esempio pulizie e consulenza marketing sono attivita' diverse, quindi "
+            "la sola partecipazione del 20% non integra di per se' la causa ostativa."
+        ),
+        sources=(
+            "04_Elenco_Cause_Ostative_e_Esclusioni_2026.pdf",
+            "05_Circolare_9E-2019_Approfondimento_Cause_Ostative.pdf",
+            "13_CASI CRITICI E RISPOSTE AI QUESITI (PRASSI ADE).pdf",
+        ),
+    ),
+)
+
+ACTIVE_HARD_CODED_RULES = tuple(rule for rule in HARD_CODED_RULES if _allow_hardcoded(rule.category))
+
+
+def _match_hardcoded_rule(query: QueryFeatures, regime_id: str) -> tuple[HardCodedRule, str] | None:
+    for rule in ACTIVE_HARD_CODED_RULES:
+        if rule.regime_id != regime_id or not rule.predicate(query):
+            continue
+        message = rule.message(query) if callable(rule.message) else rule.message
+        if message:
+            return rule, message
+    return None
+
+
+ACTIVE_HARD_CODED_RULES_BY_INTENT = {rule.intent_id: rule for rule in ACTIVE_HARD_CODED_RULES}
+
+
+def _get_intent_classifier() -> NearestCentroidClassifier | None:
+    # Bloccante (embedding di tutti gli esempi): va chiamata all'avvio o da un thread.
+    global intent_classifier, intent_classifier_error
+    if intent_classifier is not None:
+        return intent_classifier
+    if not INTENT_CLASSIFIER_ENABLED or not SEMANTIC_SEARCH_ENABLED:
+        return None
+    with intent_classifier_lock:
+        if intent_classifier is not None or intent_classifier_error is not None:
+            return intent_classifier
+        try:
+            examples = load_intent_examples(INTENT_EXAMPLES_PATH)
+            if not examples:
+                intent_classifier_error = f"Nessun esempio di intent in {INTENT_EXAMPLES_PATH}."
+                return None
+            # Gli esempi passano dalla stessa normalizzazione delle domande (_classify_query
+            # incorpora QueryFeatures.text), altrimenti centroidi e query non sono confrontabili.
+            normalized = {
+                intent_id: [_normalize_tax_query(item) for item in items]
+                for intent_id, items in examples.items()
+            }
+            intent_classifier = NearestCentroidClassifier.from_examples(
+                normalized,
+                rag.embedder.embed_texts,
+                threshold=INTENT_CLASSIFIER_THRESHOLD,
+            )
+        except Exception as error:  # pragma: no cover
+            intent_classifier_error = f"Classificatore intent non disponibile: {error}"
+            return None
+    return intent_classifier
+
+
+@app.on_event("startup")
+async def _warm_intent_classifier() -> None:
+    if INTENT_CLASSIFIER_ENABLED and SEMANTIC_SEARCH_ENABLED:
+        await asyncio.to_thread(_get_intent_classifier)
+
+
+async def _classify_query(query: QueryFeatures) -> tuple[List[float] | None, IntentPrediction | None]:
+    # Il vettore della query serve anche alla ricerca su Qdrant: viene calcolato una sola volta,
+    # in un thread come il retrieval.
+    classifier = intent_classifier
+    if classifier is None and INTENT_CLASSIFIER_ENABLED and SEMANTIC_SEARCH_ENABLED and intent_classifier_error is None:
+        classifier = await asyncio.to_thread(_get_intent_classifier)
+    if classifier is None or not query.text:
+        return None, None
+    query_vector = await asyncio.to_thread(rag.embed_query, query.text)
+    return query_vector, classifier.classify(query_vector)
+
+
+def _is_routed_off_topic(query: QueryFeatures, prediction: IntentPrediction | None) -> bool:
+    if prediction is not None:
+        return prediction.intent_id == OFF_TOPIC_INTENT
+    return _is_off_topic_query(query)
+
+
+def _route_hardcoded_rule(
+    query: QueryFeatures,
+    regime_id: str,
+    prediction: IntentPrediction | None,
+) -> tuple[HardCodedRule, str] | None:
+    # Il classificatore sceglie solo quale regola provare prima: una regola risponde
+    # soltanto se il suo predicato concorda, altrimenti decide la scansione normale.
+    if prediction is not None:
+        rule = ACTIVE_HARD_CODED_RULES_BY_INTENT.get(prediction.intent_id)
+        if rule is not None and rule.regime_id == regime_id and rule.predicate(query):
+            message = rule.message(query) if callable(rule.message) else rule.message
+            if message:
+                return rule, message
+    return _match_hardcoded_rule(query, regime_id)
+
+
+def _sse_message_response(message: str, sources: List[str] | None = None) -> StreamingResponse:
+    async def message_gen():
+        payload = {"text": message, "done": True, "sources": sources or []}
+        yield f"data: {json.dumps(payload, ensure_ascii=False)}\n\n"
+
+    return StreamingResponse(message_gen(), media_type="text/event-stream")
+
+
 def _clean_model_answer(answer: str) -> str:
     cleaned = answer.strip()
     replacements = (
@@ -1804,13 +3020,21 @@ def _clean_model_answer(answer: str) -> str:
     return cleaned
 
 
-def _intent_expansions(query: str, regime_id: str) -> List[str]:
+EXPANSION_THRESHOLD_TERMS = _keyword_set("soglia", "ricavi", "compensi", "limite", "uscita")
+EXPANSION_TAX_TERMS = _keyword_set("tass", "imposta", "aliquota", "sostitutiva")
+EXPANSION_DEADLINE_TERMS = _keyword_set("scadenz", "saldo", "acconto", "calendario")
+EXPANSION_INPS_TERMS = _keyword_set("inps", "contribut", "artigiani", "commercianti", "gestione separata", "35%")
+EXPANSION_EXCLUSION_TERMS = _keyword_set("ostativ", "esclusion", "esclus", "cause")
+
+
+def _intent_expansions(query: "str | QueryFeatures", regime_id: str) -> List[str]:
     if regime_id != "forfettario":
         return []
-    q = _normalize_tax_query(query)
+    features = _query_features(query)
+    q = features.text
     expansions: List[str] = []
 
-    definition_term = _extract_definition_term(q)
+    definition_term = _extract_definition_term(features)
     if definition_term:
         expansions.extend(
             [
@@ -1823,7 +3047,7 @@ def _intent_expansions(query: str, regime_id: str) -> List[str]:
     if "ateco" in q:
         expansions.append("tabella coefficienti redditività ateco allegato 4")
 
-    if any(term in q for term in ("soglia", "ricavi", "compensi", "limite", "uscita")):
+    if _any_term(features, EXPANSION_THRESHOLD_TERMS):
         expansions.extend(
             [
                 "regime forfettario soglia 85000 ricavi compensi",
@@ -1832,7 +3056,7 @@ def _intent_expansions(query: str, regime_id: str) -> List[str]:
             ]
         )
 
-    if any(term in q for term in ("tass", "imposta", "aliquota", "sostitutiva")):
+    if _any_term(features, EXPANSION_TAX_TERMS):
         expansions.extend(
             [
                 "regime forfettario imposta sostitutiva 15% 5%",
@@ -1841,7 +3065,7 @@ def _intent_expansions(query: str, regime_id: str) -> List[str]:
             ]
         )
 
-    if any(term in q for term in ("scadenz", "saldo", "acconto", "calendario")):
+    if _any_term(features, EXPANSION_DEADLINE_TERMS):
         expansions.extend(
             [
                 "calendario fiscale forfettari 2026 saldo acconto",
@@ -1849,7 +3073,7 @@ def _intent_expansions(query: str, regime_id: str) -> List[str]:
             ]
         )
 
-    if any(term in q for term in ("inps", "contribut", "artigiani", "commercianti", "gestione separata", "35%")):
+    if _any_term(features, EXPANSION_INPS_TERMS):
         expansions.extend(
             [
                 "riduzione contributiva 35% regime forfettario",
@@ -1860,7 +3084,7 @@ def _intent_expansions(query: str, regime_id: str) -> List[str]:
             ]
         )
 
-    if any(term in q for term in ("ostativ", "esclusion", "esclus", "cause")):
+    if _any_term(features, EXPANSION_EXCLUSION_TERMS):
         expansions.extend(
             [
                 "cause ostative regime forfettario 2026",
@@ -1871,6 +3095,11 @@ def _intent_expansions(query: str, regime_id: str) -> List[str]:
     return list(dict.fromkeys(expansions))
 
 
+# Tutti gli insiemi _keyword_set (regole ed espansioni) sono dichiarati sopra: l'automa si
+# compila una volta sola qui, prima che le richieste lo usino dai thread di asyncio.to_thread.
+INTENT_KEYWORDS.compile()
+
+
 def _merge_results(primary: List[RetrievedChunk], extras: List[RetrievedChunk], top_k: int = 8) -> List[RetrievedChunk]:
     by_key = {}
     for item in primary + extras:
@@ -1904,8 +3133,8 @@ def _merge_results(primary: List[RetrievedChunk], extras: List[RetrievedChunk],
     return selected
 
 
-def _dynamic_score_thresholds(query: str) -> List[float]:
-    token_count = len(_normalize_tax_query(query).split())
+def _dynamic_score_thresholds(query: "str | QueryFeatures") -> List[float]:
+    token_count = len(_query_features(query).text.split())
     if token_count <= 3:
         return [0.16, 0.12, 0.08]
     if token_count <= 6:
@@ -1913,11 +3142,17 @@ def _dynamic_score_thresholds(query: str) -> List[float]:
     return [0.22, 0.18, 0.12]
 
 
-def _search_with_intent(query: str, regime_id: str) -> tuple[List[RetrievedChunk], str]:
-    normalized_query = _normalize_tax_query(query)
+def _search_with_intent(
+    query: "str | QueryFeatures",
+    regime_id: str,
+    query_vector: List[float] | None = None,
+) -> tuple[List[RetrievedChunk], str]:
+    features = _query_features(query)
+    normalized_query = features.text
+    raw_query = features.raw.strip()
     primary_queries = [normalized_query]
-    if query.strip() and normalized_query != query.strip().lower():
-        primary_queries.append(query.strip())
+    if raw_query and normalized_query != raw_query.lower():
+        primary_queries.append(raw_query)
 
     lexical_results: List[RetrievedChunk] = []
     if lexical_index is not None:
@@ -1940,7 +3175,7 @@ def _search_with_intent(query: str, regime_id: str) -> tuple[List[RetrievedChunk
             return lexical_results, "lexical"
         return [], "none"
 
-    thresholds = _dynamic_score_thresholds(normalized_query)
+    thresholds = _dynamic_score_thresholds(features)
     for threshold in thresholds:
         primary_results: List[RetrievedChunk] = []
         for primary_query in primary_queries:
@@ -1950,11 +3185,12 @@ def _search_with_intent(query: str, regime_id: str) -> tuple[List[RetrievedChunk
                     top_k=8,
                     min_score=threshold,
                     regime_ids=[regime_id],
+                    query_vector=query_vector if primary_query == normalized_query else None,
                 )
             )
 
         extra_results: List[RetrievedChunk] = []
-        for expanded_query in _intent_expansions(normalized_query, regime_id=regime_id):
+        for expanded_query in _intent_expansions(features, regime_id=regime_id):
             extra_results.extend(
                 rag.search(
                     expanded_query,
@@ -1973,6 +3209,113 @@ def _search_with_intent(query: str, regime_id: str) -> tuple[List[RetrievedChunk
     return lexical_results, "lexical"
 
 
+def _flight_key(kind: str, query: str, regime_id: str) -> tuple:
+    return (kind, query, regime_id, corpus_version)
+
+
+async def _retrieve(
+    query: "str | QueryFeatures", regime_id: str, query_vector: List[float] | None = None
+) -> tuple[List[RetrievedChunk], str]:
+    # Retrieval in un thread, cosi' non blocca l'event loop e domande identiche (dopo la
+    # normalizzazione) arrivate nel frattempo attendono lo stesso risultato.
+    features = _query_features(query)
+    return await request_flights.run(
+        _flight_key("retrieval", features.text, regime_id),
+        lambda: asyncio.to_thread(_search_with_intent, features, regime_id, query_vector),
+    )
+
+
+async def _generate_answer(
+    transport: LLMTransport, messages: List[dict], regime_id: str, retrieval_mode: str
+) -> Any:
+    started = time.perf_counter()
+    response = await transport.complete(model=llm_model, messages=messages)
+    _log_llm_usage(
+        "chat",
+        regime_id,
+        usage=getattr(response, "usage", None),
+        started=started,
+        retrieval_mode=retrieval_mode,
+    )
+    return response
+
+
+async def _generate_stream(
+    transport: LLMTransport, messages: List[dict], regime_id: str, retrieval_mode: str
+):
+    usage = None
+    first_token_at = None
+    started = time.perf_counter()
+    async for chunk in transport.stream(
+        model=llm_model,
+        messages=messages,
+        stream_options={"include_usage": True},
+    ):
+        usage = getattr(chunk, "usage", None) or usage
+        if first_token_at is None and getattr(chunk, "choices", None):
+            first_token_at = time.perf_counter()
+        yield chunk
+    _log_llm_usage(
+        "chat-stream",
+        regime_id,
+        usage=usage,
+        started=started,
+        first_token_at=first_token_at,
+        retrieval_mode=retrieval_mode,
+    )
+
+
+async def _coalesce_deltas(chunks: Any, window_s: float):
+    # Il primo delta parte subito (time-to-first-token), i successivi vengono accorpati
+    # in finestre di window_s secondi: meno frame SSE e meno json.dumps per token.
+    loop = asyncio.get_running_loop()
+    iterator = chunks.__aiter__()
+    buffer: List[str] = []
+    sent_first = False
+    deadline: float | None = None
+    pending: asyncio.Future | None = None
+    try:
+        while True:
+            if pending is None:
+                pending = asyncio.ensure_future(iterator.__anext__())
+            timeout = None if deadline is None else max(0.0, deadline - loop.time())
+            done, _ = await asyncio.wait({pending}, timeout=timeout)
+            if not done:
+                yield "".join(buffer)
+                buffer.clear()
+                deadline = None
+                continue
+            finished, pending = pending, None
+            try:
+                chunk = finished.result()
+            except StopAsyncIteration:
+                break
+            if isinstance(chunk, QueuePosition):
+                yield chunk
+                continue
+            delta = chunk.choices[0].delta.content or "" if chunk.choices else ""
+            if not delta:
+                continue
+            buffer.append(delta)
+            if not sent_first or window_s <= 0 or (deadline is not None and loop.time() >= deadline):
+                yield "".join(buffer)
+                buffer.clear()
+                sent_first = True
+                deadline = None
+            elif deadline is None:
+                deadline = loop.time() + window_s
+        if buffer:
+            yield "".join(buffer)
+    finally:
+        if pending is not None:
+            pending.cancel()
+            await asyncio.wait({pending})
+        # Chiude subito lo stream condiviso: se era l'ultimo lettore la generazione si ferma.
+        aclose = getattr(iterator, "aclose", None)
+        if aclose is not None:
+            await aclose()
+
+
 def _resolve_requested_regime(regime_id: str | None) -> RegimeProfile | None:
     if not regime_id:
         return None
@@ -1981,8 +3324,9 @@ def _resolve_requested_regime(regime_id: str | None) -> RegimeProfile | None:
 
 
 def _reload_runtime_indexes() -> None:
-    global rag, rag_load_error, rag_ready, lexical_index
+    global rag, rag_load_error, rag_ready, lexical_index, corpus_version
     _refresh_regime_profiles()
+    corpus_version += 1
     rag = QdrantRAG.from_env()
     rag.load()
     rag_load_error = None
@@ -2032,7 +3376,7 @@ async def persist_chat_turn(payload: ChatTurnPayload):
         confidence_score=payload.confidence_score,
         retrieval_mode=payload.retrieval_mode,
     )
-    event_store.append(
+    _publish_event(
         {
             "event": "chat_turn_saved",
             "chat_id": payload.chat_id,
@@ -2083,10 +3427,14 @@ async def save_feedback(payload: FeedbackRequest):
 
 
 @app.get("/admin/overview")
-async def admin_overview(x_admin_key: str | None = Header(default=None)):
+async def admin_overview(
+    window_hours: int = Query(default=24, ge=1, le=USAGE_RETENTION_HOURS),
+    x_admin_key: str | None = Header(default=None),
+):
     _require_admin(x_admin_key)
-    stats = build_admin_stats(chat_store, feedback_store, event_store)
-    recent_feedback = feedback_store.read_all()[-10:]
+    await asyncio.to_thread(event_bus.flush)
+    stats = admin_aggregates.stats(usage_window_hours=window_hours)
+    recent_feedback = feedback_store.read_tail(10)
     return {
         "stats": stats.model_dump(),
         "recent_feedback": recent_feedback,
@@ -2094,6 +3442,32 @@ async def admin_overview(x_admin_key: str | None = Header(default=None)):
     }
 
 
+@app.get("/admin/events")
+async def admin_events(
+    event: str | None = None,
+    window_minutes: int = 60,
+    bucket: str = "minute",
+    x_admin_key: str | None = Header(default=None),
+):
+    # Serie per minuto/ora per le dashboard: `event` accetta piu' tipi separati da virgola.
+    _require_admin(x_admin_key)
+    await asyncio.to_thread(event_bus.flush)
+    events = [item.strip() for item in (event or "").split(",") if item.strip()] or None
+    try:
+        return event_rollups.series(events, timedelta(minutes=max(1, window_minutes)), bucket)
+    except ValueError as error:
+        raise HTTPException(status_code=400, detail=str(error)) from error
+
+
+@app.post("/admin/aggregates/rebuild")
+async def admin_rebuild_aggregates(x_admin_key: str | None = Header(default=None)):
+    _require_admin(x_admin_key)
+    await asyncio.to_thread(event_bus.flush)
+    # Rilettura completa di chat e log: fuori dall'event loop.
+    stats = await asyncio.to_thread(admin_aggregates.rebuild)
+    return {"status": "rebuilt", "stats": stats.model_dump()}
+
+
 @app.post("/admin/auth/verify")
 async def admin_auth_verify(x_admin_key: str | None = Header(default=None)):
     _require_admin(x_admin_key)
@@ -2142,7 +3516,7 @@ async def admin_reindex(x_admin_key: str | None = Header(default=None)):
         recreate_collection=True,
     )
     _reload_runtime_indexes()
-    event_store.append(
+    _publish_event(
         {
             "event": "reindex_completed",
             "total_chunks": total_chunks,
@@ -2191,7 +3565,8 @@ async def read_root(payload: ChatRequest):
             sources=[],
             chat_id=payload.chat_id,
         )
-    contenuto = _normalize_tax_query(raw_contenuto)
+    features = _query_features(raw_contenuto)
+    contenuto = features.text
 
     requested_regime = _resolve_requested_regime(payload.regime_id)
     if payload.regime_id and requested_regime is None:
@@ -2201,8 +3576,8 @@ async def read_root(payload: ChatRequest):
             chat_id=payload.chat_id,
         )
 
-    llm_client = _get_llm_client()
-    if llm_client is None:
+    transport = _get_llm_transport()
+    if transport is None:
         return _respond(
             message=client_init_error or "Client DeepSeek non disponibile.",
             sources=[],
@@ -2232,11 +3607,9 @@ async def read_root(payload: ChatRequest):
         )
 
     is_forfettario_regime = active_regime.regime_id == "forfettario"
-    allow_critical = _allow_hardcoded("critical")
-    allow_stable = _allow_hardcoded("stable")
-    allow_optional = _allow_hardcoded("optional")
 
-    if _is_off_topic_query(contenuto):
+    query_vector, intent_prediction = await _classify_query(features)
+    if _is_routed_off_topic(features, intent_prediction):
         return ChatResponse(
             message=(
                 f"{_regime_scope_message(active_regime)} "
@@ -2245,749 +3618,36 @@ async def read_root(payload: ChatRequest):
             sources=[],
         )
 
-    if allow_optional and is_forfettario_regime and _is_forfettario_intro_query(contenuto):
-        return ChatResponse(
-            message=(
-                "Il regime forfettario è un regime fiscale agevolato per partite IVA individuali. "
-                "In pratica, il reddito imponibile non si calcola sottraendo tutte le spese reali una per una, "
-                "ma applicando ai ricavi un coefficiente di redditività legato all'attività svolta. "
-                "Su quel reddito si paga di norma un'imposta sostitutiva del 15%, che in alcuni casi scende al 5% "
-                "per le nuove attività. Prevede anche semplificazioni IVA e contabili, ma si può usare solo se "
-                "rispetti i requisiti e non hai cause ostative."
-            ),
-            sources=[
-                "01_Legge_190-2014_Base_Normativa_e_Coefficienti.pdf",
-                "04_Elenco_Cause_Ostative_e_Esclusioni_2026.pdf",
-            ],
-        )
-
-    if allow_stable and is_forfettario_regime and _is_quadro_lm_query(contenuto):
-        return ChatResponse(
-            message=(
-                "Il Quadro LM è la sezione del Modello Redditi Persone Fisiche dedicata ai contribuenti "
-                "che applicano il regime forfettario. Serve a determinare il reddito imponibile e "
-                "l'imposta sostitutiva dovuta."
-            ),
-            sources=[
-                "09_Guida_Tecnica_Quadro_LM_Dichiarazione_Redditi.pdf",
-            ],
-        )
-
-    if allow_critical and is_forfettario_regime and _is_ateco_coeff_query(contenuto):
-        ateco_data = _extract_ateco_components(contenuto)
-        if ateco_data is not None:
-            prefix, subcode = ateco_data
-            coeff = _lookup_coefficiente_ateco(prefix, subcode=subcode)
-            if coeff is not None:
-                if subcode is not None and coeff.endswith("%"):
-                    message = (
-                        f"Il coefficiente di redditività per ATECO {prefix}.{subcode} è {coeff}."
-                    )
-                elif prefix == 46 or prefix == 47:
-                    message = (
-                        f"Per il codice ATECO {prefix}, {coeff} "
-                        "Controlla sempre il sottocodice completo per il valore esatto."
-                    )
-                else:
-                    message = (
-                        f"Il coefficiente di redditività per ATECO {prefix} è {coeff}."
-                    )
-                return ChatResponse(
-                    message=message,
-                    sources=[
-                        "03_Tabella_Coefficienti_Redditivita_ATECO.pdf",
-                        "01_Legge_190-2014_Base_Normativa_e_Coefficienti.pdf",
-                    ],
-                )
-        if _is_ateco_list_query(contenuto):
-            return ChatResponse(
-                message=(
-                    "Nel regime forfettario i coefficienti di redditività sono associati a gruppi ATECO: "
-                    "40% (es. commercio e alloggio/ristorazione), "
-                    "54% (commercio ambulante alimenti/bevande), "
-                    "62% (intermediari del commercio), "
-                    "67% (altre attività economiche), "
-                    "78% (attività professionali, sanitarie, istruzione e finanziarie), "
-                    "86% (costruzioni e attività immobiliari). "
-                    "Se mi indichi un codice ATECO specifico, ti dico il coefficiente esatto."
-                ),
-                sources=[
-                    "03_Tabella_Coefficienti_Redditivita_ATECO.pdf",
-                    "01_Legge_190-2014_Base_Normativa_e_Coefficienti.pdf",
-                ],
-            )
+    hard_coded = _route_hardcoded_rule(features, active_regime.regime_id, intent_prediction)
+    if hard_coded is not None:
+        rule, message = hard_coded
+        _log_llm_usage("chat", active_regime.regime_id, intent_id=rule.intent_id)
+        return ChatResponse(message=message, sources=list(rule.sources))
 
-    if allow_critical and is_forfettario_regime and _is_random_ateco_query(contenuto):
+    if not regime_explicit and is_forfettario_regime and not _is_forfettario_domain_query(features):
         return ChatResponse(
             message=(
-                "Non posso inventare un codice ATECO a caso. Nei documenti disponibili non c'è "
-                "l'elenco completo dei codici ATECO italiani; c'è solo la tabella dei gruppi ATECO "
-                "con i relativi coefficienti. Se mi dai un codice specifico, posso dirti il coefficiente."
+                f"{_regime_scope_message(active_regime)} "
+                "Riformula la domanda in questo ambito."
             ),
-            sources=[
-                "03_Tabella_Coefficienti_Redditivita_ATECO.pdf",
-                "01_Legge_190-2014_Base_Normativa_e_Coefficienti.pdf",
-            ],
+            sources=[],
         )
 
-    if allow_critical and is_forfettario_regime and _is_ateco_codes_query(contenuto):
+    if regime_explicit and not _is_tax_regime_query(features):
         return ChatResponse(
             message=(
-                "Nei documenti disponibili non c'è un elenco completo di tutti i codici ATECO italiani; "
-                "c'è la tabella dei gruppi ATECO rilevanti per il regime forfettario con i relativi coefficienti. "
-                "Se vuoi, posso dirti il coefficiente partendo da un codice ATECO preciso."
+                f"{_regime_scope_message(active_regime)} "
+                "Riformula la domanda in questo ambito."
             ),
-            sources=[
-                "03_Tabella_Coefficienti_Redditivita_ATECO.pdf",
-                "01_Legge_190-2014_Base_Normativa_e_Coefficienti.pdf",
-            ],
+            sources=[],
         )
 
-    if allow_stable and is_forfettario_regime and _is_forfettario_query(contenuto) and _is_limit_query(contenuto) and _is_tax_query(contenuto):
-        return ChatResponse(
-            message=(
-                "Per restare nel regime forfettario, nel periodo precedente ricavi o compensi non devono superare 85.000 euro; "
-                "se durante l'anno superi 100.000 euro, l'uscita dal regime è immediata. "
-                "L'imposta sostitutiva è in via ordinaria al 15%, ridotta al 5% per i primi 5 anni se sono rispettati i requisiti di nuova attività."
-            ),
-            sources=[
-                "02_Circolare_32E-2023_Novita_Soglie_e_Uscita_Immediat.pdf",
-                "01_Legge_190-2014_Base_Normativa_e_Coefficienti.pdf",
-            ],
-        )
-
-    if allow_stable and is_forfettario_regime and _is_forfettario_query(contenuto) and _is_limit_query(contenuto):
-        return ChatResponse(
-            message=(
-                "Per il regime forfettario, la soglia ordinaria è 85.000 euro di ricavi o compensi. "
-                "L'uscita immediata scatta se nell'anno superi 100.000 euro."
-            ),
-            sources=[
-                "02_Circolare_32E-2023_Novita_Soglie_e_Uscita_Immediat.pdf",
-                "01_Legge_190-2014_Base_Normativa_e_Coefficienti.pdf",
-            ],
-        )
-
-    if allow_stable and is_forfettario_regime and _is_general_forfettario_tax_query(contenuto):
-        return ChatResponse(
-            message=(
-                "Nel regime forfettario paghi un'imposta sostitutiva che in via ordinaria e' del 15%. "
-                "Per le nuove attivita', se rispetti i requisiti, l'aliquota scende al 5% per i primi 5 anni."
-            ),
-            sources=[
-                "01_Legge_190-2014_Base_Normativa_e_Coefficienti.pdf",
-                "09_Guida_Tecnica_Quadro_LM_Dichiarazione_Redditi.pdf",
-            ],
-        )
-
-    if allow_stable and is_forfettario_regime and _is_forfettario_exit_100k_query(contenuto):
-        return ChatResponse(
-            message=(
-                "Se superi 100.000 euro di ricavi o compensi nell'anno, l'uscita dal forfettario è immediata "
-                "dal momento del superamento."
-            ),
-            sources=[
-                "02_Circolare_32E-2023_Novita_Soglie_e_Uscita_Immediat.pdf",
-            ],
-        )
-
-    if allow_stable and is_forfettario_regime and _is_cash_basis_threshold_query(contenuto):
-        return ChatResponse(
-            message=(
-                "Per le soglie del regime forfettario conta quanto incassi, non quanto fatturi, perché si applica "
-                "il criterio di cassa. "
-                "Quindi per verificare i limiti di 85.000 e 100.000 euro rilevano i ricavi o compensi percepiti."
-            ),
-            sources=[
-                "02_Circolare_32E-2023_Novita_Soglie_e_Uscita_Immediat.pdf",
-                "01_Legge_190-2014_Base_Normativa_e_Coefficienti.pdf",
-            ],
-        )
-
-    if allow_stable and is_forfettario_regime and _is_aliquota_5_query(contenuto):
-        return ChatResponse(
-            message=(
-                "L'aliquota del 5% si applica alle nuove attività che rispettano i requisiti previsti "
-                "per il regime forfettario, e vale per i primi 5 anni."
-            ),
-            sources=[
-                "01_Legge_190-2014_Base_Normativa_e_Coefficienti.pdf",
-                "02_Circolare_32E-2023_Novita_Soglie_e_Uscita_Immediat.pdf",
-            ],
-        )
-
-    if allow_stable and is_forfettario_regime and _is_inps_35_apply_query(contenuto):
-        return ChatResponse(
-            message=(
-                "La domanda per la riduzione INPS del 35% è esclusivamente telematica. "
-                "Si presenta dal portale INPS, con accesso SPID, CIE o CNS, nel Cassetto Previdenziale per "
-                "Artigiani e Commercianti alla voce Domande telematizzate e Regime agevolato."
-            ),
-            sources=[
-                "11_Guida_Riduzione_Contributiva_35_INPS.pdf",
-                "10_Circolare_INPS_14-2026_Artigiani_e_Commercianti.pdf",
-            ],
-        )
-
-    if allow_stable and is_forfettario_regime and _is_inps_35_deadline_query(contenuto):
-        return ChatResponse(
-            message=(
-                "La domanda per la riduzione contributiva INPS del 35% si presenta solo online nel Cassetto "
-                "Previdenziale Artigiani e Commercianti (accesso con SPID/CIE/CNS). "
-                "Per i contribuenti già attivi va presentata entro il 28 febbraio di ogni anno; "
-                "se inviata dopo, l'agevolazione decorre dal 1° gennaio dell'anno successivo. "
-                "Per le nuove attività, la richiesta va fatta tempestivamente dopo l'iscrizione previdenziale."
-            ),
-            sources=[
-                "11_Guida_Riduzione_Contributiva_35_INPS.pdf",
-                "10_Circolare_INPS_14-2026_Artigiani_e_Commercianti.pdf",
-            ],
-        )
-
-    if allow_stable and is_forfettario_regime and _is_inps_35_late_deadline_query(contenuto):
-        return ChatResponse(
-            message=(
-                "Sì, puoi presentarla anche dopo il 28 febbraio, ma per i contribuenti già attivi la riduzione "
-                "non opera nell'anno in corso. "
-                "Se la domanda è tardiva, l'agevolazione decorre dal 1° gennaio dell'anno successivo."
-            ),
-            sources=[
-                "11_Guida_Riduzione_Contributiva_35_INPS.pdf",
-                "10_Circolare_INPS_14-2026_Artigiani_e_Commercianti.pdf",
-            ],
-        )
-
-    if allow_stable and is_forfettario_regime and _is_inps_35_short_deadline_query(contenuto):
-        return ChatResponse(
-            message=(
-                "Per i contribuenti già attivi, la domanda per la riduzione INPS del 35% va presentata "
-                "entro il 28 febbraio di ogni anno."
-            ),
-            sources=[
-                "11_Guida_Riduzione_Contributiva_35_INPS.pdf",
-                "10_Circolare_INPS_14-2026_Artigiani_e_Commercianti.pdf",
-            ],
-        )
-
-    if allow_stable and is_forfettario_regime and _is_inps_35_march_decorrenza_query(contenuto):
-        return ChatResponse(
-            message=(
-                "Se presenti la domanda il 10 marzo, la riduzione non decorre nell'anno in corso ma dal "
-                "1° gennaio dell'anno successivo."
-            ),
-            sources=[
-                "11_Guida_Riduzione_Contributiva_35_INPS.pdf",
-                "10_Circolare_INPS_14-2026_Artigiani_e_Commercianti.pdf",
-            ],
-        )
-
-    if allow_stable and is_forfettario_regime and _is_inps_35_new_activity_query(contenuto):
-        return ChatResponse(
-            message=(
-                "Per una nuova attività, la richiesta della riduzione INPS del 35% va fatta dopo l'iscrizione "
-                "alla Gestione Artigiani e Commercianti, tramite il Cassetto Previdenziale. "
-                "Va presentata tempestivamente, senza attendere il 28 febbraio dell'anno successivo."
-            ),
-            sources=[
-                "11_Guida_Riduzione_Contributiva_35_INPS.pdf",
-                "10_Circolare_INPS_14-2026_Artigiani_e_Commercianti.pdf",
-            ],
-        )
-
-    if allow_stable and is_forfettario_regime and _is_inps_35_reapply_query(contenuto):
-        return ChatResponse(
-            message=(
-                "Sì, se rinunci puoi presentare una nuova domanda in seguito, purché tu sia ancora nel "
-                "regime forfettario e restino i requisiti per l'agevolazione. "
-                "Per i contribuenti già attivi si applica il termine ordinario del 28 febbraio; se presenti "
-                "la domanda dopo tale data, la riduzione decorre dal 1° gennaio dell'anno successivo."
-            ),
-            sources=[
-                "11_Guida_Riduzione_Contributiva_35_INPS.pdf",
-                "10_Circolare_INPS_14-2026_Artigiani_e_Commercianti.pdf",
-            ],
-        )
-
-    if allow_stable and is_forfettario_regime and _is_inps_35_renewal_query(contenuto):
-        return ChatResponse(
-            message=(
-                "Sì, l'agevolazione si rinnova se continui ad avere i requisiti del regime forfettario e "
-                "dell'iscrizione alla Gestione Artigiani e Commercianti. "
-                "Se i requisiti vengono meno o rinunci, si torna al regime contributivo ordinario."
-            ),
-            sources=[
-                "11_Guida_Riduzione_Contributiva_35_INPS.pdf",
-                "10_Circolare_INPS_14-2026_Artigiani_e_Commercianti.pdf",
-            ],
-        )
-
-    if allow_stable and is_forfettario_regime and _is_inps_35_loss_query(contenuto):
-        return ChatResponse(
-            message=(
-                "L'agevolazione del 35% si perde se non restano i requisiti per applicarla o se presenti "
-                "rinuncia. In quel caso si rientra nel regime contributivo ordinario."
-            ),
-            sources=[
-                "11_Guida_Riduzione_Contributiva_35_INPS.pdf",
-                "10_Circolare_INPS_14-2026_Artigiani_e_Commercianti.pdf",
-            ],
-        )
-
-    if allow_stable and is_forfettario_regime and _is_inps_35_cassa_query(contenuto):
-        return ChatResponse(
-            message=(
-                "No, la riduzione INPS del 35% non si applica ai professionisti iscritti a una Cassa "
-                "professionale e non si applica neppure alla Gestione Separata. "
-                "È riservata agli imprenditori individuali forfettari iscritti alla Gestione Artigiani e Commercianti."
-            ),
-            sources=[
-                "11_Guida_Riduzione_Contributiva_35_INPS.pdf",
-                "10_Circolare_INPS_14-2026_Artigiani_e_Commercianti.pdf",
-                "06_Circolare_INPS_8-2026_Aliquote_Gestione_Separata.pdf",
-            ],
-        )
-
-    if allow_stable and is_forfettario_regime and _is_inps_35_general_query(contenuto):
-        return ChatResponse(
-            message=(
-                "La riduzione INPS del 35% è riservata agli imprenditori individuali forfettari iscritti alla "
-                "Gestione Artigiani e Commercianti; non si applica a Gestione Separata o Casse professionali. "
-                "La domanda è telematica; per gli attivi va presentata entro il 28 febbraio, se tardiva decorre "
-                "dal 1° gennaio dell'anno successivo. "
-                "L'agevolazione si rinnova se restano i requisiti, ma riduce la contribuzione utile ai fini pensionistici."
-            ),
-            sources=[
-                "11_Guida_Riduzione_Contributiva_35_INPS.pdf",
-                "10_Circolare_INPS_14-2026_Artigiani_e_Commercianti.pdf",
-                "06_Circolare_INPS_8-2026_Aliquote_Gestione_Separata.pdf",
-            ],
-        )
-
-    if allow_stable and is_forfettario_regime and _is_ex_datore_after_two_years_query(contenuto):
-        return ChatResponse(
-            message=(
-                "No, non è ostativo se il rapporto con l'ex datore di lavoro è cessato da oltre due periodi "
-                "d'imposta. La causa ostativa riguarda la fatturazione prevalente verso datori di lavoro con "
-                "cui il rapporto è in corso o è cessato nei due precedenti periodi d'imposta."
-            ),
-            sources=[
-                "04_Elenco_Cause_Ostative_e_Esclusioni_2026.pdf",
-                "05_Circolare_9E-2019_Approfondimento_Cause_Ostative.pdf",
-            ],
-        )
-
-    if allow_stable and is_forfettario_regime and _is_srl_control_query(contenuto):
-        return ChatResponse(
-            message=(
-                "In presenza di controllo, anche di fatto, una partecipazione in SRL può costituire causa "
-                "ostativa se la società esercita attività economiche direttamente o indirettamente riconducibili "
-                "a quella svolta individualmente. La sola percentuale di partecipazione non basta: conta il controllo "
-                "ai sensi dell'articolo 2359 c.c. e la riconducibilità dell'attività."
-            ),
-            sources=[
-                "04_Elenco_Cause_Ostative_e_Esclusioni_2026.pdf",
-                "05_Circolare_9E-2019_Approfondimento_Cause_Ostative.pdf",
-            ],
-        )
-
-    if allow_stable and is_forfettario_regime and _is_vies_query(contenuto):
-        return ChatResponse(
-            message=(
-                "Sì, per il forfettario l'iscrizione al VIES è necessaria quando effettua operazioni "
-                "intracomunitarie (vendita di servizi o acquisto di beni/servizi nell'UE). "
-                "Serve a operare con partita IVA abilitata nei rapporti UE."
-            ),
-            sources=[
-                "12_Operazioni_Estere_VIES_Reverse_Charge_e_Dogane.pdf",
-            ],
-        )
-
-    if allow_stable and is_forfettario_regime and _is_ads_reverse_charge_query(contenuto):
-        return ChatResponse(
-            message=(
-                "Per acquisti di servizi esteri come Google Ads o Facebook Ads, in forfettario si applica "
-                "integrazione/autofattura TD17 con IVA al 22% e versamento entro il giorno 16 del mese successivo "
-                "con F24 codice 6099. L'IVA resta un costo non detraibile."
-            ),
-            sources=[
-                "12_Operazioni_Estere_VIES_Reverse_Charge_e_Dogane.pdf",
-                "08a_Guida_Pratica_Fatturazione_Elettronica_Forfettari_2026.pdf",
-            ],
-        )
-
-    if allow_stable and is_forfettario_regime and _is_bollo_reimbursement_tax_query(contenuto):
-        return ChatResponse(
-            message=(
-                "No. Il rimborso dei 2 euro del bollo da parte del cliente non costituisce un ricavo "
-                "aggiuntivo da tassare separatamente e non si somma al limite degli 85.000 euro. Il bollo "
-                "resta solo un riaddebito dell'imposta assolta in fattura."
-            ),
-            sources=[
-                "08b_Manuale_AdE_Imposta_Bollo_Fatture_Elettroniche.pdf",
-                "08a_Guida_Pratica_Fatturazione_Elettronica_Forfettari_2026.pdf",
-                "13_CASI CRITICI E RISPOSTE AI QUESITI (PRASSI ADE).pdf",
-            ],
-        )
-
-    if allow_stable and is_forfettario_regime and _is_residency_query(contenuto):
-        return ChatResponse(
-            message=(
-                "In via generale il regime forfettario e' riservato ai residenti in Italia. Fanno eccezione "
-                "i residenti in uno Stato UE o SEE con adeguato scambio di informazioni, ma solo se producono "
-                "in Italia almeno il 75% del reddito complessivo."
-            ),
-            sources=[
-                "04_Elenco_Cause_Ostative_e_Esclusioni_2026.pdf",
-                "01_Legge_190-2014_Base_Normativa_e_Coefficienti.pdf",
-            ],
-        )
-
-    if allow_stable and is_forfettario_regime and _is_special_vat_regime_query(contenuto):
-        return ChatResponse(
-            message=(
-                "No, i regimi speciali IVA sono incompatibili con il regime forfettario. Se ti avvali di "
-                "regimi speciali come agricoltura, editoria, agenzie di viaggio o sali e tabacchi, non puoi "
-                "accedere o permanere nel forfettario."
-            ),
-            sources=[
-                "04_Elenco_Cause_Ostative_e_Esclusioni_2026.pdf",
-                "01_Legge_190-2014_Base_Normativa_e_Coefficienti.pdf",
-            ],
-        )
-
-    if allow_stable and is_forfettario_regime and _is_730_only_forfettario_query(contenuto):
-        return ChatResponse(
-            message=(
-                "Il reddito della partita IVA forfettaria non si dichiara nel 730 ma nel Modello Redditi PF, "
-                "quadro LM. Il 730 puoi usarlo solo per eventuali altri redditi soggetti a IRPEF, come lavoro "
-                "dipendente, pensione, terreni o fabbricati; se hai solo reddito forfettario, il 730 non basta "
-                "e le detrazioni si usano solo se hai capienza IRPEF su altri redditi."
-            ),
-            sources=[
-                "16_IL MODELLO 730 E IL CONTRIBUENTE FORFETTARIO (2026).pdf",
-                "09_Guida_Tecnica_Quadro_LM_Dichiarazione_Redditi.pdf",
-            ],
-        )
-
-    if allow_stable and is_forfettario_regime and _is_cassa_integrativo_threshold_query(contenuto):
-        return ChatResponse(
-            message=(
-                "No. Il contributo integrativo addebitato in fattura dagli iscritti a una Cassa professionale "
-                "(per esempio 2%, 4% o 5%) non concorre al reddito forfettario e non conta nel limite degli "
-                "85.000 euro."
-            ),
-            sources=[
-                "15_CASSE PROFESSIONALI AUTONOME E REGIME FORFETTARIO (2026).pdf",
-            ],
-        )
-
-    if allow_stable and is_forfettario_regime and _is_cassa_integrativo_deduction_query(contenuto):
-        return ChatResponse(
-            message=(
-                "No. Il contributo integrativo non e' deducibile e non va trattato come costo del professionista, "
-                "perche' e' un importo addebitato al cliente e poi riversato alla Cassa. In deduzione, nel rigo "
-                "LM35, rilevano invece i contributi soggettivi e maternita' effettivamente versati."
-            ),
-            sources=[
-                "15_CASSE PROFESSIONALI AUTONOME E REGIME FORFETTARIO (2026).pdf",
-                "09_Guida_Tecnica_Quadro_LM_Dichiarazione_Redditi.pdf",
-            ],
-        )
-
-    if allow_stable and is_forfettario_regime and _is_naspi_anticipation_query(contenuto):
-        return ChatResponse(
-            message=(
-                "Sì, chi apre una partita IVA forfettaria puo' chiedere l'anticipazione della NASPI in un'unica "
-                "soluzione, ma la domanda va inviata all'INPS entro 30 giorni dall'apertura della partita IVA o "
-                "dall'inizio attivita'. L'importo anticipato e' tassato ordinariamente IRPEF, non rientra nel "
-                "forfettario e non concorre al limite degli 85.000 euro."
-            ),
-            sources=[
-                "14_NASPI, DISOCCUPAZIONE E INCENTIVI ALL'AUTOIMPRENDITORIALITÀ (2026).pdf",
-            ],
-        )
-
-    if allow_stable and is_forfettario_regime and _is_naspi_monthly_compatibility_query(contenuto):
-        return ChatResponse(
-            message=(
-                "La NASPI mensile puo' essere compatibile con la partita IVA forfettaria, ma non resta intera: "
-                "va comunicato il reddito presunto all'INPS con NASPI-COM entro un mese e l'assegno viene ridotto. "
-                "Nei documenti la compatibilita' e' indicata entro 5.500 euro per attivita' d'impresa/commercio e "
-                "8.500 euro per lavoro autonomo o professionale."
-            ),
-            sources=[
-                "14_NASPI, DISOCCUPAZIONE E INCENTIVI ALL'AUTOIMPRENDITORIALITÀ (2026).pdf",
-            ],
-        )
-
-    if allow_stable and is_forfettario_regime and _is_bollo_exact_threshold_query(contenuto):
-        return ChatResponse(
-            message=(
-                "No, con importo esattamente pari a 77,47 euro il bollo non si applica. "
-                "L'imposta di bollo da 2,00 euro scatta solo oltre 77,47 euro."
-            ),
-            sources=[
-                "08b_Manuale_AdE_Imposta_Bollo_Fatture_Elettroniche.pdf",
-                "08a_Guida_Pratica_Fatturazione_Elettronica_Forfettari_2026.pdf",
-            ],
-        )
-
-    if allow_stable and is_forfettario_regime and _is_bollo_query(contenuto):
-        return ChatResponse(
-            message=(
-                "Sì, se la fattura supera 77,47 euro si applica l'imposta di bollo da 2,00 euro, "
-                "anche nelle fatture verso l'estero. "
-                "In fattura va indicata la dicitura di assolvimento del bollo; "
-                "il versamento è gestito con liquidazione periodica tramite i canali dell'Agenzia delle Entrate."
-            ),
-            sources=[
-                "08b_Manuale_AdE_Imposta_Bollo_Fatture_Elettroniche.pdf",
-                "08a_Guida_Pratica_Fatturazione_Elettronica_Forfettari_2026.pdf",
-            ],
-        )
-
-    if allow_stable and is_forfettario_regime and _is_intrastat_query(contenuto):
-        return ChatResponse(
-            message=(
-                "Nei documenti, l'Intrastat è richiamato per le operazioni di servizi B2B verso soggetti UE. "
-                "Per i casi specifici (periodicità e obbligo puntuale) è necessaria verifica operativa sul singolo caso."
-            ),
-            sources=[
-                "12_Operazioni_Estere_VIES_Reverse_Charge_e_Dogane.pdf",
-            ],
-        )
-
-    if allow_stable and is_forfettario_regime and _is_eu_b2c_services_query(contenuto):
-        return ChatResponse(
-            message=(
-                "Nei documenti disponibili è trattata in modo esplicito soprattutto la casistica B2B UE "
-                "(reverse charge e Intrastat). "
-                "Per servizi B2C verso cliente UE la disciplina IVA dipende dal tipo di servizio e dal luogo di consumo, "
-                "quindi serve una verifica specifica prima di emettere fattura."
-            ),
-            sources=[
-                "12_Operazioni_Estere_VIES_Reverse_Charge_e_Dogane.pdf",
-                "08a_Guida_Pratica_Fatturazione_Elettronica_Forfettari_2026.pdf",
-            ],
-        )
-
-    if allow_stable and is_forfettario_regime and _is_eu_b2b_services_query(contenuto):
-        return ChatResponse(
-            message=(
-                "Per servizi B2B verso cliente UE, la fattura si emette senza IVA con dicitura "
-                "\"Reverse Charge\" o \"Inversione contabile\" e richiede iscrizione VIES. "
-                "Per queste operazioni è previsto l'adempimento Intrastat. "
-                "Se la fattura supera 77,47 euro, si applica anche il bollo da 2,00 euro."
-            ),
-            sources=[
-                "12_Operazioni_Estere_VIES_Reverse_Charge_e_Dogane.pdf",
-                "08a_Guida_Pratica_Fatturazione_Elettronica_Forfettari_2026.pdf",
-            ],
-        )
-
-    if allow_stable and is_forfettario_regime and _is_extra_ue_wording_query(contenuto):
-        return ChatResponse(
-            message=(
-                "La dicitura da usare per servizi extra-UE è: "
-                "\"Operazione non soggetta ai sensi degli artt. da 7 a 7-septies del DPR 633/72\"."
-            ),
-            sources=[
-                "12_Operazioni_Estere_VIES_Reverse_Charge_e_Dogane.pdf",
-            ],
-        )
-
-    if allow_stable and is_forfettario_regime and _is_extra_ue_services_query(contenuto):
-        return ChatResponse(
-            message=(
-                "Per servizi verso cliente extra-UE, la fattura è senza IVA con dicitura: "
-                "\"Operazione non soggetta ai sensi degli artt. da 7 a 7-septies del DPR 633/72\". "
-                "Se l'importo supera 77,47 euro, si applica il bollo da 2,00 euro."
-            ),
-            sources=[
-                "12_Operazioni_Estere_VIES_Reverse_Charge_e_Dogane.pdf",
-                "08b_Manuale_AdE_Imposta_Bollo_Fatture_Elettroniche.pdf",
-            ],
-        )
-
-    if allow_stable and is_forfettario_regime and _is_employment_income_under_threshold_query(contenuto):
-        return ChatResponse(
-            message=(
-                "Con reddito da lavoro dipendente pari a 29.000 euro, la sola soglia dei 30.000 euro "
-                "non è causa ostativa. "
-                "Restano comunque da verificare le altre condizioni di accesso e permanenza nel forfettario."
-            ),
-            sources=[
-                "04_Elenco_Cause_Ostative_e_Esclusioni_2026.pdf",
-                "05_Circolare_9E-2019_Approfondimento_Cause_Ostative.pdf",
-            ],
-        )
-
-    if allow_stable and is_forfettario_regime and _is_employment_income_threshold_query(contenuto):
-        return ChatResponse(
-            message=(
-                "In generale, con redditi da lavoro dipendente o assimilati superiori a 30.000 euro "
-                "non puoi applicare il regime forfettario. "
-                "La soglia non rileva se il rapporto di lavoro è cessato. "
-                "Restano comunque da verificare anche le altre cause ostative."
-            ),
-            sources=[
-                "04_Elenco_Cause_Ostative_e_Esclusioni_2026.pdf",
-                "05_Circolare_9E-2019_Approfondimento_Cause_Ostative.pdf",
-                "02_Circolare_32E-2023_Novita_Soglie_e_Uscita_Immediat.pdf",
-            ],
-        )
-
-    if allow_stable and is_forfettario_regime and _is_employment_cessation_query(contenuto):
-        return ChatResponse(
-            message=(
-                "Sì: se il rapporto di lavoro dipendente è cessato, la soglia dei 30.000 euro non rileva "
-                "come causa ostativa. Restano però da verificare gli altri requisiti del regime forfettario."
-            ),
-            sources=[
-                "04_Elenco_Cause_Ostative_e_Esclusioni_2026.pdf",
-                "05_Circolare_9E-2019_Approfondimento_Cause_Ostative.pdf",
-            ],
-        )
-
-    if allow_stable and is_forfettario_regime and _is_business_meal_cost_query(contenuto):
-        return ChatResponse(
-            message=(
-                "No. Nel regime forfettario non detrai l'IVA sugli acquisti e non deduci analiticamente "
-                "spese come una cena con cliente. Il vantaggio fiscale e' gia' forfettizzato tramite il "
-                "coefficiente di redditivita', quindi quella fattura non ti abbassa separatamente l'imposta del 15%."
-            ),
-            sources=[
-                "01_Legge_190-2014_Base_Normativa_e_Coefficienti.pdf",
-                "08a_Guida_Pratica_Fatturazione_Elettronica_Forfettari_2026.pdf",
-                "13_CASI CRITICI E RISPOSTE AI QUESITI (PRASSI ADE).pdf",
-            ],
-        )
-
-    if allow_stable and is_forfettario_regime and _is_employee_above_threshold_access_query(contenuto):
-        return ChatResponse(
-            message=(
-                "No, in via generale non puoi applicare il regime forfettario se hai redditi da lavoro "
-                "dipendente o assimilati superiori a 30.000 euro. La soglia diventa irrilevante solo se il "
-                "rapporto di lavoro e' cessato; altrimenti questa e' una causa ostativa."
-            ),
-            sources=[
-                "04_Elenco_Cause_Ostative_e_Esclusioni_2026.pdf",
-                "05_Circolare_9E-2019_Approfondimento_Cause_Ostative.pdf",
-                "16_IL MODELLO 730 E IL CONTRIBUENTE FORFETTARIO (2026).pdf",
-            ],
-        )
-
-    if allow_stable and is_forfettario_regime and _is_ex_employer_prevalence_query(contenuto):
-        return ChatResponse(
-            message=(
-                "Puoi aprire la partita IVA, ma c'e' un rischio forte di causa ostativa se fatturi "
-                "prevalentemente all'ex datore di lavoro o alla ex azienda con cui il rapporto e' in corso "
-                "o e' cessato nei due precedenti periodi d'imposta. Se oltre il 50% dei compensi arriva da "
-                "quel soggetto, perdi il forfettario dall'anno successivo."
-            ),
-            sources=[
-                "04_Elenco_Cause_Ostative_e_Esclusioni_2026.pdf",
-                "05_Circolare_9E-2019_Approfondimento_Cause_Ostative.pdf",
-                "13_CASI CRITICI E RISPOSTE AI QUESITI (PRASSI ADE).pdf",
-            ],
-        )
-
-    if allow_stable and is_forfettario_regime and _is_strumental_asset_sale_query(contenuto):
-        return ChatResponse(
-            message=(
-                "No. La cessione di un bene strumentale usato, come un vecchio PC aziendale, non si somma "
-                "ai ricavi o compensi che contano per la soglia degli 85.000 euro. In questi casi il "
-                "forfettario non tassa la plusvalenza come ricavo ordinario del regime."
-            ),
-            sources=[
-                "13_CASI CRITICI E RISPOSTE AI QUESITI (PRASSI ADE).pdf",
-                "01_Legge_190-2014_Base_Normativa_e_Coefficienti.pdf",
-            ],
-        )
-
-    if allow_stable and is_forfettario_regime and _is_family_detraction_query(contenuto):
-        return ChatResponse(
-            message=(
-                "No. L'imposta sostitutiva del regime forfettario non consente di recuperare dal carico "
-                "fiscale della partita IVA le detrazioni per figli a carico o spese come l'asilo nido. "
-                "Quelle agevolazioni non riducono l'imposta sostitutiva del forfettario; restano solo gli "
-                "eventuali strumenti dedicati, come l'Assegno Unico, se spettanti."
-            ),
-            sources=[
-                "16_IL MODELLO 730 E IL CONTRIBUENTE FORFETTARIO (2026).pdf",
-                "01_Legge_190-2014_Base_Normativa_e_Coefficienti.pdf",
-            ],
-        )
-
-    if allow_stable and is_forfettario_regime and _is_exit_100k_example_query(contenuto):
-        return ChatResponse(
-            message=(
-                "No, non resti forfettario fino a dicembre. Se superi 100.000 euro di compensi o ricavi "
-                "percepiti nell'anno, l'uscita dal regime e' immediata dal momento del superamento e "
-                "sull'operazione che fa superare la soglia devi applicare subito il regime IVA ordinario."
-            ),
-            sources=[
-                "02_Circolare_32E-2023_Novita_Soglie_e_Uscita_Immediat.pdf",
-                "13_CASI CRITICI E RISPOSTE AI QUESITI (PRASSI ADE).pdf",
-                "01_Legge_190-2014_Base_Normativa_e_Coefficienti.pdf",
-            ],
-        )
-
-    if allow_stable and is_forfettario_regime and _is_foreign_software_reverse_charge_query(contenuto):
-        return ChatResponse(
-            message=(
-                "No, non sei a posto cosi'. Se acquisti un software o un servizio digitale da un fornitore "
-                "estero senza IVA, devi emettere autofattura/integrazione TD17 con IVA italiana al 22% e "
-                "versarla con F24 entro il giorno 16 del mese successivo. Nel forfettario quell'IVA resta "
-                "un costo e non e' detraibile."
-            ),
-            sources=[
-                "12_Operazioni_Estere_VIES_Reverse_Charge_e_Dogane.pdf",
-                "08a_Guida_Pratica_Fatturazione_Elettronica_Forfettari_2026.pdf",
-            ],
-        )
-
-    if allow_stable and is_forfettario_regime and _is_srl_non_reconducible_query(contenuto):
-        return ChatResponse(
-            message=(
-                "Sì, in linea di principio puoi applicare il forfettario se hai solo il 20% della SRL, "
-                "quindi senza controllo, e l'attivita' individuale non e' riconducibile a quella della "
-                "societa'. Nel tuo esempio pulizie e consulenza marketing sono attivita' diverse, quindi "
-                "la sola partecipazione del 20% non integra di per se' la causa ostativa."
-            ),
-            sources=[
-                "04_Elenco_Cause_Ostative_e_Esclusioni_2026.pdf",
-                "05_Circolare_9E-2019_Approfondimento_Cause_Ostative.pdf",
-                "13_CASI CRITICI E RISPOSTE AI QUESITI (PRASSI ADE).pdf",
-            ],
-        )
-
-    if not regime_explicit and is_forfettario_regime and not _is_forfettario_domain_query(contenuto):
-        return ChatResponse(
-            message=(
-                f"{_regime_scope_message(active_regime)} "
-                "Riformula la domanda in questo ambito."
-            ),
-            sources=[],
-        )
-
-    if regime_explicit and not _is_tax_regime_query(contenuto):
-        return ChatResponse(
-            message=(
-                f"{_regime_scope_message(active_regime)} "
-                "Riformula la domanda in questo ambito."
-            ),
-            sources=[],
-        )
-
-    definition_term = _extract_definition_term(raw_contenuto)
+    definition_term = _extract_definition_term(features)
     term_mentions: List[LexicalChunk] = []
     if definition_term:
         term_mentions = _collect_term_mentions(definition_term, active_regime.regime_id)
 
-    retrieved, retrieval_mode = _search_with_intent(
-        contenuto, regime_id=active_regime.regime_id
-    )
+    retrieved, retrieval_mode = await _retrieve(contenuto, active_regime.regime_id, query_vector)
     if not retrieved:
         if definition_term and term_mentions:
             _log_rag_event(
@@ -3073,46 +3733,20 @@ async def read_root(payload: ChatRequest):
             },
         )
 
-    context_blocks = []
-    for item in retrieved:
-        context_blocks.append(
-            (
-                f"[Fonte: {item.source} | Chunk: {item.chunk_id} | "
-                f"Score: {item.score:.3f}]\n{item.text}"
-            )
-        )
-
-    context = "\n\n".join(context_blocks)
-    system_prompt = (
-        f"Sei un assistente fiscale per {active_regime.label.lower()} in Italia. "
-        "Rispondi solo con informazioni presenti nel CONTEXT. "
-        "Se il CONTEXT non contiene una parte della risposta, dillo in una sola frase breve. "
-        "Se un termine è solo citato ma non definito, dillo esplicitamente. "
-        "Non affermare che un termine non è menzionato se compare nel CONTEXT. "
-        "Non inventare norme, soglie o scadenze. "
-        "Stile obbligatorio: italiano chiaro, tono professionale, nessun markdown, "
-        "nessun uso di **, # o elenchi con trattini. "
-        "Non iniziare con formule tipo 'In base al CONTEXT fornito'."
-    )
-
+    context = _build_context(retrieved)
+    messages = build_messages(active_regime.label, context, contenuto)
     try:
-        response = llm_client.chat.completions.create(
-            model=llm_model,
-            messages=[
-                {"role": "system", "content": system_prompt},
-                {
-                    "role": "user",
-                    "content": (
-                        f"DOMANDA:\n{contenuto}\n\n"
-                        f"CONTEXT:\n{context}\n\n"
-                        "Rispondi in italiano in modo sintetico. "
-                        "Usa massimo 4 frasi totali. "
-                        "Dai prima la risposta diretta. "
-                        "Non inserire mai le fonti nel testo della risposta."
-                    ),
-                },
-            ],
-            stream=False,
+        response = await request_flights.run(
+            _flight_key("answer", contenuto, active_regime.regime_id),
+            lambda: _generate_answer(transport, messages, active_regime.regime_id, retrieval_mode),
+        )
+    except LLMBusyError:
+        _log_rag_event("llm_busy", {"endpoint": "chat", "regime": active_regime.regime_id})
+        return _respond(
+            message=LLM_BUSY_MESSAGE,
+            sources=[],
+            regime_id=active_regime.regime_id,
+            chat_id=payload.chat_id,
         )
     except RateLimitError:
         return _respond(
@@ -3154,8 +3788,6 @@ async def read_root(payload: ChatRequest):
 @app.post("/chat-stream")
 async def chat_stream(payload: ChatRequest):
     """Streaming chat endpoint that returns Server-Sent Events."""
-    import asyncio
-
     if SEMANTIC_SEARCH_ENABLED and not _ensure_rag_ready():
         async def error_gen():
             yield f"data: {json.dumps({'error': 'RAG non disponibile'}, ensure_ascii=False)}\n\n"
@@ -3170,12 +3802,11 @@ async def chat_stream(payload: ChatRequest):
     # Resolve regime (same logic as main endpoint)
     requested_regime = _resolve_requested_regime(payload.regime_id)
     if payload.regime_id and requested_regime is None:
-        async def regime_notfound_gen():
-            msg = "Il regime selezionato non e' disponibile tra i corpora caricati."
-            yield f"data: {json.dumps({'text': msg, 'done': True, 'sources': []}, ensure_ascii=False)}\n\n"
-        return StreamingResponse(regime_notfound_gen(), media_type="text/event-stream")
+        msg = "Il regime selezionato non e' disponibile tra i corpora caricati."
+        return _sse_message_response(msg)
 
-    contenuto = _normalize_tax_query(raw_contenuto)
+    features = _query_features(raw_contenuto)
+    contenuto = features.text
 
     if requested_regime is not None:
         active_regime, regime_explicit, regime_ambiguous = requested_regime, True, False
@@ -3184,410 +3815,43 @@ async def chat_stream(payload: ChatRequest):
 
     if regime_ambiguous:
         available = ", ".join(profile.label for profile in REGIME_PROFILES)
-        async def ambiguous_gen():
-            msg = f"La domanda sembra riferirsi a piu' regimi. Specifica meglio il regime fiscale tra: {available}."
-            yield f"data: {json.dumps({'text': msg, 'done': True, 'sources': []}, ensure_ascii=False)}\n\n"
-        return StreamingResponse(ambiguous_gen(), media_type="text/event-stream")
+        msg = f"La domanda sembra riferirsi a piu' regimi. Specifica meglio il regime fiscale tra: {available}."
+        return _sse_message_response(msg)
 
     if active_regime is None:
-        async def noregime_gen():
-            yield f"data: {json.dumps({'text': _regime_scope_message(), 'done': True, 'sources': []}, ensure_ascii=False)}\n\n"
-        return StreamingResponse(noregime_gen(), media_type="text/event-stream")
+        return _sse_message_response(_regime_scope_message())
 
     # Handle off-topic with immediate response
-    if _is_off_topic_query(contenuto):
-        async def offtopic_gen():
-            msg = f"{_regime_scope_message(active_regime)} Riformula la domanda in questo ambito."
-            yield f"data: {json.dumps({'text': msg, 'done': True, 'sources': []}, ensure_ascii=False)}\n\n"
-        return StreamingResponse(offtopic_gen(), media_type="text/event-stream")
+    query_vector, intent_prediction = await _classify_query(features)
+    if _is_routed_off_topic(features, intent_prediction):
+        msg = f"{_regime_scope_message(active_regime)} Riformula la domanda in questo ambito."
+        return _sse_message_response(msg)
 
-    # Hardcoded responses (same as main endpoint)
+    # Risposte curate (stessa tabella dell'endpoint principale)
     is_forfettario_regime = active_regime.regime_id == "forfettario"
-    allow_critical = _allow_hardcoded("critical")
-    allow_stable = _allow_hardcoded("stable")
-    allow_optional = _allow_hardcoded("optional")
-
-    if allow_optional and is_forfettario_regime and _is_forfettario_intro_query(contenuto):
-        async def intro_gen():
-            msg = (
-                "Il regime forfettario e' un regime fiscale agevolato per partite IVA individuali. "
-                "In pratica, il reddito imponibile non si calcola sottraendo tutte le spese reali una per una, "
-                "ma applicando ai ricavi un coefficiente di redditivita' legato all'attivita' svolta. "
-                "Su quel reddito si paga di norma un'imposta sostitutiva del 15%, che in alcuni casi scende al 5%."
-            )
-            yield f"data: {json.dumps({'text': msg, 'done': True, 'sources': []}, ensure_ascii=False)}\n\n"
-        return StreamingResponse(intro_gen(), media_type="text/event-stream")
-
-    if allow_stable and is_forfettario_regime and _is_quadro_lm_query(contenuto):
-        async def quadrolm_gen():
-            msg = (
-                "Il Quadro LM e' la sezione del Modello Redditi Persone Fisiche dedicata ai contribuenti "
-                "che applicano il regime forfettario. Serve a determinare il reddito imponibile e "
-                "l'imposta sostitutiva dovuta."
-            )
-            yield f"data: {json.dumps({'text': msg, 'done': True, 'sources': ['09_Guida_Tecnica_Quadro_LM_Dichiarazione_Redditi.pdf']}, ensure_ascii=False)}\n\n"
-        return StreamingResponse(quadrolm_gen(), media_type="text/event-stream")
-
-    if allow_critical and is_forfettario_regime and _is_ateco_coeff_query(contenuto):
-        ateco_data = _extract_ateco_components(contenuto)
-        if ateco_data is not None:
-            prefix, subcode = ateco_data
-            coeff = _lookup_coefficiente_ateco(prefix, subcode=subcode)
-            if coeff is not None:
-                if subcode is not None and coeff.endswith("%"):
-                    msg = f"Il coefficiente di redditivita' per ATECO {prefix}.{subcode} e' {coeff}."
-                elif prefix == 46 or prefix == 47:
-                    msg = f"Per il codice ATECO {prefix}, {coeff}. Controlla sempre il sottocodice completo per il valore esatto."
-                else:
-                    msg = f"Il coefficiente di redditivita' per ATECO {prefix} e' {coeff}."
-                async def ateco_gen():
-                    yield f"data: {json.dumps({'text': msg, 'done': True, 'sources': ['03_Tabella_Coefficienti_Redditivita_ATECO.pdf', '01_Legge_190-2014_Base_Normativa_e_Coefficienti.pdf']}, ensure_ascii=False)}\n\n"
-                return StreamingResponse(ateco_gen(), media_type="text/event-stream")
-
-        if _is_ateco_list_query(contenuto):
-            async def atecolist_gen():
-                msg = (
-                    "Nel regime forfettario i coefficienti di redditivita' sono associati a gruppi ATECO: "
-                    "40% (es. commercio e alloggio/ristorazione), "
-                    "54% (commercio ambulante alimenti/bevande), "
-                    "62% (intermediari del commercio), "
-                    "67% (altre attivita' economiche), "
-                    "78% (attivita' professionali, sanitarie, istruzione e finanziarie), "
-                    "86% (costruzioni e attivita' immobiliari). "
-                    "Se mi indichi un codice ATECO specifico, ti dico il coefficiente esatto."
-                )
-                yield f"data: {json.dumps({'text': msg, 'done': True, 'sources': ['03_Tabella_Coefficienti_Redditivita_ATECO.pdf', '01_Legge_190-2014_Base_Normativa_e_Coefficienti.pdf']}, ensure_ascii=False)}\n\n"
-            return StreamingResponse(atecolist_gen(), media_type="text/event-stream")
-
-    if allow_critical and is_forfettario_regime and _is_random_ateco_query(contenuto):
-        async def randomateco_gen():
-            msg = (
-                "Non posso inventare un codice ATECO a caso. Nei documenti disponibili non c'e' "
-                "l'elenco completo dei codici ATECO italiani; c'e' solo la tabella dei gruppi ATECO "
-                "con i relativi coefficienti. Se mi dai un codice specifico, posso dirti il coefficiente."
-            )
-            yield f"data: {json.dumps({'text': msg, 'done': True, 'sources': ['03_Tabella_Coefficienti_Redditivita_ATECO.pdf', '01_Legge_190-2014_Base_Normativa_e_Coefficienti.pdf']}, ensure_ascii=False)}\n\n"
-        return StreamingResponse(randomateco_gen(), media_type="text/event-stream")
-
-    if allow_critical and is_forfettario_regime and _is_ateco_codes_query(contenuto):
-        async def atecocodes_gen():
-            msg = (
-                "Nei documenti disponibili non c'e' un elenco completo di tutti i codici ATECO italiani; "
-                "c'e' la tabella dei gruppi ATECO rilevanti per il regime forfettario con i relativi coefficienti. "
-                "Se vuoi, posso dirti il coefficiente partendo da un codice ATECO preciso."
-            )
-            yield f"data: {json.dumps({'text': msg, 'done': True, 'sources': ['03_Tabella_Coefficienti_Redditivita_ATECO.pdf', '01_Legge_190-2014_Base_Normativa_e_Coefficienti.pdf']}, ensure_ascii=False)}\n\n"
-        return StreamingResponse(atecocodes_gen(), media_type="text/event-stream")
-
-    # Additional hardcoded responses (limits, tax, INPS, employment, invoicing)
-    if allow_stable and is_forfettario_regime and _is_forfettario_query(contenuto) and _is_limit_query(contenuto) and _is_tax_query(contenuto):
-        async def limittax_gen():
-            msg = (
-                "Per restare nel regime forfettario, nel periodo precedente ricavi o compensi non devono superare 85.000 euro; "
-                "se durante l'anno superi 100.000 euro, l'uscita dal regime e' immediata. "
-                "Il regime cessa anche dall'anno successivo al venir meno dei requisiti richiesti per l'accesso."
-            )
-            yield f"data: {json.dumps({'text': msg, 'done': True, 'sources': ['02_Circolare_32E-2023_Novita_Soglie_e_Uscita_Immediat.pdf']}, ensure_ascii=False)}\n\n"
-        return StreamingResponse(limittax_gen(), media_type="text/event-stream")
-
-    if allow_stable and is_forfettario_regime and _is_forfettario_query(contenuto) and _is_limit_query(contenuto):
-        async def limit85k_gen():
-            msg = (
-                "Per il regime forfettario, la soglia ordinaria e' 85.000 euro di ricavi o compensi. "
-                "L'uscita immediata scatta se nell'anno superi 100.000 euro."
-            )
-            yield f"data: {json.dumps({'text': msg, 'done': True, 'sources': ['02_Circolare_32E-2023_Novita_Soglie_e_Uscita_Immediat.pdf']}, ensure_ascii=False)}\n\n"
-        return StreamingResponse(limit85k_gen(), media_type="text/event-stream")
-
-    if allow_stable and is_forfettario_regime and _is_general_forfettario_tax_query(contenuto):
-        async def tax15_gen():
-            msg = (
-                "Nel regime forfettario paghi un'imposta sostitutiva che in via ordinaria e' del 15%. "
-                "Per le nuove attivita', se rispetti i requisiti, l'aliquota scende al 5% per i primi 5 anni."
-            )
-            yield f"data: {json.dumps({'text': msg, 'done': True, 'sources': ['01_Legge_190-2014_Base_Normativa_e_Coefficienti.pdf']}, ensure_ascii=False)}\n\n"
-        return StreamingResponse(tax15_gen(), media_type="text/event-stream")
-
-    if allow_stable and is_forfettario_regime and _is_forfettario_exit_100k_query(contenuto):
-        async def exit100k_gen():
-            msg = (
-                "Se superi 100.000 euro di ricavi o compensi nell'anno, l'uscita dal forfettario e' immediata "
-                "dal momento del superamento."
-            )
-            yield f"data: {json.dumps({'text': msg, 'done': True, 'sources': ['02_Circolare_32E-2023_Novita_Soglie_e_Uscita_Immediat.pdf']}, ensure_ascii=False)}\n\n"
-        return StreamingResponse(exit100k_gen(), media_type="text/event-stream")
-
-    if allow_stable and is_forfettario_regime and _is_cash_basis_threshold_query(contenuto):
-        async def cashbasis_gen():
-            msg = (
-                "Per le soglie del regime forfettario conta quanto incassi, non quanto fatturi, perche' si applica "
-                "il criterio di cassa."
-            )
-            yield f"data: {json.dumps({'text': msg, 'done': True, 'sources': ['02_Circolare_32E-2023_Novita_Soglie_e_Uscita_Immediat.pdf']}, ensure_ascii=False)}\n\n"
-        return StreamingResponse(cashbasis_gen(), media_type="text/event-stream")
-
-    if allow_stable and is_forfettario_regime and _is_aliquota_5_query(contenuto):
-        async def aliquota5_gen():
-            msg = (
-                "L'aliquota del 5% si applica alle nuove attivita' che rispettano i requisiti previsti "
-                "per il regime forfettario, e vale per i primi 5 anni."
-            )
-            yield f"data: {json.dumps({'text': msg, 'done': True, 'sources': ['01_Legge_190-2014_Base_Normativa_e_Coefficienti.pdf']}, ensure_ascii=False)}\n\n"
-        return StreamingResponse(aliquota5_gen(), media_type="text/event-stream")
-
-    # INPS 35% reduction queries
-    if allow_stable and is_forfettario_regime and _is_inps_35_general_query(contenuto):
-        async def inps35general_gen():
-            msg = (
-                "La riduzione INPS del 35% e' riservata agli imprenditori individuali forfettari iscritti alla "
-                "gestione Artigiani o Commercianti. Non si applica a chi e' iscritto alla Gestione Separata o a una Cassa professionale."
-            )
-            yield f"data: {json.dumps({'text': msg, 'done': True, 'sources': ['10_Circolare_INPS_14-2026_Artigiani_e_Commercianti.pdf']}, ensure_ascii=False)}\n\n"
-        return StreamingResponse(inps35general_gen(), media_type="text/event-stream")
-
-    if allow_stable and is_forfettario_regime and _is_inps_35_apply_query(contenuto):
-        async def inps35apply_gen():
-            msg = (
-                "La domanda per la riduzione INPS del 35% e' esclusivamente telematica. "
-                "Si presenta dal portale INPS, con accesso SPID, CIE o CNS, nel Cassetto Previdenziale per "
-                "Artigiani e Commercianti, seguendo il percorso: Adesione agevolazioni - Richiesta agevolazione."
-            )
-            yield f"data: {json.dumps({'text': msg, 'done': True, 'sources': ['10_Circolare_INPS_14-2026_Artigiani_e_Commercianti.pdf']}, ensure_ascii=False)}\n\n"
-        return StreamingResponse(inps35apply_gen(), media_type="text/event-stream")
-
-    if allow_stable and is_forfettario_regime and _is_inps_35_deadline_query(contenuto):
-        async def inps35deadline_gen():
-            msg = (
-                "La domanda per la riduzione contributiva INPS del 35% si presenta solo online nel Cassetto "
-                "Previdenziale Artigiani e Commercianti (accesso con SPID/CIE/CNS). "
-                "Per chi e' gia' attivo, la scadenza e' il 28 febbraio dell'anno."
-            )
-            yield f"data: {json.dumps({'text': msg, 'done': True, 'sources': ['10_Circolare_INPS_14-2026_Artigiani_e_Commercianti.pdf']}, ensure_ascii=False)}\n\n"
-        return StreamingResponse(inps35deadline_gen(), media_type="text/event-stream")
-
-    if allow_stable and is_forfettario_regime and _is_inps_35_new_activity_query(contenuto):
-        async def inps35new_gen():
-            msg = (
-                "Per una nuova attivita', la richiesta della riduzione INPS del 35% va fatta dopo l'iscrizione "
-                "alla gestione Artigiani o Commercianti e deve essere presentata entro un anno dall'inizio."
-            )
-            yield f"data: {json.dumps({'text': msg, 'done': True, 'sources': ['10_Circolare_INPS_14-2026_Artigiani_e_Commercianti.pdf']}, ensure_ascii=False)}\n\n"
-        return StreamingResponse(inps35new_gen(), media_type="text/event-stream")
-
-    # Employment income queries
-    if allow_stable and is_forfettario_regime and _is_employment_income_threshold_query(contenuto):
-        async def empthreshold_gen():
-            msg = (
-                "In generale, con redditi da lavoro dipendente o assimilati superiori a 30.000 euro "
-                "non puoi applicare il regime forfettario. La soglia non rileva se il rapporto di lavoro e' cessato."
-            )
-            yield f"data: {json.dumps({'text': msg, 'done': True, 'sources': ['04_Elenco_Cause_Ostative_e_Esclusioni_2026.pdf']}, ensure_ascii=False)}\n\n"
-        return StreamingResponse(empthreshold_gen(), media_type="text/event-stream")
-
-    if allow_stable and is_forfettario_regime and _is_ex_employer_prevalence_query(contenuto):
-        async def exemployer_gen():
-            msg = (
-                "Puoi aprire la partita IVA, ma c'e' un rischio forte di causa ostativa se fatturi "
-                "prevalentemente all'ex datore di lavoro o alla ex azienda con cui il rapporto e' in corso "
-                "o e' cessato nei due precedenti periodi d'imposta. Se oltre il 50% dei compensi arriva da "
-                "quel soggetto, perdi il forfettario dall'anno successivo."
-            )
-            yield f"data: {json.dumps({'text': msg, 'done': True, 'sources': ['04_Elenco_Cause_Ostative_e_Esclusioni_2026.pdf', '05_Circolare_9E-2019_Approfondimento_Cause_Ostative.pdf']}, ensure_ascii=False)}\n\n"
-        return StreamingResponse(exemployer_gen(), media_type="text/event-stream")
-
-    # Invoicing and VAT queries
-    if allow_stable and is_forfettario_regime and _is_bollo_query(contenuto):
-        async def bollo_gen():
-            msg = (
-                "Sì, se la fattura supera 77,47 euro si applica l'imposta di bollo da 2,00 euro, "
-                "anche nelle fatture verso l'estero. "
-                "In fattura va indicata la dicitura di assolvimento del bollo."
-            )
-            yield f"data: {json.dumps({'text': msg, 'done': True, 'sources': ['08b_Manuale_AdE_Imposta_Bollo_Fatture_Elettroniche.pdf']}, ensure_ascii=False)}\n\n"
-        return StreamingResponse(bollo_gen(), media_type="text/event-stream")
-
-    if allow_stable and is_forfettario_regime and _is_vies_query(contenuto):
-        async def vies_gen():
-            msg = (
-                "Sì, per il forfettario l'iscrizione al VIES e' necessaria quando effettua operazioni "
-                "intracomunitarie di beni o servizi verso soggetti UE."
-            )
-            yield f"data: {json.dumps({'text': msg, 'done': True, 'sources': ['12_Operazioni_Estere_VIES_Reverse_Charge_e_Dogane.pdf']}, ensure_ascii=False)}\n\n"
-        return StreamingResponse(vies_gen(), media_type="text/event-stream")
-
-    if allow_stable and is_forfettario_regime and _is_ads_reverse_charge_query(contenuto):
-        async def ads_gen():
-            msg = (
-                "Per acquisti di servizi esteri come Google Ads o Facebook Ads, in forfettario si applica "
-                "integrazione/autofattura TD17 con IVA al 22% e versamento entro il giorno 16 del mese successivo "
-                "con F24 codice 6099. L'IVA resta un costo non detraibile."
-            )
-            yield f"data: {json.dumps({'text': msg, 'done': True, 'sources': ['12_Operazioni_Estere_VIES_Reverse_Charge_e_Dogane.pdf']}, ensure_ascii=False)}\n\n"
-        return StreamingResponse(ads_gen(), media_type="text/event-stream")
-
-    if allow_stable and is_forfettario_regime and _is_eu_b2b_services_query(contenuto):
-        async def eub2b_gen():
-            msg = (
-                "Per servizi B2B verso cliente UE, la fattura si emette senza IVA con dicitura "
-                "'Reverse Charge' o 'Inversione contabile' e richiede iscrizione VIES. "
-                "Per queste operazioni e' previsto l'adempimento Intrastat. "
-                "Se la fattura supera 77,47 euro, si applica anche il bollo da 2,00 euro."
-            )
-            yield f"data: {json.dumps({'text': msg, 'done': True, 'sources': ['12_Operazioni_Estere_VIES_Reverse_Charge_e_Dogane.pdf']}, ensure_ascii=False)}\n\n"
-        return StreamingResponse(eub2b_gen(), media_type="text/event-stream")
-
-    if allow_stable and is_forfettario_regime and _is_extra_ue_services_query(contenuto):
-        async def extraue_gen():
-            msg = (
-                "Per servizi verso cliente extra-UE, la fattura e' senza IVA con dicitura: "
-                "'Operazione non soggetta ai sensi degli artt. da 7 a 7-septies del DPR 633/72'. "
-                "Se l'importo supera 77,47 euro, si applica il bollo da 2,00 euro."
-            )
-            yield f"data: {json.dumps({'text': msg, 'done': True, 'sources': ['12_Operazioni_Estere_VIES_Reverse_Charge_e_Dogane.pdf']}, ensure_ascii=False)}\n\n"
-        return StreamingResponse(extraue_gen(), media_type="text/event-stream")
-
-    if allow_stable and is_forfettario_regime and _is_730_only_forfettario_query(contenuto):
-        async def modello730_gen():
-            msg = (
-                "Il reddito della partita IVA forfettaria non si dichiara nel 730 ma nel Modello Redditi PF, "
-                "quadro LM. Il 730 puoi usarlo solo per eventuali altri redditi soggetti a IRPEF, come lavoro "
-                "dipendente, pensione, terreni o fabbricati."
-            )
-            yield f"data: {json.dumps({'text': msg, 'done': True, 'sources': ['16_IL MODELLO 730 E IL CONTRIBUENTE FORFETTARIO (2026).pdf']}, ensure_ascii=False)}\n\n"
-        return StreamingResponse(modello730_gen(), media_type="text/event-stream")
-
-    if allow_stable and is_forfettario_regime and _is_cassa_integrativo_threshold_query(contenuto):
-        async def cassainteg_gen():
-            msg = (
-                "No. Il contributo integrativo addebitato in fattura dagli iscritti a una Cassa professionale "
-                "(per esempio 2%, 4% o 5%) non concorre al reddito forfettario e non conta nel limite degli "
-                "85.000 euro."
-            )
-            yield f"data: {json.dumps({'text': msg, 'done': True, 'sources': ['15_CASSE PROFESSIONALI AUTONOME E REGIME FORFETTARIO (2026).pdf']}, ensure_ascii=False)}\n\n"
-        return StreamingResponse(cassainteg_gen(), media_type="text/event-stream")
-
-    if allow_stable and is_forfettario_regime and _is_bollo_reimbursement_tax_query(contenuto):
-        async def bolloreim_gen():
-            msg = (
-                "No. Il rimborso dei 2 euro del bollo da parte del cliente non costituisce un ricavo "
-                "aggiuntivo da tassare separatamente e non si somma al limite degli 85.000 euro."
-            )
-            yield f"data: {json.dumps({'text': msg, 'done': True, 'sources': ['08b_Manuale_AdE_Imposta_Bollo_Fatture_Elettroniche.pdf']}, ensure_ascii=False)}\n\n"
-        return StreamingResponse(bolloreim_gen(), media_type="text/event-stream")
-
-    if allow_stable and is_forfettario_regime and _is_residency_query(contenuto):
-        async def residency_gen():
-            msg = (
-                "In via generale il regime forfettario e' riservato ai residenti in Italia. Fanno eccezione "
-                "i residenti in uno Stato UE o SEE con adeguato scambio di informazioni, ma solo se producono "
-                "in Italia almeno il 75% del reddito complessivo."
-            )
-            yield f"data: {json.dumps({'text': msg, 'done': True, 'sources': ['04_Elenco_Cause_Ostative_e_Esclusioni_2026.pdf']}, ensure_ascii=False)}\n\n"
-        return StreamingResponse(residency_gen(), media_type="text/event-stream")
-
-    if allow_stable and is_forfettario_regime and _is_special_vat_regime_query(contenuto):
-        async def specialvat_gen():
-            msg = (
-                "No, i regimi speciali IVA sono incompatibili con il regime forfettario. Se ti avvali di "
-                "regimi speciali come agricoltura, editoria, agenzie di viaggio o sali e tabacchi, non puoi "
-                "accedere o permanere nel forfettario."
-            )
-            yield f"data: {json.dumps({'text': msg, 'done': True, 'sources': ['04_Elenco_Cause_Ostative_e_Esclusioni_2026.pdf']}, ensure_ascii=False)}\n\n"
-        return StreamingResponse(specialvat_gen(), media_type="text/event-stream")
-
-    if allow_stable and is_forfettario_regime and _is_srl_control_query(contenuto):
-        async def srlcontrol_gen():
-            msg = (
-                "In presenza di controllo, anche di fatto, una partecipazione in SRL puo' costituire causa "
-                "ostativa se l'attivita' individuale risulta riconducibile a quella della societa'. "
-                "Senza controllo, la partecipazione di minoranza non e' di per se' ostativa."
-            )
-            yield f"data: {json.dumps({'text': msg, 'done': True, 'sources': ['04_Elenco_Cause_Ostative_e_Esclusioni_2026.pdf']}, ensure_ascii=False)}\n\n"
-        return StreamingResponse(srlcontrol_gen(), media_type="text/event-stream")
-
-    if allow_stable and is_forfettario_regime and _is_family_detraction_query(contenuto):
-        async def familydet_gen():
-            msg = (
-                "No. L'imposta sostitutiva del regime forfettario non consente di recuperare dal carico "
-                "fiscale della partita IVA le detrazioni per figli a carico o spese come l'asilo nido. "
-                "Quelle agevolazioni non riducono l'imposta sostitutiva del forfettario."
-            )
-            yield f"data: {json.dumps({'text': msg, 'done': True, 'sources': ['16_IL MODELLO 730 E IL CONTRIBUENTE FORFETTARIO (2026).pdf']}, ensure_ascii=False)}\n\n"
-        return StreamingResponse(familydet_gen(), media_type="text/event-stream")
-
-    if allow_stable and is_forfettario_regime and _is_exit_100k_example_query(contenuto):
-        async def exitexample_gen():
-            msg = (
-                "No, non resti forfettario fino a dicembre. Se superi 100.000 euro di compensi o ricavi "
-                "percepiti nell'anno, l'uscita dal regime e' immediata dal momento del superamento e "
-                "sull'operazione che fa superare la soglia devi applicare subito il regime IVA ordinario."
-            )
-            yield f"data: {json.dumps({'text': msg, 'done': True, 'sources': ['02_Circolare_32E-2023_Novita_Soglie_e_Uscita_Immediat.pdf']}, ensure_ascii=False)}\n\n"
-        return StreamingResponse(exitexample_gen(), media_type="text/event-stream")
-
-    if allow_stable and is_forfettario_regime and _is_business_meal_cost_query(contenuto):
-        async def businessmeal_gen():
-            msg = (
-                "No. Nel regime forfettario non detrai l'IVA sugli acquisti e non deduci analiticamente "
-                "spese come una cena con cliente. Il vantaggio fiscale e' gia' forfettizzato tramite il "
-                "coefficiente di redditivita'."
-            )
-            yield f"data: {json.dumps({'text': msg, 'done': True, 'sources': ['01_Legge_190-2014_Base_Normativa_e_Coefficienti.pdf']}, ensure_ascii=False)}\n\n"
-        return StreamingResponse(businessmeal_gen(), media_type="text/event-stream")
-
-    if allow_stable and is_forfettario_regime and _is_naspi_anticipation_query(contenuto):
-        async def naspianti_gen():
-            msg = (
-                "Sì, chi apre una partita IVA forfettaria puo' chiedere l'anticipazione della NASPI in un'unica "
-                "soluzione, ma la domanda va inviata all'INPS entro 30 giorni dall'apertura della partita IVA."
-            )
-            src = "14_NASPI, DISOCCUPAZIONE E INCENTIVI ALL'AUTOIMPRENDITORIALITÀ (2026).pdf"
-            yield f"data: {json.dumps({'text': msg, 'done': True, 'sources': [src]}, ensure_ascii=False)}\n\n"
-        return StreamingResponse(naspianti_gen(), media_type="text/event-stream")
-
-    if allow_stable and is_forfettario_regime and _is_foreign_software_reverse_charge_query(contenuto):
-        async def foreignsoft_gen():
-            msg = (
-                "No, non sei a posto cosi'. Se acquisti un software o un servizio digitale da un fornitore "
-                "estero senza IVA, devi emettere autofattura/integrazione TD17 con IVA italiana al 22% e "
-                "versarla con F24 entro il giorno 16 del mese successivo. Nel forfettario quell'IVA resta "
-                "un costo e non e' detraibile."
-            )
-            yield f"data: {json.dumps({'text': msg, 'done': True, 'sources': ['12_Operazioni_Estere_VIES_Reverse_Charge_e_Dogane.pdf']}, ensure_ascii=False)}\n\n"
-        return StreamingResponse(foreignsoft_gen(), media_type="text/event-stream")
-
-    if allow_stable and is_forfettario_regime and _is_strumental_asset_sale_query(contenuto):
-        async def strumental_gen():
-            msg = (
-                "No. La cessione di un bene strumentale usato, come un vecchio PC aziendale, non si somma "
-                "ai ricavi o compensi che contano per la soglia degli 85.000 euro."
-            )
-            yield f"data: {json.dumps({'text': msg, 'done': True, 'sources': ['13_CASI CRITICI E RISPOSTE AI QUESITI (PRASSI ADE).pdf']}, ensure_ascii=False)}\n\n"
-        return StreamingResponse(strumental_gen(), media_type="text/event-stream")
+    hard_coded = _route_hardcoded_rule(features, active_regime.regime_id, intent_prediction)
+    if hard_coded is not None:
+        rule, message = hard_coded
+        _log_llm_usage("chat-stream", active_regime.regime_id, intent_id=rule.intent_id)
+        return _sse_message_response(message, list(rule.sources))
 
-    if not regime_explicit and is_forfettario_regime and not _is_forfettario_domain_query(contenuto):
-        async def scopedomain_gen():
-            msg = f"{_regime_scope_message(active_regime)} Riformula la domanda in questo ambito."
-            yield f"data: {json.dumps({'text': msg, 'done': True, 'sources': []}, ensure_ascii=False)}\n\n"
-        return StreamingResponse(scopedomain_gen(), media_type="text/event-stream")
+    if not regime_explicit and is_forfettario_regime and not _is_forfettario_domain_query(features):
+        msg = f"{_regime_scope_message(active_regime)} Riformula la domanda in questo ambito."
+        return _sse_message_response(msg)
 
-    if regime_explicit and not _is_tax_regime_query(contenuto):
-        async def scope_gen():
-            msg = f"{_regime_scope_message(active_regime)} Riformula la domanda in questo ambito."
-            yield f"data: {json.dumps({'text': msg, 'done': True, 'sources': []}, ensure_ascii=False)}\n\n"
-        return StreamingResponse(scope_gen(), media_type="text/event-stream")
+    if regime_explicit and not _is_tax_regime_query(features):
+        msg = f"{_regime_scope_message(active_regime)} Riformula la domanda in questo ambito."
+        return _sse_message_response(msg)
 
     # RAG retrieval (same as main endpoint)
-    retrieved, retrieval_mode = _search_with_intent(raw_contenuto, regime_id=active_regime.regime_id)
+    retrieved, retrieval_mode = await _retrieve(features, active_regime.regime_id, query_vector)
 
     if not retrieved:
-        async def noresult_gen():
-            msg = (
-                "Non ho trovato informazioni pertinenti nei documenti disponibili. "
-                "Prova a riformulare con termini piú specifici o a verificare la tua domanda."
-            )
-            yield f"data: {json.dumps({'text': msg, 'done': True, 'sources': []}, ensure_ascii=False)}\n\n"
-        return StreamingResponse(noresult_gen(), media_type="text/event-stream")
+        msg = (
+            "Non ho trovato informazioni pertinenti nei documenti disponibili. "
+            "Prova a riformulare con termini piú specifici o a verificare la tua domanda."
+        )
+        return _sse_message_response(msg)
 
     # Check confidence
     top_score = max(item.score for item in retrieved)
@@ -3597,35 +3861,12 @@ async def chat_stream(payload: ChatRequest):
             {"query": raw_contenuto, "regime": active_regime.regime_id, "top_score": top_score},
         )
 
-    # Build context
-    context_blocks = []
-    for item in retrieved:
-        context_blocks.append(
-            f"[Fonte: {item.source} | Chunk: {item.chunk_id} | Score: {item.score:.3f}]\n{item.text}"
-        )
-    context = "\n\n".join(context_blocks)
-
-    system_prompt = (
-        f"Sei un assistente fiscale per {active_regime.label.lower()} in Italia. "
-        "Rispondi solo con informazioni presenti nel CONTEXT. "
-        "Se il CONTEXT non contiene una parte della risposta, dillo in una sola frase breve. "
-        "Non inventare norme, soglie o scadenze. "
-        "Stile obbligatorio: italiano chiaro, tono professionale, nessun markdown, "
-        "nessun uso di **, # o elenchi con trattini. "
-        "Non iniziare con formule tipo 'In base al CONTEXT fornito'."
-    )
+    context = _build_context(retrieved)
 
-    user_prompt = (
-        f"DOMANDA:\n{contenuto}\n\n"
-        f"CONTEXT:\n{context}\n\n"
-        "Rispondi in italiano in modo sintetico. "
-        "Usa massimo 4 frasi totali. "
-        "Dai prima la risposta diretta. "
-        "Non inserire mai le fonti nel testo della risposta."
-    )
+    messages = build_messages(active_regime.label, context, contenuto)
 
-    llm_client = _get_llm_client()
-    if not llm_client:
+    transport = _get_llm_transport()
+    if not transport:
         async def nollm_gen():
             yield f"data: {json.dumps({'error': client_init_error or 'LLM non disponibile'}, ensure_ascii=False)}\n\n"
         return StreamingResponse(nollm_gen(), media_type="text/event-stream")
@@ -3634,49 +3875,56 @@ async def chat_stream(payload: ChatRequest):
     source_details = _build_source_details(retrieved)
     confidence_label, confidence_score = _confidence_from_results(retrieved, retrieval_mode)
 
+    # Metadati del retrieval: convert SourceRef to dict for JSON serialization
+    retrieval_payload = {
+        "sources": sources,
+        "source_details": [
+            {
+                "source": d.source,
+                "excerpt": d.excerpt,
+                "chunk_id": d.chunk_id,
+                "page_start": d.page_start,
+                "page_end": d.page_end,
+                "score": d.score,
+            }
+            for d in source_details
+        ],
+        "confidence_label": confidence_label,
+        "confidence_score": confidence_score,
+        "retrieval_mode": retrieval_mode,
+        "regime_id": active_regime.regime_id,
+    }
+
     async def stream_generator():
+        # Fonti e confidenza partono subito, prima della generazione.
+        yield f"data: {json.dumps({'retrieval': True, **retrieval_payload}, ensure_ascii=False)}\n\n"
         try:
-            response_stream = llm_client.chat.completions.create(
-                model=llm_model,
-                messages=[
-                    {"role": "system", "content": system_prompt},
-                    {"role": "user", "content": user_prompt},
-                ],
-                stream=True,
-            )
-
             full_text = ""
-            for chunk in response_stream:
-                delta = chunk.choices[0].delta.content or "" if chunk.choices else ""
-                if delta:
-                    full_text += delta
-                    yield f"data: {json.dumps({'chunk': delta}, ensure_ascii=False)}\n\n"
-                    await asyncio.sleep(0)  # Yield control
-
-            # Final message with metadata - convert SourceRef to dict for JSON serialization
+            # Stream identici in volo condividono la stessa generazione (fan-out dei delta).
+            shared_stream = request_flights.stream(
+                _flight_key("stream", contenuto, active_regime.regime_id),
+                lambda: _generate_stream(transport, messages, active_regime.regime_id, retrieval_mode),
+                transient=lambda item: isinstance(item, QueuePosition),
+            )
+            async for item in _coalesce_deltas(shared_stream, STREAM_COALESCE_S):
+                if isinstance(item, QueuePosition):
+                    yield f"data: {json.dumps({'queued': item.position}, ensure_ascii=False)}\n\n"
+                    continue
+                full_text += item
+                yield f"data: {json.dumps({'chunk': item}, ensure_ascii=False)}\n\n"
+
+            # Final message with metadata
             final_payload = {
                 "done": True,
                 "text": _clean_model_answer(full_text),
-                "sources": sources,
-                "source_details": [
-                    {
-                        "source": d.source,
-                        "excerpt": d.excerpt,
-                        "chunk_id": d.chunk_id,
-                        "page_start": d.page_start,
-                        "page_end": d.page_end,
-                        "score": d.score,
-                    }
-                    for d in source_details
-                ],
-                "confidence_label": confidence_label,
-                "confidence_score": confidence_score,
-                "retrieval_mode": retrieval_mode,
-                "regime_id": active_regime.regime_id,
+                **retrieval_payload,
                 "chat_id": payload.chat_id,
             }
             yield f"data: {json.dumps(final_payload, ensure_ascii=False)}\n\n"
 
+        except LLMBusyError:
+            _log_rag_event("llm_busy", {"endpoint": "chat-stream", "regime": active_regime.regime_id})
+            yield f"data: {json.dumps({'error': LLM_BUSY_MESSAGE, 'busy': True}, ensure_ascii=False)}\n\n"
         except RateLimitError:
             yield f"data: {json.dumps({'error': 'Quota DeepSeek esaurita (errore 429)'}, ensure_ascii=False)}\n\n"
         except APIError as error:
@@ -116,6 +116,20 @@ class SimulationResponse(BaseModel):
     notes: List[str] = Field(default_factory=list)
 
 
+class LLMUsageStats(BaseModel):
+    window_hours: int
+    covered_hours: float | None = None
+    generated_answers: int = 0
+    hard_coded_answers: int = 0
+    duration_ms_p50: float | None = None
+    duration_ms_p95: float | None = None
+    ttft_ms_p50: float | None = None
+    ttft_ms_p95: float | None = None
+    tokens_per_answer_p50: float | None = None
+    tokens_per_answer_p95: float | None = None
+    cached_token_ratio: float | None = None
+
+
 class AdminStats(BaseModel):
     total_chats: int
     total_messages: int
@@ -125,3 +139,4 @@ class AdminStats(BaseModel):
     low_confidence_events: int
     top_questions: List[str] = Field(default_factory=list)
     top_regimes: List[str] = Field(default_factory=list)
+    llm_usage: LLMUsageStats | None = None
@@ -30,7 +30,9 @@ def _resolve_path_list(value: str | None, default: str) -> list[Path]:
 
 
 DATA_ROOT = _resolve_path(os.getenv("DATA_ROOT"), "data")
+STORAGE_SQLITE_PATH = _resolve_path(os.getenv("STORAGE_SQLITE_PATH"), str(DATA_ROOT / "flytax.sqlite3"))
 LOG_DIR = _resolve_path(os.getenv("LOG_DIR"), "logs")
 RAG_INDEX_PATH = _resolve_path(os.getenv("RAG_INDEX_PATH"), "rag_index/index.json")
 UPLOADS_ROOT = _resolve_path(os.getenv("UPLOADS_ROOT"), ".")
 DOCUMENT_ROOTS = _resolve_path_list(os.getenv("DOCUMENT_ROOTS"), ".")
+INTENT_EXAMPLES_PATH = _resolve_path(os.getenv("INTENT_EXAMPLES_PATH"), "intent_examples.json")
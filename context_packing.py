@@ -0,0 +1,134 @@
+from __future__ import annotations
+
+from dataclasses import dataclass, field
+from typing import TYPE_CHECKING, List, Sequence
+
+if TYPE_CHECKING:
+    from rag_qdrant import RetrievedChunk
+
+
+@dataclass
+class PackedBlock:
+    source: str
+    chunk_ids: List[int]
+    text: str
+    score: float
+    page_start: int | None = None
+    page_end: int | None = None
+    tokens: int = field(init=False, default=0)
+
+    def __post_init__(self) -> None:
+        self.tokens = estimate_tokens(self.text)
+
+    def header(self) -> str:
+        first, last = self.chunk_ids[0], self.chunk_ids[-1]
+        chunk_label = str(first) if first == last else f"{first}-{last}"
+        parts = [f"Fonte: {self.source}", f"Chunk: {chunk_label}"]
+        if self.page_start is not None:
+            end = self.page_end if self.page_end is not None else self.page_start
+            parts.append(f"Pagine: {self.page_start}-{end}" if end != self.page_start else f"Pagina: {end}")
+        parts.append(f"Score: {self.score:.3f}")
+        return "[" + " | ".join(parts) + "]"
+
+
+def estimate_tokens(text: str) -> int:
+    # Stima grezza (circa 4 caratteri per token) sufficiente per dimensionare il prompt.
+    return (len(text) + 3) // 4
+
+
+# Il chunker indicizza con 200 caratteri di sovrapposizione: sotto questa soglia una
+# coincidenza suffisso/prefisso e' casuale ("comma 5" + "5 per cento") e non va fusa.
+MIN_OVERLAP = 40
+CHUNK_SEPARATOR = "\n"
+
+
+def merge_overlap(left: str, right: str, max_overlap: int = 400, min_overlap: int = MIN_OVERLAP) -> str:
+    # I chunk consecutivi condividono fino a `overlap` caratteri: si cerca il suffisso
+    # piu' lungo di `left` che sia prefisso di `right` e lo si scrive una volta sola.
+    if len(right) >= min_overlap and right in left:
+        return left
+    limit = min(len(left), len(right), max_overlap)
+    for size in range(limit, min_overlap - 1, -1):
+        if left.endswith(right[:size]):
+            return left + right[size:]
+    return f"{left}{CHUNK_SEPARATOR}{right}"
+
+
+def _pages(chunks: Sequence[RetrievedChunk]) -> tuple[int | None, int | None]:
+    starts = [page for page in (getattr(chunk, "page_start", None) for chunk in chunks) if page is not None]
+    ends = [page for page in (getattr(chunk, "page_end", None) for chunk in chunks) if page is not None]
+    return (min(starts) if starts else None, max(ends) if ends else None)
+
+
+def _same_page(previous: RetrievedChunk, chunk: RetrievedChunk) -> bool:
+    left = getattr(previous, "page_end", None)
+    right = getattr(chunk, "page_start", None)
+    return left is None or right is None or left == right
+
+
+def merge_chunks(chunks: Sequence[RetrievedChunk]) -> List[PackedBlock]:
+    best_by_key: dict[tuple[str, int], RetrievedChunk] = {}
+    for chunk in chunks:
+        key = (chunk.source, chunk.chunk_id)
+        current = best_by_key.get(key)
+        if current is None or chunk.score > current.score:
+            best_by_key[key] = chunk
+
+    blocks: List[PackedBlock] = []
+    run: List[RetrievedChunk] = []
+
+    def flush() -> None:
+        if not run:
+            return
+        text = run[0].text
+        for previous, chunk in zip(run, run[1:]):
+            if _same_page(previous, chunk):
+                text = merge_overlap(text, chunk.text)
+            else:
+                # Ogni pagina e' chunkata a parte: a cavallo di pagina non c'e' sovrapposizione.
+                text = f"{text}{CHUNK_SEPARATOR}{chunk.text}"
+        page_start, page_end = _pages(run)
+        blocks.append(
+            PackedBlock(
+                source=run[0].source,
+                chunk_ids=[chunk.chunk_id for chunk in run],
+                text=text,
+                score=max(chunk.score for chunk in run),
+                page_start=page_start,
+                page_end=page_end,
+            )
+        )
+        run.clear()
+
+    for key in sorted(best_by_key):
+        chunk = best_by_key[key]
+        if run and (run[-1].source != chunk.source or run[-1].chunk_id + 1 != chunk.chunk_id):
+            flush()
+        run.append(chunk)
+    flush()
+    return blocks
+
+
+def pack_context(chunks: Sequence[RetrievedChunk], token_budget: int) -> List[PackedBlock]:
+    blocks = sorted(merge_chunks(chunks), key=lambda block: block.score, reverse=True)
+    selected: List[PackedBlock] = []
+    used = 0
+    for block in blocks:
+        if any(block.text in kept.text for kept in selected):
+            continue
+        cost = block.tokens + estimate_tokens(block.header())
+        if used + cost <= token_budget:
+            selected.append(block)
+            used += cost
+        elif not selected:
+            # Il blocco migliore non va mai perso: se da solo supera il budget lo si tronca.
+            room = max(0, token_budget - estimate_tokens(block.header())) * 4
+            block.text = block.text[:room].rstrip()
+            block.tokens = estimate_tokens(block.text)
+            selected.append(block)
+            used += block.tokens
+    return selected
+
+
+def render_context(blocks: Sequence[PackedBlock]) -> str:
+    return "\n\n".join(f"{block.header()}\n{block.text}" for block in blocks)
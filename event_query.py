@@ -0,0 +1,102 @@
+from __future__ import annotations
+
+import os
+import threading
+from collections import Counter
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, Iterable, List
+
+from storage_services import _parse_timestamp
+
+
+BUCKET_SECONDS = {"minute": 60, "hour": 3600}
+EVENT_ROLLUP_HORIZON_HOURS = int(os.getenv("EVENT_ROLLUP_HORIZON_HOURS", "48"))
+MAX_BUCKETS = 5000
+READ_BATCH = 5000
+
+
+def _floor(moment: datetime, bucket: str) -> datetime:
+    seconds = BUCKET_SECONDS[bucket]
+    return datetime.fromtimestamp(int(moment.timestamp()) // seconds * seconds, tz=timezone.utc)
+
+
+class EventRollups:
+    # Conteggi per minuto e per tipo di evento delle ultime `horizon_hours` ore, tenuti in
+    # memoria e aggiornati leggendo solo gli eventi nuovi (read_from dal checkpoint). Le
+    # serie orarie si ottengono sommando i minuti; finestre piu' lunghe dell'orizzonte
+    # passano da EventStore.query, che salta i segmenti fuori finestra.
+    def __init__(self, event_store: Any, horizon_hours: int = EVENT_ROLLUP_HORIZON_HOURS) -> None:
+        self.event_store = event_store
+        self.horizon = timedelta(hours=max(1, horizon_hours))
+        self._minutes: Dict[datetime, Counter] = {}
+        self._checkpoint: Any = None
+        self._identity: Any = None
+        self._lock = threading.Lock()
+
+    def refresh(self, now: datetime | None = None) -> None:
+        now = now or datetime.now(timezone.utc)
+        start = _floor(now - self.horizon, "minute")
+        with self._lock:
+            identity = self.event_store.log_identity()
+            if self._checkpoint is None or identity != self._identity:
+                self._minutes.clear()
+                self._checkpoint = self.event_store.checkpoint_since(start)
+                self._identity = identity
+            while True:
+                records, self._checkpoint = self.event_store.read_from(self._checkpoint, limit=READ_BATCH)
+                for record in records:
+                    timestamp = _parse_timestamp(record.get("timestamp"))
+                    if timestamp is None or timestamp < start:
+                        continue
+                    self._minutes.setdefault(_floor(timestamp, "minute"), Counter())[record.get("event")] += 1
+                if len(records) < READ_BATCH:
+                    break
+            for minute in [minute for minute in self._minutes if minute < start]:
+                del self._minutes[minute]
+
+    def series(
+        self,
+        events: Iterable[str] | None = None,
+        window: timedelta = timedelta(hours=1),
+        bucket: str = "minute",
+        now: datetime | None = None,
+    ) -> dict:
+        if bucket not in BUCKET_SECONDS:
+            raise ValueError(f"Bucket non valido: {bucket}")
+        now = now or datetime.now(timezone.utc)
+        since = _floor(now - window, bucket)
+        count = int((now - since).total_seconds()) // BUCKET_SECONDS[bucket] + 1
+        if count > MAX_BUCKETS:
+            raise ValueError(f"Troppi intervalli ({count}): usa una finestra piu' corta o bucket=hour.")
+        wanted = set(events) if events else None
+
+        buckets: Dict[datetime, Counter] = {
+            since + timedelta(seconds=index * BUCKET_SECONDS[bucket]): Counter() for index in range(count)
+        }
+        if since >= _floor(now - self.horizon, "minute"):
+            self.refresh(now)
+            with self._lock:
+                for minute, counts in self._minutes.items():
+                    if minute >= since and minute <= now:
+                        buckets.setdefault(_floor(minute, bucket), Counter()).update(
+                            {key: value for key, value in counts.items() if wanted is None or key in wanted}
+                        )
+        else:
+            for record in self.event_store.query(events=wanted, since=since, until=now + timedelta(seconds=1)):
+                timestamp = _parse_timestamp(record.get("timestamp"))
+                if timestamp is not None:
+                    buckets.setdefault(_floor(timestamp, bucket), Counter())[record.get("event")] += 1
+
+        totals: Counter = Counter()
+        series: List[dict] = []
+        for start in sorted(buckets):
+            counts = buckets[start]
+            totals.update(counts)
+            series.append({"start": start.isoformat(), "counts": dict(counts)})
+        return {
+            "since": since.isoformat(),
+            "until": now.isoformat(),
+            "bucket": bucket,
+            "totals": dict(totals),
+            "buckets": series,
+        }
@@ -0,0 +1,127 @@
+from __future__ import annotations
+
+import atexit
+import logging
+import threading
+from collections import deque
+from typing import Any, Iterable
+
+
+logger = logging.getLogger(__name__)
+
+
+class BufferedEventWriter:
+    # Bus eventi in-process: gli handler accodano il record e tornano subito, un thread
+    # in background scrive a blocchi (al raggiungimento di `max_batch` record o ogni
+    # `flush_interval_s`) su tutti i sink con `append_many`. Il buffer e' limitato a
+    # `max_pending` record: oltre si scarta e si conta in `dropped`.
+    def __init__(
+        self,
+        sinks: Iterable[Any],
+        max_batch: int = 200,
+        flush_interval_s: float = 0.5,
+        max_pending: int = 10000,
+    ) -> None:
+        self.sinks = list(sinks)
+        self.max_batch = max(1, max_batch)
+        self.flush_interval_s = max(0.01, flush_interval_s)
+        self.max_pending = max(1, max_pending)
+        self.dropped = 0
+        self.failed_batches = 0
+        self._buffer: deque[dict] = deque()
+        self._in_flight = 0
+        self._flush_requested = False
+        self._closed = False
+        self._changed = threading.Condition()
+        self._thread: threading.Thread | None = None
+        atexit.register(self.close)
+
+    @property
+    def pending(self) -> int:
+        with self._changed:
+            return len(self._buffer) + self._in_flight
+
+    def publish(self, record: dict) -> bool:
+        with self._changed:
+            if self._closed:
+                # Dopo la chiusura (shutdown) si scrive in modo sincrono per non perdere record.
+                closed = True
+            elif len(self._buffer) >= self.max_pending:
+                self.dropped += 1
+                return False
+            else:
+                closed = False
+                self._buffer.append(record)
+                self._ensure_thread()
+                if len(self._buffer) >= self.max_batch:
+                    self._changed.notify_all()
+        if closed:
+            self._write([record])
+        return True
+
+    def flush(self, timeout: float | None = 5.0) -> bool:
+        with self._changed:
+            if self._thread is None or not self._thread.is_alive():
+                batch = list(self._buffer)
+                self._buffer.clear()
+            else:
+                self._flush_requested = True
+                self._changed.notify_all()
+                return self._changed.wait_for(
+                    lambda: not self._buffer and not self._in_flight, timeout=timeout
+                )
+        self._write(batch)
+        return True
+
+    def close(self, timeout: float | None = 5.0) -> None:
+        with self._changed:
+            if self._closed:
+                return
+            self._closed = True
+            self._changed.notify_all()
+            thread = self._thread
+        if thread is not None:
+            thread.join(timeout)
+        # Se il thread non c'e' (o non ha finito in tempo) scrive quel che resta.
+        with self._changed:
+            batch = list(self._buffer)
+            self._buffer.clear()
+        self._write(batch)
+
+    def _ensure_thread(self) -> None:
+        if self._thread is None or not self._thread.is_alive():
+            self._thread = threading.Thread(target=self._run, name="event-writer", daemon=True)
+            self._thread.start()
+
+    def _run(self) -> None:
+        while True:
+            with self._changed:
+                self._changed.wait_for(
+                    lambda: len(self._buffer) >= self.max_batch or self._flush_requested or self._closed,
+                    timeout=self.flush_interval_s,
+                )
+                if not self._buffer:
+                    self._flush_requested = False
+                    self._changed.notify_all()
+                    if self._closed:
+                        return
+                    continue
+                count = min(self.max_batch, len(self._buffer))
+                batch = [self._buffer.popleft() for _ in range(count)]
+                self._in_flight = len(batch)
+            self._write(batch)
+            with self._changed:
+                self._in_flight = 0
+                if not self._buffer:
+                    self._flush_requested = False
+                self._changed.notify_all()
+
+    def _write(self, batch: list[dict]) -> None:
+        if not batch:
+            return
+        for sink in self.sinks:
+            try:
+                sink.append_many(batch)
+            except Exception:
+                self.failed_batches += 1
+                logger.exception("Scrittura eventi fallita su %s (%d record)", type(sink).__name__, len(batch))
@@ -0,0 +1,90 @@
+import json
+import math
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Callable, Dict, List
+
+
+OFF_TOPIC_INTENT = "off_topic"
+RETRIEVAL_INTENT = "retrieval"
+
+
+@dataclass(frozen=True)
+class IntentPrediction:
+    intent_id: str
+    score: float
+    margin: float
+
+
+def load_intent_examples(path: Path) -> Dict[str, List[str]]:
+    if not path.exists():
+        return {}
+    payload = json.loads(path.read_text(encoding="utf-8"))
+    return {
+        str(intent_id): [str(item) for item in examples if str(item).strip()]
+        for intent_id, examples in payload.items()
+        if examples
+    }
+
+
+def _unit(vector: List[float]) -> List[float]:
+    norm = math.sqrt(sum(value * value for value in vector))
+    if norm == 0:
+        return list(vector)
+    return [value / norm for value in vector]
+
+
+class NearestCentroidClassifier:
+    def __init__(
+        self,
+        centroids: Dict[str, List[float]],
+        threshold: float = 0.8,
+        min_margin: float = 0.04,
+    ) -> None:
+        self.centroids = {intent_id: _unit(vector) for intent_id, vector in centroids.items()}
+        self.threshold = threshold
+        self.min_margin = min_margin
+
+    @classmethod
+    def from_examples(
+        cls,
+        examples: Dict[str, List[str]],
+        embed_texts: Callable[[List[str]], List[List[float]]],
+        threshold: float = 0.8,
+        min_margin: float = 0.04,
+    ) -> "NearestCentroidClassifier":
+        labels: List[str] = []
+        texts: List[str] = []
+        for intent_id, items in examples.items():
+            labels.extend(intent_id for _ in items)
+            texts.extend(items)
+        vectors = embed_texts(texts) if texts else []
+
+        sums: Dict[str, List[float]] = {}
+        for intent_id, vector in zip(labels, vectors):
+            current = sums.get(intent_id)
+            if current is None:
+                sums[intent_id] = list(vector)
+            else:
+                for position, value in enumerate(vector):
+                    current[position] += value
+        return cls(sums, threshold=threshold, min_margin=min_margin)
+
+    def classify(self, query_vector: List[float]) -> IntentPrediction | None:
+        # I vettori sono normalizzati: il prodotto scalare e' la similarita' coseno.
+        # Sotto soglia, o troppo vicino al secondo intent, decide il motore a regole.
+        query_vector = _unit(query_vector)
+        best_id = None
+        best_score = second_score = -1.0
+        for intent_id, centroid in self.centroids.items():
+            score = sum(a * b for a, b in zip(query_vector, centroid))
+            if score > best_score:
+                best_id, best_score, second_score = intent_id, score, best_score
+            elif score > second_score:
+                second_score = score
+        if best_id is None or best_score < self.threshold:
+            return None
+        margin = best_score - second_score if second_score > -1.0 else best_score
+        if margin < self.min_margin:
+            return None
+        return IntentPrediction(intent_id=best_id, score=best_score, margin=margin)
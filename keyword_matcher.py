@@ -0,0 +1,116 @@
+import threading
+from collections import deque
+from typing import Dict, Iterable, List, NamedTuple
+
+
+class CompiledKeywords(NamedTuple):
+    # Snapshot immutabile dell'automa: `version` e' il numero di termini che contiene.
+    goto: tuple[Dict[str, int], ...]
+    fail: tuple[int, ...]
+    output: tuple[int, ...]
+    version: int
+
+    def scan(self, text: str) -> int:
+        goto = self.goto
+        fail = self.fail
+        output = self.output
+        state = 0
+        found = 0
+        for char in text:
+            while state and char not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(char, 0)
+            found |= output[state]
+        return found
+
+
+# Aho-Corasick su tutte le keyword registrate: una sola passata sul testo restituisce
+# la bitmask degli id dei termini presenti come sottostringa. Registrazione e compilazione
+# sono serializzate da un lock; scan legge sempre un unico snapshot compilato, quindi
+# e' sicura anche da piu' thread (asyncio.to_thread) mentre si registrano termini nuovi.
+class KeywordAutomaton:
+    def __init__(self) -> None:
+        self._term_ids: Dict[str, int] = {}
+        self._group_masks: Dict[tuple[str, ...], int] = {}
+        self._compiled: CompiledKeywords | None = None
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._term_ids)
+
+    def register(self, terms: Iterable[str]) -> int:
+        key = tuple(terms)
+        mask = self._group_masks.get(key)
+        if mask is not None:
+            return mask
+        with self._lock:
+            mask = 0
+            for term in key:
+                if not term:
+                    continue
+                term_id = self._term_ids.get(term)
+                if term_id is None:
+                    term_id = len(self._term_ids)
+                    self._term_ids[term] = term_id
+                mask |= 1 << term_id
+            self._group_masks[key] = mask
+        return mask
+
+    def mask(self, terms: tuple[str, ...]) -> int:
+        # Solo gruppi gia' registrati: un gruppo sconosciuto e' un errore, non una registrazione tardiva.
+        mask = self._group_masks.get(terms)
+        if mask is None:
+            raise KeyError(f"gruppo di keyword non registrato: {terms!r}")
+        return mask
+
+    def compile(self) -> CompiledKeywords:
+        with self._lock:
+            compiled = self._compiled
+            if compiled is not None and compiled.version == len(self._term_ids):
+                return compiled
+            terms = list(self._term_ids.items())
+
+            goto: List[Dict[str, int]] = [{}]
+            output = [0]
+            for term, term_id in terms:
+                state = 0
+                for char in term:
+                    next_state = goto[state].get(char)
+                    if next_state is None:
+                        next_state = len(goto)
+                        goto[state][char] = next_state
+                        goto.append({})
+                        output.append(0)
+                    state = next_state
+                output[state] |= 1 << term_id
+
+            fail = [0] * len(goto)
+            queue = deque(goto[0].values())
+            while queue:
+                state = queue.popleft()
+                for char, next_state in goto[state].items():
+                    queue.append(next_state)
+                    fallback = fail[state]
+                    while fallback and char not in goto[fallback]:
+                        fallback = fail[fallback]
+                    candidate = goto[fallback].get(char, 0)
+                    fail[next_state] = candidate if candidate != next_state else 0
+                    output[next_state] |= output[fail[next_state]]
+
+            compiled = CompiledKeywords(tuple(goto), tuple(fail), tuple(output), len(terms))
+            self._compiled = compiled
+            return compiled
+
+    def snapshot(self) -> CompiledKeywords:
+        compiled = self._compiled
+        if compiled is None or compiled.version != len(self._term_ids):
+            compiled = self.compile()
+        return compiled
+
+    def scan(self, text: str) -> int:
+        return self.snapshot().scan(text)
+
+    @property
+    def version(self) -> int:
+        # Cambia ogni volta che vengono registrati nuovi termini.
+        return len(self._term_ids)
@@ -1,9 +1,9 @@
 import json
 import math
 import re
-from dataclasses import dataclass
+from dataclasses import dataclass, field
 from pathlib import Path
-from typing import Iterable, List
+from typing import Dict, Iterable, List
 
 
 TOKEN_RE = re.compile(r"\w+", flags=re.UNICODE)
@@ -19,10 +19,28 @@ class LexicalChunk:
     page_end: int | None = None
 
 
+@dataclass
+class _RegimePartition:
+    chunks: List[LexicalChunk] = field(default_factory=list)
+    token_sets: List[set[str]] = field(default_factory=list)
+    postings: Dict[str, List[int]] = field(default_factory=dict)
+
+    def add(self, chunk: LexicalChunk, tokens: set[str]) -> None:
+        position = len(self.chunks)
+        self.chunks.append(chunk)
+        self.token_sets.append(tokens)
+        for token in tokens:
+            self.postings.setdefault(token, []).append(position)
+
+
 class LexicalFallbackIndex:
     def __init__(self, chunks: List[LexicalChunk]) -> None:
         self.chunks = chunks
-        self._token_cache = [set(self.tokenize(chunk.text)) for chunk in chunks]
+        # Un segmento per regime: ogni query scorre solo le posting list del regime richiesto.
+        self._partitions: Dict[str, _RegimePartition] = {}
+        for chunk in chunks:
+            partition = self._partitions.setdefault(chunk.regime, _RegimePartition())
+            partition.add(chunk, set(self.tokenize(chunk.text)))
 
     @classmethod
     def from_chunks(cls, chunks: Iterable[LexicalChunk]) -> "LexicalFallbackIndex":
@@ -55,6 +73,16 @@ class LexicalFallbackIndex:
     def tokenize(text: str) -> List[str]:
         return [t.lower() for t in TOKEN_RE.findall(text) if len(t) > 1]
 
+    @property
+    def regimes(self) -> List[str]:
+        return list(self._partitions)
+
+    def _select_partitions(self, regime_id: str | None) -> List[_RegimePartition]:
+        if regime_id:
+            partition = self._partitions.get(regime_id)
+            return [partition] if partition is not None else []
+        return list(self._partitions.values())
+
     def search(
         self,
         query: str,
@@ -66,18 +94,20 @@ class LexicalFallbackIndex:
             return []
         query_set = set(tokens)
 
-        scored: List[tuple[LexicalChunk, float]] = []
-        for chunk, token_set in zip(self.chunks, self._token_cache):
-            if regime_id and chunk.regime != regime_id:
-                continue
-            overlap = len(query_set.intersection(token_set))
-            if overlap == 0:
-                continue
-            score = overlap / math.sqrt(len(query_set) * max(len(token_set), 1))
-            scored.append((chunk, score))
+        scored: List[tuple[int, int, LexicalChunk, float]] = []
+        for partition_index, partition in enumerate(self._select_partitions(regime_id)):
+            overlaps: Dict[int, int] = {}
+            for token in query_set:
+                for position in partition.postings.get(token, ()):
+                    overlaps[position] = overlaps.get(position, 0) + 1
+            for position, overlap in overlaps.items():
+                token_set = partition.token_sets[position]
+                score = overlap / math.sqrt(len(query_set) * max(len(token_set), 1))
+                scored.append((partition_index, position, partition.chunks[position], score))
 
-        scored.sort(key=lambda item: item[1], reverse=True)
-        return scored[:top_k]
+        # A parita' di score conserva l'ordine di inserimento dei chunk.
+        scored.sort(key=lambda item: (-item[3], item[0], item[1]))
+        return [(chunk, score) for _, _, chunk, score in scored[:top_k]]
 
     def find_mentions(
         self,
@@ -92,12 +122,36 @@ class LexicalFallbackIndex:
             return []
         escaped = r"\s+".join(re.escape(part) for part in parts)
         pattern = re.compile(rf"\b{escaped}\b", flags=re.IGNORECASE)
+        required_tokens = {
+            part.lower()
+            for part in parts
+            if len(part) > 1 and TOKEN_RE.fullmatch(part)
+        }
         hits: List[LexicalChunk] = []
-        for chunk in self.chunks:
-            if regime_id and chunk.regime != regime_id:
-                continue
-            if pattern.search(chunk.text):
-                hits.append(chunk)
-                if len(hits) >= max_hits:
-                    break
+        for partition in self._select_partitions(regime_id):
+            candidates = self._candidate_positions(partition, required_tokens)
+            for position in candidates:
+                chunk = partition.chunks[position]
+                if pattern.search(chunk.text):
+                    hits.append(chunk)
+                    if len(hits) >= max_hits:
+                        return hits
         return hits
+
+    @staticmethod
+    def _candidate_positions(
+        partition: _RegimePartition,
+        required_tokens: set[str],
+    ) -> Iterable[int]:
+        if not required_tokens:
+            return range(len(partition.chunks))
+        postings = sorted(
+            (partition.postings.get(token, []) for token in required_tokens),
+            key=len,
+        )
+        candidates = set(postings[0])
+        for posting in postings[1:]:
+            candidates.intersection_update(posting)
+            if not candidates:
+                break
+        return sorted(candidates)
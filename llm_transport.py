@@ -0,0 +1,322 @@
+import asyncio
+import os
+import random
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+from dataclasses import dataclass
+from typing import Any, AsyncIterator, Deque
+
+import httpx
+from openai import APIConnectionError, APIStatusError, RateLimitError
+
+
+@dataclass(frozen=True)
+class LLMTransportConfig:
+    max_connections: int = 20
+    max_keepalive_connections: int = 10
+    keepalive_expiry_s: float = 30.0
+    connect_timeout_s: float = 5.0
+    read_timeout_s: float = 60.0
+    max_retries: int = 2
+    retry_base_delay_s: float = 0.5
+    retry_max_delay_s: float = 8.0
+    hedge_after_s: float = 0.0
+    hedge_min_samples: int = 20
+    max_concurrency: int = 8
+    max_queue: int = 32
+    max_queue_wait_s: float = 10.0
+
+    @classmethod
+    def from_env(cls) -> "LLMTransportConfig":
+        return cls(
+            max_connections=int(os.getenv("LLM_MAX_CONNECTIONS", "20")),
+            max_keepalive_connections=int(os.getenv("LLM_MAX_KEEPALIVE_CONNECTIONS", "10")),
+            keepalive_expiry_s=float(os.getenv("LLM_KEEPALIVE_EXPIRY_S", "30")),
+            connect_timeout_s=float(os.getenv("LLM_CONNECT_TIMEOUT_S", "5")),
+            read_timeout_s=float(os.getenv("LLM_READ_TIMEOUT_S", "60")),
+            max_retries=max(0, int(os.getenv("LLM_MAX_RETRIES", "2"))),
+            retry_base_delay_s=float(os.getenv("LLM_RETRY_BASE_DELAY_S", "0.5")),
+            retry_max_delay_s=float(os.getenv("LLM_RETRY_MAX_DELAY_S", "8")),
+            hedge_after_s=float(os.getenv("LLM_HEDGE_AFTER_S", "0")),
+            max_concurrency=max(1, int(os.getenv("LLM_MAX_CONCURRENCY", "8"))),
+            max_queue=max(0, int(os.getenv("LLM_MAX_QUEUE", "32"))),
+            max_queue_wait_s=float(os.getenv("LLM_MAX_QUEUE_WAIT_S", "10")),
+        )
+
+    @property
+    def timeout(self) -> httpx.Timeout:
+        return httpx.Timeout(
+            self.read_timeout_s,
+            connect=self.connect_timeout_s,
+            read=self.read_timeout_s,
+        )
+
+
+class LLMBusyError(Exception):
+    pass
+
+
+@dataclass(frozen=True)
+class QueuePosition:
+    position: int
+
+
+class QueueTicket:
+    def __init__(self, limiter: "ConcurrencyLimiter", position: int, future: asyncio.Future | None) -> None:
+        self.limiter = limiter
+        self.position = position
+        self._future = future
+
+    async def wait(self) -> None:
+        if self._future is not None:
+            await self.limiter._wait(self._future)
+
+    def cancel(self) -> None:
+        # Rinuncia al ticket senza averlo atteso: se il posto era gia' stato assegnato lo restituisce.
+        if self._future is None or not self.limiter._abandon(self._future):
+            self.limiter.release()
+
+
+# Limite globale alle chiamate LLM contemporanee, con coda di attesa limitata: oltre
+# max_queue richieste in attesa, o dopo max_wait_s in coda, si risponde subito "occupato".
+class ConcurrencyLimiter:
+    def __init__(self, max_concurrent: int, max_queue: int, max_wait_s: float) -> None:
+        self.max_concurrent = max_concurrent
+        self.max_queue = max_queue
+        self.max_wait_s = max_wait_s
+        self.active = 0
+        self._waiters: Deque[asyncio.Future] = deque()
+
+    @property
+    def queued(self) -> int:
+        return len(self._waiters)
+
+    def reserve(self) -> QueueTicket:
+        if self.active < self.max_concurrent and not self._waiters:
+            self.active += 1
+            return QueueTicket(self, 0, None)
+        if len(self._waiters) >= self.max_queue:
+            raise LLMBusyError("coda piena")
+        future = asyncio.get_running_loop().create_future()
+        self._waiters.append(future)
+        return QueueTicket(self, len(self._waiters), future)
+
+    def release(self) -> None:
+        # Il posto passa direttamente al primo in coda, senza tornare libero.
+        while self._waiters:
+            future = self._waiters.popleft()
+            if not future.done():
+                future.set_result(None)
+                return
+        self.active -= 1
+
+    @asynccontextmanager
+    async def slot(self):
+        await self.reserve().wait()
+        try:
+            yield
+        finally:
+            self.release()
+
+    async def _wait(self, future: asyncio.Future) -> None:
+        try:
+            await asyncio.wait_for(asyncio.shield(future), timeout=self.max_wait_s)
+        except asyncio.TimeoutError:
+            if self._abandon(future):
+                raise LLMBusyError("attesa in coda scaduta") from None
+        except asyncio.CancelledError:
+            if not self._abandon(future):
+                self.release()
+            raise
+
+    def _abandon(self, future: asyncio.Future) -> bool:
+        # True se il ticket era ancora in coda; False se il posto era gia' stato assegnato.
+        if future.done():
+            return False
+        self._waiters.remove(future)
+        future.cancel()
+        return True
+
+
+def build_http_client(config: LLMTransportConfig) -> httpx.AsyncClient:
+    return httpx.AsyncClient(
+        limits=httpx.Limits(
+            max_connections=config.max_connections,
+            max_keepalive_connections=config.max_keepalive_connections,
+            keepalive_expiry=config.keepalive_expiry_s,
+        ),
+        timeout=config.timeout,
+    )
+
+
+def is_retryable(error: BaseException) -> bool:
+    if isinstance(error, (RateLimitError, APIConnectionError)):
+        return True
+    if isinstance(error, APIStatusError):
+        return getattr(error, "status_code", 0) >= 500
+    return False
+
+
+def _retry_after(error: BaseException) -> float | None:
+    response = getattr(error, "response", None)
+    headers = getattr(response, "headers", None)
+    if not headers:
+        return None
+    try:
+        return float(headers.get("retry-after", ""))
+    except ValueError:
+        return None
+
+
+async def _close_stream(response: Any) -> None:
+    close = getattr(response, "close", None) or getattr(response, "aclose", None)
+    if close is None:
+        return
+    result = close()
+    if asyncio.iscoroutine(result):
+        await result
+
+
+# Trasporto verso il provider LLM: il client OpenAI gira con max_retries=0 e i tentativi
+# (backoff esponenziale con jitter, Retry-After sui 429) e l'eventuale richiesta "hedged"
+# sugli stream lenti a produrre il primo token sono gestiti qui.
+class LLMTransport:
+    def __init__(self, client: Any, config: LLMTransportConfig) -> None:
+        self.client = client
+        self.config = config
+        self._ttft_samples: Deque[float] = deque(maxlen=200)
+        self.limiter = ConcurrencyLimiter(
+            config.max_concurrency,
+            config.max_queue,
+            config.max_queue_wait_s,
+        )
+
+    def backoff_delay(self, attempt: int, error: BaseException | None = None) -> float:
+        ceiling = min(self.config.retry_max_delay_s, self.config.retry_base_delay_s * (2**attempt))
+        delay = random.uniform(0, ceiling)
+        retry_after = _retry_after(error) if error is not None else None
+        if retry_after is not None:
+            delay = max(delay, min(retry_after, self.config.retry_max_delay_s))
+        return delay
+
+    def hedge_delay(self) -> float | None:
+        # Soglia = p95 dei time-to-first-token osservati, mai sotto LLM_HEDGE_AFTER_S.
+        if self.config.hedge_after_s <= 0:
+            return None
+        if len(self._ttft_samples) < self.config.hedge_min_samples:
+            return self.config.hedge_after_s
+        ordered = sorted(self._ttft_samples)
+        p95 = ordered[min(len(ordered) - 1, int(0.95 * len(ordered)))]
+        return max(self.config.hedge_after_s, p95)
+
+    async def complete(self, **kwargs: Any) -> Any:
+        async with self.limiter.slot():
+            attempt = 0
+            while True:
+                try:
+                    return await self.client.chat.completions.create(**kwargs, stream=False)
+                except Exception as error:
+                    if not is_retryable(error) or attempt >= self.config.max_retries:
+                        raise
+                    await asyncio.sleep(self.backoff_delay(attempt, error))
+                    attempt += 1
+
+    async def stream(self, **kwargs: Any) -> AsyncIterator[Any]:
+        # Se la richiesta finisce in coda, prima dei chunk viene emesso un QueuePosition.
+        ticket = self.limiter.reserve()
+        # wait() gestisce da se' timeout e cancellazione; prima di chiamarla il ticket va rilasciato qui.
+        unwaited, held = True, False
+        try:
+            if ticket.position:
+                yield QueuePosition(ticket.position)
+            unwaited = False
+            await ticket.wait()
+            held = True
+            async for chunk in self._stream_with_retries(kwargs):
+                yield chunk
+        finally:
+            if held:
+                self.limiter.release()
+            elif unwaited:
+                ticket.cancel()
+
+    async def _stream_with_retries(self, kwargs: dict) -> AsyncIterator[Any]:
+        # I tentativi valgono solo prima del primo chunk: dopo, un errore va al chiamante
+        # per non duplicare testo gia' inviato al client.
+        attempt = 0
+        while True:
+            try:
+                response, iterator, first = await self._open_stream(kwargs)
+                break
+            except Exception as error:
+                if not is_retryable(error) or attempt >= self.config.max_retries:
+                    raise
+                await asyncio.sleep(self.backoff_delay(attempt, error))
+                attempt += 1
+
+        try:
+            if first is not None:
+                yield first
+            async for chunk in iterator:
+                yield chunk
+        finally:
+            await _close_stream(response)
+
+    async def _first_chunk(self, kwargs: dict) -> tuple[Any, AsyncIterator[Any], Any]:
+        started = time.perf_counter()
+        response = await self.client.chat.completions.create(**kwargs, stream=True)
+        iterator = response.__aiter__()
+        try:
+            first = await iterator.__anext__()
+        except StopAsyncIteration:
+            first = None
+        except BaseException:
+            # Anche la richiesta perdente cancellata qui deve restituire la connessione al pool.
+            await _close_stream(response)
+            raise
+        self._ttft_samples.append(time.perf_counter() - started)
+        return response, iterator, first
+
+    @staticmethod
+    async def _discard(tasks: set[asyncio.Future]) -> None:
+        # Cancella i tentativi ancora aperti e ne attende la chiusura; chi ha gia' ottenuto
+        # uno stream prima della cancellazione lo chiude qui.
+        if not tasks:
+            return
+        for task in tasks:
+            task.cancel()
+        await asyncio.wait(tasks)
+        for task in tasks:
+            if not task.cancelled() and task.exception() is None:
+                await _close_stream(task.result()[0])
+
+    async def _open_stream(self, kwargs: dict) -> tuple[Any, AsyncIterator[Any], Any]:
+        delay = self.hedge_delay()
+        primary = asyncio.ensure_future(self._first_chunk(kwargs))
+        if delay is None:
+            return await primary
+
+        pending = {primary}
+        winner = None
+        first_error: BaseException | None = None
+        try:
+            done, pending = await asyncio.wait(pending, timeout=delay)
+            if done:
+                return primary.result()
+
+            pending.add(asyncio.ensure_future(self._first_chunk(kwargs)))
+            while pending and winner is None:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is not None:
+                        first_error = first_error or task.exception()
+                    elif winner is None:
+                        winner = task.result()
+                    else:
+                        await _close_stream(task.result()[0])
+        finally:
+            await self._discard(pending)
+        if winner is None:
+            raise first_error  # type: ignore[misc]
+        return winner
@@ -0,0 +1,124 @@
+#!/usr/bin/env python3
+from __future__ import annotations
+
+import argparse
+import json
+import statistics
+import time
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(
+        description="Misura il time-to-first-token di stream SSE concorrenti contro l'API FlyTax."
+    )
+    parser.add_argument(
+        "--api-url",
+        default="http://127.0.0.1:8000/chat-stream",
+        help="Endpoint streaming (default: http://127.0.0.1:8000/chat-stream)",
+    )
+    parser.add_argument("--concurrency", type=int, default=8, help="Stream aperti in parallelo.")
+    parser.add_argument("--requests", type=int, default=16, help="Numero totale di richieste.")
+    parser.add_argument(
+        "--question",
+        default="Come si compila la fattura elettronica nel regime forfettario?",
+        help="Domanda inviata (meglio una che passa dal modello, non una regola hardcoded).",
+    )
+    parser.add_argument(
+        "--output",
+        type=Path,
+        default=Path("stream_load_report.json"),
+        help="File JSON di report.",
+    )
+    return parser.parse_args()
+
+
+def _percentile(values: list[float], fraction: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    position = min(len(ordered) - 1, max(0, round(fraction * (len(ordered) - 1))))
+    return ordered[position]
+
+
+def run_stream(api_url: str, question: str, index: int) -> dict:
+    payload = {"content": question, "regime_id": "forfettario"}
+    req = urllib.request.Request(
+        api_url,
+        data=json.dumps(payload).encode("utf-8"),
+        headers={"Content-Type": "application/json"},
+    )
+    started = time.perf_counter()
+    first_token = None
+    chunks = 0
+    error = None
+    try:
+        with urllib.request.urlopen(req, timeout=180) as response:
+            for raw_line in response:
+                line = raw_line.decode("utf-8").strip()
+                if not line.startswith("data: "):
+                    continue
+                frame = json.loads(line[len("data: "):])
+                if "chunk" in frame:
+                    chunks += 1
+                    if first_token is None:
+                        first_token = time.perf_counter() - started
+                if frame.get("error"):
+                    error = frame["error"]
+                if frame.get("done"):
+                    break
+    except Exception as exc:
+        error = str(exc)
+
+    return {
+        "index": index,
+        "ttft_s": first_token,
+        "total_s": time.perf_counter() - started,
+        "chunks": chunks,
+        "error": error,
+    }
+
+
+def main() -> int:
+    args = parse_args()
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=max(1, args.concurrency)) as pool:
+        results = list(
+            pool.map(
+                lambda index: run_stream(args.api_url, args.question, index),
+                range(1, args.requests + 1),
+            )
+        )
+    elapsed = time.perf_counter() - started
+
+    ttfts = [item["ttft_s"] for item in results if item["ttft_s"] is not None]
+    totals = [item["total_s"] for item in results if not item["error"]]
+    failed = sum(1 for item in results if item["error"])
+    summary = {
+        "requests": args.requests,
+        "concurrency": args.concurrency,
+        "failed": failed,
+        "elapsed_s": elapsed,
+        "ttft_p50_s": _percentile(ttfts, 0.5),
+        "ttft_p95_s": _percentile(ttfts, 0.95),
+        "ttft_max_s": max(ttfts) if ttfts else 0.0,
+        "total_mean_s": statistics.fmean(totals) if totals else 0.0,
+    }
+
+    args.output.write_text(
+        json.dumps({"summary": summary, "results": results}, ensure_ascii=False, indent=2),
+        encoding="utf-8",
+    )
+    print(f"Richieste: {args.requests} (concorrenza {args.concurrency}), fallite: {failed}")
+    print(
+        f"TTFT p50 {summary['ttft_p50_s']:.3f}s, p95 {summary['ttft_p95_s']:.3f}s, "
+        f"max {summary['ttft_max_s']:.3f}s"
+    )
+    print(f"Report: {args.output}")
+    return 0 if failed == 0 else 1
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
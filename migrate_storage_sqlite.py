@@ -0,0 +1,37 @@
+#!/usr/bin/env python3
+from __future__ import annotations
+
+import argparse
+from pathlib import Path
+
+from app_paths import DATA_ROOT, STORAGE_SQLITE_PATH
+from storage_sqlite import SQLiteDatabase, migrate_json_tree
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(
+        description="Migra storico chat, feedback ed eventi da data/ (JSON/JSONL) al database SQLite."
+    )
+    parser.add_argument("--data-root", type=Path, default=DATA_ROOT, help="Cartella dati di origine.")
+    parser.add_argument("--db", type=Path, default=STORAGE_SQLITE_PATH, help="Database SQLite di destinazione.")
+    parser.add_argument("--batch-size", type=int, default=500, help="Record per transazione.")
+    return parser.parse_args()
+
+
+def main() -> int:
+    args = parse_args()
+    database = SQLiteDatabase(args.db)
+    try:
+        report = migrate_json_tree(args.data_root, database, batch_size=max(1, args.batch_size))
+    finally:
+        database.close()
+    print(
+        f"Migrazione completata in {args.db}: chat={report['chats']}, messaggi={report['messages']}, "
+        f"feedback={report['feedback']}, eventi={report['events']}, file illeggibili={report['skipped']}"
+    )
+    print("Avvia l'API con STORAGE_BACKEND=sqlite per usare il nuovo archivio.")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,51 @@
+from functools import lru_cache
+from typing import Any, Dict, List
+
+
+# L'ordine conta per la cache dei prefissi lato provider (DeepSeek): prima tutto cio' che
+# e' identico tra le richieste (istruzioni e regole di stile), poi il CONTEXT, per ultima
+# la domanda. Entrambi gli endpoint devono passare da qui per produrre gli stessi byte.
+ANSWER_RULES = (
+    "Rispondi in italiano in modo sintetico. "
+    "Usa massimo 4 frasi totali. "
+    "Dai prima la risposta diretta. "
+    "Non inserire mai le fonti nel testo della risposta."
+)
+
+
+@lru_cache(maxsize=16)
+def build_system_prompt(regime_label: str) -> str:
+    return (
+        f"Sei un assistente fiscale per {regime_label.lower()} in Italia. "
+        "Rispondi solo con informazioni presenti nel CONTEXT. "
+        "Se il CONTEXT non contiene una parte della risposta, dillo in una sola frase breve. "
+        "Se un termine è solo citato ma non definito, dillo esplicitamente. "
+        "Non affermare che un termine non è menzionato se compare nel CONTEXT. "
+        "Non inventare norme, soglie o scadenze. "
+        "Stile obbligatorio: italiano chiaro, tono professionale, nessun markdown, "
+        "nessun uso di **, # o elenchi con trattini. "
+        "Non iniziare con formule tipo 'In base al CONTEXT fornito'. "
+        f"{ANSWER_RULES}"
+    )
+
+
+def build_messages(regime_label: str, context: str, question: str) -> List[Dict[str, str]]:
+    return [
+        {"role": "system", "content": build_system_prompt(regime_label)},
+        {"role": "user", "content": f"CONTEXT:\n{context}\n\nDOMANDA:\n{question}"},
+    ]
+
+
+def prompt_cache_usage(usage: Any) -> Dict[str, int] | None:
+    if usage is None:
+        return None
+    hit = getattr(usage, "prompt_cache_hit_tokens", None)
+    miss = getattr(usage, "prompt_cache_miss_tokens", None)
+    prompt_tokens = getattr(usage, "prompt_tokens", None)
+    if hit is None and miss is None and prompt_tokens is None:
+        return None
+    return {
+        "prompt_tokens": int(prompt_tokens or 0),
+        "prompt_cache_hit_tokens": int(hit or 0),
+        "prompt_cache_miss_tokens": int(miss if miss is not None else (prompt_tokens or 0) - (hit or 0)),
+    }
@@ -64,8 +64,11 @@ class QdrantRAG:
         qdrant_api_key: str | None,
         collection_name: str,
         embedding_model: str,
+        partition_by_regime: bool = False,
     ) -> None:
         self.collection_name = collection_name
+        self.partition_by_regime = partition_by_regime
+        self._partition_names: List[str] | None = None
         self.embedder = SentenceTransformerEmbedder(embedding_model)
         self.client = QdrantClient(url=qdrant_url, api_key=qdrant_api_key, timeout=60)
 
@@ -79,6 +82,7 @@ class QdrantRAG:
                 "EMBEDDING_MODEL",
                 "sentence-transformers/paraphrase-multilingual-MiniLM-L12-v2",
             ),
+            partition_by_regime=os.getenv("QDRANT_PARTITION_BY_REGIME", "0") == "1",
         )
 
     @staticmethod
@@ -192,33 +196,66 @@ class QdrantRAG:
                 text_parts.append(node.tail)
         return " ".join(text_parts)
 
-    def _collection_exists(self) -> bool:
+    def regime_collection_name(self, regime_id: str) -> str:
+        return f"{self.collection_name}__{self.normalize_regime_id(regime_id)}"
+
+    def _partitioned_collections(self, refresh: bool = False) -> List[str]:
+        if self._partition_names is not None and not refresh:
+            return self._partition_names
+        prefix = f"{self.collection_name}__"
+        try:
+            response = self.client.get_collections()
+        except Exception:
+            return []
+        self._partition_names = sorted(
+            item.name for item in response.collections if item.name.startswith(prefix)
+        )
+        return self._partition_names
+
+    def _target_collections(self, regime_ids: List[str] | None = None) -> List[str]:
+        if not self.partition_by_regime:
+            return [self.collection_name]
+        available = self._partitioned_collections()
+        if regime_ids:
+            requested = dict.fromkeys(
+                self.regime_collection_name(item) for item in regime_ids if item
+            )
+            return [name for name in requested if name in available]
+        return list(available)
+
+    def _collection_exists(self, collection_name: str | None = None) -> bool:
         try:
-            self.client.get_collection(self.collection_name)
+            self.client.get_collection(collection_name or self.collection_name)
             return True
         except Exception:
             return False
 
-    def ensure_collection(self, vector_size: int, recreate: bool = False) -> None:
-        exists = self._collection_exists()
+    def ensure_collection(
+        self,
+        vector_size: int,
+        recreate: bool = False,
+        collection_name: str | None = None,
+    ) -> None:
+        collection_name = collection_name or self.collection_name
+        exists = self._collection_exists(collection_name)
         if recreate and exists:
-            self.client.delete_collection(self.collection_name)
+            self.client.delete_collection(collection_name)
             exists = False
 
         if not exists:
             self.client.create_collection(
-                collection_name=self.collection_name,
+                collection_name=collection_name,
                 vectors_config=models.VectorParams(
                     size=vector_size,
                     distance=models.Distance.COSINE,
                 ),
                 on_disk_payload=True,
             )
-        self._ensure_payload_indexes()
+        self._ensure_payload_indexes(collection_name)
 
-    def _ensure_payload_indexes(self) -> None:
+    def _ensure_payload_indexes(self, collection_name: str | None = None) -> None:
         self.client.create_payload_index(
-            collection_name=self.collection_name,
+            collection_name=collection_name or self.collection_name,
             field_name="regime",
             field_schema=models.PayloadSchemaType.KEYWORD,
             wait=True,
@@ -290,8 +327,31 @@ class QdrantRAG:
             raise ValueError("Nessun chunk generato dai documenti")
 
         probe_vec = self.embedder.embed_query(raw_chunks[0]["text"])
-        self.ensure_collection(vector_size=len(probe_vec), recreate=recreate_collection)
+        if self.partition_by_regime:
+            chunks_by_collection: dict[str, List[dict]] = {}
+            for item in raw_chunks:
+                collection_name = self.regime_collection_name(item["regime"])
+                chunks_by_collection.setdefault(collection_name, []).append(item)
+        else:
+            chunks_by_collection = {self.collection_name: raw_chunks}
+
+        for collection_name, collection_chunks in chunks_by_collection.items():
+            self.ensure_collection(
+                vector_size=len(probe_vec),
+                recreate=recreate_collection,
+                collection_name=collection_name,
+            )
+            self._upsert_chunks(collection_name, collection_chunks, embed_batch_size)
+        self._partition_names = None
 
+        return len(raw_chunks)
+
+    def _upsert_chunks(
+        self,
+        collection_name: str,
+        raw_chunks: List[dict],
+        embed_batch_size: int,
+    ) -> None:
         point_id = 1
         for start in range(0, len(raw_chunks), embed_batch_size):
             batch = raw_chunks[start : start + embed_batch_size]
@@ -318,27 +378,29 @@ class QdrantRAG:
                 point_id += 1
 
             self.client.upsert(
-                collection_name=self.collection_name,
+                collection_name=collection_name,
                 points=points,
                 wait=True,
             )
 
-        return len(raw_chunks)
-
     def load(self) -> None:
-        if not self._collection_exists():
+        if self.partition_by_regime:
+            self._partitioned_collections(refresh=True)
+        collections = self._target_collections()
+        if not collections or not all(self._collection_exists(name) for name in collections):
             raise FileNotFoundError(
                 f"Collection Qdrant non trovata: {self.collection_name}"
             )
-        self._ensure_payload_indexes()
-        points, _ = self.client.scroll(
-            collection_name=self.collection_name,
-            limit=1,
-            with_payload=False,
-            with_vectors=False,
-        )
-        if not points:
-            raise ValueError(f"Collection Qdrant vuota: {self.collection_name}")
+        for collection_name in collections:
+            self._ensure_payload_indexes(collection_name)
+            points, _ = self.client.scroll(
+                collection_name=collection_name,
+                limit=1,
+                with_payload=False,
+                with_vectors=False,
+            )
+            if not points:
+                raise ValueError(f"Collection Qdrant vuota: {collection_name}")
 
     def iter_payload_chunks(
         self,
@@ -351,27 +413,31 @@ class QdrantRAG:
                 self.normalize_regime_id(item) for item in regime_ids if item
             }
 
-        offset = None
-        while True:
-            points, next_offset = self.client.scroll(
-                collection_name=self.collection_name,
-                limit=batch_size,
-                offset=offset,
-                with_payload=True,
-                with_vectors=False,
-            )
-            if not points:
-                break
-            for point in points:
-                payload = point.payload or {}
-                if normalized_regimes:
-                    regime = payload.get("regime")
-                    if regime not in normalized_regimes:
-                        continue
-                yield payload
-            if next_offset is None:
-                break
-            offset = next_offset
+        for collection_name in self._target_collections(regime_ids):
+            offset = None
+            while True:
+                points, next_offset = self.client.scroll(
+                    collection_name=collection_name,
+                    limit=batch_size,
+                    offset=offset,
+                    with_payload=True,
+                    with_vectors=False,
+                )
+                if not points:
+                    break
+                for point in points:
+                    payload = point.payload or {}
+                    if normalized_regimes and not self.partition_by_regime:
+                        regime = payload.get("regime")
+                        if regime not in normalized_regimes:
+                            continue
+                    yield payload
+                if next_offset is None:
+                    break
+                offset = next_offset
+
+    def embed_query(self, query: str) -> List[float]:
+        return self.embedder.embed_query(query.strip())
 
     def search(
         self,
@@ -379,14 +445,16 @@ class QdrantRAG:
         top_k: int = 4,
         min_score: float = 0.2,
         regime_ids: List[str] | None = None,
+        query_vector: List[float] | None = None,
     ) -> List[RetrievedChunk]:
         query = query.strip()
         if not query:
             return []
 
-        query_vector = self.embedder.embed_query(query)
+        if query_vector is None:
+            query_vector = self.embedder.embed_query(query)
         query_filter = None
-        if regime_ids:
+        if regime_ids and not self.partition_by_regime:
             normalized_regimes = [self.normalize_regime_id(item) for item in regime_ids if item]
             if normalized_regimes:
                 if len(normalized_regimes) == 1:
@@ -397,28 +465,21 @@ class QdrantRAG:
                     must=[models.FieldCondition(key="regime", match=match)]
                 )
 
-        # Compatibilita' tra versioni del client:
-        # - nuove: query_points(...)
-        # - vecchie: search(...)
-        if hasattr(self.client, "query_points"):
-            response = self.client.query_points(
-                collection_name=self.collection_name,
-                query=query_vector,
-                limit=top_k,
-                with_payload=True,
-                score_threshold=min_score,
-                query_filter=query_filter,
-            )
-            hits = response.points
-        else:
-            hits = self.client.search(
-                collection_name=self.collection_name,
-                query_vector=query_vector,
-                limit=top_k,
-                with_payload=True,
-                score_threshold=min_score,
-                query_filter=query_filter,
+        # Con le collection partizionate per regime non serve il filtro sul payload:
+        # si interrogano solo le collection dei regimi richiesti.
+        hits = []
+        for collection_name in self._target_collections(regime_ids):
+            hits.extend(
+                self._query_collection(
+                    collection_name,
+                    query_vector,
+                    top_k=top_k,
+                    min_score=min_score,
+                    query_filter=query_filter,
+                )
             )
+        if len(hits) > top_k:
+            hits = sorted(hits, key=lambda hit: hit.score, reverse=True)[:top_k]
 
         results: List[RetrievedChunk] = []
         for hit in hits:
@@ -443,3 +504,35 @@ class QdrantRAG:
                 )
             )
         return results
+
+    def _query_collection(
+        self,
+        collection_name: str,
+        query_vector: List[float],
+        top_k: int,
+        min_score: float,
+        query_filter: "models.Filter | None",
+    ) -> list:
+        # Compatibilita' tra versioni del client:
+        # - nuove: query_points(...)
+        # - vecchie: search(...)
+        if hasattr(self.client, "query_points"):
+            response = self.client.query_points(
+                collection_name=collection_name,
+                query=query_vector,
+                limit=top_k,
+                with_payload=True,
+                score_threshold=min_score,
+                query_filter=query_filter,
+            )
+            return list(response.points)
+        return list(
+            self.client.search(
+                collection_name=collection_name,
+                query_vector=query_vector,
+                limit=top_k,
+                with_payload=True,
+                score_threshold=min_score,
+                query_filter=query_filter,
+            )
+        )
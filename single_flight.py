@@ -0,0 +1,111 @@
+import asyncio
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, Hashable, List
+
+
+class _Broadcast:
+    # Un solo consumatore legge lo stream sorgente e accumula gli elementi; ogni
+    # iscritto li riceve tutti dall'inizio, anche se arriva a generazione gia' avviata.
+    # Gli elementi `transient` (es. posizione in coda) valgono solo finche' sono gli ultimi:
+    # a chi arriva dopo non vengono rigiocati. Quando l'ultimo iscritto se ne va la
+    # generazione viene annullata, cosi' non consuma token ne' posti del limitatore.
+    def __init__(self, source: AsyncIterator[Any], transient: Callable[[Any], bool] | None = None) -> None:
+        self._source = source
+        self._transient = transient
+        self._items: List[Any] = []
+        self._done = False
+        self._error: BaseException | None = None
+        self._changed = asyncio.Condition()
+        self.subscribers = 0
+        self.abandoned = False
+        self.task = asyncio.ensure_future(self._pump())
+
+    async def _pump(self) -> None:
+        try:
+            async for item in self._source:
+                async with self._changed:
+                    self._items.append(item)
+                    self._changed.notify_all()
+        except Exception as error:
+            self._error = error
+        except asyncio.CancelledError:
+            self._error = RuntimeError("generazione annullata")
+            raise
+        finally:
+            aclose = getattr(self._source, "aclose", None)
+            if aclose is not None:
+                await aclose()
+            async with self._changed:
+                self._done = True
+                self._changed.notify_all()
+
+    async def subscribe(self) -> AsyncIterator[Any]:
+        # Incremento e decremento stanno nello stesso generatore, prima del primo await:
+        # un iscritto mai avviato non tiene in vita la generazione.
+        self.subscribers += 1
+        try:
+            position = 0
+            while True:
+                async with self._changed:
+                    await self._changed.wait_for(lambda: position < len(self._items) or self._done)
+                    batch = self._items[position:]
+                    position = len(self._items)
+                    finished = self._done
+                for index, item in enumerate(batch):
+                    if self._transient is not None and index < len(batch) - 1 and self._transient(item):
+                        continue
+                    yield item
+                if finished:
+                    if self._error is not None:
+                        raise self._error
+                    return
+        finally:
+            self.subscribers -= 1
+            if self.subscribers == 0 and not self.task.done():
+                self.abandoned = True
+                self.task.cancel()
+
+
+# Coalescenza delle richieste identiche in volo: chi arriva mentre la stessa chiave e' gia'
+# in esecuzione attende lo stesso future (o si iscrive allo stesso stream) invece di
+# ripetere retrieval e chiamata al modello. A lavoro concluso la chiave viene liberata.
+class SingleFlight:
+    def __init__(self) -> None:
+        self._calls: Dict[Hashable, asyncio.Future] = {}
+        self._streams: Dict[Hashable, _Broadcast] = {}
+
+    def in_flight(self, key: Hashable) -> bool:
+        return key in self._calls or key in self._streams
+
+    async def run(self, key: Hashable, factory: Callable[[], Awaitable[Any]]) -> Any:
+        future = self._calls.get(key)
+        if future is None:
+            future = asyncio.ensure_future(factory())
+            self._calls[key] = future
+            future.add_done_callback(lambda _: self._release(self._calls, key, future))
+        # shield: se un client si disconnette, gli altri in attesa ricevono comunque il risultato.
+        return await asyncio.shield(future)
+
+    async def stream(
+        self,
+        key: Hashable,
+        factory: Callable[[], AsyncIterator[Any]],
+        transient: Callable[[Any], bool] | None = None,
+    ) -> AsyncIterator[Any]:
+        # La generazione si sceglie alla prima lettura: scelta e iscrizione avvengono senza
+        # await in mezzo, quindi non si aggancia mai una generazione appena annullata.
+        broadcast = self._streams.get(key)
+        if broadcast is None or broadcast.abandoned:
+            broadcast = _Broadcast(factory(), transient)
+            self._streams[key] = broadcast
+            broadcast.task.add_done_callback(lambda _: self._release(self._streams, key, broadcast))
+        subscription = broadcast.subscribe()
+        try:
+            async for item in subscription:
+                yield item
+        finally:
+            await subscription.aclose()
+
+    @staticmethod
+    def _release(registry: Dict[Hashable, Any], key: Hashable, owner: Any) -> None:
+        if registry.get(key) is owner:
+            del registry[key]
@@ -1,29 +1,194 @@
 from __future__ import annotations
 
+import gzip
 import json
-from collections import Counter
-from datetime import datetime, timezone
+import os
+import tempfile
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager, nullcontext
+from datetime import datetime, timedelta, timezone
+from itertools import islice
 from pathlib import Path
+from typing import Iterable, Iterator
 from uuid import uuid4
 
-from app_models import AdminStats, ChatMessage, ChatSummary, ChatTranscript
+from app_models import ChatMessage, ChatSummary, ChatTranscript, LLMUsageStats
 
 
 def utc_now_iso() -> str:
     return datetime.now(timezone.utc).isoformat()
 
 
+try:
+    import fcntl
+except ImportError:  # Windows: nessun lock tra processi, resta solo quello tra thread.
+    fcntl = None
+
+
+_LOCKS_GUARD = threading.Lock()
+_LOCKS: dict[str, threading.RLock] = {}
+_LOCK_DEPTH = threading.local()
+
+
+@contextmanager
+def file_lock(path: Path) -> Iterator[None]:
+    # Lock consultivo (flock) su un file dedicato, valido tra processi (uvicorn --workers N)
+    # e tra thread. Rientrante nello stesso thread: flock non lo e' su descrittori diversi.
+    key = str(path)
+    with _LOCKS_GUARD:
+        local_lock = _LOCKS.setdefault(key, threading.RLock())
+    with local_lock:
+        depth = getattr(_LOCK_DEPTH, "counts", None)
+        if depth is None:
+            depth = _LOCK_DEPTH.counts = {}
+        if depth.get(key):
+            depth[key] += 1
+            try:
+                yield
+            finally:
+                depth[key] -= 1
+            return
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        fd = os.open(key, os.O_RDWR | os.O_CREAT, 0o644)
+        depth[key] = 1
+        try:
+            if fcntl is not None:
+                fcntl.flock(fd, fcntl.LOCK_EX)
+            yield
+        finally:
+            depth[key] = 0
+            if fcntl is not None:
+                fcntl.flock(fd, fcntl.LOCK_UN)
+            os.close(fd)
+
+
+@contextmanager
+def shared_file_lock(path: Path) -> Iterator[None]:
+    # Lato condiviso (LOCK_SH) dello stesso file di file_lock: piu' detentori insieme, ma
+    # nessuno mentre un altro lo tiene con file_lock. Senza fcntl degrada a esclusivo.
+    if fcntl is None:
+        with file_lock(path):
+            yield
+        return
+    Path(path).parent.mkdir(parents=True, exist_ok=True)
+    fd = os.open(str(path), os.O_RDWR | os.O_CREAT, 0o644)
+    try:
+        fcntl.flock(fd, fcntl.LOCK_SH)
+        yield
+    finally:
+        fcntl.flock(fd, fcntl.LOCK_UN)
+        os.close(fd)
+
+
+def atomic_write_text(path: Path, text: str) -> None:
+    # File temporaneo univoco nella stessa cartella, poi rename: i lettori vedono sempre
+    # la versione vecchia o quella nuova, mai un file scritto a meta'.
+    path = Path(path)
+    fd, temp_name = tempfile.mkstemp(dir=path.parent, prefix=f".{path.name}.", suffix=".tmp")
+    try:
+        with os.fdopen(fd, "w", encoding="utf-8") as handle:
+            handle.write(text)
+            handle.flush()
+            os.fsync(handle.fileno())
+        os.replace(temp_name, path)
+    except BaseException:
+        try:
+            os.unlink(temp_name)
+        except FileNotFoundError:
+            pass
+        raise
+
+
+def append_bytes(path: Path, data: bytes) -> None:
+    # Percorso di scrittura unico per i file append-only: O_APPEND, una sola write()
+    # sotto flock, cosi' righe di processi diversi non si mescolano.
+    fd = os.open(str(path), os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+    try:
+        if fcntl is not None:
+            fcntl.flock(fd, fcntl.LOCK_EX)
+        view = memoryview(data)
+        while view:
+            written = os.write(fd, view)
+            view = view[written:]
+    finally:
+        if fcntl is not None:
+            fcntl.flock(fd, fcntl.LOCK_UN)
+        os.close(fd)
+
+
+def _decode_line(line: bytes) -> dict | None:
+    line = line.strip()
+    if not line:
+        return None
+    try:
+        record = json.loads(line)
+    except (json.JSONDecodeError, UnicodeDecodeError):
+        return None
+    return record if isinstance(record, dict) else None
+
+
+def _json_lines(records) -> bytes:
+    return "".join(json.dumps(record, ensure_ascii=False) + "\n" for record in records).encode("utf-8")
+
+
+CHAT_CATALOG_FILENAME = "_catalog.jsonl"
+LEGACY_CHAT_CATALOG_FILENAME = "_catalog.json"
+CHAT_CATALOG_COMPACT_MIN = int(os.getenv("CHAT_CATALOG_COMPACT_MIN", "1000"))
+CHAT_LOCKS_DIRNAME = ".locks"
+CHAT_LOG_COMPACT_EVERY = int(os.getenv("CHAT_LOG_COMPACT_EVERY", "50"))
+
+
 class ChatHistoryStore:
-    def __init__(self, base_dir: Path = Path("data/chat_history")) -> None:
+    # Ogni chat e' un log NDJSON `<chat_id>.jsonl`: la prima riga e' l'intestazione,
+    # poi un messaggio per riga; un cambio di regime aggiunge una riga {"meta": ...}.
+    # Salvare un turno e' un solo append; ogni CHAT_LOG_COMPACT_EVERY turni il log viene
+    # riscritto con l'intestazione aggiornata. I vecchi `<chat_id>.json` restano leggibili
+    # e vengono convertiti al primo salvataggio.
+    def __init__(
+        self,
+        base_dir: Path = Path("data/chat_history"),
+        compact_every: int | None = None,
+        catalog_compact_min: int | None = None,
+    ) -> None:
         self.base_dir = Path(base_dir)
         self.base_dir.mkdir(parents=True, exist_ok=True)
+        self.compact_every = CHAT_LOG_COMPACT_EVERY if compact_every is None else compact_every
+        # Catalogo delle chat come log append-only `_catalog.jsonl`: ogni save_turn/delete_chat
+        # aggiunge una riga (voce aggiornata o {"deleted": true}). In memoria e' un OrderedDict
+        # dalla meno alla piu' recente, aggiornato leggendo solo le righe nuove: la lista
+        # costa O(limit) e non apre le trascrizioni. Quando le righe superate sono troppe
+        # il log viene riscritto con le sole voci vive.
+        self.catalog_compact_min = CHAT_CATALOG_COMPACT_MIN if catalog_compact_min is None else catalog_compact_min
+        self._catalog_path = self.base_dir / CHAT_CATALOG_FILENAME
+        self._catalog: OrderedDict[str, dict] | None = None
+        self._catalog_inode: int | None = None
+        self._catalog_offset = 0
+        self._catalog_lines = 0
+        self._locks_dir = self.base_dir / CHAT_LOCKS_DIRNAME
+        # Impostato da AdminAggregates: riceve ogni turno salvato e ogni chat cancellata.
+        self.aggregates = None
 
     def create_chat_id(self) -> str:
         return uuid4().hex
 
     def _chat_path(self, chat_id: str) -> Path:
+        return self.base_dir / f"{chat_id}.jsonl"
+
+    def _legacy_path(self, chat_id: str) -> Path:
         return self.base_dir / f"{chat_id}.json"
 
+    def _is_reserved(self, chat_id: str) -> bool:
+        return chat_id == self._catalog_path.stem
+
+    def _chat_lock(self, chat_id: str):
+        # Lock su un file separato: compattazione e conversione sostituiscono il log con
+        # un rename, quindi il lock non puo' stare sul log stesso.
+        return file_lock(self._locks_dir / f"{chat_id}.lock")
+
+    def _catalog_lock(self):
+        return file_lock(self._locks_dir / f"{LEGACY_CHAT_CATALOG_FILENAME}.lock")
+
     def save_turn(
         self,
         chat_id: str,
@@ -35,156 +200,905 @@ class ChatHistoryStore:
         confidence_score: float | None = None,
         retrieval_mode: str | None = None,
     ) -> dict:
-        chat = self._load_raw(chat_id) or {
+        if self._is_reserved(chat_id):
+            raise ValueError("chat_id riservato")
+        timestamp = utc_now_iso()
+        messages = [
+            {
+                "role": "user",
+                "text": user_message,
+                "sources": [],
+                "created_at": timestamp,
+            },
+            {
+                "role": "assistant",
+                "text": assistant_message,
+                "sources": assistant_sources,
+                "created_at": timestamp,
+                "confidence_label": confidence_label,
+                "confidence_score": confidence_score,
+                "retrieval_mode": retrieval_mode,
+            },
+        ]
+        with self._recording(), self._chat_lock(chat_id):
+            entry, created_at = self._append_turn(chat_id, regime_id, user_message, messages, timestamp)
+            if self.compact_every > 0 and (entry["message_count"] // 2) % self.compact_every == 0:
+                self.compact(chat_id)
+        # Il turno appena scritto, senza rileggere il log: la trascrizione completa e' su get_chat.
+        return {
             "chat_id": chat_id,
-            "title": user_message.strip()[:72] or "Nuova chat",
-            "regime_id": regime_id,
-            "created_at": utc_now_iso(),
-            "updated_at": utc_now_iso(),
-            "messages": [],
+            "title": entry["title"],
+            "regime_id": entry["regime_id"],
+            "created_at": created_at,
+            "updated_at": timestamp,
+            "messages": messages,
         }
-        timestamp = utc_now_iso()
-        chat["regime_id"] = regime_id or chat.get("regime_id")
-        chat["updated_at"] = timestamp
-        chat.setdefault("messages", []).extend(
-            [
-                {
-                    "role": "user",
-                    "text": user_message,
-                    "sources": [],
-                    "created_at": timestamp,
-                },
-                {
-                    "role": "assistant",
-                    "text": assistant_message,
-                    "sources": assistant_sources,
-                    "created_at": timestamp,
-                    "confidence_label": confidence_label,
-                    "confidence_score": confidence_score,
-                    "retrieval_mode": retrieval_mode,
-                },
-            ]
-        )
-        self._chat_path(chat_id).write_text(
-            json.dumps(chat, ensure_ascii=False, indent=2),
-            encoding="utf-8",
-        )
-        return chat
+
+    def _append_turn(
+        self,
+        chat_id: str,
+        regime_id: str | None,
+        user_message: str,
+        messages: list[dict],
+        timestamp: str,
+    ) -> tuple[dict, str]:
+        path = self._chat_path(chat_id)
+        if not path.exists() and self._legacy_path(chat_id).exists():
+            self._convert_legacy(chat_id)
+        entry = previous = None
+        created_at = timestamp
+        if path.exists():
+            first = self._read_first_record(path)
+            if first is not None and "chat_id" in first:
+                created_at = first.get("created_at", "")
+                # La voce di catalogo di questa chat cambia solo sotto il suo lock: e' affidabile.
+                entry = self._catalog_entry_for(chat_id)
+                if entry is None:
+                    header = self._read_header(chat_id)
+                    entry = {**self._catalog_entry(header), "message_count": self._count_messages(chat_id)}
+                previous = entry
+            else:
+                # Log senza intestazione valida: si mette da parte invece di sovrascriverlo.
+                self._quarantine(path)
+                previous = self._catalog_entry_for(chat_id)
+
+        if entry is None:
+            header = {
+                "chat_id": chat_id,
+                "title": user_message.strip()[:72] or "Nuova chat",
+                "regime_id": regime_id,
+                "created_at": timestamp,
+                "updated_at": timestamp,
+            }
+            lines = [header, *messages]
+            entry = self._catalog_entry(header)
+            atomic_write_text(path, _json_lines(lines).decode("utf-8"))
+        else:
+            lines = list(messages)
+            if regime_id and regime_id != entry.get("regime_id"):
+                lines.insert(0, {"meta": {"regime_id": regime_id}})
+            append_bytes(path, _json_lines(lines))
+
+        entry = {
+            **entry,
+            "regime_id": regime_id or entry.get("regime_id"),
+            "updated_at": timestamp,
+            "message_count": entry["message_count"] + len(messages),
+        }
+        self._append_catalog(entry)
+        if self.aggregates is not None:
+            self.aggregates.record_turn(previous, entry, user_message)
+        return entry, created_at
 
     def list_chats(self, limit: int = 30) -> list[ChatSummary]:
-        chats = []
-        for path in self.base_dir.glob("*.json"):
-            payload = json.loads(path.read_text(encoding="utf-8"))
-            chats.append(
-                ChatSummary(
-                    chat_id=payload["chat_id"],
-                    title=payload.get("title", "Chat"),
-                    regime_id=payload.get("regime_id"),
-                    updated_at=payload.get("updated_at", ""),
-                    message_count=len(payload.get("messages", [])),
-                )
-            )
-        chats.sort(key=lambda item: item.updated_at, reverse=True)
-        return chats[:limit]
+        with self._catalog_lock():
+            entries = list(islice(reversed(self._load_catalog().values()), max(0, limit)))
+        return [ChatSummary(**item) for item in entries]
 
     def get_chat(self, chat_id: str) -> ChatTranscript | None:
-        payload = self._load_raw(chat_id)
-        if payload is None:
+        header = self._read_header(chat_id)
+        if header is None:
             return None
         return ChatTranscript(
-            chat_id=payload["chat_id"],
-            title=payload.get("title", "Chat"),
-            regime_id=payload.get("regime_id"),
-            created_at=payload.get("created_at", ""),
-            updated_at=payload.get("updated_at", ""),
-            messages=[ChatMessage(**message) for message in payload.get("messages", [])],
+            chat_id=header["chat_id"],
+            title=header.get("title", "Chat"),
+            regime_id=header.get("regime_id"),
+            created_at=header.get("created_at", ""),
+            updated_at=header.get("updated_at", ""),
+            messages=list(self.iter_messages(chat_id)),
         )
 
+    def iter_messages(self, chat_id: str) -> Iterator[ChatMessage]:
+        # Legge il log riga per riga senza caricare l'intera trascrizione.
+        for record in self._iter_message_records(chat_id):
+            yield ChatMessage(**record)
+
+    def iter_chat_ids(self) -> Iterator[str]:
+        seen = set()
+        for pattern in ("*.jsonl", "*.json"):
+            for path in self.base_dir.glob(pattern):
+                if self._is_reserved(path.stem) or path.stem in seen:
+                    continue
+                seen.add(path.stem)
+                yield path.stem
+
     def delete_chat(self, chat_id: str) -> bool:
-        path = self._chat_path(chat_id)
-        if not path.exists():
+        if self._is_reserved(chat_id):
             return False
-        path.unlink()
+        deleted = False
+        with self._recording(), self._chat_lock(chat_id):
+            questions = []
+            if self.aggregates is not None:
+                questions = [
+                    record.get("text", "")
+                    for record in self._iter_message_records(chat_id)
+                    if record.get("role") == "user"
+                ]
+            for path in (self._chat_path(chat_id), self._legacy_path(chat_id)):
+                if path.exists():
+                    path.unlink()
+                    deleted = True
+            if deleted:
+                entry = self._catalog_entry_for(chat_id)
+                self._append_catalog({"chat_id": chat_id, "deleted": True})
+                if self.aggregates is not None and entry is not None:
+                    self.aggregates.record_delete(entry, questions)
+        return deleted
+
+    def _recording(self):
+        # Scrittura della chat e variazione degli aggregati insieme, mai a cavallo di un rebuild.
+        return self.aggregates.recording() if self.aggregates is not None else nullcontext()
+
+    def compact(self, chat_id: str) -> bool:
+        # Riscrive il log con un'unica intestazione aggiornata, senza righe meta o corrotte.
+        with self._chat_lock(chat_id):
+            if not self._chat_path(chat_id).exists():
+                return False
+            payload = self._load_raw(chat_id)
+            if payload is None:
+                return False
+            messages = payload.pop("messages")
+            atomic_write_text(self._chat_path(chat_id), _json_lines([payload, *messages]).decode("utf-8"))
         return True
 
+    @staticmethod
+    def _catalog_entry(payload: dict) -> dict:
+        return {
+            "chat_id": payload["chat_id"],
+            "title": payload.get("title", "Chat"),
+            "regime_id": payload.get("regime_id"),
+            "updated_at": payload.get("updated_at", ""),
+            "message_count": len(payload.get("messages", [])),
+        }
+
+    def _catalog_entry_for(self, chat_id: str) -> dict | None:
+        with self._catalog_lock():
+            entry = self._load_catalog().get(chat_id)
+        return dict(entry) if entry is not None else None
+
+    def _load_catalog(self) -> OrderedDict[str, dict]:
+        # Legge solo le righe aggiunte dall'ultimo accesso, anche da altri worker; se il log
+        # e' stato compattato (rename, nuovo inode) lo rilegge da capo.
+        with self._catalog_lock():
+            try:
+                handle = self._catalog_path.open("rb")
+            except FileNotFoundError:
+                # Primo avvio (o catalogo cancellato): lo si ricostruisce dalle trascrizioni.
+                return self.rebuild_catalog()
+            with handle:
+                stat = os.fstat(handle.fileno())
+                if (
+                    self._catalog is None
+                    or stat.st_ino != self._catalog_inode
+                    or stat.st_size < self._catalog_offset
+                ):
+                    self._catalog = OrderedDict()
+                    self._catalog_inode = stat.st_ino
+                    self._catalog_offset = 0
+                    self._catalog_lines = 0
+                if stat.st_size > self._catalog_offset:
+                    records, self._catalog_offset = _read_handle_from(handle, self._catalog_offset, None)
+                    for record in records:
+                        self._apply_catalog_record(record)
+            return self._catalog
+
+    def _apply_catalog_record(self, record: dict) -> None:
+        chat_id = record.get("chat_id")
+        if not chat_id:
+            return
+        self._catalog_lines += 1
+        self._catalog.pop(chat_id, None)
+        if not record.get("deleted"):
+            self._catalog[chat_id] = record
+
+    def _append_catalog(self, record: dict) -> None:
+        with self._catalog_lock():
+            # Prima ci si allinea (e si ricostruisce il catalogo se manca), poi si aggiunge la riga.
+            current = self._load_catalog().get(record["chat_id"])
+            if current == record or (current is None and record.get("deleted")):
+                return
+            append_bytes(self._catalog_path, _json_lines([record]))
+            catalog = self._load_catalog()
+            if self._catalog_lines > max(self.catalog_compact_min, 2 * len(catalog)):
+                self._write_catalog(list(catalog.values()))
+
+    def rebuild_catalog(self) -> OrderedDict[str, dict]:
+        with self._catalog_lock():
+            catalog = []
+            for chat_id in self.iter_chat_ids():
+                try:
+                    payload = self._load_raw(chat_id)
+                except (json.JSONDecodeError, KeyError):
+                    continue
+                if payload is not None:
+                    catalog.append(self._catalog_entry(payload))
+            catalog.sort(key=lambda item: item["updated_at"])
+            self._write_catalog(catalog)
+            # Il vecchio indice JSON (riscritto per intero a ogni turno) non serve piu'.
+            legacy_catalog = self.base_dir / LEGACY_CHAT_CATALOG_FILENAME
+            if legacy_catalog.exists():
+                legacy_catalog.unlink()
+            return self._catalog
+
+    def _write_catalog(self, entries: list[dict]) -> None:
+        # Riscrive il log con una riga per chat viva, dalla meno alla piu' recente.
+        atomic_write_text(self._catalog_path, _json_lines(entries).decode("utf-8"))
+        stat = self._catalog_path.stat()
+        self._catalog = OrderedDict((item["chat_id"], item) for item in entries)
+        self._catalog_inode = stat.st_ino
+        self._catalog_offset = stat.st_size
+        self._catalog_lines = len(entries)
+
+    def _count_messages(self, chat_id: str) -> int:
+        return sum(1 for _ in self._iter_message_records(chat_id))
+
+    @staticmethod
+    def _iter_log(path: Path) -> Iterator[dict]:
+        with path.open(encoding="utf-8") as handle:
+            for line in handle:
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    # Riga troncata da una scrittura interrotta: si ignora, la compattazione la elimina.
+                    continue
+                if isinstance(record, dict):
+                    yield record
+
+    @staticmethod
+    def _read_first_record(path: Path) -> dict | None:
+        with path.open(encoding="utf-8") as handle:
+            for line in handle:
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    return None
+                return record if isinstance(record, dict) else None
+        return None
+
+    @staticmethod
+    def _quarantine(path: Path) -> Path:
+        stamp = datetime.now(timezone.utc).strftime("%Y%m%dT%H%M%S%f")
+        target = path.with_name(f"{path.name}.corrupt-{stamp}")
+        os.replace(path, target)
+        return target
+
+    def _read_header(self, chat_id: str) -> dict | None:
+        # Intestazione con regime e ultimo aggiornamento correnti, senza tenere i messaggi.
+        if self._is_reserved(chat_id):
+            return None
+        path = self._chat_path(chat_id)
+        if not path.exists():
+            legacy = self._load_legacy(chat_id)
+            if legacy is not None:
+                legacy.pop("messages", None)
+            return legacy
+        header = None
+        for record in self._iter_log(path):
+            if header is None:
+                if "chat_id" not in record:
+                    return None
+                header = dict(record)
+            elif "meta" in record:
+                header.update(record["meta"])
+            elif "role" in record:
+                header["updated_at"] = record.get("created_at", header.get("updated_at", ""))
+        return header
+
     def _load_raw(self, chat_id: str) -> dict | None:
+        header = self._read_header(chat_id)
+        if header is None:
+            return None
+        if not self._chat_path(chat_id).exists():
+            return self._load_legacy(chat_id)
+        header["messages"] = list(self._iter_message_records(chat_id))
+        return header
+
+    def _iter_message_records(self, chat_id: str) -> Iterator[dict]:
+        if self._is_reserved(chat_id):
+            return
         path = self._chat_path(chat_id)
         if not path.exists():
+            yield from (self._load_legacy(chat_id) or {}).get("messages", [])
+            return
+        for record in self._iter_log(path):
+            if "role" in record:
+                yield record
+
+    def _load_legacy(self, chat_id: str) -> dict | None:
+        path = self._legacy_path(chat_id)
+        if self._is_reserved(chat_id) or not path.exists():
             return None
-        return json.loads(path.read_text(encoding="utf-8"))
+        payload = json.loads(path.read_text(encoding="utf-8"))
+        return payload if isinstance(payload, dict) else None
+
+    def _convert_legacy(self, chat_id: str) -> None:
+        payload = self._load_legacy(chat_id)
+        if payload is None:
+            return
+        messages = payload.pop("messages", [])
+        atomic_write_text(self._chat_path(chat_id), _json_lines([payload, *messages]).decode("utf-8"))
+        self._legacy_path(chat_id).unlink()
+
+
+# Checkpoint di read_from: stringa opaca "<tipo>:<campi>" che solo il backend che l'ha
+# prodotta sa interpretare; START_CHECKPOINT (stringa vuota) vale per tutti e legge da capo.
+# Un checkpoint di un altro backend, o malformato, solleva ValueError invece di essere indovinato.
+START_CHECKPOINT = ""
+
+
+def _checkpoint_fields(checkpoint: str, kind: str, count: int) -> list[str] | None:
+    if checkpoint == START_CHECKPOINT:
+        return None
+    if isinstance(checkpoint, str):
+        prefix, _, rest = checkpoint.partition(":")
+        fields = rest.split(":")
+        if prefix == kind and len(fields) == count and all(fields):
+            return fields
+    raise ValueError(f"checkpoint {checkpoint!r} non valido per un log {kind}")
 
 
 class JsonlStore:
+    checkpoint_kind = "jsonl"
+
     def __init__(self, path: Path) -> None:
         self.path = Path(path)
         self.path.parent.mkdir(parents=True, exist_ok=True)
 
     def append(self, payload: dict) -> None:
-        record = {"timestamp": utc_now_iso(), **payload}
-        with self.path.open("a", encoding="utf-8") as handle:
-            handle.write(json.dumps(record, ensure_ascii=False) + "\n")
+        self.append_many([payload])
+
+    def append_many(self, payloads: list[dict]) -> int:
+        timestamp = utc_now_iso()
+        records = [{"timestamp": timestamp, **payload} for payload in payloads]
+        if records:
+            append_bytes(self.path, _json_lines(records))
+        return len(records)
+
+    TAIL_BLOCK_SIZE = 64 * 1024
 
     def read_all(self) -> list[dict]:
+        return list(self.iter_records())
+
+    def log_identity(self) -> int | None:
+        # Cambia se il file viene sostituito: i checkpoint in byte non sono piu' validi.
+        try:
+            return self.path.stat().st_ino
+        except FileNotFoundError:
+            return None
+
+    def iter_records(self) -> Iterator[dict]:
+        # Lettura in streaming, una riga alla volta.
+        if not self.path.exists():
+            return
+        with self.path.open("rb") as handle:
+            yield from _iter_handle(handle)
+
+    def read_from(self, checkpoint: str = START_CHECKPOINT, limit: int | None = None) -> tuple[list[dict], str]:
+        # Lettura incrementale: i record dopo il checkpoint (offset in byte) e il nuovo checkpoint.
+        # Ci si ferma all'ultima riga completa: una riga ancora in scrittura resta per dopo.
+        fields = _checkpoint_fields(checkpoint, self.checkpoint_kind, 1)
+        offset = int(fields[0]) if fields else 0
         if not self.path.exists():
+            return [], checkpoint
+        with self.path.open("rb") as handle:
+            records, end = _read_handle_from(handle, offset, limit)
+        return records, checkpoint if end == offset else f"{self.checkpoint_kind}:{end}"
+
+    def read_tail(self, limit: int) -> list[dict]:
+        # Ultimi `limit` record leggendo il file a blocchi dalla fine: il costo dipende da
+        # quanti record si chiedono, non dalla dimensione del file.
+        if limit <= 0 or not self.path.exists():
             return []
-        records = []
-        for line in self.path.read_text(encoding="utf-8").splitlines():
-            line = line.strip()
-            if not line:
+        return _tail_file(self.path, limit, self.TAIL_BLOCK_SIZE)
+
+    def query(
+        self,
+        events: Iterable[str] | None = None,
+        since: datetime | None = None,
+        until: datetime | None = None,
+        limit: int | None = None,
+    ) -> list[dict]:
+        wanted = set(events) if events is not None else None
+        since_iso = since.isoformat() if since is not None else None
+        until_iso = until.isoformat() if until is not None else None
+        results = []
+        for record in self.iter_records():
+            if _in_window(record, wanted, since_iso, until_iso):
+                results.append(record)
+                if limit is not None and len(results) >= limit:
+                    break
+        return results
+
+    def checkpoint_since(self, since: datetime) -> str:
+        return START_CHECKPOINT
+
+
+def _iter_handle(handle) -> Iterator[dict]:
+    for line in handle:
+        record = _decode_line(line)
+        if record is not None:
+            yield record
+
+
+def _read_handle_from(handle, offset: int, limit: int | None) -> tuple[list[dict], int]:
+    records: list[dict] = []
+    end = offset
+    handle.seek(offset)
+    for line in handle:
+        if not line.endswith(b"\n") or (limit is not None and len(records) >= limit):
+            break
+        end += len(line)
+        record = _decode_line(line)
+        if record is not None:
+            records.append(record)
+    return records, end
+
+
+def _tail_file(path: Path, limit: int, block_size: int) -> list[dict]:
+    records: list[dict] = []
+    with path.open("rb") as handle:
+        position = handle.seek(0, os.SEEK_END)
+        remainder = b""
+        while position > 0 and len(records) < limit:
+            step = min(block_size, position)
+            position -= step
+            handle.seek(position)
+            block = handle.read(step) + remainder
+            lines = block.split(b"\n")
+            # La prima riga del blocco puo' essere incompleta: la si completa col blocco precedente.
+            remainder = lines.pop(0) if position > 0 else b""
+            for line in reversed(lines):
+                record = _decode_line(line)
+                if record is not None:
+                    records.append(record)
+                    if len(records) >= limit:
+                        break
+    records.reverse()
+    return records
+
+
+SEGMENT_MANIFEST_FILENAME = "manifest.json"
+INDEX_BLOCK_BYTES = 64 * 1024
+
+
+def _in_window(record: dict, events: set[str] | None, since_iso: str | None, until_iso: str | None) -> bool:
+    if events is not None and record.get("event") not in events:
+        return False
+    timestamp = str(record.get("timestamp", ""))
+    if since_iso is not None and timestamp < since_iso:
+        return False
+    return until_iso is None or timestamp < until_iso
+
+
+class SegmentedJsonlStore(JsonlStore):
+    checkpoint_kind = "segment"
+
+    # Log diviso in segmenti giornalieri (UTC, per giorno di scrittura) nella cartella
+    # `<nome file senza estensione>/`: `AAAA-MM-GG.jsonl` per il giorno corrente, i giorni
+    # chiusi compressi in `.jsonl.gz`. Il manifest registra per ogni segmento chiuso numero
+    # di record e intervallo di timestamp, cosi' i lettori saltano i segmenti fuori finestra.
+    # Con `retention_days > 0` i segmenti piu' vecchi vengono cancellati alla rotazione.
+    # I checkpoint di read_from sono "segment:<giorno>:<offset nel segmento non compresso>".
+    # Append, compressione e retention passano dallo stesso lock sulla cartella; il file
+    # `.jsonl` di un giorno chiuso viene cancellato solo dopo che il manifest elenca il `.gz`.
+    def __init__(self, path: Path, retention_days: int = 0) -> None:
+        super().__init__(path)
+        self.directory = self.path.with_suffix("")
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.retention_days = retention_days
+        self.manifest_path = self.directory / SEGMENT_MANIFEST_FILENAME
+        self._lock_path = self.directory / ".lock"
+        self._rotated_day: str | None = None
+        # Indice sparso dei segmenti aperti: blocchi di ~INDEX_BLOCK_BYTES con offset e
+        # timestamp minimo/massimo, esteso solo sui byte aggiunti dall'ultima query.
+        self._block_index: dict[str, dict] = {}
+        if self.path.exists():
+            self._import_legacy_file()
+
+    def append_many(self, payloads: list[dict]) -> int:
+        timestamp = utc_now_iso()
+        records = [{"timestamp": timestamp, **payload} for payload in payloads]
+        if not records:
+            return 0
+        with file_lock(self._lock_path):
+            today = _utc_day()
+            if today != self._rotated_day:
+                self.rotate(today)
+            if self._segment_path(today, compressed=True).exists():
+                # Giorno gia' chiuso da un worker con l'orologio avanti: niente nuovo `.jsonl`.
+                self._append_compressed(today, records)
+            else:
+                append_bytes(self._segment_path(today), _json_lines(records))
+        return len(records)
+
+    def rotate(self, today: str | None = None) -> None:
+        # Comprime i segmenti dei giorni passati e applica la retention. Idempotente: piu'
+        # worker possono chiamarla, il lock sulla cartella la serializza.
+        today = today or _utc_day()
+        with file_lock(self._lock_path):
+            manifest = self._load_manifest()
+            closed = {item["day"]: item for item in manifest["segments"]}
+            compressed: list[Path] = []
+            for path in sorted(self.directory.glob("*.jsonl")):
+                day = path.name[: -len(".jsonl")]
+                if day >= today:
+                    continue
+                closed[day] = self._compress_segment(path, day, closed.get(day))
+                compressed.append(path)
+            if self.retention_days > 0:
+                cutoff = (
+                    datetime.fromisoformat(today) - timedelta(days=self.retention_days)
+                ).date().isoformat()
+                for day in [day for day in closed if day < cutoff]:
+                    self._segment_path(day, compressed=True).unlink(missing_ok=True)
+                    del closed[day]
+            manifest["segments"] = [closed[day] for day in sorted(closed)]
+            self._write_manifest(manifest)
+            # Solo ora il `.gz` e' visibile ai lettori: il `.jsonl` si puo' togliere.
+            for path in compressed:
+                path.unlink(missing_ok=True)
+        self._rotated_day = today
+
+    def segments(self) -> list[dict]:
+        # Segmenti dal piu' vecchio al piu' recente. Prima i file aperti, poi il manifest: se
+        # un giorno compare in entrambi vince il `.gz` (stesso contenuto, il `.jsonl` sta per
+        # essere cancellato); se il `.jsonl` non c'e' piu', il manifest letto dopo elenca gia' il `.gz`.
+        segments = {}
+        for path in self.directory.glob("*.jsonl"):
+            day = path.name[: -len(".jsonl")]
+            segments[day] = {"day": day, "name": path.name, "compressed": False}
+        for item in self._load_manifest()["segments"]:
+            segments[item["day"]] = item
+        return [segments[day] for day in sorted(segments)]
+
+    def log_identity(self) -> str:
+        return str(self.directory)
+
+    def iter_records(self, since: datetime | None = None) -> Iterator[dict]:
+        since_iso = since.isoformat() if since is not None else None
+        for segment in self.segments():
+            if since_iso is not None and segment.get("last_timestamp") and segment["last_timestamp"] < since_iso:
                 continue
-            try:
-                records.append(json.loads(line))
-            except json.JSONDecodeError:
+            with self._open_segment(segment) as handle:
+                if handle is not None:
+                    yield from _iter_handle(handle)
+
+    def query(
+        self,
+        events: Iterable[str] | None = None,
+        since: datetime | None = None,
+        until: datetime | None = None,
+        limit: int | None = None,
+    ) -> list[dict]:
+        # Record filtrati per tipo e finestra [since, until). I segmenti chiusi fuori finestra
+        # si saltano col manifest, in quello aperto si leggono solo i blocchi che la toccano.
+        wanted = set(events) if events is not None else None
+        since_iso = since.isoformat() if since is not None else None
+        until_iso = until.isoformat() if until is not None else None
+        results: list[dict] = []
+        for segment in self.segments():
+            if segment["compressed"]:
+                first, last = segment.get("first_timestamp"), segment.get("last_timestamp")
+                if (since_iso and last and last < since_iso) or (until_iso and first and first >= until_iso):
+                    continue
+                with self._open_segment(segment) as handle:
+                    candidates = _iter_handle(handle) if handle is not None else iter(())
+                    results.extend(item for item in candidates if _in_window(item, wanted, since_iso, until_iso))
+            else:
+                for block in self._index_segment(segment["name"]):
+                    if (since_iso and block["max"] < since_iso) or (until_iso and block["min"] >= until_iso):
+                        continue
+                    results.extend(
+                        item
+                        for item in self._read_block(segment["name"], block)
+                        if _in_window(item, wanted, since_iso, until_iso)
+                    )
+            if limit is not None and len(results) >= limit:
+                return results[:limit]
+        return results
+
+    def checkpoint_since(self, since: datetime) -> str:
+        # Checkpoint di partenza per read_from che include tutti i record da `since` in poi.
+        return f"{self.checkpoint_kind}:{(since - timedelta(days=1)).date().isoformat()}:0"
+
+    def _index_segment(self, name: str) -> list[dict]:
+        path = self.directory / name
+        try:
+            size = path.stat().st_size
+        except FileNotFoundError:
+            self._block_index.pop(name, None)
+            return []
+        index = self._block_index.get(name)
+        if index is None or size < index["end"]:
+            index = self._block_index[name] = {"end": 0, "blocks": []}
+        if size - index["end"] >= INDEX_BLOCK_BYTES:
+            with path.open("rb") as handle:
+                handle.seek(index["end"])
+                position = index["end"]
+                block = {"start": position, "min": "\uffff", "max": ""}
+                for line in handle:
+                    if not line.endswith(b"\n"):
+                        break
+                    position += len(line)
+                    record = _decode_line(line)
+                    if record is not None:
+                        timestamp = str(record.get("timestamp", ""))
+                        block["min"] = min(block["min"], timestamp)
+                        block["max"] = max(block["max"], timestamp)
+                    if position - block["start"] >= INDEX_BLOCK_BYTES:
+                        index["blocks"].append({**block, "end": position})
+                        index["end"] = position
+                        block = {"start": position, "min": "\uffff", "max": ""}
+        # La coda non ancora indicizzata (meno di un blocco) si legge sempre.
+        return [*index["blocks"], {"start": index["end"], "end": None, "min": "", "max": "\uffff"}]
+
+    def _read_block(self, name: str, block: dict) -> Iterator[dict]:
+        path = self.directory / name
+        try:
+            handle = path.open("rb")
+        except FileNotFoundError:
+            return
+        with handle:
+            handle.seek(block["start"])
+            remaining = None if block["end"] is None else block["end"] - block["start"]
+            for line in handle:
+                if remaining is not None:
+                    if remaining <= 0:
+                        break
+                    remaining -= len(line)
+                if not line.endswith(b"\n"):
+                    break
+                record = _decode_line(line)
+                if record is not None:
+                    yield record
+
+    def read_from(self, checkpoint: str = START_CHECKPOINT, limit: int | None = None) -> tuple[list[dict], str]:
+        fields = _checkpoint_fields(checkpoint, self.checkpoint_kind, 2)
+        start_day, start_offset = (fields[0], int(fields[1])) if fields else ("", 0)
+        records: list[dict] = []
+        for segment in self.segments():
+            if segment["day"] < start_day:
                 continue
+            position = start_offset if segment["day"] == start_day else 0
+            remaining = None if limit is None else limit - len(records)
+            with self._open_segment(segment) as handle:
+                if handle is None and self._segment_exists(segment["day"]):
+                    # Non leggibile ora ma ancora presente: il checkpoint resta qui, si riprova dopo.
+                    break
+                if handle is None:
+                    # Cancellato dalla retention: non c'e' piu' nulla da leggere.
+                    continue
+                batch, end = _read_handle_from(handle, position, remaining)
+            records.extend(batch)
+            checkpoint = f"{self.checkpoint_kind}:{segment['day']}:{end}"
+            if limit is not None and len(records) >= limit:
+                break
+        return records, checkpoint
+
+    def read_tail(self, limit: int) -> list[dict]:
+        if limit <= 0:
+            return []
+        records: list[dict] = []
+        for segment in reversed(self.segments()):
+            needed = limit - len(records)
+            if segment["compressed"]:
+                with self._open_segment(segment) as handle:
+                    chunk = list(_iter_handle(handle))[-needed:] if handle is not None else []
+            else:
+                path = self.directory / segment["name"]
+                chunk = _tail_file(path, needed, self.TAIL_BLOCK_SIZE) if path.exists() else []
+            records[:0] = chunk
+            if len(records) >= limit:
+                break
         return records
 
+    def _segment_path(self, day: str, compressed: bool = False) -> Path:
+        return self.directory / f"{day}.jsonl{'.gz' if compressed else ''}"
+
+    def _segment_exists(self, day: str) -> bool:
+        return self._segment_path(day).exists() or self._segment_path(day, compressed=True).exists()
+
+    @contextmanager
+    def _open_segment(self, segment: dict):
+        path = self.directory / segment["name"]
+        try:
+            handle = gzip.open(path, "rb") if segment["compressed"] else path.open("rb")
+        except FileNotFoundError:
+            handle = None
+        if handle is None and not segment["compressed"]:
+            # Segmento compresso da un altro worker dopo segments(): stessi byte (e offset) nel `.gz`.
+            try:
+                handle = gzip.open(self._segment_path(segment["day"], compressed=True), "rb")
+            except FileNotFoundError:
+                handle = None
+        if handle is None:
+            # Cancellato dalla retention.
+            yield None
+            return
+        with handle:
+            yield handle
+
+    def _compress_segment(self, path: Path, day: str, existing: dict | None) -> dict:
+        # Scrive il `.gz` senza cancellare il `.jsonl`: lo fa rotate() dopo il manifest.
+        target = self._segment_path(day, compressed=True)
+        data = path.read_bytes()
+        if existing is not None and target.exists():
+            # Record arrivati in ritardo per un giorno gia' chiuso: si accodano al segmento compresso.
+            with gzip.open(target, "rb") as handle:
+                data = handle.read() + data
+        self._replace_bytes(target, gzip.compress(data, mtime=0))
+        return self._segment_entry(day, data)
+
+    def _append_compressed(self, day: str, records: list[dict]) -> None:
+        # Un membro gzip in piu' in coda al segmento (i lettori decomprimono i membri in
+        # sequenza, quindi gli offset restano quelli del flusso non compresso).
+        target = self._segment_path(day, compressed=True)
+        data = _json_lines(records)
+        self._replace_bytes(target, target.read_bytes() + gzip.compress(data, mtime=0))
+        manifest = self._load_manifest()
+        with gzip.open(target, "rb") as handle:
+            entry = self._segment_entry(day, handle.read())
+        manifest["segments"] = [entry if item["day"] == day else item for item in manifest["segments"]]
+        if all(item["day"] != day for item in manifest["segments"]):
+            manifest["segments"] = sorted([*manifest["segments"], entry], key=lambda item: item["day"])
+        self._write_manifest(manifest)
 
-class FeedbackStore(JsonlStore):
+    def _segment_entry(self, day: str, data: bytes) -> dict:
+        target = self._segment_path(day, compressed=True)
+        records = list(_iter_handle(data.splitlines(keepends=True)))
+        timestamps = [str(item.get("timestamp", "")) for item in records if item.get("timestamp")]
+        return {
+            "day": day,
+            "name": target.name,
+            "compressed": True,
+            "records": len(records),
+            "raw_bytes": len(data),
+            "bytes": target.stat().st_size,
+            "first_timestamp": min(timestamps) if timestamps else None,
+            "last_timestamp": max(timestamps) if timestamps else None,
+        }
+
+    def _replace_bytes(self, target: Path, data: bytes) -> None:
+        fd, temp_name = tempfile.mkstemp(dir=self.directory, prefix=f".{target.name}.", suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as handle:
+                handle.write(data)
+                handle.flush()
+                os.fsync(handle.fileno())
+            os.replace(temp_name, target)
+        except BaseException:
+            Path(temp_name).unlink(missing_ok=True)
+            raise
+
+    def _write_manifest(self, manifest: dict) -> None:
+        atomic_write_text(self.manifest_path, json.dumps(manifest, ensure_ascii=False, indent=2))
+
+    def _load_manifest(self) -> dict:
+        try:
+            manifest = json.loads(self.manifest_path.read_text(encoding="utf-8"))
+        except (FileNotFoundError, json.JSONDecodeError):
+            manifest = None
+        if not isinstance(manifest, dict) or not isinstance(manifest.get("segments"), list):
+            # Manifest assente o illeggibile: lo si ricava dai file compressi presenti.
+            manifest = {"segments": []}
+            for path in sorted(self.directory.glob("*.jsonl.gz")):
+                manifest["segments"].append(
+                    {"day": path.name[: -len(".jsonl.gz")], "name": path.name, "compressed": True}
+                )
+        return manifest
+
+    def _import_legacy_file(self) -> None:
+        # Il vecchio file unico viene distribuito nei segmenti del giorno dei suoi record.
+        with file_lock(self._lock_path):
+            if not self.path.exists():
+                return
+            by_day: dict[str, list[dict]] = {}
+            with self.path.open("rb") as handle:
+                for record in _iter_handle(handle):
+                    day = str(record.get("timestamp", ""))[:10] or _utc_day()
+                    by_day.setdefault(day, []).append(record)
+            for day, records in sorted(by_day.items()):
+                append_bytes(self._segment_path(day), _json_lines(records))
+            self.path.unlink()
+        self.rotate()
+
+
+def _utc_day() -> str:
+    return datetime.now(timezone.utc).date().isoformat()
+
+
+class FeedbackStore(SegmentedJsonlStore):
     pass
 
 
-class EventStore(JsonlStore):
+class EventStore(SegmentedJsonlStore):
     pass
 
 
-def build_admin_stats(
-    chat_store: ChatHistoryStore,
-    feedback_store: FeedbackStore,
-    event_store: EventStore,
-) -> AdminStats:
-    chats = chat_store.list_chats(limit=500)
-    total_messages = 0
-    question_counter: Counter[str] = Counter()
-    regime_counter: Counter[str] = Counter()
+def _percentile(values: list[float], fraction: float) -> float | None:
+    if not values:
+        return None
+    ordered = sorted(values)
+    return float(ordered[min(len(ordered) - 1, int(fraction * len(ordered)))])
+
+
+def _parse_timestamp(value: object) -> datetime | None:
+    try:
+        parsed = datetime.fromisoformat(str(value))
+    except ValueError:
+        return None
+    return parsed if parsed.tzinfo else parsed.replace(tzinfo=timezone.utc)
 
-    for summary in chats:
-        transcript = chat_store.get_chat(summary.chat_id)
-        if transcript is None:
+
+def build_llm_usage_stats(
+    event_records: list[dict],
+    window_hours: int = 24,
+    available_since: datetime | None = None,
+) -> LLMUsageStats:
+    # available_since: inizio dei campioni conservati, se piu' recente della finestra richiesta.
+    now = datetime.now(timezone.utc)
+    since = now - timedelta(hours=window_hours)
+    covered_since = max(since, available_since) if available_since is not None else since
+    durations: list[float] = []
+    ttfts: list[float] = []
+    tokens: list[float] = []
+    prompt_tokens = cached_tokens = 0
+    generated = hard_coded = 0
+    for item in event_records:
+        if item.get("event") != "llm_usage":
             continue
-        total_messages += len(transcript.messages)
-        if transcript.regime_id:
-            regime_counter[transcript.regime_id] += 1
-        for message in transcript.messages:
-            if message.role == "user":
-                question_counter[message.text.strip()] += 1
-
-    feedback_records = feedback_store.read_all()
-    positive_feedback = sum(1 for item in feedback_records if item.get("vote") == "up")
-    negative_feedback = sum(1 for item in feedback_records if item.get("vote") == "down")
-
-    event_records = event_store.read_all()
-    no_result_events = sum(1 for item in event_records if item.get("event") == "rag_no_results")
-    low_confidence_events = sum(
-        1 for item in event_records if item.get("event") == "rag_low_confidence"
-    )
+        timestamp = _parse_timestamp(item.get("timestamp"))
+        if timestamp is None or timestamp < since:
+            continue
+        if item.get("answer_type") == "hard_coded":
+            hard_coded += 1
+            continue
+        generated += 1
+        if item.get("duration_ms") is not None:
+            durations.append(float(item["duration_ms"]))
+        if item.get("ttft_ms") is not None:
+            ttfts.append(float(item["ttft_ms"]))
+        if item.get("prompt_tokens") is not None or item.get("completion_tokens") is not None:
+            tokens.append(float((item.get("prompt_tokens") or 0) + (item.get("completion_tokens") or 0)))
+        prompt_tokens += item.get("prompt_tokens") or 0
+        cached_tokens += item.get("cached_tokens") or 0
 
-    return AdminStats(
-        total_chats=len(chats),
-        total_messages=total_messages,
-        positive_feedback=positive_feedback,
-        negative_feedback=negative_feedback,
-        no_result_events=no_result_events,
-        low_confidence_events=low_confidence_events,
-        top_questions=[item for item, _ in question_counter.most_common(5)],
-        top_regimes=[item for item, _ in regime_counter.most_common(5)],
+    return LLMUsageStats(
+        window_hours=window_hours,
+        covered_hours=round((now - covered_since).total_seconds() / 3600, 2),
+        generated_answers=generated,
+        hard_coded_answers=hard_coded,
+        duration_ms_p50=_percentile(durations, 0.5),
+        duration_ms_p95=_percentile(durations, 0.95),
+        ttft_ms_p50=_percentile(ttfts, 0.5),
+        ttft_ms_p95=_percentile(ttfts, 0.95),
+        tokens_per_answer_p50=_percentile(tokens, 0.5),
+        tokens_per_answer_p95=_percentile(tokens, 0.95),
+        cached_token_ratio=round(cached_tokens / prompt_tokens, 4) if prompt_tokens else None,
     )
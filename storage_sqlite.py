@@ -0,0 +1,461 @@
+from __future__ import annotations
+
+import json
+import sqlite3
+import threading
+from contextlib import nullcontext
+from datetime import datetime
+from pathlib import Path
+from typing import Iterable, Iterator
+from uuid import uuid4
+
+from app_models import ChatMessage, ChatSummary, ChatTranscript
+from storage_services import (
+    START_CHECKPOINT,
+    ChatHistoryStore,
+    EventStore,
+    FeedbackStore,
+    _checkpoint_fields,
+    utc_now_iso,
+)
+
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS chats (
+    chat_id TEXT PRIMARY KEY,
+    title TEXT NOT NULL,
+    regime_id TEXT,
+    created_at TEXT NOT NULL,
+    updated_at TEXT NOT NULL,
+    message_count INTEGER NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS idx_chats_updated_at ON chats (updated_at DESC);
+CREATE TABLE IF NOT EXISTS messages (
+    chat_id TEXT NOT NULL REFERENCES chats (chat_id) ON DELETE CASCADE,
+    position INTEGER NOT NULL,
+    role TEXT NOT NULL,
+    text TEXT NOT NULL,
+    sources TEXT NOT NULL,
+    created_at TEXT NOT NULL,
+    confidence_label TEXT,
+    confidence_score REAL,
+    retrieval_mode TEXT,
+    PRIMARY KEY (chat_id, position)
+);
+CREATE TABLE IF NOT EXISTS feedback (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    timestamp TEXT NOT NULL,
+    vote TEXT,
+    chat_id TEXT,
+    payload TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_feedback_timestamp ON feedback (timestamp);
+CREATE TABLE IF NOT EXISTS events (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    timestamp TEXT NOT NULL,
+    event TEXT,
+    payload TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_events_event_timestamp ON events (event, timestamp);
+CREATE INDEX IF NOT EXISTS idx_events_timestamp ON events (timestamp);
+"""
+
+
+class SQLiteDatabase:
+    # Una connessione condivisa in WAL: i lettori non bloccano lo scrittore e le
+    # scritture dei vari store sono serializzate dal lock.
+    def __init__(self, path: Path) -> None:
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.lock = threading.RLock()
+        self.connection = sqlite3.connect(str(self.path), check_same_thread=False, isolation_level=None)
+        self.connection.row_factory = sqlite3.Row
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("PRAGMA synchronous=NORMAL")
+        self.connection.execute("PRAGMA foreign_keys=ON")
+        self.connection.execute("PRAGMA busy_timeout=5000")
+        self.connection.executescript(SCHEMA)
+
+    def transaction(self) -> "_Transaction":
+        return _Transaction(self)
+
+    def query(self, sql: str, params: Iterable = ()) -> list[sqlite3.Row]:
+        with self.lock:
+            return self.connection.execute(sql, tuple(params)).fetchall()
+
+    def close(self) -> None:
+        with self.lock:
+            self.connection.close()
+
+
+class _Transaction:
+    def __init__(self, database: SQLiteDatabase) -> None:
+        self.database = database
+
+    def __enter__(self) -> sqlite3.Connection:
+        self.database.lock.acquire()
+        self.database.connection.execute("BEGIN IMMEDIATE")
+        return self.database.connection
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        try:
+            self.database.connection.execute("ROLLBACK" if exc_type else "COMMIT")
+        finally:
+            self.database.lock.release()
+
+
+def _message_row(chat_id: str, position: int, message: dict) -> tuple:
+    return (
+        chat_id,
+        position,
+        message.get("role", ""),
+        message.get("text", ""),
+        json.dumps(message.get("sources") or [], ensure_ascii=False),
+        message.get("created_at", ""),
+        message.get("confidence_label"),
+        message.get("confidence_score"),
+        message.get("retrieval_mode"),
+    )
+
+
+INSERT_MESSAGE = "INSERT INTO messages VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)"
+
+
+class SQLiteChatHistoryStore:
+    def __init__(self, database: SQLiteDatabase) -> None:
+        self.database = database
+        self.aggregates = None
+
+    def create_chat_id(self) -> str:
+        return uuid4().hex
+
+    def save_turn(
+        self,
+        chat_id: str,
+        regime_id: str | None,
+        user_message: str,
+        assistant_message: str,
+        assistant_sources: list[str],
+        confidence_label: str | None = None,
+        confidence_score: float | None = None,
+        retrieval_mode: str | None = None,
+    ) -> dict:
+        timestamp = utc_now_iso()
+        new_messages = [
+            {
+                "role": "user",
+                "text": user_message,
+                "sources": [],
+                "created_at": timestamp,
+            },
+            {
+                "role": "assistant",
+                "text": assistant_message,
+                "sources": assistant_sources,
+                "created_at": timestamp,
+                "confidence_label": confidence_label,
+                "confidence_score": confidence_score,
+                "retrieval_mode": retrieval_mode,
+            },
+        ]
+        with self._recording():
+            with self.database.transaction() as connection:
+                row = connection.execute(
+                    "SELECT title, regime_id, created_at, message_count FROM chats WHERE chat_id = ?", (chat_id,)
+                ).fetchone()
+                previous = dict(row) if row is not None else None
+                if row is None:
+                    offset = 0
+                    chat = {
+                        "title": user_message.strip()[:72] or "Nuova chat",
+                        "regime_id": regime_id,
+                        "created_at": timestamp,
+                    }
+                    connection.execute(
+                        "INSERT INTO chats VALUES (?, ?, ?, ?, ?, 0)",
+                        (chat_id, chat["title"], regime_id, timestamp, timestamp),
+                    )
+                else:
+                    offset = row["message_count"]
+                    chat = {
+                        "title": row["title"],
+                        "regime_id": regime_id or row["regime_id"],
+                        "created_at": row["created_at"],
+                    }
+                connection.executemany(
+                    INSERT_MESSAGE,
+                    [_message_row(chat_id, offset + index, message) for index, message in enumerate(new_messages)],
+                )
+                connection.execute(
+                    "UPDATE chats SET regime_id = COALESCE(?, regime_id), updated_at = ?, message_count = ? "
+                    "WHERE chat_id = ?",
+                    (regime_id, timestamp, offset + len(new_messages), chat_id),
+                )
+            if self.aggregates is not None:
+                current = {"regime_id": chat["regime_id"], "message_count": offset + len(new_messages)}
+                self.aggregates.record_turn(previous, current, user_message)
+        # Come lo store JSON: restituisce il turno scritto, la trascrizione completa e' su get_chat.
+        return {"chat_id": chat_id, **chat, "updated_at": timestamp, "messages": new_messages}
+
+    def import_chat(self, connection: sqlite3.Connection, payload: dict) -> None:
+        # Usato dalla migrazione: inserisce una trascrizione completa nella transazione data.
+        chat_id = payload["chat_id"]
+        messages = payload.get("messages", [])
+        connection.execute("DELETE FROM chats WHERE chat_id = ?", (chat_id,))
+        connection.execute(
+            "INSERT INTO chats VALUES (?, ?, ?, ?, ?, ?)",
+            (
+                chat_id,
+                payload.get("title", "Chat"),
+                payload.get("regime_id"),
+                payload.get("created_at", ""),
+                payload.get("updated_at", ""),
+                len(messages),
+            ),
+        )
+        connection.executemany(
+            INSERT_MESSAGE,
+            [_message_row(chat_id, index, message) for index, message in enumerate(messages)],
+        )
+
+    def list_chats(self, limit: int = 30) -> list[ChatSummary]:
+        rows = self.database.query(
+            "SELECT chat_id, title, regime_id, updated_at, message_count FROM chats "
+            "ORDER BY updated_at DESC LIMIT ?",
+            (limit,),
+        )
+        return [ChatSummary(**dict(row)) for row in rows]
+
+    def get_chat(self, chat_id: str) -> ChatTranscript | None:
+        payload = self._load_raw(chat_id)
+        if payload is None:
+            return None
+        return ChatTranscript(
+            chat_id=payload["chat_id"],
+            title=payload["title"],
+            regime_id=payload["regime_id"],
+            created_at=payload["created_at"],
+            updated_at=payload["updated_at"],
+            messages=[ChatMessage(**message) for message in payload["messages"]],
+        )
+
+    def iter_chat_ids(self) -> Iterator[str]:
+        for row in self.database.query("SELECT chat_id FROM chats"):
+            yield row["chat_id"]
+
+    def delete_chat(self, chat_id: str) -> bool:
+        with self._recording():
+            with self.database.transaction() as connection:
+                entry = connection.execute(
+                    "SELECT regime_id, message_count FROM chats WHERE chat_id = ?", (chat_id,)
+                ).fetchone()
+                questions = [
+                    row["text"]
+                    for row in connection.execute(
+                        "SELECT text FROM messages WHERE chat_id = ? AND role = 'user'", (chat_id,)
+                    )
+                ]
+                connection.execute("DELETE FROM chats WHERE chat_id = ?", (chat_id,))
+            if entry is None:
+                return False
+            if self.aggregates is not None:
+                self.aggregates.record_delete(dict(entry), questions)
+        return True
+
+    def _recording(self):
+        # Come ChatHistoryStore: transazione e variazione degli aggregati mai a cavallo di un rebuild.
+        return self.aggregates.recording() if self.aggregates is not None else nullcontext()
+
+    def _load_raw(self, chat_id: str) -> dict | None:
+        with self.database.lock:
+            chat = self.database.connection.execute(
+                "SELECT chat_id, title, regime_id, created_at, updated_at FROM chats WHERE chat_id = ?",
+                (chat_id,),
+            ).fetchone()
+            if chat is None:
+                return None
+            rows = self.database.connection.execute(
+                "SELECT role, text, sources, created_at, confidence_label, confidence_score, retrieval_mode "
+                "FROM messages WHERE chat_id = ? ORDER BY position",
+                (chat_id,),
+            ).fetchall()
+        messages = []
+        for row in rows:
+            message = dict(row)
+            message["sources"] = json.loads(message["sources"])
+            if message["role"] == "user":
+                for key in ("confidence_label", "confidence_score", "retrieval_mode"):
+                    message.pop(key)
+            messages.append(message)
+        return {**dict(chat), "messages": messages}
+
+
+class SQLiteRecordStore:
+    # Stessa interfaccia di JsonlStore: il record completo resta in `payload` (JSON),
+    # le colonne estratte servono solo per indici e filtri.
+    table = ""
+    columns: tuple[str, ...] = ()
+    checkpoint_kind = "sqlite"
+
+    def __init__(self, database: SQLiteDatabase) -> None:
+        self.database = database
+
+    def append(self, payload: dict) -> None:
+        self.append_many([payload])
+
+    def append_many(self, payloads: Iterable[dict], connection: sqlite3.Connection | None = None) -> int:
+        rows = [self._row({"timestamp": utc_now_iso(), **payload}) for payload in payloads]
+        if not rows:
+            return 0
+        placeholders = ", ".join("?" for _ in range(len(self.columns) + 2))
+        sql = f"INSERT INTO {self.table} (timestamp, {', '.join(self.columns)}, payload) VALUES ({placeholders})"
+        if connection is not None:
+            connection.executemany(sql, rows)
+        else:
+            with self.database.transaction() as active:
+                active.executemany(sql, rows)
+        return len(rows)
+
+    def import_records(self, connection: sqlite3.Connection, records: Iterable[dict]) -> int:
+        # Migrazione: i record conservano il proprio timestamp originale.
+        return self.append_many(records, connection=connection)
+
+    def read_all(self) -> list[dict]:
+        return list(self.iter_records())
+
+    def iter_records(self) -> Iterator[dict]:
+        return self.iter_payloads(f"SELECT payload FROM {self.table} ORDER BY id")
+
+    def read_tail(self, limit: int) -> list[dict]:
+        if limit <= 0:
+            return []
+        records = list(
+            self.iter_payloads(f"SELECT payload FROM {self.table} ORDER BY id DESC LIMIT ?", (limit,))
+        )
+        records.reverse()
+        return records
+
+    def read_from(self, checkpoint: str = START_CHECKPOINT, limit: int | None = None) -> tuple[list[dict], str]:
+        # Come JsonlStore.read_from, ma il checkpoint e' l'ultimo id letto invece di un offset in byte.
+        fields = _checkpoint_fields(checkpoint, self.checkpoint_kind, 1)
+        rows = self.database.query(
+            f"SELECT id, payload FROM {self.table} WHERE id > ? ORDER BY id LIMIT ?",
+            (int(fields[0]) if fields else 0, -1 if limit is None else limit),
+        )
+        if not rows:
+            return [], checkpoint
+        return [json.loads(row["payload"]) for row in rows], f"{self.checkpoint_kind}:{rows[-1]['id']}"
+
+    def log_identity(self) -> str:
+        # I checkpoint sono id di riga: restano validi finche' il database e' lo stesso.
+        return str(self.database.path)
+
+    def count(self) -> int:
+        return self.database.query(f"SELECT COUNT(*) FROM {self.table}")[0][0]
+
+    def iter_payloads(self, sql: str, params: Iterable = ()) -> Iterator[dict]:
+        for row in self.database.query(sql, params):
+            yield json.loads(row[0])
+
+    def _row(self, record: dict) -> tuple:
+        return (
+            str(record.get("timestamp", "")),
+            *(record.get(column) for column in self.columns),
+            json.dumps(record, ensure_ascii=False),
+        )
+
+
+class SQLiteFeedbackStore(SQLiteRecordStore):
+    table = "feedback"
+    columns = ("vote", "chat_id")
+
+
+class SQLiteEventStore(SQLiteRecordStore):
+    table = "events"
+    columns = ("event",)
+
+    def query(
+        self,
+        events: Iterable[str] | None = None,
+        since: datetime | None = None,
+        until: datetime | None = None,
+        limit: int | None = None,
+    ) -> list[dict]:
+        # Stessa semantica di EventStore.query, risolta sugli indici (event, timestamp).
+        clauses, params = [], []
+        if events is not None:
+            wanted = list(events)
+            clauses.append(f"event IN ({', '.join('?' for _ in wanted)})")
+            params.extend(wanted)
+        if since is not None:
+            clauses.append("timestamp >= ?")
+            params.append(since.isoformat())
+        if until is not None:
+            clauses.append("timestamp < ?")
+            params.append(until.isoformat())
+        where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+        params.append(-1 if limit is None else limit)
+        return list(self.iter_payloads(f"SELECT payload FROM events {where} ORDER BY id LIMIT ?", params))
+
+    def checkpoint_since(self, since: datetime) -> str:
+        rows = self.database.query(
+            "SELECT MIN(id) FROM events WHERE timestamp >= ?", (since.isoformat(),)
+        )
+        first = rows[0][0]
+        if first is not None:
+            last = max(0, first - 1)
+        else:
+            last = self.database.query("SELECT COALESCE(MAX(id), 0) FROM events")[0][0]
+        return f"{self.checkpoint_kind}:{last}" if last else START_CHECKPOINT
+
+
+def _batched(items: Iterable, size: int) -> Iterator[list]:
+    batch = []
+    for item in items:
+        batch.append(item)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def migrate_json_tree(data_root: Path, database: SQLiteDatabase, batch_size: int = 500) -> dict:
+    # Migrazione una tantum da data/ (trascrizioni JSON e file JSONL) al database.
+    # Le chat gia' presenti vengono sovrascritte; feedback ed eventi si importano solo
+    # se le tabelle sono vuote, cosi' un secondo lancio non duplica i record.
+    data_root = Path(data_root)
+    chats = SQLiteChatHistoryStore(database)
+    feedback = SQLiteFeedbackStore(database)
+    events = SQLiteEventStore(database)
+    report = {"chats": 0, "messages": 0, "feedback": 0, "events": 0, "skipped": 0}
+
+    source = ChatHistoryStore(data_root / "chat_history")
+
+    def transcripts() -> Iterator[dict]:
+        for chat_id in sorted(source.iter_chat_ids()):
+            try:
+                transcript = source.get_chat(chat_id)
+            except (json.JSONDecodeError, KeyError, TypeError):
+                report["skipped"] += 1
+                continue
+            if transcript is not None:
+                yield transcript.model_dump()
+
+    for batch in _batched(transcripts(), batch_size):
+        with database.transaction() as connection:
+            for payload in batch:
+                chats.import_chat(connection, payload)
+                report["chats"] += 1
+                report["messages"] += len(payload.get("messages", []))
+
+    for store, source_log, key in (
+        (feedback, FeedbackStore(data_root / "feedback" / "feedback.jsonl"), "feedback"),
+        (events, EventStore(data_root / "events" / "app_events.jsonl"), "events"),
+    ):
+        if store.count():
+            continue
+        for batch in _batched(source_log.iter_records(), batch_size):
+            with database.transaction() as connection:
+                report[key] += store.import_records(connection, batch)
+    return report
@@ -0,0 +1,260 @@
+#!/usr/bin/env python3
+from __future__ import annotations
+
+import argparse
+import hashlib
+import json
+import os
+import random
+import threading
+import time
+import uuid
+from dataclasses import dataclass
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+CANNED_ANSWERS = (
+    "Nel regime forfettario il reddito si determina applicando al fatturato il "
+    "coefficiente di redditivita' previsto per il codice ATECO, senza dedurre i costi.",
+    "L'imposta sostitutiva e' pari al 15%, ridotta al 5% per i primi cinque anni di "
+    "una nuova attivita' se ricorrono i requisiti previsti dalla legge.",
+    "Il limite di ricavi e compensi per accedere e restare nel regime e' di 85.000 euro; "
+    "oltre 100.000 euro si esce dal regime gia' nell'anno in corso.",
+    "Le fatture emesse nel regime forfettario non espongono l'IVA e riportano la "
+    "dicitura di esenzione prevista dalla norma di riferimento.",
+)
+
+
+@dataclass(frozen=True)
+class StubConfig:
+    ttft_ms: float = 300.0
+    tokens_per_sec: float = 40.0
+    error_rate: float = 0.0
+    rate_limit_rate: float = 0.0
+    seed: int = 0
+
+    @classmethod
+    def from_env(cls) -> "StubConfig":
+        return cls(
+            ttft_ms=float(os.getenv("STUB_LLM_TTFT_MS", "300")),
+            tokens_per_sec=float(os.getenv("STUB_LLM_TOKENS_PER_SEC", "40")),
+            error_rate=float(os.getenv("STUB_LLM_ERROR_RATE", "0")),
+            rate_limit_rate=float(os.getenv("STUB_LLM_RATE_LIMIT_RATE", "0")),
+            seed=int(os.getenv("STUB_LLM_SEED", "0")),
+        )
+
+
+def canned_answer(messages: list) -> str:
+    # Risposta deterministica: dipende solo dall'ultimo messaggio utente.
+    question = next(
+        (str(item.get("content", "")) for item in reversed(messages) if item.get("role") == "user"),
+        "",
+    )
+    digest = hashlib.sha256(question.encode("utf-8")).digest()
+    return CANNED_ANSWERS[digest[0] % len(CANNED_ANSWERS)]
+
+
+def split_tokens(text: str) -> list[str]:
+    words = text.split(" ")
+    return [word + (" " if index < len(words) - 1 else "") for index, word in enumerate(words)]
+
+
+def _estimate_tokens(text: str) -> int:
+    return (len(text) + 3) // 4
+
+
+class StubLLMServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address: tuple[str, int], config: StubConfig) -> None:
+        super().__init__(address, _StubHandler)
+        self.config = config
+        self._random = random.Random(config.seed)
+        self._lock = threading.Lock()
+        self._seen_prefixes: set[str] = set()
+        self.request_count = 0
+
+    def next_fault(self) -> str | None:
+        with self._lock:
+            self.request_count += 1
+            roll = self._random.random()
+        if roll < self.config.rate_limit_rate:
+            return "rate_limit"
+        if roll < self.config.rate_limit_rate + self.config.error_rate:
+            return "server_error"
+        return None
+
+    def usage_for(self, messages: list, answer: str) -> dict:
+        # Simula la cache dei prefissi di DeepSeek: il system prompt gia' visto conta come hit.
+        system = "".join(str(item.get("content", "")) for item in messages if item.get("role") == "system")
+        prompt = "".join(str(item.get("content", "")) for item in messages)
+        prompt_tokens = _estimate_tokens(prompt)
+        with self._lock:
+            cached = system in self._seen_prefixes
+            self._seen_prefixes.add(system)
+        hit = min(prompt_tokens, _estimate_tokens(system)) if cached else 0
+        completion_tokens = len(split_tokens(answer))
+        return {
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": completion_tokens,
+            "total_tokens": prompt_tokens + completion_tokens,
+            "prompt_cache_hit_tokens": hit,
+            "prompt_cache_miss_tokens": prompt_tokens - hit,
+        }
+
+
+class _StubHandler(BaseHTTPRequestHandler):
+    server: StubLLMServer
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format: str, *args) -> None:
+        return
+
+    def do_POST(self) -> None:
+        if self.path.rstrip("/") not in {"/chat/completions", "/v1/chat/completions"}:
+            self._send_json(404, {"error": {"message": "Not found", "type": "invalid_request_error"}})
+            return
+        length = int(self.headers.get("Content-Length", "0") or 0)
+        try:
+            body = json.loads(self.rfile.read(length) or b"{}")
+        except json.JSONDecodeError:
+            self._send_json(400, {"error": {"message": "Invalid JSON", "type": "invalid_request_error"}})
+            return
+
+        fault = self.server.next_fault()
+        if fault == "rate_limit":
+            self._send_json(
+                429,
+                {"error": {"message": "Rate limit reached", "type": "rate_limit_error"}},
+                headers={"Retry-After": "1"},
+            )
+            return
+        if fault == "server_error":
+            self._send_json(500, {"error": {"message": "Injected failure", "type": "server_error"}})
+            return
+
+        messages = body.get("messages") or []
+        model = body.get("model") or "deepseek-chat"
+        answer = canned_answer(messages)
+        usage = self.server.usage_for(messages, answer)
+        completion_id = f"chatcmpl-{uuid.uuid4().hex[:12]}"
+        created = int(time.time())
+
+        time.sleep(self.server.config.ttft_ms / 1000)
+        if body.get("stream"):
+            include_usage = bool((body.get("stream_options") or {}).get("include_usage"))
+            self._stream(completion_id, created, model, answer, usage if include_usage else None)
+            return
+
+        time.sleep(self._token_delay() * max(0, len(split_tokens(answer)) - 1))
+        self._send_json(
+            200,
+            {
+                "id": completion_id,
+                "object": "chat.completion",
+                "created": created,
+                "model": model,
+                "choices": [
+                    {
+                        "index": 0,
+                        "message": {"role": "assistant", "content": answer},
+                        "finish_reason": "stop",
+                    }
+                ],
+                "usage": usage,
+            },
+        )
+
+    def _token_delay(self) -> float:
+        rate = self.server.config.tokens_per_sec
+        return 1 / rate if rate > 0 else 0.0
+
+    def _stream(self, completion_id: str, created: int, model: str, answer: str, usage: dict | None) -> None:
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Cache-Control", "no-cache")
+        self.send_header("Connection", "close")
+        self.end_headers()
+        self.close_connection = True
+
+        def chunk(delta: dict, finish_reason: str | None = None, chunk_usage: dict | None = None) -> dict:
+            payload = {
+                "id": completion_id,
+                "object": "chat.completion.chunk",
+                "created": created,
+                "model": model,
+                "choices": [] if chunk_usage else [
+                    {"index": 0, "delta": delta, "finish_reason": finish_reason}
+                ],
+            }
+            if chunk_usage:
+                payload["usage"] = chunk_usage
+            return payload
+
+        try:
+            self._write_event(chunk({"role": "assistant", "content": ""}))
+            for index, token in enumerate(split_tokens(answer)):
+                if index:
+                    time.sleep(self._token_delay())
+                self._write_event(chunk({"content": token}))
+            self._write_event(chunk({}, finish_reason="stop"))
+            if usage is not None:
+                self._write_event(chunk({}, chunk_usage=usage))
+            self.wfile.write(b"data: [DONE]\n\n")
+            self.wfile.flush()
+        except (BrokenPipeError, ConnectionResetError):
+            return
+
+    def _write_event(self, payload: dict) -> None:
+        self.wfile.write(f"data: {json.dumps(payload, ensure_ascii=False)}\n\n".encode("utf-8"))
+        self.wfile.flush()
+
+    def _send_json(self, status: int, payload: dict, headers: dict | None = None) -> None:
+        data = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+
+def parse_args() -> argparse.Namespace:
+    defaults = StubConfig.from_env()
+    parser = argparse.ArgumentParser(
+        description="Server LLM finto compatibile con l'API chat completions di OpenAI, per test di carico offline."
+    )
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=int(os.getenv("STUB_LLM_PORT", "8090")))
+    parser.add_argument("--ttft-ms", type=float, default=defaults.ttft_ms, help="Ritardo prima del primo token.")
+    parser.add_argument("--tokens-per-sec", type=float, default=defaults.tokens_per_sec, help="Velocita' di generazione.")
+    parser.add_argument("--error-rate", type=float, default=defaults.error_rate, help="Quota di risposte 500.")
+    parser.add_argument("--rate-limit-rate", type=float, default=defaults.rate_limit_rate, help="Quota di risposte 429.")
+    parser.add_argument("--seed", type=int, default=defaults.seed, help="Seed per l'iniezione degli errori.")
+    return parser.parse_args()
+
+
+def main() -> int:
+    args = parse_args()
+    config = StubConfig(
+        ttft_ms=args.ttft_ms,
+        tokens_per_sec=args.tokens_per_sec,
+        error_rate=args.error_rate,
+        rate_limit_rate=args.rate_limit_rate,
+        seed=args.seed,
+    )
+    server = StubLLMServer((args.host, args.port), config)
+    print(f"Stub LLM in ascolto su http://{args.host}:{server.server_address[1]}")
+    print(f"Avvia l'API con LLM_BASE_URL=http://{args.host}:{server.server_address[1]}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,235 @@
+import json
+import tempfile
+import threading
+import time
+import unittest
+from collections import Counter
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+from unittest import mock
+
+from admin_aggregates import AdminAggregates
+from storage_services import ChatHistoryStore, EventStore, FeedbackStore, build_llm_usage_stats
+from storage_sqlite import SQLiteChatHistoryStore, SQLiteDatabase, SQLiteEventStore, SQLiteFeedbackStore
+
+
+def _save(store, chat_id, question, regime_id="forfettario"):
+    store.save_turn(
+        chat_id=chat_id,
+        regime_id=regime_id,
+        user_message=question,
+        assistant_message="Risposta",
+        assistant_sources=[],
+    )
+
+
+def _full_scan(chats, feedback, events):
+    # Conteggio di riferimento rileggendo tutto, come faceva /admin/overview prima degli aggregati.
+    transcripts = [chats.get_chat(chat_id) for chat_id in chats.iter_chat_ids()]
+    transcripts = [item for item in transcripts if item is not None]
+    questions = Counter(
+        message.text.strip() for item in transcripts for message in item.messages if message.role == "user"
+    )
+    votes = Counter(item.get("vote") for item in feedback.iter_records())
+    records = list(events.iter_records())
+    counts = Counter(item.get("event") for item in records)
+    return {
+        "total_chats": len(transcripts),
+        "total_messages": sum(len(item.messages) for item in transcripts),
+        "positive_feedback": votes["up"],
+        "negative_feedback": votes["down"],
+        "no_result_events": counts["rag_no_results"],
+        "low_confidence_events": counts["rag_low_confidence"],
+        "top_questions": sorted(item for item, _ in questions.most_common(5)),
+        "top_regimes": sorted(
+            item for item, _ in Counter(item.regime_id for item in transcripts if item.regime_id).most_common(5)
+        ),
+        "llm_usage": build_llm_usage_stats(
+            [item for item in records if item.get("event") == "llm_usage"]
+        ).model_dump(),
+    }
+
+
+class AdminAggregatesTests(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.root = Path(self.tmpdir.name)
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def _json_stores(self):
+        return (
+            ChatHistoryStore(self.root / "chat_history"),
+            FeedbackStore(self.root / "feedback" / "feedback.jsonl"),
+            EventStore(self.root / "events" / "app_events.jsonl"),
+        )
+
+    def _populate(self, chats, feedback, events):
+        _save(chats, "chat-1", "Quanto posso fatturare?")
+        _save(chats, "chat-1", "Che aliquota pago?", regime_id="ordinario")
+        _save(chats, "chat-2", "Quanto posso fatturare?")
+        _save(chats, "chat-3", "Posso dedurre i costi?")
+        feedback.append({"vote": "up", "message": "ok"})
+        feedback.append({"vote": "down", "message": "no"})
+        events.append_many(
+            [
+                {"event": "rag_no_results"},
+                {"event": "rag_low_confidence"},
+                {"event": "llm_usage", "answer_type": "generated", "duration_ms": 900, "prompt_tokens": 100},
+            ]
+        )
+
+    def _assert_matches_full_scan(self, aggregates, chats, feedback, events):
+        actual = aggregates.stats().model_dump()
+        actual["top_questions"] = sorted(actual["top_questions"])
+        actual["top_regimes"] = sorted(actual["top_regimes"])
+        self.assertEqual(actual, _full_scan(chats, feedback, events))
+
+    def test_incremental_counters_match_a_full_scan(self):
+        chats, feedback, events = self._json_stores()
+        aggregates = AdminAggregates(self.root / "admin", chats, feedback, events)
+        aggregates.stats()
+        self._populate(chats, feedback, events)
+        self._assert_matches_full_scan(aggregates, chats, feedback, events)
+        self.assertEqual(aggregates.stats().top_questions[0], "Quanto posso fatturare?")
+
+        self.assertTrue(chats.delete_chat("chat-1"))
+        feedback.append({"vote": "up", "message": "ancora"})
+        self._assert_matches_full_scan(aggregates, chats, feedback, events)
+        self.assertEqual(aggregates.stats().top_regimes, ["forfettario"])
+
+    def test_turns_append_one_delta_and_state_is_saved_on_read(self):
+        chats, feedback, events = self._json_stores()
+        aggregates = AdminAggregates(self.root / "admin", chats, feedback, events)
+        aggregates.stats()
+        state_path = self.root / "admin" / "chat_aggregates.json"
+        before = state_path.stat().st_mtime_ns
+        with mock.patch("admin_aggregates.atomic_write_text") as write:
+            for index in range(5):
+                _save(chats, f"chat-{index}", "Quanto posso fatturare?")
+        write.assert_not_called()
+        self.assertEqual(state_path.stat().st_mtime_ns, before)
+        self.assertEqual(len((self.root / "admin" / "chat_deltas.jsonl").read_text().splitlines()), 5)
+
+        # Un altro worker somma le stesse variazioni dallo stato persistito.
+        other = AdminAggregates(self.root / "admin", *self._json_stores())
+        self.assertEqual(other.stats().total_chats, 5)
+        self.assertEqual(aggregates.stats().total_messages, 10)
+        self._assert_matches_full_scan(aggregates, chats, feedback, events)
+
+        with mock.patch("admin_aggregates.CHAT_DELTAS_COMPACT_BYTES", 1):
+            _save(chats, "chat-0", "Che aliquota pago?")
+            self.assertEqual(aggregates.stats().total_messages, 12)
+        self.assertEqual((self.root / "admin" / "chat_deltas.jsonl").read_text(), "")
+        _save(chats, "chat-9", "Posso dedurre i costi?")
+        self._assert_matches_full_scan(other, chats, feedback, events)
+
+    def test_logs_are_read_only_after_the_checkpoint(self):
+        chats, feedback, events = self._json_stores()
+        self._populate(chats, feedback, events)
+        AdminAggregates(self.root / "admin", chats, feedback, events).stats()
+
+        # Un nuovo processo riparte dallo stato persistito: legge solo i record nuovi.
+        reopened = AdminAggregates(self.root / "admin", *self._json_stores())
+        events.append({"event": "rag_no_results"})
+        with mock.patch.object(EventStore, "read_from", wraps=reopened.event_store.read_from) as read_from:
+            stats = reopened.stats()
+        self.assertEqual(stats.no_result_events, 2)
+        self.assertEqual(stats.llm_usage.generated_answers, 1)
+        first_offset = read_from.call_args_list[0].args[0]
+        self.assertNotEqual(first_offset, 0)
+
+    def test_turn_saved_during_rebuild_is_counted_once(self):
+        chats, feedback, events = self._json_stores()
+        aggregates = AdminAggregates(self.root / "admin", chats, feedback, events)
+        for index in range(3):
+            _save(chats, f"chat-{index}", "Quanto posso fatturare?")
+        aggregates.stats()
+
+        scanning = threading.Event()
+        original_get_chat = chats.get_chat
+
+        def slow_get_chat(chat_id):
+            scanning.set()
+            time.sleep(0.05)
+            return original_get_chat(chat_id)
+
+        def save_all():
+            scanning.wait(1)
+            # Un turno per chat mentre la rilettura e' in corso: alcune sono gia' state lette, altre no.
+            for index in range(3):
+                _save(chats, f"chat-{index}", "Che aliquota pago?")
+
+        writer = threading.Thread(target=save_all)
+        writer.start()
+        with mock.patch.object(chats, "get_chat", side_effect=slow_get_chat):
+            aggregates.rebuild_chats()
+        writer.join()
+        self._assert_matches_full_scan(aggregates, chats, feedback, events)
+        self.assertEqual(aggregates.stats().total_messages, 12)
+
+    def test_checkpoints_in_an_older_format_restart_the_section(self):
+        chats, feedback, events = self._json_stores()
+        self._populate(chats, feedback, events)
+        AdminAggregates(self.root / "admin", chats, feedback, events).stats()
+        state_path = self.root / "admin" / "log_aggregates.json"
+        state = json.loads(state_path.read_text(encoding="utf-8"))
+        # Checkpoint salvato da una versione precedente: intero invece della stringa opaca.
+        state["events"]["checkpoint"] = 120
+        state_path.write_text(json.dumps(state), encoding="utf-8")
+
+        reopened = AdminAggregates(self.root / "admin", *self._json_stores())
+        self._assert_matches_full_scan(reopened, chats, feedback, events)
+
+    def test_usage_window_is_clamped_and_reports_covered_hours(self):
+        chats, feedback, events = self._json_stores()
+        now = datetime.now(timezone.utc)
+        events.append_many(
+            [
+                {"event": "llm_usage", "answer_type": "generated", "timestamp": (now - timedelta(hours=hours)).isoformat()}
+                for hours in (30, 10, 1)
+            ]
+        )
+        aggregates = AdminAggregates(self.root / "admin", chats, feedback, events)
+        usage = aggregates.stats(usage_window_hours=24 * 30).llm_usage
+        self.assertEqual(usage.window_hours, 24 * 7)
+        self.assertEqual(usage.covered_hours, 24 * 7)
+        self.assertEqual(usage.generated_answers, 3)
+
+        # Con il tetto dei campioni raggiunto la copertura parte dal campione piu' vecchio rimasto.
+        with mock.patch("admin_aggregates.USAGE_SAMPLES_MAX", 2):
+            reopened = AdminAggregates(self.root / "admin-cap", *self._json_stores())
+            usage = reopened.stats(usage_window_hours=48).llm_usage
+        self.assertEqual(usage.window_hours, 48)
+        self.assertAlmostEqual(usage.covered_hours, 10, places=1)
+        self.assertEqual(usage.generated_answers, 2)
+
+    def test_rebuild_recovers_from_lost_state(self):
+        chats, feedback, events = self._json_stores()
+        aggregates = AdminAggregates(self.root / "admin", chats, feedback, events)
+        self._populate(chats, feedback, events)
+        for path in (self.root / "admin").glob("*.json"):
+            path.write_text("{", encoding="utf-8")
+        self.assertEqual(aggregates.rebuild().total_chats, 3)
+        self._assert_matches_full_scan(aggregates, chats, feedback, events)
+
+    def test_sqlite_backend_feeds_the_same_aggregates(self):
+        database = SQLiteDatabase(self.root / "flytax.sqlite3")
+        try:
+            stores = (
+                SQLiteChatHistoryStore(database),
+                SQLiteFeedbackStore(database),
+                SQLiteEventStore(database),
+            )
+            aggregates = AdminAggregates(self.root / "admin", *stores)
+            aggregates.stats()
+            self._populate(*stores)
+            stores[0].delete_chat("chat-3")
+            self._assert_matches_full_scan(aggregates, *stores)
+        finally:
+            database.close()
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,48 @@
+import re
+import unittest
+from difflib import SequenceMatcher
+
+from alias_matcher import RegimeAliasMatcher
+
+
+def tokenize(text):
+    return re.findall(r"[a-z0-9%]+", text)
+
+
+def is_close(token, alias_token):
+    if len(token) < 5 or len(alias_token) < 5:
+        return False
+    if token[0] != alias_token[0] or token[-1] != alias_token[-1]:
+        return False
+    return SequenceMatcher(None, token, alias_token).ratio() >= 0.82
+
+
+class RegimeAliasMatcherTests(unittest.TestCase):
+    def build_matcher(self):
+        return RegimeAliasMatcher(
+            [
+                ("forfettario", "forfettario"),
+                ("forfettario", "regime dei forfettari"),
+                ("ordinario", "regime ordinario"),
+            ],
+            tokenize=tokenize,
+            is_close=is_close,
+        )
+
+    def test_exact_and_fuzzy_aliases_resolve_in_profile_order(self):
+        matcher = self.build_matcher()
+        self.assertEqual(matcher.match("aliquota del regime forfettario"), ["forfettario"])
+        self.assertEqual(matcher.match("come funziona il forfetarrio"), ["forfettario"])
+        self.assertEqual(
+            matcher.match("passo dal regime ordinarrio al forfettario"),
+            ["forfettario", "ordinario"],
+        )
+
+    def test_multi_token_alias_needs_consecutive_tokens(self):
+        matcher = self.build_matcher()
+        self.assertEqual(matcher.match("regime agevolato ordinario"), [])
+        self.assertEqual(matcher.match("regime ordinaro"), ["ordinario"])
+
+
+if __name__ == "__main__":
+    unittest.main()
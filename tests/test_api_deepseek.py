@@ -2,9 +2,13 @@ import asyncio
 import importlib
 import json
 import os
+import random
 import sys
+import tempfile
+import time
 import types
 import unittest
+from difflib import SequenceMatcher
 from pathlib import Path
 from unittest import mock
 
@@ -16,7 +20,7 @@ class FakeRag:
     def load(self):
         return None
 
-    def search(self, query, top_k=4, min_score=0.2, regime_ids=None):
+    def search(self, query, top_k=4, min_score=0.2, regime_ids=None, query_vector=None):
         if self._search_results is not None:
             return self._search_results
         regime = regime_ids[0] if regime_ids else "forfettario"
@@ -45,19 +49,34 @@ class ApiDeepseekRoutingTests(unittest.TestCase):
         payload_chunks=None,
         extra_env=None,
     ):
-        fake_client = mock.Mock()
-        fake_client.chat.completions.create.return_value = types.SimpleNamespace(
-            choices=[
-                types.SimpleNamespace(
-                    message=types.SimpleNamespace(content=llm_answer)
+        async def fake_stream(text):
+            for delta in (text[: len(text) // 2], text[len(text) // 2 :]):
+                yield types.SimpleNamespace(
+                    choices=[types.SimpleNamespace(delta=types.SimpleNamespace(content=delta))]
                 )
-            ]
-        )
+
+        def fake_create(*args, **kwargs):
+            if kwargs.get("stream"):
+                return fake_stream(llm_answer)
+            return types.SimpleNamespace(
+                choices=[
+                    types.SimpleNamespace(
+                        message=types.SimpleNamespace(content=llm_answer)
+                    )
+                ]
+            )
+
+        fake_client = mock.Mock()
+        fake_client.chat.completions.create = mock.AsyncMock(side_effect=fake_create)
 
         fake_openai = types.ModuleType("openai")
-        fake_openai.OpenAI = mock.Mock(return_value=fake_client)
+        fake_openai.AsyncOpenAI = type(
+            "AsyncOpenAI", (), {"__new__": lambda cls, *args, **kwargs: fake_client}
+        )
         fake_openai.APIError = type("APIError", (Exception,), {})
         fake_openai.RateLimitError = type("RateLimitError", (Exception,), {})
+        fake_openai.APIConnectionError = type("APIConnectionError", (Exception,), {})
+        fake_openai.APIStatusError = type("APIStatusError", (Exception,), {})
 
         fake_dotenv = types.ModuleType("dotenv")
         fake_dotenv.load_dotenv = lambda: None
@@ -101,9 +120,16 @@ class ApiDeepseekRoutingTests(unittest.TestCase):
 
                 return decorator
 
+            def on_event(self, *args, **kwargs):
+                def decorator(fn):
+                    return fn
+
+                return decorator
+
         fake_fastapi.FastAPI = FakeFastAPI
         fake_fastapi.File = lambda *args, **kwargs: None
         fake_fastapi.Header = lambda *args, **kwargs: None
+        fake_fastapi.Query = lambda default=None, **kwargs: default
 
         class FakeHTTPException(Exception):
             def __init__(self, status_code=400, detail=""):
@@ -130,6 +156,8 @@ class ApiDeepseekRoutingTests(unittest.TestCase):
             "kwargs": kwargs,
         }
 
+        fake_fastapi_responses.StreamingResponse = lambda *args, **kwargs: {"args": args, "kwargs": kwargs}
+
         fake_app_models = types.ModuleType("app_models")
         for class_name in (
             "ChatRequest",
@@ -156,9 +184,19 @@ class ApiDeepseekRoutingTests(unittest.TestCase):
             def append(self, payload):
                 self.items.append(payload)
 
+            def append_many(self, payloads):
+                self.items.extend(payloads)
+                return len(payloads)
+
             def read_all(self):
                 return list(self.items)
 
+            def iter_records(self):
+                return iter(list(self.items))
+
+            def read_tail(self, limit):
+                return list(self.items[-limit:]) if limit > 0 else []
+
             def list_chats(self, limit=30):
                 return []
 
@@ -181,21 +219,43 @@ class ApiDeepseekRoutingTests(unittest.TestCase):
         fake_storage_services.ChatHistoryStore = FakeStore
         fake_storage_services.EventStore = FakeStore
         fake_storage_services.FeedbackStore = FakeStore
+        fake_storage_services.JsonlStore = FakeStore
+
+        fake_storage_sqlite = types.ModuleType("storage_sqlite")
+        fake_storage_sqlite.SQLiteDatabase = FakeStore
+        fake_storage_sqlite.SQLiteChatHistoryStore = FakeStore
+        fake_storage_sqlite.SQLiteEventStore = FakeStore
+        fake_storage_sqlite.SQLiteFeedbackStore = FakeStore
 
         class FakeAdminStats(FakeBaseModel):
             top_questions = []
             top_regimes = []
 
-        fake_storage_services.build_admin_stats = lambda *args, **kwargs: FakeAdminStats(
-            total_chats=0,
-            total_messages=0,
-            positive_feedback=0,
-            negative_feedback=0,
-            no_result_events=0,
-            low_confidence_events=0,
-            top_questions=[],
-            top_regimes=[],
-        )
+        fake_admin_aggregates = types.ModuleType("admin_aggregates")
+
+        class FakeAdminAggregates:
+            def __init__(self, *args, **kwargs):
+                pass
+
+            def stats(self, usage_window_hours=24):
+                return FakeAdminStats(
+                    total_chats=0,
+                    total_messages=0,
+                    positive_feedback=0,
+                    negative_feedback=0,
+                    no_result_events=0,
+                    low_confidence_events=0,
+                    top_questions=[],
+                    top_regimes=[],
+                )
+
+            rebuild = stats
+
+        fake_admin_aggregates.AdminAggregates = FakeAdminAggregates
+        fake_admin_aggregates.USAGE_RETENTION_HOURS = 24 * 7
+
+        fake_event_query = types.ModuleType("event_query")
+        fake_event_query.EventRollups = FakeStore
 
         fake_tax_simulator = types.ModuleType("tax_simulator")
         fake_tax_simulator.simulate_forfettario = lambda payload: payload
@@ -247,6 +307,9 @@ class ApiDeepseekRoutingTests(unittest.TestCase):
                     "app_models": fake_app_models,
                     "rag_qdrant": fake_rag_qdrant,
                     "storage_services": fake_storage_services,
+                    "storage_sqlite": fake_storage_sqlite,
+                    "admin_aggregates": fake_admin_aggregates,
+                    "event_query": fake_event_query,
                     "tax_simulator": fake_tax_simulator,
                 },
                 clear=False,
@@ -262,6 +325,18 @@ class ApiDeepseekRoutingTests(unittest.TestCase):
             )
         )
 
+    def ask_stream(self, module, question):
+        async def collect():
+            response = await module.chat_stream(
+                module.ChatRequest(content=question, regime_id=None, chat_id=None)
+            )
+            frames = []
+            async for frame in response["args"][0]:
+                frames.append(json.loads(frame[len("data: "):]))
+            return frames
+
+        return asyncio.run(collect())
+
     def test_loss_query_no_longer_hits_aliquota_5_branch(self):
         module = self.load_module()
         response = self.ask(module, "Quando si perde l'agevolazione del 35%?")
@@ -382,6 +457,266 @@ class ApiDeepseekRoutingTests(unittest.TestCase):
         self.assertIn("partita iva", normalized)
         self.assertIn("extra ue", normalized)
 
+    def test_typo_correction_matches_full_scan_over_canonical_tokens(self):
+        module = self.load_module()
+
+        def full_scan(token):
+            # Confronto su tutta la lista canonica, come prima dell'indice SymSpell.
+            exact = module.EXACT_QUERY_TOKEN_REPLACEMENTS.get(token)
+            if exact is not None:
+                return exact
+            if len(token) < 6 or any(char.isdigit() for char in token):
+                return token
+            best_match, best_score = token, 0.0
+            for candidate in module.CANONICAL_QUERY_TOKENS:
+                if token[0] != candidate[0] or token[-1] != candidate[-1]:
+                    continue
+                if abs(len(token) - len(candidate)) > 2:
+                    continue
+                score = SequenceMatcher(None, token, candidate).ratio()
+                if score >= 0.84 and score > best_score:
+                    best_match, best_score = candidate, score
+            return best_match
+
+        words = set(module.CANONICAL_QUERY_TOKENS)
+        words.update(value for value in module.EXACT_QUERY_TOKEN_REPLACEMENTS.values() if " " not in value)
+        for profile in module.REGIME_PROFILES:
+            for alias in profile.aliases:
+                words.update(module._tokenize_for_matching(alias))
+        letters = "abcdefghijklmnopqrstuvwxyz"
+        rng = random.Random(29)
+        typos = {"reigime", "bollqo"}
+        for word in sorted(words):
+            for _ in range(60):
+                position = rng.randrange(len(word) + 1)
+                edit = rng.choice(("insert", "delete", "replace", "swap"))
+                if edit == "insert":
+                    typos.add(word[:position] + rng.choice(letters) + word[position:])
+                elif edit == "delete" and position < len(word):
+                    typos.add(word[:position] + word[position + 1 :])
+                elif edit == "replace" and position < len(word):
+                    typos.add(word[:position] + rng.choice(letters) + word[position + 1 :])
+                elif edit == "swap" and position < len(word) - 1:
+                    typos.add(word[:position] + word[position + 1] + word[position] + word[position + 2 :])
+        mismatches = [token for token in sorted(typos) if module._correct_tax_token(token) != full_scan(token)]
+        self.assertEqual(mismatches, [])
+        self.assertEqual(module._correct_tax_token("reigime"), "reigime")
+        self.assertEqual(module._correct_tax_token("bollqo"), "bollqo")
+
+    def test_query_features_normalize_once_and_memoize_predicates(self):
+        module = self.load_module()
+        features = module._query_features("Qual è l'alliquota del regime forfetario?")
+        self.assertIn("aliquota", features.tokens)
+        self.assertIs(module._query_features(features), features)
+        self.assertTrue(module._is_forfettario_query(features))
+        self.assertIn("_is_forfettario_query", features.memo)
+        self.assertEqual(
+            module._is_forfettario_query(features.raw),
+            module._is_forfettario_query(features),
+        )
+
+    def test_intent_prediction_never_overrides_rule_predicates(self):
+        module = self.load_module()
+        vies = module._query_features("Nel regime forfettario il vies serve per vendere servizi in ue?")
+        expected = module._match_hardcoded_rule(vies, "forfettario")
+        self.assertIsNotNone(expected)
+        other = next(
+            rule
+            for rule in module.ACTIVE_HARD_CODED_RULES
+            if rule.regime_id == "forfettario" and not rule.predicate(vies)
+        )
+        for intent_id in (other.intent_id, module.RETRIEVAL_INTENT, expected[0].intent_id):
+            prediction = module.IntentPrediction(intent_id=intent_id, score=0.9, margin=0.5)
+            routed = module._route_hardcoded_rule(vies, "forfettario", prediction)
+            self.assertEqual(routed[0].intent_id, expected[0].intent_id)
+
+        # Una previsione senza predicato concorde non serve la risposta preconfezionata.
+        unrelated = module._query_features("Come funziona la ricerca nei documenti caricati?")
+        prediction = module.IntentPrediction(intent_id=expected[0].intent_id, score=0.9, margin=0.5)
+        self.assertEqual(
+            module._route_hardcoded_rule(unrelated, "forfettario", prediction),
+            module._match_hardcoded_rule(unrelated, "forfettario"),
+        )
+
+    def test_keyword_sets_are_declared_constants(self):
+        module = self.load_module()
+        features = module._query_features("Quali sono le cause ostative del regime forfettario?")
+        self.assertTrue(module._any_term(features, module.EXPANSION_EXCLUSION_TERMS))
+        self.assertFalse(module._any_term(features, module.OFF_TOPIC_TERMS))
+        # Un insieme non dichiarato con _keyword_set non viene registrato al volo.
+        with self.assertRaises(KeyError):
+            module._any_term(features, ("cripto-attivita",))
+
+    def test_keyword_automaton_is_complete_after_import(self):
+        module = self.load_module()
+        version = module.INTENT_KEYWORDS.version
+        self.assertEqual(module.INTENT_KEYWORDS.snapshot().version, version)
+        for question in (
+            "Quali sono le cause ostative del forfettario?",
+            "Scadenze saldo e acconto imposta sostitutiva",
+            "Riduzione contributiva 35% inps artigiani",
+            "Devo mettere il bollo su una fattura estera da 100 euro?",
+        ):
+            features = module._query_features(question)
+            for rule in module.HARD_CODED_RULES:
+                rule.predicate(features)
+            module._intent_expansions(features, regime_id="forfettario")
+        self.assertEqual(module.INTENT_KEYWORDS.version, version)
+
+    def test_stream_serves_same_hard_coded_answer_as_json_endpoint(self):
+        module = self.load_module()
+        question = "Devo mettere il bollo su una fattura estera da 100 euro?"
+        response = self.ask(module, question)
+        frames = self.ask_stream(module, question)
+        self.assertEqual(len(frames), 1)
+        self.assertTrue(frames[0]["done"])
+        self.assertEqual(frames[0]["text"], response.message)
+        self.assertEqual(frames[0]["sources"], response.sources)
+        module._get_llm_client().chat.completions.create.assert_not_called()
+
+    def test_stream_relays_llm_deltas_without_blocking(self):
+        module = self.load_module(llm_answer="Risposta dal modello sul forfettario.")
+        frames = self.ask_stream(module, "Quali sono le cause ostative del regime forfettario?")
+        self.assertTrue(frames[0]["retrieval"])
+        self.assertEqual(frames[0]["sources"], frames[-1]["sources"])
+        self.assertEqual(frames[0]["confidence_label"], frames[-1]["confidence_label"])
+        chunks = [frame["chunk"] for frame in frames if "chunk" in frame]
+        self.assertEqual("".join(chunks), "Risposta dal modello sul forfettario.")
+        self.assertTrue(frames[-1]["done"])
+        self.assertEqual(frames[-1]["text"], "Risposta dal modello sul forfettario.")
+        module._get_llm_client().chat.completions.create.assert_awaited_once()
+
+    def test_both_endpoints_send_the_same_cache_friendly_prompt(self):
+        module = self.load_module(llm_answer="Risposta dal modello.")
+        question = "Quali sono le cause ostative del regime forfettario?"
+        self.ask(module, question)
+        self.ask_stream(module, question)
+
+        create = module._get_llm_client().chat.completions.create
+        json_call, stream_call = create.await_args_list
+        self.assertEqual(json_call.kwargs["messages"], stream_call.kwargs["messages"])
+        system_message, user_message = json_call.kwargs["messages"]
+        self.assertNotIn(question, system_message["content"])
+        self.assertTrue(user_message["content"].startswith("CONTEXT:\n"))
+        self.assertNotIn("\n\n", user_message["content"].rsplit("DOMANDA:\n", 1)[1])
+        self.assertEqual(stream_call.kwargs["stream_options"], {"include_usage": True})
+
+    def test_identical_concurrent_questions_share_retrieval_and_generation(self):
+        module = self.load_module(llm_answer="Risposta condivisa.")
+        create = module._get_llm_client().chat.completions.create
+        plain_create = create.side_effect
+
+        async def slow_create(*args, **kwargs):
+            await asyncio.sleep(0.02)
+            return plain_create(*args, **kwargs)
+
+        create.side_effect = slow_create
+        searched = []
+        original_search = module.rag.search
+
+        def counting_search(*args, **kwargs):
+            searched.append(args[0])
+            return original_search(*args, **kwargs)
+
+        module.rag.search = counting_search
+        question = "Quali sono le cause ostative del regime forfettario?"
+
+        async def scenario():
+            return await asyncio.gather(
+                *(
+                    module.read_root(module.ChatRequest(content=question, regime_id=None, chat_id=f"chat-{index}"))
+                    for index in range(3)
+                )
+            )
+
+        responses = asyncio.run(scenario())
+        self.assertEqual([item.message for item in responses], ["Risposta condivisa."] * 3)
+        self.assertEqual([item.chat_id for item in responses], ["chat-0", "chat-1", "chat-2"])
+        create.assert_awaited_once()
+        single_request_searches = len(searched)
+        searched.clear()
+        self.ask(module, question)
+        self.assertEqual(single_request_searches, len(searched))
+        self.assertEqual(create.await_count, 2)
+
+    def test_stream_deltas_are_coalesced_on_a_time_window(self):
+        module = self.load_module()
+
+        def chunk(text):
+            return types.SimpleNamespace(
+                choices=[types.SimpleNamespace(delta=types.SimpleNamespace(content=text))]
+            )
+
+        async def burst():
+            for index in range(10):
+                yield chunk(f"d{index}")
+
+        async def stalled():
+            yield chunk("a")
+            yield chunk("b")
+            await asyncio.sleep(0.1)
+            yield chunk("c")
+
+        async def collect(source):
+            return [item async for item in module._coalesce_deltas(source, 0.03)]
+
+        self.assertEqual(asyncio.run(collect(burst())), ["d0", "d1d2d3d4d5d6d7d8d9"])
+        self.assertEqual(asyncio.run(collect(stalled())), ["a", "b", "c"])
+
+    def test_saturated_llm_queue_answers_busy_immediately(self):
+        module = self.load_module(llm_answer="Risposta dal modello.")
+        transport = module._get_llm_transport()
+        transport.limiter.max_concurrent = 0
+        transport.limiter.max_queue = 0
+
+        response = self.ask(module, "Quali sono le cause ostative del regime forfettario?")
+        self.assertEqual(response.message, module.LLM_BUSY_MESSAGE)
+        frames = self.ask_stream(module, "Quali sono le cause ostative del regime forfettario?")
+        self.assertEqual(frames[-1], {"error": module.LLM_BUSY_MESSAGE, "busy": True})
+        module._get_llm_client().chat.completions.create.assert_not_called()
+
+    def test_admin_endpoints_flush_events_off_the_event_loop(self):
+        module = self.load_module()
+        module.ADMIN_ACCESS_KEY = "chiave"
+
+        def slow_flush(timeout=5.0):
+            time.sleep(0.2)
+            return True
+
+        async def scenario():
+            ticks = 0
+
+            async def ticker():
+                nonlocal ticks
+                while True:
+                    await asyncio.sleep(0.01)
+                    ticks += 1
+
+            task = asyncio.ensure_future(ticker())
+            await module.admin_rebuild_aggregates(x_admin_key="chiave")
+            task.cancel()
+            return ticks
+
+        with mock.patch.object(module.event_bus, "flush", side_effect=slow_flush):
+            self.assertGreater(asyncio.run(scenario()), 5)
+
+    def test_answers_log_compact_llm_usage_records(self):
+        module = self.load_module(llm_answer="Risposta dal modello.")
+        self.ask_stream(module, "Quali sono le cause ostative del regime forfettario?")
+        self.ask(module, "Devo mettere il bollo su una fattura estera da 100 euro?")
+
+        self.assertTrue(module.event_bus.flush())
+        usage = [item for item in module.event_store.items if item.get("event") == "llm_usage"]
+        generated, hard_coded = usage
+        self.assertEqual(generated["answer_type"], "generated")
+        self.assertEqual(generated["endpoint"], "chat-stream")
+        self.assertEqual(generated["model"], module.llm_model)
+        self.assertIn(generated["retrieval_mode"], {"semantic", "lexical", "hybrid"})
+        self.assertIsNotNone(generated["ttft_ms"])
+        self.assertLessEqual(generated["ttft_ms"], generated["duration_ms"])
+        self.assertEqual(hard_coded["answer_type"], "hard_coded")
+        self.assertTrue(hard_coded["intent_id"])
+
     def test_typo_query_routes_to_vies_answer(self):
         module = self.load_module()
         response = self.ask(
@@ -436,6 +771,63 @@ class ApiDeepseekRoutingTests(unittest.TestCase):
         response = self.ask(module, "Cos'è il regime forfettario?")
         self.assertIn("regime fiscale agevolato", response.message.lower())
 
+    def test_intent_classifier_reuses_the_retrieval_query_vector(self):
+        module = self.load_module(extra_env={"INTENT_CLASSIFIER_ENABLED": "1"})
+
+        def embed(text):
+            vector = [0.0] * 64
+            for token in module._tokenize_for_matching(text):
+                vector[sum(map(ord, token)) % 64] += 1.0
+            return vector
+
+        module.rag.embed_query = embed
+        module.intent_classifier = module.NearestCentroidClassifier(
+            {"off_topic": embed("quali sono le cause ostative del regime forfettario")},
+            threshold=0.9,
+        )
+        searched_vectors = []
+        original_search = module.rag.search
+
+        def search(query, **kwargs):
+            searched_vectors.append(kwargs.get("query_vector"))
+            return original_search(query, **kwargs)
+
+        module.rag.search = search
+
+        response = self.ask(module, "Quali sono le cause ostative del regime forfettario?")
+        self.assertIn("Riformula la domanda", response.message)
+        self.assertEqual(searched_vectors, [])
+
+        self.ask(module, "Come si compila la fattura elettronica nel forfettario?")
+        self.assertTrue(searched_vectors)
+        self.assertEqual(
+            searched_vectors[0],
+            embed(module._normalize_tax_query("Come si compila la fattura elettronica nel forfettario?")),
+        )
+
+    def test_intent_examples_are_normalized_like_queries_before_embedding(self):
+        module = self.load_module(extra_env={"INTENT_CLASSIFIER_ENABLED": "1"})
+        embedded = []
+
+        def embed_texts(texts):
+            embedded.extend(texts)
+            return [[1.0, float(len(text))] for text in texts]
+
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            examples_path = Path(tmp_dir) / "intents.json"
+            examples_path.write_text(
+                json.dumps({"aliquota": ["Qual è l'alliquota del regime forfetario?"]}), encoding="utf-8"
+            )
+            module.INTENT_EXAMPLES_PATH = examples_path
+            module.intent_classifier = None
+            module.rag.embedder = types.SimpleNamespace(embed_texts=embed_texts)
+            asyncio.run(module._warm_intent_classifier())
+
+        self.assertIsNotNone(module.intent_classifier)
+        self.assertEqual(embedded, [module._normalize_tax_query("Qual è l'alliquota del regime forfetario?")])
+        self.assertIn("aliquota", embedded[0])
+        self.assertIn("forfettario", embedded[0])
+
     def test_definition_query_returns_cited_not_defined(self):
         module = self.load_module(
             rag_results=[],
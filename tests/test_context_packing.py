@@ -0,0 +1,78 @@
+import types
+import unittest
+
+from context_packing import estimate_tokens, merge_overlap, pack_context, render_context
+from rag import LocalRAG
+
+
+def _chunk(source, chunk_id, text, score, page=None):
+    return types.SimpleNamespace(
+        regime="forfettario",
+        source=source,
+        chunk_id=chunk_id,
+        text=text,
+        score=score,
+        page_start=page,
+        page_end=page,
+    )
+
+
+class ContextPackingTests(unittest.TestCase):
+    def test_merge_overlap_writes_shared_span_once(self):
+        shared = "il reddito imponibile e' determinato applicando il coefficiente"
+        self.assertEqual(merge_overlap(f"alfa {shared}", f"{shared} delta"), f"alfa {shared} delta")
+        self.assertEqual(merge_overlap(f"alfa {shared}", shared), f"alfa {shared}")
+        self.assertEqual(merge_overlap("alfa", "omega"), "alfa\nomega")
+
+    def test_short_accidental_overlap_is_not_merged(self):
+        self.assertEqual(merge_overlap("articolo 1, comma 5", "5 per cento"), "articolo 1, comma 5\n5 per cento")
+        self.assertEqual(merge_overlap("articolo 1, comma 5 per cento", "per cento"), "articolo 1, comma 5 per cento\nper cento")
+
+    def test_chunks_across_page_break_are_joined_not_merged(self):
+        chunks = [
+            _chunk("legge.pdf", 7, "si applica l'aliquota del 15 per cento", 0.8, page=3),
+            _chunk("legge.pdf", 8, "per cento dei ricavi conseguiti nell'anno", 0.7, page=4),
+        ]
+        blocks = pack_context(chunks, token_budget=10_000)
+        self.assertEqual(len(blocks), 1)
+        self.assertEqual(blocks[0].chunk_ids, [7, 8])
+        self.assertEqual((blocks[0].page_start, blocks[0].page_end), (3, 4))
+        self.assertEqual(
+            blocks[0].text,
+            "si applica l'aliquota del 15 per cento\nper cento dei ricavi conseguiti nell'anno",
+        )
+
+    def test_adjacent_chunks_from_real_chunker_are_merged(self):
+        words = " ".join(f"parola{index}" for index in range(600))
+        # Stesso chunking (1200/200) usato da QdrantRAG in indicizzazione.
+        parts = LocalRAG.chunk_text(words, chunk_size=1200, overlap=200)
+        chunks = [_chunk("legge.pdf", index, text, 0.5 + index / 100, page=1) for index, text in enumerate(parts[:3])]
+
+        blocks = pack_context(chunks, token_budget=10_000)
+        self.assertEqual(len(blocks), 1)
+        self.assertEqual(blocks[0].chunk_ids, [0, 1, 2])
+        self.assertEqual((blocks[0].page_start, blocks[0].page_end), (1, 1))
+        self.assertLess(len(blocks[0].text), sum(len(text) for text in parts[:3]))
+        self.assertTrue(words.startswith(blocks[0].text))
+
+    def test_budget_is_filled_in_score_order_and_duplicates_dropped(self):
+        chunks = [
+            _chunk("a.pdf", 0, "x" * 400, 0.3),
+            _chunk("b.pdf", 5, "y" * 400, 0.9),
+            _chunk("b.pdf", 5, "y" * 400, 0.4),
+            _chunk("c.pdf", 2, "z" * 400, 0.6),
+        ]
+        blocks = pack_context(chunks, token_budget=250)
+        self.assertEqual([block.source for block in blocks], ["b.pdf", "c.pdf"])
+        self.assertEqual(blocks[0].score, 0.9)
+        self.assertLessEqual(sum(estimate_tokens(block.header()) + block.tokens for block in blocks), 250)
+        self.assertTrue(render_context(blocks).startswith("[Fonte: b.pdf | Chunk: 5 | Score: 0.900]"))
+
+    def test_best_block_is_truncated_rather_than_dropped(self):
+        blocks = pack_context([_chunk("a.pdf", 0, "x" * 4000, 0.8)], token_budget=100)
+        self.assertEqual(len(blocks), 1)
+        self.assertLessEqual(blocks[0].tokens, 100)
+
+
+if __name__ == "__main__":
+    unittest.main()
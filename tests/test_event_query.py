@@ -0,0 +1,120 @@
+import tempfile
+import unittest
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+from unittest import mock
+
+import storage_services
+from event_query import EventRollups
+from storage_services import EventStore
+from storage_sqlite import SQLiteDatabase, SQLiteEventStore
+
+
+NOW = datetime(2026, 3, 2, 10, 30, 20, tzinfo=timezone.utc)
+
+
+def _event(name, moment):
+    return {"event": name, "timestamp": moment.isoformat()}
+
+
+class EventQueryTests(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.root = Path(self.tmpdir.name)
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def _segmented_store(self):
+        store = EventStore(self.root / "events" / "app_events.jsonl")
+        with mock.patch.object(storage_services, "_utc_day", return_value="2026-02-20"):
+            store.append_many([_event("rag_no_results", datetime(2026, 2, 20, 9, tzinfo=timezone.utc))])
+        with mock.patch.object(storage_services, "_utc_day", return_value="2026-03-02"):
+            store.append_many(
+                [
+                    _event("rag_no_results", NOW - timedelta(minutes=90)),
+                    _event("rag_no_results", NOW - timedelta(minutes=5, seconds=10)),
+                    _event("rag_low_confidence", NOW - timedelta(minutes=5)),
+                    _event("rag_no_results", NOW - timedelta(seconds=5)),
+                ]
+            )
+        return store
+
+    def test_query_filters_by_type_and_window(self):
+        store = self._segmented_store()
+        recent = store.query(events=["rag_no_results"], since=NOW - timedelta(hours=1), until=NOW)
+        self.assertEqual(len(recent), 2)
+        self.assertEqual(len(store.query(since=NOW - timedelta(hours=1))), 3)
+        self.assertEqual(len(store.query(limit=2)), 2)
+        # Il segmento compresso di febbraio e' fuori finestra: non viene aperto.
+        with mock.patch.object(storage_services.gzip, "open", side_effect=AssertionError("segmento letto")):
+            store.query(since=NOW - timedelta(days=1))
+
+    def test_sparse_index_skips_blocks_outside_the_window(self):
+        store = EventStore(self.root / "events" / "app_events.jsonl")
+        with mock.patch.object(storage_services, "_utc_day", return_value="2026-03-02"), mock.patch.object(
+            storage_services, "INDEX_BLOCK_BYTES", 512
+        ):
+            start = datetime(2026, 3, 2, 0, 0, tzinfo=timezone.utc)
+            store.append_many(
+                [{**_event("e", start + timedelta(minutes=index)), "index": index} for index in range(200)]
+            )
+            read = []
+            original = store._read_block
+
+            def tracking(name, block):
+                read.append(block)
+                return original(name, block)
+
+            with mock.patch.object(store, "_read_block", side_effect=tracking):
+                found = store.query(since=start + timedelta(minutes=150), until=start + timedelta(minutes=155))
+            blocks = store._index_segment(store.segments()[0]["name"])
+        self.assertEqual([item["index"] for item in found], [150, 151, 152, 153, 154])
+        self.assertGreater(len(blocks), 10)
+        self.assertLessEqual(len(read), 3)
+
+    def test_rollups_bucket_recent_events_and_fall_back_for_long_windows(self):
+        store = self._segmented_store()
+        rollups = EventRollups(store, horizon_hours=2)
+        minutes = rollups.series(["rag_no_results"], timedelta(minutes=10), "minute", now=NOW)
+        self.assertEqual(minutes["totals"], {"rag_no_results": 2})
+        self.assertEqual(len(minutes["buckets"]), 11)
+        non_empty = [item for item in minutes["buckets"] if item["counts"]]
+        self.assertEqual(
+            [item["start"] for item in non_empty],
+            ["2026-03-02T10:25:00+00:00", "2026-03-02T10:30:00+00:00"],
+        )
+
+        hours = rollups.series(None, timedelta(hours=2), "hour", now=NOW)
+        self.assertEqual(hours["totals"], {"rag_no_results": 3, "rag_low_confidence": 1})
+
+        with mock.patch.object(storage_services, "_utc_day", return_value="2026-03-02"):
+            store.append(_event("rag_low_confidence", NOW))
+        self.assertEqual(rollups.series(["rag_low_confidence"], timedelta(minutes=1), now=NOW)["totals"], {"rag_low_confidence": 1})
+
+        long_window = rollups.series(["rag_no_results"], timedelta(days=30), "hour", now=NOW)
+        self.assertEqual(long_window["totals"], {"rag_no_results": 4})
+        with self.assertRaises(ValueError):
+            rollups.series(None, timedelta(days=30), "minute", now=NOW)
+
+    def test_sqlite_event_store_supports_the_same_queries(self):
+        database = SQLiteDatabase(self.root / "flytax.sqlite3")
+        try:
+            store = SQLiteEventStore(database)
+            store.append_many(
+                [
+                    _event("rag_no_results", NOW - timedelta(hours=3)),
+                    _event("rag_no_results", NOW - timedelta(minutes=2)),
+                    _event("chat_turn_saved", NOW - timedelta(minutes=1)),
+                ]
+            )
+            self.assertEqual(len(store.query(events=["rag_no_results"], since=NOW - timedelta(hours=1))), 1)
+            rollups = EventRollups(store, horizon_hours=1)
+            result = rollups.series(None, timedelta(minutes=30), now=NOW)
+            self.assertEqual(result["totals"], {"rag_no_results": 1, "chat_turn_saved": 1})
+        finally:
+            database.close()
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,81 @@
+import threading
+import time
+import unittest
+
+from event_writer import BufferedEventWriter
+
+
+class _Sink:
+    def __init__(self, fail_first=False):
+        self.batches = []
+        self.fail_first = fail_first
+        self.gate = threading.Event()
+        self.gate.set()
+
+    def append_many(self, payloads):
+        self.gate.wait(5)
+        if self.fail_first:
+            self.fail_first = False
+            raise OSError("disco pieno")
+        self.batches.append(list(payloads))
+        return len(payloads)
+
+    @property
+    def records(self):
+        return [item for batch in self.batches for item in batch]
+
+
+class BufferedEventWriterTests(unittest.TestCase):
+    def test_records_are_written_in_batches_and_flushed(self):
+        sink = _Sink()
+        writer = BufferedEventWriter([sink], max_batch=3, flush_interval_s=10)
+        for index in range(7):
+            writer.publish({"index": index})
+        self.assertTrue(writer.flush(timeout=2))
+        self.assertEqual([item["index"] for item in sink.records], list(range(7)))
+        self.assertLessEqual(max(len(batch) for batch in sink.batches), 3)
+        self.assertEqual(writer.pending, 0)
+        writer.close()
+
+    def test_time_threshold_writes_without_flush(self):
+        sink = _Sink()
+        writer = BufferedEventWriter([sink], max_batch=100, flush_interval_s=0.02)
+        writer.publish({"event": "uno"})
+        deadline = time.monotonic() + 2
+        while not sink.records and time.monotonic() < deadline:
+            time.sleep(0.01)
+        self.assertEqual(sink.records, [{"event": "uno"}])
+        writer.close()
+
+    def test_buffer_is_bounded_and_close_drains_it(self):
+        sink = _Sink()
+        sink.gate.clear()
+        writer = BufferedEventWriter([sink], max_batch=1, flush_interval_s=10, max_pending=2)
+        writer.publish({"index": 0})
+        time.sleep(0.05)  # il primo record e' in scrittura, bloccato sul sink
+        results = [writer.publish({"index": index}) for index in range(1, 5)]
+        self.assertEqual(results, [True, True, False, False])
+        self.assertEqual(writer.dropped, 2)
+        sink.gate.set()
+        writer.close()
+        self.assertEqual([item["index"] for item in sink.records], [0, 1, 2])
+
+        # Dopo lo shutdown i record vengono scritti subito, senza buffer.
+        writer.publish({"index": 9})
+        self.assertEqual(sink.records[-1], {"index": 9})
+
+    def test_sink_errors_do_not_stop_the_writer(self):
+        sink = _Sink(fail_first=True)
+        writer = BufferedEventWriter([sink], max_batch=1, flush_interval_s=10)
+        with self.assertLogs("event_writer", level="ERROR"):
+            writer.publish({"index": 0})
+            writer.flush(timeout=2)
+        writer.publish({"index": 1})
+        writer.flush(timeout=2)
+        self.assertEqual(writer.failed_batches, 1)
+        self.assertEqual(sink.records, [{"index": 1}])
+        writer.close()
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,47 @@
+import tempfile
+import unittest
+from pathlib import Path
+
+from intent_classifier import NearestCentroidClassifier, load_intent_examples
+
+
+VOCABULARY = ("bollo", "fattura", "vies", "ue", "meteo", "sanremo")
+
+
+def embed_texts(texts):
+    return [[float(word in text.lower().split()) for word in VOCABULARY] for text in texts]
+
+
+class NearestCentroidClassifierTests(unittest.TestCase):
+    def build_classifier(self, threshold=0.8):
+        return NearestCentroidClassifier.from_examples(
+            {
+                "bollo": ["bollo fattura", "bollo"],
+                "vies": ["vies ue", "vies"],
+                "off_topic": ["meteo", "sanremo"],
+            },
+            embed_texts,
+            threshold=threshold,
+        )
+
+    def test_confident_prediction_returns_nearest_centroid(self):
+        classifier = self.build_classifier()
+        prediction = classifier.classify(embed_texts(["bollo fattura"])[0])
+        self.assertEqual(prediction.intent_id, "bollo")
+        self.assertGreaterEqual(prediction.score, 0.8)
+
+    def test_low_confidence_falls_back_to_rules(self):
+        classifier = self.build_classifier()
+        self.assertIsNone(classifier.classify(embed_texts(["bollo vies"])[0]))
+        self.assertIsNone(classifier.classify([0.0] * len(VOCABULARY)))
+
+    def test_load_intent_examples_skips_empty_intents(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            path = Path(tmp_dir) / "intents.json"
+            path.write_text('{"bollo": ["Serve il bollo?"], "vuoto": []}', encoding="utf-8")
+            self.assertEqual(load_intent_examples(path), {"bollo": ["Serve il bollo?"]})
+            self.assertEqual(load_intent_examples(Path(tmp_dir) / "missing.json"), {})
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,71 @@
+import threading
+import unittest
+
+from keyword_matcher import KeywordAutomaton
+
+
+class KeywordAutomatonTests(unittest.TestCase):
+    def test_scan_matches_substring_semantics(self):
+        automaton = KeywordAutomaton()
+        groups = [
+            ("soglia", "ricavi", "compensi"),
+            ("ue", "extra ue", "extra-ue"),
+            ("inps", "riduzione inps", "35%"),
+            ("he", "she", "his", "hers"),
+        ]
+        masks = [automaton.register(group) for group in groups]
+        texts = [
+            "qual e la soglia dei ricavi nel forfettario",
+            "fattura verso cliente extra ue",
+            "riduzione inps del 35%",
+            "ushers",
+            "",
+        ]
+        for text in texts:
+            with self.subTest(text=text):
+                found = automaton.scan(text)
+                for group, mask in zip(groups, masks):
+                    self.assertEqual(bool(found & mask), any(term in text for term in group))
+
+    def test_registering_new_terms_recompiles(self):
+        automaton = KeywordAutomaton()
+        first = automaton.register(("bollo",))
+        self.assertTrue(automaton.scan("marca da bollo") & first)
+        second = automaton.register(("vies",))
+        self.assertEqual(automaton.mask(("vies",)), second)
+        self.assertEqual(automaton.register(("bollo",)), first)
+        self.assertTrue(automaton.scan("iscrizione al vies") & second)
+        self.assertFalse(automaton.scan("iscrizione al vies") & first)
+        with self.assertRaises(KeyError):
+            automaton.mask(("intrastat",))
+
+
+    def test_concurrent_register_and_scan(self):
+        automaton = KeywordAutomaton()
+        base = automaton.register(("forfettario",))
+        automaton.compile()
+        errors = []
+
+        def scanner():
+            try:
+                for _ in range(300):
+                    if not automaton.scan("regime forfettario") & base:
+                        errors.append("mancato match")
+            except Exception as exc:
+                errors.append(exc)
+
+        def registrar():
+            for index in range(300):
+                automaton.register((f"termine{index}",))
+
+        threads = [threading.Thread(target=scanner) for _ in range(4)] + [threading.Thread(target=registrar)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(errors, [])
+        self.assertTrue(automaton.scan("c'e' termine299") & automaton.mask(("termine299",)))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,52 @@
+import unittest
+
+from lexical_fallback import LexicalChunk, LexicalFallbackIndex
+
+
+class LexicalFallbackIndexTests(unittest.TestCase):
+    def build_index(self):
+        return LexicalFallbackIndex.from_chunks(
+            [
+                LexicalChunk(
+                    regime="forfettario",
+                    source="02_Circolare_32E-2023_Novita_Soglie_e_Uscita_Immediat.pdf",
+                    chunk_id=0,
+                    text="La soglia dei ricavi per il regime forfettario è 85.000 euro.",
+                ),
+                LexicalChunk(
+                    regime="ordinario",
+                    source="ordinario.pdf",
+                    chunk_id=0,
+                    text="Nel regime ordinario la soglia dei ricavi non si applica.",
+                ),
+                LexicalChunk(
+                    regime="forfettario",
+                    source="03_Tabella_Coefficienti_Redditivita_ATECO.pdf",
+                    chunk_id=1,
+                    text="Il codice ATECO determina il coefficiente di redditività.",
+                ),
+            ]
+        )
+
+    def test_search_is_scoped_to_regime_partition(self):
+        index = self.build_index()
+        hits = index.search("soglia ricavi", regime_id="forfettario")
+        self.assertEqual(len(hits), 1)
+        self.assertEqual(hits[0][0].regime, "forfettario")
+        self.assertEqual(index.search("soglia ricavi", regime_id="inesistente"), [])
+
+    def test_search_without_regime_scans_all_partitions(self):
+        index = self.build_index()
+        hits = index.search("soglia ricavi")
+        self.assertEqual({chunk.regime for chunk, _ in hits}, {"forfettario", "ordinario"})
+
+    def test_find_mentions_uses_word_boundaries(self):
+        index = self.build_index()
+        hits = index.find_mentions("codice ATECO", regime_id="forfettario")
+        self.assertEqual([chunk.chunk_id for chunk in hits], [1])
+        self.assertEqual(index.find_mentions("ATECO", regime_id="ordinario"), [])
+        self.assertEqual(index.find_mentions("ricav", regime_id="forfettario"), [])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,189 @@
+import asyncio
+import types
+import unittest
+
+import httpx
+from openai import APIStatusError, RateLimitError
+
+from llm_transport import (
+    ConcurrencyLimiter,
+    LLMBusyError,
+    LLMTransport,
+    LLMTransportConfig,
+    QueuePosition,
+    is_retryable,
+)
+
+
+def _status_error(error_cls, status_code):
+    request = httpx.Request("POST", "https://api.deepseek.com/chat/completions")
+    response = httpx.Response(status_code, request=request, headers={"retry-after": "0"})
+    return error_cls("errore", response=response, body=None)
+
+
+def _chunk(text):
+    return types.SimpleNamespace(
+        choices=[types.SimpleNamespace(delta=types.SimpleNamespace(content=text))]
+    )
+
+
+class _FakeStream:
+    def __init__(self, texts, first_delay=0.0):
+        self.texts = texts
+        self.first_delay = first_delay
+        self.closed = False
+
+    def __aiter__(self):
+        return self._iterate()
+
+    async def _iterate(self):
+        await asyncio.sleep(self.first_delay)
+        for text in self.texts:
+            yield _chunk(text)
+
+    async def close(self):
+        self.closed = True
+
+
+class _FakeClient:
+    def __init__(self, outcomes):
+        self.outcomes = list(outcomes)
+        self.calls = 0
+        self.chat = types.SimpleNamespace(completions=types.SimpleNamespace(create=self._create))
+
+    async def _create(self, **kwargs):
+        self.calls += 1
+        outcome = self.outcomes.pop(0)
+        if isinstance(outcome, BaseException):
+            raise outcome
+        return outcome
+
+
+class LLMTransportTests(unittest.TestCase):
+    def setUp(self):
+        self.config = LLMTransportConfig(retry_base_delay_s=0.0, retry_max_delay_s=0.0)
+
+    def test_retryable_errors(self):
+        self.assertTrue(is_retryable(_status_error(RateLimitError, 429)))
+        self.assertTrue(is_retryable(_status_error(APIStatusError, 503)))
+        self.assertFalse(is_retryable(_status_error(APIStatusError, 400)))
+        self.assertFalse(is_retryable(ValueError("boom")))
+
+    def test_complete_retries_rate_limit_then_succeeds(self):
+        client = _FakeClient([_status_error(RateLimitError, 429), "risposta"])
+        transport = LLMTransport(client, self.config)
+        self.assertEqual(asyncio.run(transport.complete(model="m", messages=[])), "risposta")
+        self.assertEqual(client.calls, 2)
+
+    def test_complete_gives_up_after_max_retries(self):
+        errors = [_status_error(APIStatusError, 502) for _ in range(3)]
+        client = _FakeClient(errors)
+        transport = LLMTransport(client, self.config)
+        with self.assertRaises(APIStatusError):
+            asyncio.run(transport.complete(model="m", messages=[]))
+        self.assertEqual(client.calls, self.config.max_retries + 1)
+
+    def test_stream_hedges_slow_first_token(self):
+        slow = _FakeStream(["lento"], first_delay=1.0)
+        fast = _FakeStream(["veloce", " ok"])
+        client = _FakeClient([slow, fast])
+        config = LLMTransportConfig(hedge_after_s=0.05)
+        transport = LLMTransport(client, config)
+
+        async def collect():
+            return [chunk.choices[0].delta.content async for chunk in transport.stream(model="m")]
+
+        self.assertEqual(asyncio.run(collect()), ["veloce", " ok"])
+        self.assertEqual(client.calls, 2)
+        self.assertTrue(fast.closed)
+        # Lo stream perdente, cancellato in attesa del primo token, viene chiuso.
+        self.assertTrue(slow.closed)
+
+
+
+class ConcurrencyLimiterTests(unittest.TestCase):
+    def test_queue_hands_slots_over_in_order_and_rejects_overflow(self):
+        async def scenario():
+            limiter = ConcurrencyLimiter(max_concurrent=1, max_queue=1, max_wait_s=1.0)
+            first = limiter.reserve()
+            second = limiter.reserve()
+            self.assertEqual((first.position, second.position), (0, 1))
+            with self.assertRaises(LLMBusyError):
+                limiter.reserve()
+            waiter = asyncio.ensure_future(second.wait())
+            await asyncio.sleep(0)
+            self.assertFalse(waiter.done())
+            limiter.release()
+            await waiter
+            self.assertEqual((limiter.active, limiter.queued), (1, 0))
+            limiter.release()
+            self.assertEqual(limiter.active, 0)
+
+        asyncio.run(scenario())
+
+    def test_queue_wait_times_out_as_busy(self):
+        async def scenario():
+            limiter = ConcurrencyLimiter(max_concurrent=1, max_queue=4, max_wait_s=0.01)
+            limiter.reserve()
+            with self.assertRaises(LLMBusyError):
+                await limiter.reserve().wait()
+            self.assertEqual(limiter.queued, 0)
+
+        asyncio.run(scenario())
+
+    def test_stream_reports_queue_position_before_chunks(self):
+        client = _FakeClient([_FakeStream(["ciao"])])
+        transport = LLMTransport(client, LLMTransportConfig(max_concurrency=1))
+
+        async def scenario():
+            held = transport.limiter.reserve()
+            items = []
+
+            async def consume():
+                async for item in transport.stream(model="m"):
+                    items.append(item)
+
+            consumer = asyncio.ensure_future(consume())
+            await asyncio.sleep(0.01)
+            self.assertEqual(items, [QueuePosition(1)])
+            self.assertEqual(held.position, 0)
+            transport.limiter.release()
+            await consumer
+            return items
+
+        items = asyncio.run(scenario())
+        self.assertEqual(items[1].choices[0].delta.content, "ciao")
+        self.assertEqual(transport.limiter.active, 0)
+
+    def test_closing_a_queued_stream_gives_the_slot_back(self):
+        client = _FakeClient([_FakeStream(["ciao"])])
+        transport = LLMTransport(client, LLMTransportConfig(max_concurrency=1))
+
+        async def scenario():
+            first = transport.stream(model="m")
+            self.assertEqual((await first.__anext__()).choices[0].delta.content, "ciao")
+            queued = transport.stream(model="m")
+            self.assertEqual(await queued.__anext__(), QueuePosition(1))
+            # Il client in coda se ne va prima di ottenere il posto.
+            await queued.aclose()
+            self.assertEqual(transport.limiter.queued, 0)
+            await first.aclose()
+            return transport.limiter.active, transport.limiter.queued
+
+        self.assertEqual(asyncio.run(scenario()), (0, 0))
+
+    def test_cancelling_a_granted_but_unused_ticket_releases_it(self):
+        async def scenario():
+            limiter = ConcurrencyLimiter(max_concurrent=1, max_queue=1, max_wait_s=1.0)
+            limiter.reserve()
+            queued = limiter.reserve()
+            limiter.release()
+            self.assertEqual((limiter.active, limiter.queued), (1, 0))
+            queued.cancel()
+            return limiter.active
+
+        self.assertEqual(asyncio.run(scenario()), 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,33 @@
+import types
+import unittest
+
+from prompt_builder import build_messages, build_system_prompt, prompt_cache_usage
+
+
+class PromptBuilderTests(unittest.TestCase):
+    def test_stable_prefix_is_identical_and_question_comes_last(self):
+        first = build_messages("Regime forfettario", "contesto A", "Domanda uno?")
+        second = build_messages("Regime forfettario", "contesto B", "Domanda due?")
+        self.assertEqual(first[0], second[0])
+        self.assertIs(build_system_prompt("Regime forfettario"), build_system_prompt("Regime forfettario"))
+        self.assertEqual(first[1]["content"], "CONTEXT:\ncontesto A\n\nDOMANDA:\nDomanda uno?")
+
+    def test_prompt_cache_usage_reads_deepseek_fields(self):
+        usage = types.SimpleNamespace(
+            prompt_tokens=900,
+            prompt_cache_hit_tokens=640,
+            prompt_cache_miss_tokens=260,
+        )
+        self.assertEqual(
+            prompt_cache_usage(usage),
+            {"prompt_tokens": 900, "prompt_cache_hit_tokens": 640, "prompt_cache_miss_tokens": 260},
+        )
+        self.assertEqual(
+            prompt_cache_usage(types.SimpleNamespace(prompt_tokens=100)),
+            {"prompt_tokens": 100, "prompt_cache_hit_tokens": 0, "prompt_cache_miss_tokens": 100},
+        )
+        self.assertIsNone(prompt_cache_usage(None))
+
+
+if __name__ == "__main__":
+    unittest.main()
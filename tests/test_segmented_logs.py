@@ -0,0 +1,150 @@
+import gzip
+import json
+import tempfile
+import threading
+import unittest
+from datetime import datetime, timezone
+from pathlib import Path
+from unittest import mock
+
+import storage_services
+from storage_services import START_CHECKPOINT, EventStore, JsonlStore
+
+
+def _at(day):
+    return mock.patch.object(storage_services, "_utc_day", return_value=day)
+
+
+def _records(store, day, count, start=0):
+    with _at(day):
+        store.append_many(
+            [{"event": "e", "index": start + index, "timestamp": f"{day}T12:00:0{index % 10}+00:00"} for index in range(count)]
+        )
+
+
+class SegmentedLogTests(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.path = Path(self.tmpdir.name) / "events" / "app_events.jsonl"
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def test_closed_days_are_compressed_and_listed_in_the_manifest(self):
+        store = EventStore(self.path)
+        _records(store, "2026-03-01", 3)
+        first, checkpoint = store.read_from(limit=2)
+        _records(store, "2026-03-02", 2, start=3)
+
+        self.assertEqual(
+            sorted(item.name for item in store.directory.iterdir() if not item.name.startswith(".")),
+            ["2026-03-01.jsonl.gz", "2026-03-02.jsonl", "manifest.json"],
+        )
+        manifest = json.loads(store.manifest_path.read_text(encoding="utf-8"))
+        self.assertEqual(manifest["segments"][0]["records"], 3)
+        self.assertEqual(manifest["segments"][0]["last_timestamp"], "2026-03-01T12:00:02+00:00")
+
+        self.assertEqual([item["index"] for item in store.iter_records()], [0, 1, 2, 3, 4])
+        self.assertEqual([item["index"] for item in store.read_tail(3)], [2, 3, 4])
+        # Il checkpoint preso prima della compressione resta valido dopo.
+        rest, checkpoint = store.read_from(checkpoint)
+        self.assertEqual([item["index"] for item in first + rest], [0, 1, 2, 3, 4])
+        self.assertEqual(store.read_from(checkpoint), ([], checkpoint))
+
+        since = datetime(2026, 3, 2, tzinfo=timezone.utc)
+        with mock.patch.object(storage_services.gzip, "open", side_effect=AssertionError("segmento letto")):
+            self.assertEqual([item["index"] for item in store.iter_records(since=since)], [3, 4])
+
+    def test_retention_drops_old_segments(self):
+        store = EventStore(self.path, retention_days=2)
+        for offset, day in enumerate(("2026-03-01", "2026-03-02", "2026-03-03", "2026-03-04")):
+            _records(store, day, 1, start=offset)
+        self.assertEqual([item["day"] for item in store.segments()], ["2026-03-02", "2026-03-03", "2026-03-04"])
+        self.assertEqual([item["index"] for item in store.read_all()], [1, 2, 3])
+
+    def test_legacy_single_file_is_split_into_segments(self):
+        self.path.parent.mkdir(parents=True)
+        lines = [
+            {"event": "vecchio", "timestamp": "2026-01-05T10:00:00+00:00"},
+            {"event": "vecchio", "timestamp": "2026-01-06T10:00:00+00:00"},
+        ]
+        self.path.write_text("".join(json.dumps(item) + "\n" for item in lines), encoding="utf-8")
+        with _at("2026-03-01"):
+            store = EventStore(self.path)
+        self.assertFalse(self.path.exists())
+        self.assertEqual(store.read_all(), lines)
+        self.assertEqual([item["compressed"] for item in store.segments()], [True, True])
+
+
+    def test_late_append_to_a_closed_day_goes_into_the_compressed_segment(self):
+        slow_worker = EventStore(self.path)
+        fast_worker = EventStore(self.path)
+        _records(slow_worker, "2026-03-01", 2)
+        _, checkpoint = fast_worker.read_from()
+        _records(fast_worker, "2026-03-02", 1, start=2)
+        # Il worker con l'orologio indietro scrive ancora sul giorno gia' compresso.
+        _records(slow_worker, "2026-03-01", 2, start=3)
+
+        self.assertFalse((slow_worker.directory / "2026-03-01.jsonl").exists())
+        self.assertEqual([item["day"] for item in fast_worker.segments()], ["2026-03-01", "2026-03-02"])
+        self.assertEqual(fast_worker.segments()[0]["records"], 4)
+        self.assertEqual(sorted(item["index"] for item in fast_worker.read_all()), [0, 1, 2, 3, 4])
+        rest, _ = fast_worker.read_from(checkpoint)
+        self.assertEqual(sorted(item["index"] for item in rest), [2, 3, 4])
+
+    def test_read_from_follows_a_segment_compressed_after_listing(self):
+        store = EventStore(self.path)
+        _records(store, "2026-03-01", 3)
+        stale = store.segments()
+        with _at("2026-03-02"):
+            store.rotate()
+        with mock.patch.object(store, "segments", return_value=stale):
+            records, checkpoint = store.read_from()
+        self.assertEqual([item["index"] for item in records], [0, 1, 2])
+        self.assertTrue(checkpoint.startswith("segment:2026-03-01:"))
+
+        # Un segmento elencato ma al momento illeggibile non fa avanzare il checkpoint.
+        with mock.patch.object(store, "segments", return_value=stale), mock.patch.object(
+            storage_services.gzip, "open", side_effect=FileNotFoundError
+        ):
+            self.assertEqual(store.read_from(), ([], START_CHECKPOINT))
+
+    def test_foreign_checkpoints_are_rejected(self):
+        store = EventStore(self.path)
+        flat = JsonlStore(Path(self.tmpdir.name) / "flat.jsonl")
+        _records(store, "2026-03-01", 2)
+        flat.append({"index": 0})
+        _, segment_checkpoint = store.read_from()
+        _, flat_checkpoint = flat.read_from()
+        for checkpoint in (0, 120, ["2026-03-01", 0], flat_checkpoint, "segment:2026-03-01"):
+            with self.subTest(checkpoint=checkpoint), self.assertRaises(ValueError):
+                store.read_from(checkpoint)
+        with self.assertRaises(ValueError):
+            flat.read_from(segment_checkpoint)
+
+    def test_compression_does_not_lose_concurrent_appends(self):
+        writer = EventStore(self.path)
+        rotator = EventStore(self.path)
+        with _at("2026-03-01"):
+            writer.append_many([{"event": "e", "index": -1}])
+
+            def write():
+                for index in range(200):
+                    writer.append_many([{"event": "e", "index": index}])
+
+            def rotate():
+                for _ in range(50):
+                    rotator.rotate(today="2026-03-02")
+                    (rotator.directory / "2026-03-01.jsonl").touch()
+
+            threads = [threading.Thread(target=write), threading.Thread(target=rotate)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+        indexes = sorted(item["index"] for item in EventStore(self.path).read_all())
+        self.assertEqual(indexes, list(range(-1, 200)))
+
+
+if __name__ == "__main__":
+    unittest.main()
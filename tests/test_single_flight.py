@@ -0,0 +1,148 @@
+import asyncio
+import unittest
+
+from single_flight import SingleFlight
+
+
+class SingleFlightTests(unittest.TestCase):
+    def test_concurrent_calls_share_one_execution(self):
+        flights = SingleFlight()
+        calls = []
+
+        async def work():
+            calls.append(1)
+            await asyncio.sleep(0.01)
+            return "risultato"
+
+        async def scenario():
+            results = await asyncio.gather(*(flights.run("chiave", work) for _ in range(5)))
+            self.assertFalse(flights.in_flight("chiave"))
+            return results
+
+        self.assertEqual(asyncio.run(scenario()), ["risultato"] * 5)
+        self.assertEqual(len(calls), 1)
+
+    def test_errors_reach_every_waiter_and_release_the_key(self):
+        flights = SingleFlight()
+
+        async def failing():
+            await asyncio.sleep(0)
+            raise RuntimeError("boom")
+
+        async def scenario():
+            results = await asyncio.gather(
+                flights.run("chiave", failing),
+                flights.run("chiave", failing),
+                return_exceptions=True,
+            )
+            return results, await flights.run("chiave", lambda: asyncio.sleep(0, result="ok"))
+
+        results, retry = asyncio.run(scenario())
+        self.assertTrue(all(isinstance(item, RuntimeError) for item in results))
+        self.assertEqual(retry, "ok")
+
+    def test_stream_fans_out_to_late_subscribers(self):
+        flights = SingleFlight()
+        started = []
+
+        async def tokens():
+            started.append(1)
+            for token in ("a", "b", "c"):
+                await asyncio.sleep(0.005)
+                yield token
+
+        async def collect(delay):
+            await asyncio.sleep(delay)
+            return [token async for token in flights.stream("chiave", tokens)]
+
+        async def scenario():
+            return await asyncio.gather(collect(0), collect(0.007))
+
+        self.assertEqual(asyncio.run(scenario()), [["a", "b", "c"], ["a", "b", "c"]])
+        self.assertEqual(len(started), 1)
+
+
+    def test_stream_is_cancelled_when_last_subscriber_leaves(self):
+        flights = SingleFlight()
+        produced = []
+        closed = []
+
+        async def tokens():
+            try:
+                for token in range(1000):
+                    produced.append(token)
+                    await asyncio.sleep(0.001)
+                    yield token
+            finally:
+                closed.append(1)
+
+        async def read(count):
+            stream = flights.stream("chiave", tokens)
+            received = []
+            async for token in stream:
+                received.append(token)
+                if len(received) == count:
+                    break
+            await stream.aclose()
+            return received
+
+        async def scenario():
+            first, second = await asyncio.gather(read(3), read(10))
+            self.assertEqual(second, list(range(10)))
+            await asyncio.sleep(0.02)
+            self.assertFalse(flights.in_flight("chiave"))
+            return first
+
+        self.assertEqual(asyncio.run(scenario()), [0, 1, 2])
+        self.assertEqual(closed, [1])
+        self.assertLess(len(produced), 20)
+
+    def test_unstarted_subscriber_does_not_keep_generation_alive(self):
+        flights = SingleFlight()
+        closed = []
+
+        async def tokens():
+            try:
+                for token in range(1000):
+                    await asyncio.sleep(0.001)
+                    yield token
+            finally:
+                closed.append(1)
+
+        async def scenario():
+            leader = flights.stream("chiave", tokens)
+            self.assertEqual(await leader.__anext__(), 0)
+            # Richiesta annullata prima della prima lettura: il suo generatore non parte mai.
+            follower = flights.stream("chiave", tokens)
+            await leader.aclose()
+            await asyncio.sleep(0.02)
+            self.assertFalse(flights.in_flight("chiave"))
+            # Il follower avviato dopo ottiene una generazione nuova.
+            self.assertEqual(await follower.__anext__(), 0)
+            await follower.aclose()
+
+        asyncio.run(scenario())
+        self.assertEqual(closed, [1, 1])
+
+    def test_late_subscribers_skip_stale_transient_items(self):
+        flights = SingleFlight()
+
+        async def tokens():
+            yield "coda:1"
+            for token in ("a", "b"):
+                await asyncio.sleep(0.005)
+                yield token
+
+        async def collect(delay):
+            await asyncio.sleep(delay)
+            stream = flights.stream("chiave", tokens, transient=lambda item: item.startswith("coda:"))
+            return [token async for token in stream]
+
+        async def scenario():
+            return await asyncio.gather(collect(0), collect(0.007))
+
+        self.assertEqual(asyncio.run(scenario()), [["coda:1", "a", "b"], ["a", "b"]])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,63 @@
+import multiprocessing
+import tempfile
+import unittest
+from pathlib import Path
+
+from storage_services import ChatHistoryStore, EventStore
+
+
+def _write_turns(base_dir, worker, turns):
+    store = ChatHistoryStore(Path(base_dir), compact_every=4)
+    for index in range(turns):
+        store.save_turn(
+            chat_id="condivisa",
+            regime_id="forfettario",
+            user_message=f"Domanda {worker}-{index}",
+            assistant_message="Risposta " + "x" * 2000,
+            assistant_sources=[],
+        )
+
+
+def _write_events(path, worker, count):
+    store = EventStore(Path(path))
+    for index in range(count):
+        store.append({"event": "test", "worker": worker, "index": index, "padding": "y" * 5000})
+
+
+@unittest.skipUnless(
+    "fork" in multiprocessing.get_all_start_methods(), "richiede processi figli via fork"
+)
+class StorageConcurrencyTests(unittest.TestCase):
+    def _run_workers(self, target, *args):
+        context = multiprocessing.get_context("fork")
+        workers = [context.Process(target=target, args=(args[0], worker, *args[1:])) for worker in range(4)]
+        for process in workers:
+            process.start()
+        for process in workers:
+            process.join(30)
+            self.assertEqual(process.exitcode, 0)
+
+    def test_concurrent_turns_on_the_same_chat_are_not_lost(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            self._run_workers(_write_turns, tmpdir, 10)
+            store = ChatHistoryStore(Path(tmpdir))
+            transcript = store.get_chat("condivisa")
+            self.assertEqual(len(transcript.messages), 80)
+            questions = {item.text for item in transcript.messages if item.role == "user"}
+            self.assertEqual(len(questions), 40)
+            self.assertEqual(store.list_chats()[0].message_count, 80)
+
+    def test_concurrent_appends_do_not_tear_lines(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            path = Path(tmpdir) / "events.jsonl"
+            self._run_workers(_write_events, path, 50)
+            store = EventStore(path)
+            segment = store.directory / store.segments()[0]["name"]
+            lines = segment.read_text(encoding="utf-8").splitlines()
+            records = store.read_all()
+            self.assertEqual(len(lines), 200)
+            self.assertEqual(len(records), 200)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,8 +1,16 @@
+import json
 import tempfile
 import unittest
+from datetime import datetime, timedelta, timezone
 from pathlib import Path
 
-from storage_services import ChatHistoryStore, EventStore, FeedbackStore, build_admin_stats
+from storage_services import (
+    ChatHistoryStore,
+    EventStore,
+    FeedbackStore,
+    JsonlStore,
+    build_llm_usage_stats,
+)
 
 
 class StorageServicesTests(unittest.TestCase):
@@ -21,27 +29,248 @@ class StorageServicesTests(unittest.TestCase):
             self.assertEqual(len(transcript.messages), 2)
             self.assertEqual(transcript.regime_id, "forfettario")
 
-    def test_admin_stats_aggregate_data(self):
+    def test_chat_catalog_lists_newest_first_without_reading_transcripts(self):
         with tempfile.TemporaryDirectory() as tmpdir:
-            base = Path(tmpdir)
-            chat_store = ChatHistoryStore(base / "history")
-            feedback_store = FeedbackStore(base / "feedback" / "feedback.jsonl")
-            event_store = EventStore(base / "events" / "events.jsonl")
+            base_dir = Path(tmpdir) / "history"
+            store = ChatHistoryStore(base_dir)
+            for chat_id in ("chat-1", "chat-2", "chat-3"):
+                store.save_turn(
+                    chat_id=chat_id,
+                    regime_id="forfettario",
+                    user_message=f"Domanda {chat_id}",
+                    assistant_message="Risposta",
+                    assistant_sources=[],
+                )
+            store.save_turn(
+                chat_id="chat-1",
+                regime_id="forfettario",
+                user_message="Seconda domanda",
+                assistant_message="Risposta",
+                assistant_sources=[],
+            )
+            self.assertTrue(store.delete_chat("chat-2"))
+            # Le trascrizioni non vengono lette: anche se illeggibili la lista resta valida.
+            (base_dir / "chat-3.jsonl").write_text("{rotto", encoding="utf-8")
+
+            listed = store.list_chats(limit=5)
+            self.assertEqual([item.chat_id for item in listed], ["chat-1", "chat-3"])
+            self.assertEqual(listed[0].message_count, 4)
+            self.assertEqual(listed[0].title, "Domanda chat-1")
+            self.assertEqual([item.chat_id for item in store.list_chats(limit=1)], ["chat-1"])
+
+            reopened = ChatHistoryStore(base_dir)
+            self.assertEqual([item.chat_id for item in reopened.list_chats()], ["chat-1", "chat-3"])
+            self.assertIsNone(reopened.get_chat("_catalog"))
+
+    def test_chat_catalog_is_rebuilt_from_existing_transcripts(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            base_dir = Path(tmpdir) / "history"
+            store = ChatHistoryStore(base_dir)
+            for chat_id in ("vecchia", "nuova"):
+                store.save_turn(
+                    chat_id=chat_id,
+                    regime_id="forfettario",
+                    user_message=chat_id,
+                    assistant_message="Risposta",
+                    assistant_sources=[],
+                )
+            (base_dir / "_catalog.jsonl").unlink()
+            rebuilt = ChatHistoryStore(base_dir).list_chats()
+            self.assertEqual([item.chat_id for item in rebuilt], ["nuova", "vecchia"])
+
+    def test_chat_catalog_is_an_append_only_log_compacted_when_stale(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            base_dir = Path(tmpdir) / "history"
+            base_dir.mkdir()
+            (base_dir / "_catalog.json").write_text("[]", encoding="utf-8")
+            store = ChatHistoryStore(base_dir, catalog_compact_min=6)
+            other_worker = ChatHistoryStore(base_dir, catalog_compact_min=6)
+            catalog_path = base_dir / "_catalog.jsonl"
+
+            def turn(chat_id):
+                store.save_turn(
+                    chat_id=chat_id,
+                    regime_id="forfettario",
+                    user_message=f"Domanda {chat_id}",
+                    assistant_message="Risposta",
+                    assistant_sources=[],
+                )
+
+            turn("chat-1")
+            self.assertFalse((base_dir / "_catalog.json").exists())
+            before = catalog_path.read_bytes()
+            turn("chat-2")
+            turn("chat-1")
+            after = catalog_path.read_bytes()
+            self.assertTrue(after.startswith(before))
+            self.assertEqual(len(after.splitlines()), 3)
+            self.assertEqual([item.chat_id for item in other_worker.list_chats()], ["chat-1", "chat-2"])
+
+            turn("chat-2")
+            store.delete_chat("chat-1")
+            self.assertEqual([item.chat_id for item in other_worker.list_chats()], ["chat-2"])
+            for _ in range(2):
+                turn("chat-2")
+            # Oltre la soglia il log viene riscritto con le sole voci vive.
+            self.assertEqual(len(catalog_path.read_text(encoding="utf-8").splitlines()), 1)
+            listed = other_worker.list_chats()
+            self.assertEqual([item.chat_id for item in listed], ["chat-2"])
+            self.assertEqual(listed[0].message_count, 8)
+
+    def test_turns_are_appended_to_the_chat_log_and_compacted(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            base_dir = Path(tmpdir) / "history"
+            store = ChatHistoryStore(base_dir, compact_every=3)
+            log_path = base_dir / "chat-1.jsonl"
+            store.save_turn(
+                chat_id="chat-1",
+                regime_id="forfettario",
+                user_message="Prima domanda",
+                assistant_message="Prima risposta",
+                assistant_sources=[],
+            )
+            before = log_path.read_bytes()
+            store.save_turn(
+                chat_id="chat-1",
+                regime_id="ordinario",
+                user_message="Seconda domanda",
+                assistant_message="Seconda risposta",
+                assistant_sources=["fonte.pdf"],
+            )
+            after = log_path.read_bytes()
+            self.assertTrue(after.startswith(before))
+            self.assertEqual(len(after.splitlines()), 6)
+
+            # Una riga troncata da una scrittura interrotta non rompe la lettura.
+            with log_path.open("a", encoding="utf-8") as handle:
+                handle.write('{"role": "user", "te\n')
+            transcript = store.get_chat("chat-1")
+            self.assertEqual(transcript.regime_id, "ordinario")
+            self.assertEqual([item.text for item in transcript.messages][-1], "Seconda risposta")
+            self.assertEqual(len(transcript.messages), 4)
+
+            store.save_turn(
+                chat_id="chat-1",
+                regime_id="ordinario",
+                user_message="Terza domanda",
+                assistant_message="Terza risposta",
+                assistant_sources=[],
+            )
+            lines = log_path.read_text(encoding="utf-8").splitlines()
+            self.assertEqual(len(lines), 7)
+            self.assertIn('"regime_id": "ordinario"', lines[0])
+            self.assertEqual(store.get_chat("chat-1").updated_at, store.list_chats()[0].updated_at)
+
+    def test_corrupt_chat_log_is_quarantined_not_overwritten(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            base_dir = Path(tmpdir) / "history"
+            base_dir.mkdir()
+            damaged = '{"chat_id": "chat-1", "tit\n{"role": "user", "text": "Domanda persa"}\n'
+            (base_dir / "chat-1.jsonl").write_text(damaged, encoding="utf-8")
+            store = ChatHistoryStore(base_dir)
 
-            chat_store.save_turn(
+            turn = store.save_turn(
                 chat_id="chat-1",
                 regime_id="forfettario",
-                user_message="Domanda 1",
-                assistant_message="Risposta 1",
+                user_message="Nuova domanda",
+                assistant_message="Nuova risposta",
                 assistant_sources=[],
             )
-            feedback_store.append({"vote": "up", "message": "Risposta 1"})
-            event_store.append({"event": "rag_no_results"})
+            self.assertEqual([item["text"] for item in turn["messages"]], ["Nuova domanda", "Nuova risposta"])
+            quarantined = list(base_dir.glob("chat-1.jsonl.corrupt-*"))
+            self.assertEqual(len(quarantined), 1)
+            self.assertEqual(quarantined[0].read_text(encoding="utf-8"), damaged)
+            self.assertEqual(len(store.get_chat("chat-1").messages), 2)
+            self.assertEqual([item.chat_id for item in store.list_chats()], ["chat-1"])
+
+    def test_legacy_transcripts_are_read_and_converted(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            base_dir = Path(tmpdir) / "history"
+            base_dir.mkdir()
+            legacy = {
+                "chat_id": "vecchia",
+                "title": "Vecchia chat",
+                "regime_id": "forfettario",
+                "created_at": "2025-01-01T00:00:00+00:00",
+                "updated_at": "2025-01-01T00:00:00+00:00",
+                "messages": [
+                    {"role": "user", "text": "Domanda", "sources": [], "created_at": "2025-01-01T00:00:00+00:00"},
+                    {"role": "assistant", "text": "Risposta", "sources": [], "created_at": "2025-01-01T00:00:00+00:00"},
+                ],
+            }
+            (base_dir / "vecchia.json").write_text(json.dumps(legacy), encoding="utf-8")
+            store = ChatHistoryStore(base_dir)
+            self.assertEqual(store.list_chats()[0].message_count, 2)
+            self.assertEqual(store.get_chat("vecchia").title, "Vecchia chat")
+
+            store.save_turn(
+                chat_id="vecchia",
+                regime_id="forfettario",
+                user_message="Nuova domanda",
+                assistant_message="Nuova risposta",
+                assistant_sources=[],
+            )
+            self.assertFalse((base_dir / "vecchia.json").exists())
+            transcript = store.get_chat("vecchia")
+            self.assertEqual(transcript.title, "Vecchia chat")
+            self.assertEqual(len(transcript.messages), 4)
+            self.assertEqual(store.list_chats()[0].message_count, 4)
+
+    def test_jsonl_tail_stream_and_checkpoint_reads(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            path = Path(tmpdir) / "events.jsonl"
+            store = JsonlStore(path)
+            store.TAIL_BLOCK_SIZE = 64
+            store.append_many([{"event": "e", "index": index, "text": "x" * (index % 7) * 10} for index in range(50)])
+
+            self.assertEqual([item["index"] for item in store.read_tail(3)], [47, 48, 49])
+            self.assertEqual(len(store.read_tail(100)), 50)
+            self.assertEqual(store.read_tail(0), [])
+            self.assertEqual([item["index"] for item in store.iter_records()], list(range(50)))
+
+            first, checkpoint = store.read_from(limit=20)
+            self.assertEqual([item["index"] for item in first], list(range(20)))
+            rest, checkpoint = store.read_from(checkpoint)
+            self.assertEqual([item["index"] for item in rest], list(range(20, 50)))
+            self.assertEqual(checkpoint, f"jsonl:{path.stat().st_size}")
+
+            # Una riga ancora in scrittura non viene consumata ne' fa avanzare il checkpoint.
+            with path.open("a", encoding="utf-8") as handle:
+                handle.write('{"event": "parziale"')
+            self.assertEqual(store.read_from(checkpoint), ([], checkpoint))
+            self.assertEqual(store.read_tail(1)[0]["index"], 49)
+            with path.open("a", encoding="utf-8") as handle:
+                handle.write("}\n")
+            self.assertEqual(store.read_from(checkpoint)[0], [{"event": "parziale"}])
+
+    def test_llm_usage_stats_report_percentiles_inside_the_window(self):
+        now = datetime.now(timezone.utc)
+        old = (now - timedelta(hours=30)).isoformat()
+        records = [
+            {
+                "event": "llm_usage",
+                "timestamp": now.isoformat(),
+                "answer_type": "generated",
+                "duration_ms": duration,
+                "ttft_ms": duration // 4,
+                "prompt_tokens": 800,
+                "completion_tokens": 100 + index,
+                "cached_tokens": 400,
+            }
+            for index, duration in enumerate(range(100, 2100, 100))
+        ]
+        records.append({"event": "llm_usage", "timestamp": now.isoformat(), "answer_type": "hard_coded"})
+        records.append({"event": "llm_usage", "timestamp": old, "answer_type": "generated", "duration_ms": 99999})
+        records.append({"event": "rag_no_results", "timestamp": now.isoformat()})
 
-            stats = build_admin_stats(chat_store, feedback_store, event_store)
-            self.assertEqual(stats.total_chats, 1)
-            self.assertEqual(stats.positive_feedback, 1)
-            self.assertEqual(stats.no_result_events, 1)
+        stats = build_llm_usage_stats(records, window_hours=24)
+        self.assertEqual((stats.generated_answers, stats.hard_coded_answers), (20, 1))
+        self.assertEqual(stats.duration_ms_p50, 1100)
+        self.assertEqual(stats.duration_ms_p95, 2000)
+        self.assertEqual(stats.ttft_ms_p50, 275)
+        self.assertEqual(stats.tokens_per_answer_p50, 910)
+        self.assertEqual(stats.cached_token_ratio, 0.5)
+        self.assertIsNone(build_llm_usage_stats([], window_hours=24).duration_ms_p95)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,135 @@
+import tempfile
+import unittest
+from pathlib import Path
+
+from admin_aggregates import AdminAggregates
+from storage_services import ChatHistoryStore, EventStore, FeedbackStore
+from storage_sqlite import (
+    SQLiteChatHistoryStore,
+    SQLiteDatabase,
+    SQLiteEventStore,
+    SQLiteFeedbackStore,
+    migrate_json_tree,
+)
+
+
+def _save(store, chat_id, question):
+    return store.save_turn(
+        chat_id=chat_id,
+        regime_id="forfettario",
+        user_message=question,
+        assistant_message="Risposta",
+        assistant_sources=["fonte.pdf"],
+        confidence_label="alta",
+        confidence_score=0.9,
+        retrieval_mode="semantic",
+    )
+
+
+class SQLiteStorageTests(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.root = Path(self.tmpdir.name)
+        self.database = SQLiteDatabase(self.root / "flytax.sqlite3")
+
+    def tearDown(self):
+        self.database.close()
+        self.tmpdir.cleanup()
+
+    def test_database_uses_wal(self):
+        mode = self.database.query("PRAGMA journal_mode")[0][0]
+        self.assertEqual(mode, "wal")
+
+    def test_chat_store_matches_json_store(self):
+        json_store = ChatHistoryStore(self.root / "history")
+        sqlite_store = SQLiteChatHistoryStore(self.database)
+        returned = []
+        for store in (json_store, sqlite_store):
+            first = _save(store, "chat-1", "Quanto posso fatturare?")
+            _save(store, "chat-2", "Che aliquota pago?")
+            turn = _save(store, "chat-1", "E se supero la soglia?")
+            self.assertEqual(turn["created_at"], first["created_at"])
+            returned.append({key: value for key, value in turn.items() if key not in ("created_at", "updated_at")})
+        # Entrambi restituiscono solo il turno scritto, con l'intestazione della chat.
+        self.assertEqual(returned[0]["messages"][0]["text"], "E se supero la soglia?")
+        for payload in returned:
+            for message in payload["messages"]:
+                message.pop("created_at")
+        self.assertEqual(returned[1], returned[0])
+
+        expected = json_store.get_chat("chat-1").model_dump()
+        actual = sqlite_store.get_chat("chat-1").model_dump()
+        for payload in (expected, actual):
+            payload.pop("created_at")
+            payload.pop("updated_at")
+            for message in payload["messages"]:
+                message.pop("created_at")
+        self.assertEqual(actual, expected)
+        self.assertEqual([item.chat_id for item in sqlite_store.list_chats()], ["chat-1", "chat-2"])
+        self.assertEqual(sqlite_store.list_chats(limit=1)[0].message_count, 4)
+
+        self.assertTrue(sqlite_store.delete_chat("chat-1"))
+        self.assertFalse(sqlite_store.delete_chat("chat-1"))
+        self.assertIsNone(sqlite_store.get_chat("chat-1"))
+        self.assertEqual(self.database.query("SELECT COUNT(*) FROM messages")[0][0], 2)
+
+    def test_record_stores_and_admin_stats(self):
+        chats = SQLiteChatHistoryStore(self.database)
+        feedback = SQLiteFeedbackStore(self.database)
+        events = SQLiteEventStore(self.database)
+        _save(chats, "chat-1", "Quanto posso fatturare?")
+        feedback.append({"vote": "up", "chat_id": "chat-1", "message": "ok"})
+        self.assertEqual(
+            events.append_many([{"event": "rag_no_results"}, {"event": "rag_low_confidence"}]),
+            2,
+        )
+
+        records = events.read_all()
+        self.assertEqual([item["event"] for item in records], ["rag_no_results", "rag_low_confidence"])
+        self.assertIn("timestamp", records[0])
+
+        self.assertEqual([item["event"] for item in events.read_tail(1)], ["rag_low_confidence"])
+        first, checkpoint = events.read_from(limit=1)
+        self.assertEqual([item["event"] for item in first], ["rag_no_results"])
+        self.assertEqual(events.read_from(checkpoint)[0][0]["event"], "rag_low_confidence")
+
+        stats = AdminAggregates(self.root / "admin", chats, feedback, events).stats()
+        self.assertEqual(stats.total_chats, 1)
+        self.assertEqual(stats.total_messages, 2)
+        self.assertEqual(stats.positive_feedback, 1)
+        self.assertEqual(stats.no_result_events, 1)
+        self.assertEqual(stats.top_questions, ["Quanto posso fatturare?"])
+
+    def test_migration_imports_json_tree_once(self):
+        data_root = self.root / "data"
+        json_chats = ChatHistoryStore(data_root / "chat_history")
+        _save(json_chats, "chat-1", "Domanda uno")
+        _save(json_chats, "chat-2", "Domanda due")
+        (data_root / "chat_history" / "rotta.json").write_text("{", encoding="utf-8")
+        FeedbackStore(data_root / "feedback" / "feedback.jsonl").append({"vote": "down", "message": "no"})
+        EventStore(data_root / "events" / "app_events.jsonl").append_many(
+            [{"event": "chat_turn_saved"}, {"event": "rag_no_results"}]
+        )
+
+        report = migrate_json_tree(data_root, self.database, batch_size=1)
+        self.assertEqual(
+            report,
+            {"chats": 2, "messages": 4, "feedback": 1, "events": 2, "skipped": 1},
+        )
+        again = migrate_json_tree(data_root, self.database)
+        self.assertEqual((again["chats"], again["feedback"], again["events"]), (2, 0, 0))
+
+        migrated = SQLiteChatHistoryStore(self.database)
+        self.assertEqual(
+            [item.chat_id for item in migrated.list_chats()],
+            [item.chat_id for item in json_chats.list_chats()],
+        )
+        self.assertEqual(migrated.get_chat("chat-1").messages[1].sources, ["fonte.pdf"])
+        self.assertEqual(
+            SQLiteEventStore(self.database).read_all(),
+            EventStore(data_root / "events" / "app_events.jsonl").read_all(),
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,80 @@
+import asyncio
+import json
+import threading
+import unittest
+import urllib.error
+import urllib.request
+
+from openai import AsyncOpenAI, RateLimitError
+
+from stub_llm_server import StubConfig, StubLLMServer, canned_answer
+
+
+class StubLLMServerTests(unittest.TestCase):
+    def start_server(self, **overrides):
+        config = StubConfig(ttft_ms=0, tokens_per_sec=0, **overrides)
+        server = StubLLMServer(("127.0.0.1", 0), config)
+        thread = threading.Thread(target=server.serve_forever, daemon=True)
+        thread.start()
+        self.addCleanup(server.server_close)
+        self.addCleanup(server.shutdown)
+        return f"http://127.0.0.1:{server.server_address[1]}"
+
+    def client(self, base_url):
+        return AsyncOpenAI(api_key="stub", base_url=base_url, max_retries=0)
+
+    def test_non_streaming_and_streaming_return_the_same_canned_answer(self):
+        base_url = self.start_server()
+        messages = [
+            {"role": "system", "content": "Sei un assistente fiscale."},
+            {"role": "user", "content": "Qual e' la soglia dei ricavi?"},
+        ]
+
+        async def scenario():
+            client = self.client(base_url)
+            response = await client.chat.completions.create(model="deepseek-chat", messages=messages)
+            stream = await client.chat.completions.create(
+                model="deepseek-chat",
+                messages=messages,
+                stream=True,
+                stream_options={"include_usage": True},
+            )
+            deltas, usage = [], None
+            async for chunk in stream:
+                if chunk.choices and chunk.choices[0].delta.content:
+                    deltas.append(chunk.choices[0].delta.content)
+                usage = chunk.usage or usage
+            await client.close()
+            return response, "".join(deltas), usage
+
+        response, streamed, usage = asyncio.run(scenario())
+        self.assertEqual(response.choices[0].message.content, canned_answer(messages))
+        self.assertEqual(streamed, canned_answer(messages))
+        self.assertEqual(response.usage.model_extra["prompt_cache_hit_tokens"], 0)
+        self.assertGreater(usage.model_extra["prompt_cache_hit_tokens"], 0)
+
+    def test_rate_limit_injection_returns_429_with_retry_after(self):
+        base_url = self.start_server(rate_limit_rate=1.0)
+        request = urllib.request.Request(
+            f"{base_url}/chat/completions",
+            data=json.dumps({"model": "deepseek-chat", "messages": []}).encode("utf-8"),
+            headers={"Content-Type": "application/json"},
+        )
+        with self.assertRaises(urllib.error.HTTPError) as raised:
+            urllib.request.urlopen(request, timeout=5)
+        self.assertEqual(raised.exception.code, 429)
+        self.assertEqual(raised.exception.headers["Retry-After"], "1")
+
+        async def scenario():
+            client = self.client(base_url)
+            try:
+                await client.chat.completions.create(model="deepseek-chat", messages=[])
+            finally:
+                await client.close()
+
+        with self.assertRaises(RateLimitError):
+            asyncio.run(scenario())
+
+
+if __name__ == "__main__":
+    unittest.main()
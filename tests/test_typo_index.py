@@ -0,0 +1,25 @@
+import unittest
+
+from typo_index import SymSpellIndex
+
+
+class SymSpellIndexTests(unittest.TestCase):
+    def test_candidates_cover_insertions_deletions_and_substitutions(self):
+        index = SymSpellIndex.from_words(["forfettario", "aliquota", "soglia"], max_distance=2)
+        self.assertIn("forfettario", index.candidates("forfetario"))
+        self.assertIn("aliquota", index.candidates("alliquota"))
+        self.assertIn("soglia", index.candidates("sogila"))
+        self.assertEqual(index.candidates("bitcoin"), [])
+
+    def test_candidates_keep_dictionary_order(self):
+        index = SymSpellIndex.from_words(["contributi", "contributivi", "contributiva"], max_distance=2)
+        self.assertEqual(
+            index.candidates("contributiv"),
+            ["contributi", "contributivi", "contributiva"],
+        )
+        self.assertIn("contributi", index)
+        self.assertEqual(len(index), 3)
+
+
+if __name__ == "__main__":
+    unittest.main()
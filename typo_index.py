@@ -0,0 +1,55 @@
+from typing import Dict, Iterable, List
+
+
+# Indice SymSpell: ogni parola del dizionario viene registrata con tutte le sue varianti
+# ottenute cancellando fino a max_distance caratteri. Un token con un refuso condivide
+# almeno una variante con la parola corretta, quindi i candidati si trovano per hash lookup.
+class SymSpellIndex:
+    def __init__(self, max_distance: int = 2) -> None:
+        self.max_distance = max_distance
+        self._ranks: Dict[str, int] = {}
+        self._deletes: Dict[str, List[str]] = {}
+
+    @classmethod
+    def from_words(cls, words: Iterable[str], max_distance: int = 2) -> "SymSpellIndex":
+        index = cls(max_distance=max_distance)
+        for word in words:
+            index.add(word)
+        return index
+
+    def __contains__(self, word: str) -> bool:
+        return word in self._ranks
+
+    def __len__(self) -> int:
+        return len(self._ranks)
+
+    def add(self, word: str) -> None:
+        if not word or word in self._ranks:
+            return
+        self._ranks[word] = len(self._ranks)
+        for variant in self._variants(word):
+            self._deletes.setdefault(variant, []).append(word)
+
+    def candidates(self, token: str) -> List[str]:
+        # Candidati in ordine di inserimento nel dizionario, cosi' i pareggi restano deterministici.
+        found: set[str] = set()
+        for variant in self._variants(token):
+            found.update(self._deletes.get(variant, ()))
+        return sorted(found, key=self._ranks.__getitem__)
+
+    def _variants(self, word: str) -> set[str]:
+        variants = {word}
+        frontier = {word}
+        for _ in range(self.max_distance):
+            next_frontier = set()
+            for item in frontier:
+                if len(item) <= 1:
+                    continue
+                for position in range(len(item)):
+                    next_frontier.add(item[:position] + item[position + 1 :])
+            next_frontier -= variants
+            if not next_frontier:
+                break
+            variants.update(next_frontier)
+            frontier = next_frontier
+        return variants